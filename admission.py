@@ -0,0 +1,316 @@
+"""
+変換タスクの受け付け制御（アドミッション制御）
+
+待機・処理中のタスク数とコスト、一時ディレクトリの使用量、受信中のバイト数に上限を設け、
+超えた場合は新しい処理を 429 で断る。Retry-After は直近に完了したタスクから測った
+処理速度（タスク数・コスト・バイト数/秒）をもとに、上限を下回るまでの見込み秒数にする。
+コストはファイルの種類とサイズから見積もり、大きなPDFほど重く数える
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+from taskqueue import FINISHED_STATUSES, Task, TaskStatus, TaskStore
+
+# 種類ごとの1MBあたりのコスト（記載のない種類は default）
+DEFAULT_COST_PER_MB = {'default': 1.0}
+
+
+class AdmissionRejected(Exception):
+    """上限を超えたため受け付けられない（429で返す）"""
+    
+    def __init__(self, message: str, retry_after: int, reason: str):
+        self.message = message
+        self.retry_after = retry_after
+        self.reason = reason
+        super().__init__(message)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """APIレスポンス用の辞書"""
+        return {
+            'error': self.message,
+            'reason': self.reason,
+            'retry_after': self.retry_after
+        }
+
+
+def estimate_cost(
+    filename: Optional[str],
+    size: int,
+    cost_per_mb: Optional[Dict[str, float]] = None,
+    base_cost: float = 1.0
+) -> float:
+    """
+    変換コストを見積もる（1 = 小さなテキストファイル1件）
+    
+    Args:
+        filename: ファイル名（拡張子で種類を判定、Noneは種類不明）
+        size: ファイルサイズ（バイト）
+        cost_per_mb: 拡張子ごとの1MBあたりのコスト（"default" は記載のない種類）
+        base_cost: 1件あたりの固定コスト
+    
+    Returns:
+        float: 見積もりコスト
+    """
+    weights = cost_per_mb or DEFAULT_COST_PER_MB
+    extension = os.path.splitext(filename or '')[1][1:].lower()
+    per_mb = weights.get(extension, weights.get('default', 1.0))
+    return round(base_cost + per_mb * max(0, size) / (1024 * 1024), 3)
+
+
+class AdmissionController:
+    """キューの深さ・一時ディレクトリ・受信中バイト数の上限による受け付け制御"""
+    
+    def __init__(
+        self,
+        task_store: TaskStore,
+        temp_dir: str,
+        max_queued_tasks: int = 0,
+        max_queued_cost: float = 0,
+        max_temp_bytes: int = 0,
+        max_inflight_bytes: int = 0,
+        drain_window: float = 300,
+        retry_after_min: int = 1,
+        retry_after_max: int = 300,
+        retry_after_default: int = 30,
+        temp_scan_interval: float = 2.0,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        受け付け制御の初期化（上限は0で無効）
+        
+        Args:
+            task_store: 待機・処理中のタスクを数えるタスクストア
+            temp_dir: 使用量を監視する一時ディレクトリ
+            max_queued_tasks: 待機・処理中のタスク数の上限
+            max_queued_cost: 待機・処理中のタスクの見積もりコストの合計の上限
+            max_temp_bytes: 一時ディレクトリの使用量（受信中を含む）の上限
+            max_inflight_bytes: 同時に受信中のリクエスト本文の合計の上限
+            drain_window: 処理速度を測る期間（秒）
+            retry_after_min: Retry-After の最小秒数
+            retry_after_max: Retry-After の最大秒数
+            retry_after_default: 処理速度を測れていない場合の Retry-After 秒数
+            temp_scan_interval: 一時ディレクトリの使用量を再集計する間隔（秒）
+            logger: カスタムロガー（省略可）
+        """
+        self.task_store = task_store
+        self.temp_dir = temp_dir
+        self.max_queued_tasks = max_queued_tasks
+        self.max_queued_cost = max_queued_cost
+        self.max_temp_bytes = max_temp_bytes
+        self.max_inflight_bytes = max_inflight_bytes
+        self.drain_window = drain_window
+        self.retry_after_min = retry_after_min
+        self.retry_after_max = retry_after_max
+        self.retry_after_default = retry_after_default
+        self.temp_scan_interval = temp_scan_interval
+        self.logger = logger or logging.getLogger(__name__)
+        
+        self._lock = threading.Lock()
+        self._inflight_bytes = 0
+        # 完了したタスクの記録（完了時刻, コスト, バイト数）
+        self._finished: Deque[Tuple[float, float, int]] = deque()
+        self._temp_bytes = 0
+        self._temp_scanned_at = 0.0
+        self.rejected: Dict[str, int] = {}
+    
+    def check(self, cost: float, size: int = 0, count: int = 1) -> None:
+        """
+        タスクを追加できるか確認する
+        
+        Args:
+            cost: 追加するタスクの見積もりコスト（複数の場合は合計）
+            size: 追加で一時ディレクトリに書き込むバイト数（受信済みなら0）
+            count: 追加するタスク数（一括アップロード）
+        
+        Raises:
+            AdmissionRejected: いずれかの上限を超える場合
+        """
+        tasks, queued_cost = self._pending()
+        rates = self.drain_rates()
+        
+        if self.max_queued_tasks and tasks + count > self.max_queued_tasks:
+            self._reject(
+                'queue_depth',
+                '処理待ちのタスクが多すぎます',
+                (tasks + count - self.max_queued_tasks) / rates['tasks'] if rates['tasks'] else None
+            )
+        
+        if self.max_queued_cost and tasks and queued_cost + cost > self.max_queued_cost:
+            # 上限を超える大きなファイルでも、キューが空なら受け付ける
+            self._reject(
+                'queue_cost',
+                '処理待ちのタスクが多すぎます',
+                (queued_cost + cost - self.max_queued_cost) / rates['cost'] if rates['cost'] else None
+            )
+        
+        self._check_temp(size, rates)
+    
+    @contextmanager
+    def receiving(self, size: int) -> Iterator[None]:
+        """
+        リクエスト本文の受信中のバイト数を予約する（終了時に解放）
+        
+        Args:
+            size: 受信するバイト数（Content-Length）
+        
+        Raises:
+            AdmissionRejected: 受信中のバイト数か一時ディレクトリの上限を超える場合
+        """
+        size = max(0, size or 0)
+        with self._lock:
+            inflight = self._inflight_bytes
+        if self.max_inflight_bytes and inflight and inflight + size > self.max_inflight_bytes:
+            self._reject('inflight_bytes', '受信中のアップロードが多すぎます', None, self.retry_after_min)
+        self._check_temp(size, self.drain_rates())
+        
+        with self._lock:
+            self._inflight_bytes += size
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._inflight_bytes -= size
+    
+    def on_task_status(self, task: Task, previous_status: TaskStatus) -> None:
+        """
+        完了したタスクを処理速度の計測に記録（TaskQueueの状態変化リスナー）
+        
+        Args:
+            task: 状態が変化したタスク
+            previous_status: 変化前の状態
+        """
+        if task.parent_id is not None or task.status not in FINISHED_STATUSES:
+            return
+        if previous_status in FINISHED_STATUSES:
+            return
+        
+        now = time.monotonic()
+        with self._lock:
+            self._finished.append((now, task.cost, int(task.payload.get('source_size') or 0)))
+            self._trim(now)
+    
+    def drain_rates(self) -> Dict[str, float]:
+        """
+        直近に完了したタスクから測った処理速度
+        
+        Returns:
+            Dict[str, float]: 1秒あたりの tasks / cost / bytes（測れていない場合は0）
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            if len(self._finished) < 2:
+                return {'tasks': 0.0, 'cost': 0.0, 'bytes': 0.0}
+            
+            elapsed = max(now - self._finished[0][0], 1.0)
+            return {
+                'tasks': len(self._finished) / elapsed,
+                'cost': sum(cost for _, cost, _ in self._finished) / elapsed,
+                'bytes': sum(size for _, _, size in self._finished) / elapsed
+            }
+    
+    def temp_bytes(self) -> int:
+        """一時ディレクトリの使用量（一定間隔で再集計）"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._temp_scanned_at < self.temp_scan_interval:
+                return self._temp_bytes
+            self._temp_scanned_at = now
+        
+        total = _directory_size(self.temp_dir)
+        with self._lock:
+            self._temp_bytes = total
+        return total
+    
+    def stats(self) -> Dict[str, Any]:
+        """受け付け制御の統計情報を返す"""
+        tasks, queued_cost = self._pending()
+        with self._lock:
+            inflight = self._inflight_bytes
+            rejected = dict(self.rejected)
+        rates = self.drain_rates()
+        return {
+            'queued_tasks': tasks,
+            'queued_cost': round(queued_cost, 3),
+            'temp_bytes': self.temp_bytes(),
+            'inflight_bytes': inflight,
+            'limits': {
+                'max_queued_tasks': self.max_queued_tasks,
+                'max_queued_cost': self.max_queued_cost,
+                'max_temp_bytes': self.max_temp_bytes,
+                'max_inflight_bytes': self.max_inflight_bytes
+            },
+            'drain_rates': {key: round(value, 3) for key, value in rates.items()},
+            'rejected': rejected
+        }
+    
+    def _pending(self) -> Tuple[int, float]:
+        """待機・処理中のタスク数と見積もりコストの合計（サブタスクは分割元に含める）"""
+        tasks = [
+            task for task in self.task_store.by_status(TaskStatus.WAITING, TaskStatus.PROCESSING)
+            if task.parent_id is None
+        ]
+        return len(tasks), sum(task.cost for task in tasks)
+    
+    def _check_temp(self, size: int, rates: Dict[str, float]) -> None:
+        """一時ディレクトリの上限を確認"""
+        if not self.max_temp_bytes:
+            return
+        
+        with self._lock:
+            inflight = self._inflight_bytes
+        used = self.temp_bytes() + inflight
+        if used + size > self.max_temp_bytes:
+            self._reject(
+                'temp_bytes',
+                '一時ディレクトリの空きが不足しています',
+                (used + size - self.max_temp_bytes) / rates['bytes'] if rates['bytes'] else None
+            )
+    
+    def _reject(
+        self,
+        reason: str,
+        message: str,
+        seconds: Optional[float],
+        default: Optional[int] = None
+    ) -> None:
+        """Retry-After を計算して AdmissionRejected を送出"""
+        if seconds is None:
+            retry_after = default or self.retry_after_default
+        else:
+            retry_after = math.ceil(seconds)
+        retry_after = max(self.retry_after_min, min(self.retry_after_max, retry_after))
+        
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        self.logger.warning(f"受け付けを制限しました: {reason} (Retry-After: {retry_after}秒)")
+        raise AdmissionRejected(message, retry_after, reason)
+    
+    def _trim(self, now: float) -> None:
+        """計測期間を過ぎた完了記録を破棄（ロック取得済みで呼び出す）"""
+        while self._finished and now - self._finished[0][0] > self.drain_window:
+            self._finished.popleft()
+
+
+def _directory_size(path: str) -> int:
+    """ディレクトリ以下のファイルサイズの合計"""
+    total = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        total += _directory_size(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return total
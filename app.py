@@ -1,20 +1,56 @@
 import argparse
+import atexit
+import hashlib
 import logging
 import os
 import shutil
+import time
 import uuid
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+from typing import Any, Dict, List, Optional, Tuple
 
-from flask import (Flask, jsonify, redirect, render_template, request,
-                   send_from_directory, url_for)
+from flask import (Flask, Request, Response, jsonify, redirect,
+                   render_template, request, stream_with_context, url_for)
+from werkzeug.exceptions import ClientDisconnected
 
+from admission import AdmissionController, AdmissionRejected, estimate_cost
+from batches import UploadBatchError, UploadBatchManager
 # 設定ファイルのインポート
-from config import (ALLOWED_EXTENSIONS, DEFAULT_FOLDERS, OUTPUT_DIR, TEMP_DIR,
+from config import (ALLOWED_EXTENSIONS, CACHE_DIR, DEFAULT_FOLDERS, OUTPUT_DIR,
+                    PROFILE_DIR, SEARCH_INDEX_PATH, SHARED_QUEUE_PATH,
+                    TASK_ARCHIVE_PATH, TASK_JOURNAL_PATH, TEMP_DIR, UPLOAD_DIR,
                     Config)
-from handlers.conversion_handler import handle_conversion_task
+from folder_export import FolderExport, FolderExportError
+from folder_index import FolderIndex, FolderIndexError
+from markdown_preview import MarkdownPreview, MarkdownPreviewError
+from output_files import iter_file_range, prepare_output_response
+from handlers.archive import (ARCHIVE_MEMBER_TASK_TYPE,
+                              ARCHIVE_MERGE_TASK_TYPE,
+                              handle_archive_member_task)
+from handlers.conversion_cache import ConversionCache, get_conversion_cache
+from handlers.conversion_handler import (handle_archive_merge,
+                                         handle_conversion_merge,
+                                         handle_conversion_task,
+                                         handle_url_batch_merge)
+from handlers.converter_pool import (ConverterPool, init_converter_pool,
+                                     init_worker_process)
+from handlers.http_cache import get_http_cache
+from handlers.pdf_pages import (CONVERSION_MERGE_TASK_TYPE,
+                                PDF_PAGES_TASK_TYPE, handle_pdf_pages_task)
+from handlers.profiling import ProfiledHandler
+from handlers.url_batch import (URL_BATCH_MERGE_TASK_TYPE, URL_BATCH_TASK_TYPE,
+                                handle_url_batch_task)
 # taskqueueモジュールとハンドラのインポート
-from taskqueue import Task, TaskResult, TaskStatus, create_queue
+from search_index import MarkdownSearchIndex, SearchQueryError
+from singleflight import UrlSingleFlight, make_flight_key
+from sse import SSE_HEADERS, event_stream
+from taskqueue import (EXECUTOR_THREAD, FINISHED_STATUSES, ROLE_ALL, ROLE_WEB,
+                       EventBroker, FairScheduler, SharedQueueNode,
+                       SQLiteTaskBroker, SQLiteTaskJournal, Task, TaskResult,
+                       TaskHandler, TaskStatus, TaskStore, create_queue,
+                       stage_durations)
+from uploads import ReceivingFile, UploadManager, UploadSessionError
 
 
 def parse_arguments():
@@ -31,8 +67,21 @@ def parse_arguments():
     
     return parser.parse_args()
 
+class UploadRequest(Request):
+    """フォームで送られたファイルを一時ディレクトリに直接受信し、受信しながらSHA-256を計算するリクエスト"""
+    
+    def _get_file_stream(
+        self,
+        total_content_length: Optional[int],
+        content_type: Optional[str],
+        filename: Optional[str] = None,
+        content_length: Optional[int] = None
+    ) -> ReceivingFile:
+        return ReceivingFile(TEMP_DIR)
+
 # Flaskアプリケーションの初期化
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config.from_object(Config)
 
 # ロギングの設定
@@ -42,10 +91,61 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# タスク状態変化のイベント配信（/api/events）
+event_broker = EventBroker(
+    history=Config.SSE_HISTORY,
+    client_queue_size=Config.SSE_CLIENT_QUEUE_SIZE,
+    heartbeat_interval=Config.SSE_HEARTBEAT_INTERVAL,
+    logger=logger
+)
+
+# 分割アップロードのセッション管理（/api/uploads）
+upload_manager = UploadManager(
+    UPLOAD_DIR,
+    max_size=Config.MAX_UPLOAD_SIZE,
+    session_ttl=Config.UPLOAD_SESSION_TTL,
+    logger=logger
+)
+
+# 複数ファイルの一括アップロードの進捗集計（/api/batches）
+upload_batches = UploadBatchManager(
+    max_batches=Config.UPLOAD_BATCH_MAX,
+    ttl=Config.UPLOAD_BATCH_TTL,
+    logger=logger
+)
+
+# このプロセスのMarkItDownコンバータプール（スレッドで変換する場合のみ、setup_application で作成）
+converter_pool: Optional[ConverterPool] = None
+
+# タスクの永続化（setup_application で有効化）
+task_journal: Optional[SQLiteTaskJournal] = None
+
+# 共有キューのノード（setup_application で有効化）
+cluster: Optional[SharedQueueNode] = None
+
+# 同じURLの変換の相乗り（setup_application で有効化）
+url_flights: Optional[UrlSingleFlight] = None
+
+# 出力フォルダの一覧のインデックス（setup_application で出力ディレクトリを決めてから作成）
+folder_index: Optional[FolderIndex] = None
+
+# 変換したMarkdownの全文検索（setup_application で有効化）
+search_index: Optional[MarkdownSearchIndex] = None
+
+# Markdownのプレビュー（setup_application で出力ディレクトリを決めてから作成）
+markdown_preview: Optional[MarkdownPreview] = None
+
 # 変換タスクハンドラの登録用関数
-def setup_application(custom_output_dir=None):
-    """アプリケーションのセットアップを行う関数"""
-    global OUTPUT_DIR, task_queue, tasks_store
+def setup_application(custom_output_dir=None, role=ROLE_ALL):
+    """
+    アプリケーションのセットアップを行う関数
+    
+    Args:
+        custom_output_dir: 変換ファイルの保存先ディレクトリ（省略時は設定ファイルの値）
+        role: 共有キューでの役割（"all"=登録と実行、"web"=登録のみ、"worker"=実行のみ）
+              "all" 以外を指定すると設定によらず共有キューを使う
+    """
+    global OUTPUT_DIR, task_queue, admission, converter_pool, task_journal, cluster, url_flights, folder_index, search_index, markdown_preview
     
     # カスタム出力ディレクトリが指定された場合、グローバルの出力ディレクトリを更新
     if custom_output_dir:
@@ -61,19 +161,228 @@ def setup_application(custom_output_dir=None):
         folder_path = os.path.join(OUTPUT_DIR, folder)
         os.makedirs(folder_path, exist_ok=True)
     
+    # フォルダ一覧のインデックス（最初の参照時に読み込み、以降は変換の完了・フォルダの操作で更新）
+    folder_index = FolderIndex(
+        OUTPUT_DIR,
+        reconcile_interval=Config.FOLDER_INDEX_RECONCILE_INTERVAL,
+        max_dirs=Config.FOLDER_INDEX_MAX_DIRS,
+        logger=logger
+    )
+    
+    # Markdownのプレビュー（ページの区切りと変換結果はファイルの更新日時・サイズをキーにキャッシュ）
+    markdown_preview = MarkdownPreview(
+        OUTPUT_DIR,
+        ConversionCache(
+            os.path.join(CACHE_DIR, 'preview'),
+            Config.PREVIEW_CACHE_MAX_BYTES,
+            suffix='.preview',
+            name='プレビューのキャッシュ'
+        ),
+        page_bytes=Config.PREVIEW_PAGE_BYTES,
+        logger=logger
+    )
+    
+    # タスクストアの初期化（完了タスクは保持ポリシーに従って破棄・アーカイブ）
+    task_store = TaskStore(
+        max_finished=Config.TASK_RETENTION_MAX,
+        finished_ttl=Config.TASK_RETENTION_TTL,
+        archive_path=TASK_ARCHIVE_PATH,
+        logger=logger
+    )
+    
+    # 実行順のスケジューラ（フォルダ×クライアントごとのレーンで公平に実行）
+    # URLの一括変換のサブタスクは取得先のホストごとに同時実行数と開始間隔を制限する
+    scheduler = None
+    if Config.SCHEDULER_ENABLED:
+        scheduler = FairScheduler(
+            max_running=Config.MAX_WORKERS,
+            max_running_per_lane=Config.SCHEDULER_MAX_RUNNING_PER_LANE,
+            lane_keys=Config.SCHEDULER_LANE_KEYS,
+            weights=Config.SCHEDULER_FOLDER_WEIGHTS,
+            group_key='host',
+            max_running_per_group=Config.URL_BULK_MAX_PER_HOST,
+            group_interval=Config.URL_BULK_HOST_INTERVAL
+        )
+    
     # タスクキューの初期化
-    task_queue = create_queue(default_max_workers=4, auto_start=True, logger=logger)
+    task_queue = create_queue(
+        default_max_workers=Config.MAX_WORKERS,
+        auto_start=True,
+        logger=logger,
+        process_initializer=init_worker_process,
+        process_initargs=(Config.CONVERTER_OPTIONS,),
+        task_store=task_store,
+        scheduler=scheduler,
+        worker_max_tasks=Config.WORKER_MAX_TASKS,
+        worker_max_rss=Config.WORKER_MAX_RSS
+    )
+    
+    # MarkItDownコンバータプールの初期化（バックグラウンドでウォームアップ）
+    if Config.CONVERSION_EXECUTOR == EXECUTOR_THREAD and role != ROLE_WEB:
+        converter_pool = init_converter_pool(size=Config.MAX_WORKERS, options=Config.CONVERTER_OPTIONS)
+    
+    # 変換タスクハンドラの登録（タスクタイプごとの制限時間つき）
+    # Webノードはタスクを登録するだけで実行しないため、ハンドラーもワーカープロセスも用意しない
+    if role != ROLE_WEB:
+        timeouts = Config.TASK_TIMEOUTS
+        task_queue.register_handler('conversion', profiled(handle_conversion_task), executor=Config.CONVERSION_EXECUTOR, timeout=timeouts.get('conversion'))
+        
+        # 大きなPDFのページ範囲ごとの変換と、その結果の連結
+        task_queue.register_handler(PDF_PAGES_TASK_TYPE, profiled(handle_pdf_pages_task), executor=Config.CONVERSION_EXECUTOR, timeout=timeouts.get(PDF_PAGES_TASK_TYPE))
+        task_queue.register_handler(CONVERSION_MERGE_TASK_TYPE, profiled(handle_conversion_merge), executor=Config.CONVERSION_EXECUTOR, timeout=timeouts.get(CONVERSION_MERGE_TASK_TYPE))
+        
+        # ZIPのメンバーごとの変換と、その結果のまとめ
+        task_queue.register_handler(ARCHIVE_MEMBER_TASK_TYPE, profiled(handle_archive_member_task), executor=Config.CONVERSION_EXECUTOR, timeout=timeouts.get(ARCHIVE_MEMBER_TASK_TYPE))
+        task_queue.register_handler(ARCHIVE_MERGE_TASK_TYPE, profiled(handle_archive_merge), executor=Config.CONVERSION_EXECUTOR, timeout=timeouts.get(ARCHIVE_MERGE_TASK_TYPE))
+        
+        # URLの一括変換（一覧・サイトマップの展開はI/O待ちのためスレッドで実行）
+        task_queue.register_handler(URL_BATCH_TASK_TYPE, handle_url_batch_task, executor=EXECUTOR_THREAD, timeout=timeouts.get(URL_BATCH_TASK_TYPE))
+        task_queue.register_handler(URL_BATCH_MERGE_TASK_TYPE, handle_url_batch_merge, executor=EXECUTOR_THREAD, timeout=timeouts.get(URL_BATCH_MERGE_TASK_TYPE))
     
-    # 変換タスクハンドラの登録
-    task_queue.register_handler('conversion', handle_conversion_task)
+    # タスクの状態変化をイベントとして配信
+    task_queue.add_listener(publish_task_event)
     
-    # タスクのストレージ（本番ではDBにするべき）
-    tasks_store = {}
+    # キャンセル・タイムアウトしたタスクの一時ファイルを削除
+    task_queue.add_listener(remove_abandoned_source)
+    
+    # 同じURLの変換は実行中・鮮度内の変換に相乗りさせる
+    if Config.URL_DEDUP_ENABLED:
+        url_flights = UrlSingleFlight(
+            publish=task_queue.apply_external,
+            resubmit=submit_task,
+            freshness=Config.URL_DEDUP_FRESHNESS,
+            max_entries=Config.URL_DEDUP_MAX_ENTRIES,
+            logger=logger
+        )
+        task_queue.add_listener(url_flights.on_task_status)
+    
+    # 一括アップロードのバッチごとの件数の集計
+    task_queue.add_listener(upload_batches.on_task_status)
+    
+    # 完了した変換の出力ファイルをフォルダ一覧に反映
+    task_queue.add_listener(folder_index.on_task_status)
+    
+    # 完了した変換の出力ファイルを全文検索に登録（起動時に出力ディレクトリと突き合わせる）
+    if Config.SEARCH_INDEX_ENABLED:
+        search_index = MarkdownSearchIndex(
+            SEARCH_INDEX_PATH,
+            OUTPUT_DIR,
+            flush_interval=Config.SEARCH_FLUSH_INTERVAL,
+            reconcile_interval=Config.SEARCH_RECONCILE_INTERVAL,
+            max_document_bytes=Config.SEARCH_MAX_DOCUMENT_BYTES,
+            short_term_scan_limit=Config.SEARCH_SHORT_TERM_SCAN_LIMIT,
+            logger=logger
+        )
+        task_queue.add_listener(search_index.on_task_status)
+        atexit.register(search_index.close)
+    
+    # 受け付け制御（完了したタスクから処理速度を測り、Retry-After の計算に使う）
+    admission = AdmissionController(
+        task_store,
+        TEMP_DIR,
+        max_queued_tasks=Config.ADMISSION_MAX_QUEUED_TASKS,
+        max_queued_cost=Config.ADMISSION_MAX_QUEUED_COST,
+        max_temp_bytes=Config.ADMISSION_MAX_TEMP_BYTES,
+        max_inflight_bytes=Config.ADMISSION_MAX_INFLIGHT_BYTES,
+        drain_window=Config.ADMISSION_DRAIN_WINDOW,
+        retry_after_max=Config.ADMISSION_RETRY_AFTER_MAX,
+        logger=logger
+    )
+    task_queue.add_listener(admission.on_task_status)
+    
+    if Config.SHARED_QUEUE_ENABLED or role != ROLE_ALL:
+        # 共有キュー（Webノードは登録のみ、ワーカーノードはリースを取得して実行し、全ノードの状態を取り込む）
+        # 未完了のタスクは共有キューに残るため、ジャーナルによる復元は行わない
+        broker = SQLiteTaskBroker(
+            SHARED_QUEUE_PATH,
+            lease_ttl=Config.SHARED_QUEUE_LEASE_TTL,
+            max_attempts=Config.SHARED_QUEUE_MAX_ATTEMPTS,
+            max_finished=Config.TASK_RETENTION_MAX,
+            logger=logger
+        )
+        cluster = SharedQueueNode(
+            broker,
+            task_queue,
+            role=role,
+            capacity=Config.MAX_WORKERS,
+            poll_interval=Config.SHARED_QUEUE_POLL_INTERVAL,
+            heartbeat_interval=Config.SHARED_QUEUE_HEARTBEAT_INTERVAL,
+            prepare=lambda task: setattr(task, 'callback', make_task_callback(str(task.id))),
+            logger=logger
+        )
+        cluster.start()
+        atexit.register(cluster.stop)
+    
+    # タスクの永続化（状態変化をまとめて書き込み、前回の未完了タスクを再実行する）
+    elif Config.TASK_JOURNAL_ENABLED:
+        task_journal = SQLiteTaskJournal(
+            TASK_JOURNAL_PATH,
+            flush_interval=Config.TASK_JOURNAL_FLUSH_INTERVAL,
+            max_finished=Config.TASK_RETENTION_MAX,
+            logger=logger
+        )
+        task_queue.add_listener(task_journal.record)
+        atexit.register(task_journal.close)
+        recover_tasks(task_journal)
     
     logger.info("アプリケーションのセットアップが完了しました")
 
-# タスクのストレージ（本番ではDBにするべき）
-tasks_store: Dict[str, Dict[str, Any]] = {}
+def recover_tasks(journal: SQLiteTaskJournal) -> None:
+    """
+    前回の実行で記録したタスクを復元する
+    
+    完了タスクは一覧に戻し、待機中・処理中だったタスクは一時ファイルが残っていれば最初から再実行する
+    
+    Args:
+        journal: タスクのジャーナル
+    """
+    unfinished, finished = journal.load()
+    for task in finished:
+        task_queue.store.add(task)
+    
+    resumed = 0
+    for task in unfinished:
+        previous = task.status
+        task.status = TaskStatus.WAITING
+        task.started_at = None
+        task.progress = None
+        
+        if task.payload.get('source_type') == 'file':
+            source_path = task.payload.get('source_path')
+            
+            # 中断した分割変換の部分ファイルは作り直す
+            if source_path:
+                for parts_dir in (f"{source_path}.pages", f"{source_path}.members"):
+                    shutil.rmtree(parts_dir, ignore_errors=True)
+            
+            if not source_path or not os.path.exists(source_path):
+                task.status = TaskStatus.ERROR
+                task.finished_at = datetime.now()
+                task.error_message = '再起動前の一時ファイルが見つからないため再実行できませんでした'
+                task_queue.store.add(task)
+                journal.record(task, previous)
+                continue
+        
+        task.callback = make_task_callback(str(task.id))
+        task_queue.add_task(task)
+        resumed += 1
+    
+    if unfinished or finished:
+        logger.info(f"タスクを復元しました: 再実行 {resumed}件 / 再実行不可 {len(unfinished) - resumed}件 / 完了 {len(finished)}件")
+
+def profiled(handler: TaskHandler) -> TaskHandler:
+    """
+    プロファイルが有効な場合、しきい値以上の時間がかかった実行のプロファイルを保存するようハンドラーを包む
+    
+    Args:
+        handler: タスクハンドラー
+        
+    Returns:
+        TaskHandler: 登録するハンドラー（無効な場合はそのまま）
+    """
+    if not Config.PROFILE_ENABLED:
+        return handler
+    return ProfiledHandler(handler, Config.PROFILE_THRESHOLD, PROFILE_DIR)
 
 def allowed_file(filename: str) -> bool:
     """
@@ -87,68 +396,190 @@ def allowed_file(filename: str) -> bool:
     """
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/')
-def index():
-    """メインページの表示"""
-    # フォルダ一覧を取得してテンプレートにレンダリング
-    folders = get_folders()
-    return render_template('index.html', folders=folders, output_dir=OUTPUT_DIR)
-
-@app.route('/api/upload', methods=['POST'])
-def upload_file():
-    """ファイルアップロード処理API"""
-    # ファイルの存在確認
-    if 'file' not in request.files:
-        return jsonify({'error': 'ファイルがアップロードされていません'}), 400
+def save_upload(file, temp_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    アップロードファイルを一時ファイルとして保存し、SHA-256を返す
+    受信しながら一時ディレクトリに書き込んだファイル（UploadRequest）は移すだけで読み直さない。
+    それ以外はチャンク単位で書き込みながら計算する
     
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'ファイルが選択されていません'}), 400
+    Args:
+        file: アップロードされたファイル（FileStorage）
+        temp_path: 保存先のパス
+        chunk_size: 1回に読み込むバイト数
+        
+    Returns:
+        str: ファイル内容のSHA-256（16進文字列）
+    """
+    if isinstance(file.stream, ReceivingFile):
+        return file.stream.keep(temp_path)
     
-    # ファイル種別チェック
-    if not allowed_file(file.filename):
-        return jsonify({'error': 'このファイル形式はサポートされていません'}), 400
+    digest = hashlib.sha256()
+    with open(temp_path, 'wb') as f:
+        while True:
+            chunk = file.stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+def estimate_file_cost(filename: str, size: int) -> float:
+    """ファイル変換の見積もりコスト（種類ごとの重み×サイズ）"""
+    return estimate_cost(filename, size, Config.ADMISSION_COST_PER_MB)
+
+def admission_response(error: AdmissionRejected) -> Response:
+    """受け付けを制限した場合のレスポンス（429 と Retry-After）"""
+    response = jsonify(error.to_dict())
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def make_temp_path(filename: str) -> str:
+    """アップロードファイルを保存する一時ファイルのパスを作成"""
+    return os.path.join(TEMP_DIR, str(uuid.uuid4()) + '_' + filename)
+
+def remove_temp_files(paths: List[str]) -> None:
+    """タスクにしなかった一時ファイルを削除する（存在しないものは無視）"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"一時ファイルを削除できませんでした: {path} ({e})")
+
+def parse_priority(value: Any) -> int:
+    """リクエストで指定された優先度を許可範囲に収める（不正な値は0）"""
+    try:
+        priority = int(value)
+    except (TypeError, ValueError):
+        return 0
+    return max(Config.TASK_PRIORITY_MIN, min(Config.TASK_PRIORITY_MAX, priority))
+
+def enqueue_file_conversion(
+    filename: str,
+    temp_path: str,
+    folder: str,
+    source_sha256: Optional[str] = None,
+    client_ip: Optional[str] = None,
+    priority: int = 0,
+    batch_id: Optional[str] = None,
+    timings: Optional[Dict[str, float]] = None
+) -> str:
+    """
+    一時ファイルに保存済みのアップロードファイルの変換タスクを追加
+    
+    Args:
+        filename: 元のファイル名
+        temp_path: 一時ファイルのパス
+        folder: 保存先フォルダ
+        source_sha256: ファイル内容のSHA-256（変換キャッシュに使用）
+        client_ip: アップロード元のIPアドレス（スケジューラのレーンに使用）
+        priority: タスクの優先度
+        batch_id: 一括アップロードのバッチID（進捗をバッチ単位で集計する）
+        timings: アップロードの段階ごとの時刻（upload_started, upload_saved）
+        
+    Returns:
+        str: 追加したタスクのID
+    """
+    task = make_file_task(filename, temp_path, folder, source_sha256, client_ip, priority, batch_id, timings)
+    submit_task(task)
+    return str(task.id)
+
+def make_file_task(
+    filename: str,
+    temp_path: str,
+    folder: str,
+    source_sha256: Optional[str] = None,
+    client_ip: Optional[str] = None,
+    priority: int = 0,
+    batch_id: Optional[str] = None,
+    timings: Optional[Dict[str, float]] = None
+) -> Task:
+    """
+    一時ファイルに保存済みのアップロードファイルの変換タスクを作成（キューには追加しない）
     
-    # 保存先フォルダの取得
-    folder = request.form.get('folder', 'default')
+    Args:
+        enqueue_file_conversion と同じ
+        
+    Returns:
+        Task: 作成したタスク（バッチIDを指定した場合はバッチに追加済み）
+    """
     folder_path = os.path.join(OUTPUT_DIR, folder)
     
     # フォルダの存在確認
     if not os.path.exists(folder_path):
         os.makedirs(folder_path, exist_ok=True)
     
-    # 一時ファイルに保存
-    temp_filename = str(uuid.uuid4()) + '_' + file.filename
-    temp_path = os.path.join(TEMP_DIR, temp_filename)
-    file.save(temp_path)
-    
-    # タスクの作成と追加
+    source_size = os.path.getsize(temp_path)
     task_id = str(uuid.uuid4())
     task = Task(
         id=uuid.UUID(task_id),
         type='conversion',
-        name=f"{file.filename} の変換",
+        name=f"{filename} の変換",
         payload={
             'source_type': 'file',
             'source_path': temp_path,
-            'filename': file.filename,
+            'source_sha256': source_sha256,
+            'source_size': source_size,
+            'filename': filename,
             'folder': folder,
-            'output_dir': folder_path
-        }
+            'client_ip': client_ip,
+            'output_dir': folder_path,
+            'output_root': OUTPUT_DIR,
+            'batch_id': batch_id
+        },
+        priority=priority,
+        cost=estimate_file_cost(filename, source_size),
+        timings=dict(timings or {})
     )
     
-    task_queue.add_task(task)
+    # コールバックを設定（完了前に設定されるようキュー追加前に行う）
+    task.callback = make_task_callback(task_id)
     
-    # タスク情報の保存
-    tasks_store[task_id] = {
-        'id': task_id,
-        'added_at': datetime.now().isoformat(),
-        'filename': file.filename,
-        'status': TaskStatus.WAITING,
-        'folder': folder
-    }
+    # バッチの件数にも登録前に加える（登録直後の状態変化を取りこぼさない）
+    if batch_id is not None:
+        upload_batches.add_task(batch_id, task, source_size)
+    return task
+
+def submit_task(task: Task) -> Task:
+    """
+    タスクをキューに登録する（共有キューを使う場合は共有キューに登録し、いずれかのワーカーが実行する）
+    
+    Args:
+        task: 登録するタスク
     
-    # タスクのコールバック設定
+    Returns:
+        Task: 登録したタスク
+    """
+    if cluster is not None:
+        return cluster.enqueue(task)
+    return task_queue.add_task(task)
+
+def submit_tasks(tasks: List[Task]) -> List[Task]:
+    """
+    複数のタスクをまとめてキューに登録する（共有キューには1つのトランザクションで登録）
+    
+    Args:
+        tasks: 登録するタスク
+    
+    Returns:
+        List[Task]: 登録したタスク
+    """
+    if cluster is not None:
+        return cluster.enqueue_many(tasks)
+    return [task_queue.add_task(task) for task in tasks]
+
+def make_task_callback(task_id: str):
+    """
+    変換タスク完了時のコールバックを作成
+    
+    Args:
+        task_id: 対象のタスクID
+        
+    Returns:
+        タスク結果を受け取るコールバック関数
+    """
     def task_callback(task_result):
         if task_result and task_result.success and task_result.result:
             try:
@@ -164,15 +595,220 @@ def upload_file():
                         # 絶対パスの場合は相対パスに変換
                         relative_path = os.path.relpath(output_path, OUTPUT_DIR).replace('\\', '/')
                     
-                    # タスク情報に出力パスを追加
-                    if task_id in tasks_store:
-                        tasks_store[task_id]['output_path'] = relative_path
-                        logger.info(f"タスク {task_id} の出力パスを設定: {relative_path}")
+                    # タスク結果の出力パスを相対パスに揃える
+                    task_result.result['output_path'] = relative_path
+                    logger.info(f"タスク {task_id} の出力パスを設定: {relative_path}")
+                
+                # 変換キャッシュのヒット/ミスを記録（ワーカープロセスで実行された場合も親で集計）
+                if isinstance(task_result.result, dict) and task_result.result.get('cache_hit') is not None:
+                    get_conversion_cache().record(task_result.result['cache_hit'])
+                
+                # URLの取得結果（条件付き再取得・Markdownの再利用）も同様に記録
+                if isinstance(task_result.result, dict) and task_result.result.get('http_cache'):
+                    get_http_cache().record(task_result.result['http_cache'])
             except Exception as e:
                 logger.error(f"タスク結果処理エラー: {str(e)}")
     
-    # コールバックを設定
-    task.callback = task_callback
+    return task_callback
+
+def remove_abandoned_source(task: Task, previous_status: TaskStatus) -> None:
+    """
+    キャンセル・エラーで終わったファイル変換の一時ファイルを削除（TaskQueueの状態変化リスナー）
+    強制終了したワーカーは後片付けできないため、分割用の部分ファイルもここで消す
+    
+    Args:
+        task: 状態が変化したタスク
+        previous_status: 変化前の状態
+    """
+    if task.parent_id is not None or task.status not in (TaskStatus.CANCELED, TaskStatus.ERROR):
+        return
+    if previous_status in FINISHED_STATUSES or task.payload.get('source_type') != 'file':
+        return
+    
+    source_path = task.payload.get('source_path')
+    if not source_path:
+        return
+    
+    # スレッドで実行中のハンドラー（サブタスクを含む）が読み込み中のことがあるため、終了を待ってから削除する
+    if not task_queue.after_handlers(task.id, lambda: remove_source_files(source_path)):
+        remove_source_files(source_path)
+
+def remove_source_files(source_path: str) -> None:
+    """
+    変換元の一時ファイルと、分割用の部分ファイルを削除
+    
+    Args:
+        source_path: 変換元の一時ファイルのパス
+    """
+    for parts_dir in (f"{source_path}.pages", f"{source_path}.members"):
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    try:
+        os.remove(source_path)
+        logger.info(f"元ファイル削除: {source_path}")
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"元ファイルを削除できませんでした: {source_path} - {str(e)}")
+
+def publish_task_event(task: Task, previous_status: TaskStatus) -> None:
+    """
+    タスクの状態変化をSSEクライアントに配信（TaskQueueの状態変化リスナー）
+    
+    Args:
+        task: 状態が変化したタスク
+        previous_status: 変化前の状態（進捗のみの更新では現在の状態と同じ）
+    """
+    # サブタスクは分割元の進捗として配信する（ZIPのメンバーは分割元のメンバーごとの状態を更新）
+    if task.parent_id is not None:
+        parent = task_queue.get_task(task.parent_id)
+        if parent is None or 'member' not in task.payload:
+            return
+        task_queue.store.touch(parent)
+        task, previous_status = parent, parent.status
+    
+    timing: Dict[str, Any] = {
+        'started_at': task.started_at.isoformat() if task.started_at else None,
+        'finished_at': task.finished_at.isoformat() if task.finished_at else None
+    }
+    if task.started_at:
+        timing['wait_ms'] = int((task.started_at - task.created_at).total_seconds() * 1000)
+        if task.finished_at:
+            timing['duration_ms'] = int((task.finished_at - task.started_at).total_seconds() * 1000)
+    
+    event_broker.publish('task', {
+        'task': task_to_info(task),
+        'previous_status': previous_status,
+        'timing': timing,
+        'version': task_queue.store.version
+    })
+
+def task_to_info(task: Task) -> Dict[str, Any]:
+    """
+    タスクをAPIレスポンス用の辞書に変換
+    
+    Args:
+        task: 変換するタスク
+        
+    Returns:
+        Dict[str, Any]: タスク情報
+    """
+    payload = task.payload or {}
+    task_info = {
+        'id': str(task.id),
+        'added_at': task.created_at.isoformat(),
+        'filename': payload.get('filename') or payload.get('url') or task.name,
+        'status': task.status,
+        'folder': payload.get('folder', 'default'),
+        'priority': task.priority
+    }
+    
+    # 待機中のタスクはレーン内の待ち順位
+    if task.status == TaskStatus.WAITING and task_queue.scheduler is not None:
+        position = task_queue.scheduler.position(task.id)
+        if position is not None:
+            task_info['queue_position'] = position
+    
+    if isinstance(task.result, dict) and task.result.get('output_path'):
+        task_info['output_path'] = task.result['output_path']
+    
+    if task.error_message:
+        task_info['error'] = task.error_message
+    
+    # 一括アップロードのタスクはバッチID
+    if payload.get('batch_id'):
+        task_info['batch_id'] = payload['batch_id']
+    
+    # 同じURLの変換に相乗りしたタスクは相乗り先のタスクID
+    if payload.get('coalesced_with'):
+        task_info['coalesced_with'] = payload['coalesced_with']
+    
+    if task.progress:
+        task_info['progress'] = task.progress
+    
+    # 段階ごとの時刻（UNIX時間）と所要時間（秒）、実行時の計測値（CPU時間・RSS・入出力のバイト数）
+    if task.timings:
+        task_info['timings'] = task.timings
+        task_info['durations'] = stage_durations(task.timings)
+    if task.metrics:
+        task_info['metrics'] = task.metrics
+    
+    # ZIPのメンバーごとの状態（完了後はまとめた結果、処理中はサブタスクから作成）
+    if isinstance(task.result, dict) and task.result.get('members'):
+        task_info['members'] = task.result['members']
+    else:
+        members = sorted(
+            (child for child in task_queue.store.children(task.id) if 'member' in child.payload),
+            key=lambda child: child.payload.get('member_index', 0)
+        )
+        if members:
+            task_info['members'] = [
+                {'name': child.payload['member'], 'status': child.status, 'error': child.error_message}
+                for child in members
+            ]
+    
+    # URLの一括変換の集計（完了後はまとめた結果、処理中は進捗から求めた処理速度）
+    if isinstance(task.result, dict) and task.result.get('summary'):
+        task_info['summary'] = task.result['summary']
+        task_info['pages'] = task.result.get('pages', [])
+    elif task.type == URL_BATCH_TASK_TYPE and task.progress and task.started_at:
+        elapsed = max((datetime.now() - task.started_at).total_seconds(), 1e-6)
+        task_info['summary'] = {
+            'done': task.progress['done'],
+            'total': task.progress['total'],
+            'elapsed': round(elapsed, 3),
+            'urls_per_sec': round(task.progress['done'] / elapsed, 3)
+        }
+    
+    return task_info
+
+@app.route('/')
+def index():
+    """メインページの表示"""
+    # フォルダ一覧を取得してテンプレートにレンダリング
+    folders = get_folders()
+    return render_template('index.html', folders=folders, output_dir=OUTPUT_DIR)
+
+@app.route('/api/upload', methods=['POST'])
+def upload_file():
+    """ファイルアップロード処理API"""
+    upload_started = time.time()
+    try:
+        # 受信中のバイト数と一時ディレクトリの上限を確認してから本文を読み込む
+        with admission.receiving(request.content_length or 0):
+            # ファイルの存在確認
+            if 'file' not in request.files:
+                return jsonify({'error': 'ファイルがアップロードされていません'}), 400
+            
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({'error': 'ファイルが選択されていません'}), 400
+            
+            # ファイル種別チェック
+            if not allowed_file(file.filename):
+                return jsonify({'error': 'このファイル形式はサポートされていません'}), 400
+            
+            # 処理待ちのタスク数・コストの上限を確認（一時ファイルに保存する前に断る）
+            admission.check(estimate_file_cost(file.filename, request.content_length or 0))
+            
+            # 保存先フォルダの取得
+            folder = request.form.get('folder', 'default')
+            
+            # 一時ファイルに保存
+            temp_path = make_temp_path(file.filename)
+            source_sha256 = save_upload(file, temp_path)
+    except AdmissionRejected as e:
+        return admission_response(e)
+    
+    # タスクの作成と追加
+    task_id = enqueue_file_conversion(
+        file.filename,
+        temp_path,
+        folder,
+        source_sha256,
+        client_ip=request.remote_addr,
+        priority=parse_priority(request.form.get('priority')),
+        timings={'upload_started': upload_started, 'upload_saved': time.time()}
+    )
     
     return jsonify({
         'task_id': task_id,
@@ -180,6 +816,297 @@ def upload_file():
         'message': 'ファイルがアップロードされ、処理キューに追加されました'
     })
 
+def read_request_stream(chunk_size: int = 1024 * 1024):
+    """リクエスト本文を少しずつ読み込むジェネレータ"""
+    while True:
+        data = request.stream.read(chunk_size)
+        if not data:
+            break
+        yield data
+
+def parse_upload_offset(value: Optional[str]) -> int:
+    """
+    チャンクの開始位置を解析
+    
+    Raises:
+        UploadSessionError: 数値でない場合
+    """
+    if value is None or not value.isdigit():
+        raise UploadSessionError('Upload-Offsetヘッダーが必要です')
+    return int(value)
+
+def finalize_upload(
+    upload_id: str,
+    client_ip: Optional[str] = None,
+    priority: int = 0,
+    batch_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    分割アップロードを完了して変換タスクを追加
+    
+    Args:
+        upload_id: セッションID
+        client_ip: アップロード元のIPアドレス
+        priority: タスクの優先度
+        batch_id: 一括アップロードのバッチID（大きなファイルを分割アップロードで送った場合）
+        
+    Returns:
+        Dict[str, Any]: APIレスポンス
+    
+    Raises:
+        UploadBatchError: バッチが存在しない場合
+    """
+    session = upload_manager.get(upload_id)
+    if batch_id is not None:
+        upload_batches.get(batch_id)
+    
+    # キューが空くまでは完了させない（セッションは残るため、Retry-After 後に再度完了できる）
+    admission.check(estimate_file_cost(session.filename, session.size))
+    
+    temp_path = make_temp_path(session.filename)
+    session = upload_manager.finalize(upload_id, temp_path)
+    task_id = enqueue_file_conversion(
+        session.filename,
+        temp_path,
+        session.folder,
+        session.digest.hexdigest(),
+        client_ip=client_ip,
+        priority=priority,
+        batch_id=batch_id,
+        timings={'upload_started': session.created_at.timestamp(), 'upload_saved': time.time()}
+    )
+    
+    return {
+        'task_id': task_id,
+        'status': TaskStatus.WAITING,
+        'sha256': session.digest.hexdigest(),
+        'message': 'ファイルがアップロードされ、処理キューに追加されました'
+    }
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """分割アップロードの開始API"""
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename', '')
+    size = data.get('size')
+    
+    if filename == '':
+        return jsonify({'error': 'ファイル名が指定されていません'}), 400
+    if not allowed_file(filename):
+        return jsonify({'error': 'このファイル形式はサポートされていません'}), 400
+    if not isinstance(size, int):
+        return jsonify({'error': 'ファイルサイズが指定されていません'}), 400
+    
+    try:
+        # 受信を始める前に、キューと一時ディレクトリに余裕があるか確認
+        admission.check(estimate_file_cost(filename, size), size)
+        session = upload_manager.create(filename, size, data.get('folder', 'default'), data.get('sha256'))
+    except AdmissionRejected as e:
+        return admission_response(e)
+    except UploadSessionError as e:
+        return jsonify(e.to_dict()), e.status
+    
+    response = session.to_dict()
+    response['chunk_size'] = Config.UPLOAD_CHUNK_SIZE
+    return jsonify(response), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """分割アップロードの状態取得API（再開時に受信済みのオフセットを確認する）"""
+    try:
+        return jsonify(upload_manager.get(upload_id).to_dict())
+    except UploadSessionError as e:
+        return jsonify(e.to_dict()), e.status
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """チャンクの送信API（本文をそのまま Upload-Offset の位置から書き込む）"""
+    try:
+        offset = parse_upload_offset(request.headers.get('Upload-Offset'))
+        with admission.receiving(request.content_length or 0):
+            new_offset = upload_manager.write_chunk(
+                upload_id,
+                offset,
+                read_request_stream(),
+                request.headers.get('X-Chunk-Sha256')
+            )
+    except AdmissionRejected as e:
+        return admission_response(e)
+    except UploadSessionError as e:
+        return jsonify(e.to_dict()), e.status
+    
+    return jsonify({'upload_id': upload_id, 'offset': new_offset})
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def complete_upload(upload_id):
+    """分割アップロードの完了API（検証後に変換タスクを追加）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        return jsonify(finalize_upload(
+            upload_id,
+            request.remote_addr,
+            parse_priority(data.get('priority')),
+            data.get('batch_id')
+        ))
+    except AdmissionRejected as e:
+        return admission_response(e)
+    except (UploadSessionError, UploadBatchError) as e:
+        return jsonify(e.to_dict()), e.status
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    """分割アップロードの中止API"""
+    try:
+        upload_manager.abort(upload_id)
+    except UploadSessionError as e:
+        return jsonify(e.to_dict()), e.status
+    
+    return jsonify({'message': 'アップロードを中止しました'})
+
+def parse_count(value: Any) -> Optional[int]:
+    """リクエストで指定された件数・バイト数（不正な値はNone）"""
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        return None
+    return count if count >= 0 else None
+
+def enqueue_batch_files(
+    files: List[Tuple[str, str, str]],
+    rejected: List[Tuple[str, str]],
+    fields: Dict[str, Any],
+    client_ip: Optional[str] = None,
+    upload_started: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    一括アップロードで受信したファイルの変換タスクをまとめて追加
+    
+    Args:
+        files: 一時ファイルに保存したファイルの (ファイル名, 一時ファイルのパス, SHA-256)
+        rejected: 受け付けなかったファイルの (ファイル名, エラーメッセージ)
+        fields: フォームの項目（batch_id を指定すると既存のバッチに追加、省略時は folder で新しいバッチを作成）
+        client_ip: アップロード元のIPアドレス
+        upload_started: リクエストの受信を開始した時刻（UNIX時間、タスクの段階ごとの時刻に記録）
+        
+    Returns:
+        Dict[str, Any]: APIレスポンス
+    
+    Raises:
+        AdmissionRejected: 処理待ちのタスクが多すぎる場合（受信した一時ファイルは削除する）
+        UploadBatchError: 指定したバッチが存在しない場合（同上）
+    """
+    try:
+        batch = upload_batches.get(fields['batch_id']) if fields.get('batch_id') else None
+        # 処理待ちのタスク数・コストの上限は、バッチのファイル数とコストの合計で確認する
+        admission.check(
+            sum(estimate_file_cost(filename, os.path.getsize(temp_path)) for filename, temp_path, _ in files),
+            count=max(1, len(files))
+        )
+    except (AdmissionRejected, UploadBatchError):
+        remove_temp_files([temp_path for _, temp_path, _ in files])
+        raise
+    
+    if batch is None:
+        batch = upload_batches.create(
+            fields.get('folder') or 'default',
+            parse_count(fields.get('expected_files')),
+            parse_count(fields.get('expected_bytes'))
+        )
+    for filename, message in rejected:
+        upload_batches.reject(batch.id, filename, message)
+    
+    priority = parse_priority(fields.get('priority'))
+    timings = {'upload_started': upload_started, 'upload_saved': time.time()} if upload_started else None
+    tasks = [
+        make_file_task(filename, temp_path, batch.folder, source_sha256, client_ip, priority, batch.id, timings)
+        for filename, temp_path, source_sha256 in files
+    ]
+    submit_tasks(tasks)
+    
+    return {
+        'batch_id': batch.id,
+        'tasks': [{'task_id': str(task.id), 'filename': task.payload['filename']} for task in tasks],
+        'rejected': [{'filename': filename, 'error': message} for filename, message in rejected],
+        'batch': batch.to_dict(),
+        'message': f"{len(tasks)}個のファイルがアップロードされ、処理キューに追加されました"
+    }
+
+@app.route('/api/upload/batch', methods=['POST'])
+def upload_batch():
+    """複数ファイルの一括アップロードAPI（file を複数指定、batch_id で既存のバッチに追加）"""
+    upload_started = time.time()
+    files: List[Tuple[str, str, str]] = []
+    rejected: List[Tuple[str, str]] = []
+    try:
+        # 受信中のバイト数と一時ディレクトリの上限を確認してから本文を読み込む
+        with admission.receiving(request.content_length or 0):
+            uploads = request.files.getlist('file')
+            if not uploads:
+                return jsonify({'error': 'ファイルがアップロードされていません'}), 400
+            if len(uploads) > Config.UPLOAD_BATCH_MAX_FILES:
+                return jsonify({'error': f'一度にアップロードできるファイルは{Config.UPLOAD_BATCH_MAX_FILES}個までです'}), 413
+            
+            # 未対応の形式のファイルはバッチ全体を断らずに読み飛ばす
+            for file in uploads:
+                if file.filename == '' or not allowed_file(file.filename):
+                    rejected.append((file.filename, 'このファイル形式はサポートされていません'))
+                    continue
+                temp_path = make_temp_path(file.filename)
+                try:
+                    files.append((file.filename, temp_path, save_upload(file, temp_path)))
+                except (OSError, ClientDisconnected):
+                    # 途中まで書き込んだファイルと、保存済みのファイルを残さない
+                    remove_temp_files([temp_path] + [path for _, path, _ in files])
+                    raise
+        
+        return jsonify(enqueue_batch_files(files, rejected, request.form, request.remote_addr, upload_started))
+    except AdmissionRejected as e:
+        return admission_response(e)
+    except UploadBatchError as e:
+        return jsonify(e.to_dict()), e.status
+    except OSError as e:
+        logger.error(f"一括アップロードのファイルを保存できませんでした: {e}")
+        return jsonify({'error': 'アップロードされたファイルを保存できませんでした'}), 500
+
+@app.route('/api/batches', methods=['POST'])
+def create_batch():
+    """一括アップロードのバッチの作成API（複数のリクエストや分割アップロードに分けて送る場合に先に作成する）"""
+    data = request.get_json(silent=True) or {}
+    batch = upload_batches.create(
+        data.get('folder') or 'default',
+        parse_count(data.get('expected_files')),
+        parse_count(data.get('expected_bytes'))
+    )
+    return jsonify(batch.to_dict()), 201
+
+@app.route('/api/batches/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    """一括アップロードの状態（件数・バイト数・処理速度・残り時間）の取得API"""
+    try:
+        return jsonify(upload_batches.get(batch_id).to_dict())
+    except UploadBatchError as e:
+        return jsonify(e.to_dict()), e.status
+
+@app.route('/api/batches/<batch_id>', methods=['DELETE'])
+def cancel_batch(batch_id):
+    """一括アップロードの未完了のタスクをすべてキャンセルするAPI"""
+    try:
+        task_ids = upload_batches.task_ids(batch_id)
+    except UploadBatchError as e:
+        return jsonify(e.to_dict()), e.status
+    
+    cancelled = 0
+    for task_id in task_ids:
+        queue_task = task_queue.get_task(task_id)
+        if queue_task is not None and queue_task.status not in FINISHED_STATUSES and cancel_queue_task(queue_task):
+            cancelled += 1
+    
+    logger.info(f"一括アップロードのタスクをキャンセルしました: {batch_id} ({cancelled}件)")
+    return jsonify({
+        'message': f"{cancelled}件のタスクをキャンセルしました",
+        'batch': upload_batches.get(batch_id).to_dict()
+    })
+
 @app.route('/api/url', methods=['POST'])
 def process_url():
     """URL処理API"""
@@ -205,46 +1132,36 @@ def process_url():
             'source_type': 'url',
             'url': url,
             'folder': folder,
-            'output_dir': folder_path
-        }
+            'client_ip': request.remote_addr,
+            'output_dir': folder_path,
+            'output_root': OUTPUT_DIR,
+            'flight_key': make_flight_key(url, Config.CONVERTER_OPTIONS)
+        },
+        priority=parse_priority(data.get('priority')),
+        cost=Config.ADMISSION_URL_COST
     )
     
-    task_queue.add_task(task)
+    # コールバックを設定（完了前に設定されるようキュー追加前に行う。相乗りしたタスクも実行し直す場合がある）
+    task.callback = make_task_callback(task_id)
     
-    # タスク情報の保存
-    tasks_store[task_id] = {
-        'id': task_id,
-        'added_at': datetime.now().isoformat(),
-        'filename': url,
-        'status': TaskStatus.WAITING,
-        'folder': folder
-    }
+    # 同じURLの変換が実行中（または鮮度内）なら、変換せずにその結果を受け取る
+    leader = url_flights.attach(task) if url_flights is not None else None
+    if leader is not None:
+        return jsonify({
+            'task_id': task_id,
+            'status': task_queue.get_task(task.id).status,
+            'coalesced_with': str(leader.id),
+            'message': '同じURLの変換に相乗りしました'
+        })
     
-    # タスクのコールバック設定
-    def task_callback(task_result):
-        if task_result and task_result.success and task_result.result:
-            try:
-                # 結果が成功でかつ出力パスがある場合
-                # task_result.result は辞書型であることを確認
-                if isinstance(task_result.result, dict) and 'output_path' in task_result.result:
-                    output_path = task_result.result['output_path']
-                    
-                    # すでに相対パスの場合は変換不要
-                    if not os.path.isabs(output_path):
-                        relative_path = output_path
-                    else:
-                        # 絶対パスの場合は相対パスに変換
-                        relative_path = os.path.relpath(output_path, OUTPUT_DIR).replace('\\', '/')
-                    
-                    # タスク情報に出力パスを追加
-                    if task_id in tasks_store:
-                        tasks_store[task_id]['output_path'] = relative_path
-                        logger.info(f"タスク {task_id} の出力パスを設定: {relative_path}")
-            except Exception as e:
-                logger.error(f"タスク結果処理エラー: {str(e)}")
+    try:
+        admission.check(Config.ADMISSION_URL_COST)
+    except AdmissionRejected as e:
+        if url_flights is not None:
+            url_flights.release(task)
+        return admission_response(e)
     
-    # コールバックを設定
-    task.callback = task_callback
+    submit_task(task)
     
     return jsonify({
         'task_id': task_id,
@@ -252,34 +1169,191 @@ def process_url():
         'message': 'URLの処理がキューに追加されました'
     })
 
+@app.route('/api/url/bulk', methods=['POST'])
+def process_url_bulk():
+    """URLの一括変換API（URLの一覧 urls、またはサイトマップのURL sitemap を指定）"""
+    data = request.json
+    if not data or not (data.get('urls') or data.get('sitemap')):
+        return jsonify({'error': 'URLの一覧またはサイトマップが指定されていません'}), 400
+    
+    urls = data.get('urls') or []
+    sitemap = data.get('sitemap')
+    if not isinstance(urls, list) or (sitemap is not None and not isinstance(sitemap, str)):
+        return jsonify({'error': 'urls はURLの配列、sitemap はURLで指定してください'}), 400
+    if len(urls) > Config.URL_BULK_MAX_URLS:
+        return jsonify({'error': f'一度に変換できるURLは{Config.URL_BULK_MAX_URLS}件までです'}), 400
+    
+    folder = data.get('folder', 'default')
+    folder_path = os.path.join(OUTPUT_DIR, folder)
+    
+    # フォルダの存在確認
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path, exist_ok=True)
+    
+    # 見積もりコストはURLごとのコストの合計（サイトマップは展開するまで件数がわからないため既定の件数で見積もる）
+    cost = Config.ADMISSION_URL_COST * (len(urls) + (Config.URL_BULK_SITEMAP_ESTIMATE if sitemap else 0))
+    try:
+        admission.check(cost)
+    except AdmissionRejected as e:
+        return admission_response(e)
+    
+    task_id = str(uuid.uuid4())
+    task = Task(
+        id=uuid.UUID(task_id),
+        type=URL_BATCH_TASK_TYPE,
+        name=f"URL一括変換: {sitemap or f'{len(urls)}件'}",
+        payload={
+            'source_type': 'url_batch',
+            'urls': urls,
+            'sitemap': sitemap,
+            'folder': folder,
+            'client_ip': request.remote_addr,
+            'output_dir': folder_path,
+            'output_root': OUTPUT_DIR
+        },
+        priority=parse_priority(data.get('priority')),
+        cost=cost
+    )
+    task.callback = make_task_callback(task_id)
+    submit_task(task)
+    
+    return jsonify({
+        'task_id': task_id,
+        'status': TaskStatus.WAITING,
+        'message': 'URLの一括変換がキューに追加されました'
+    })
+
 @app.route('/api/tasks', methods=['GET'])
 def get_tasks():
-    """タスク一覧の取得API"""
-    tasks = []
-    for task_id, task_info in tasks_store.items():
-        # タスクキューからの最新状態の取得を試みる
-        queue_task = task_queue.get_task(uuid.UUID(task_id))
-        if queue_task:
-            task_info['status'] = queue_task.status
+    """
+    タスク一覧の取得API
+    
+    Query Parameters:
+        since: 前回受け取ったバージョン（指定時は以降の差分のみを返す）
+        epoch: 前回受け取ったepoch（サーバー再起動時は全件を返す）
+        status: 状態で絞り込み（複数指定可）
+        folder: フォルダで絞り込み
+                （差分取得時に絞り込みから外れたタスクは removed に含める）
+        limit: 1回で返す最大件数
+        offset: 先頭から読み飛ばす件数（差分取得時は無視）
+    """
+    store = task_queue.store
+    
+    # 一覧のバージョンとクエリからETagを作成し、変化がなければ304を返す
+    etag = f"tasks-{store.version}-{hashlib.sha1(request.query_string).hexdigest()[:12]}"
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+    
+    # 状態・フォルダでの絞り込み（索引を使うため全件走査しない）
+    statuses = [TaskStatus(s) for s in request.args.getlist('status') if s in TaskStatus._value2member_map_]
+    folder = request.args.get('folder')
+    limit = request.args.get('limit', type=int)
+    
+    since = request.args.get('since', type=int)
+    if since is not None:
+        # 別のストア（再起動前など）のバージョンは差分の基準にできない
+        epoch = request.args.get('epoch')
+        if epoch and epoch != store.epoch:
+            since = -1
         
-        tasks.append(task_info)
+        changes = store.changes_since(since, limit)
+        tasks = []
+        removed = [str(task_id) for task_id in changes.removed]
+        for task in changes.tasks:
+            if task.parent_id is not None:
+                continue
+            if (not statuses or task.status in statuses) and (folder is None or task.payload.get('folder') == folder):
+                tasks.append(task_to_info(task))
+            elif not changes.reset:
+                # 変更で絞り込みから外れたタスクは、クライアントの一覧に残らないよう削除として返す
+                removed.append(str(task.id))
+        response = jsonify({
+            'epoch': store.epoch,
+            'version': changes.version,
+            'reset': changes.reset,
+            'has_more': changes.has_more,
+            'tasks': tasks,
+            'removed': removed
+        })
+    else:
+        offset = max(0, request.args.get('offset', 0, type=int))
+        # サブタスクは一覧に含めない（分割元の進捗として表示する）
+        queue_tasks = [task for task in task_queue.list_tasks(statuses or None, folder) if task.parent_id is None]
+        page = queue_tasks[offset:offset + limit] if limit is not None else queue_tasks[offset:]
+        response = jsonify([task_to_info(task) for task in page])
+        response.headers['X-Total-Count'] = str(len(queue_tasks))
+        response.headers['X-Tasks-Version'] = str(store.version)
     
-    return jsonify(tasks)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/tasks/<task_id>', methods=['GET'])
 def get_task(task_id):
     """特定のタスク情報の取得API"""
-    if task_id not in tasks_store:
+    try:
+        queue_task = task_queue.get_task(uuid.UUID(task_id))
+    except ValueError:
+        queue_task = None
+    
+    if queue_task is None:
         return jsonify({'error': 'タスクが見つかりません'}), 404
     
-    task_info = tasks_store[task_id].copy()
+    return jsonify(task_to_info(queue_task))
+
+@app.route('/api/tasks/<task_id>', methods=['DELETE'])
+def cancel_task(task_id):
+    """
+    タスクのキャンセルAPI
     
-    # タスクキューからの最新状態の取得を試みる
-    queue_task = task_queue.get_task(uuid.UUID(task_id))
-    if queue_task:
-        task_info['status'] = queue_task.status
+    待機中のタスクは実行せず、処理中のタスクは中断する（分割中のタスクはサブタスクもすべて中止）
+    共有キューで別のワーカーが処理中のタスクは、そのワーカーに中断を要求する
+    """
+    try:
+        queue_task = task_queue.get_task(uuid.UUID(task_id))
+    except ValueError:
+        queue_task = None
     
-    return jsonify(task_info)
+    if queue_task is None:
+        return jsonify({'error': 'タスクが見つかりません'}), 404
+    
+    if not cancel_queue_task(queue_task):
+        return jsonify({'error': 'タスクはすでに終了しています', 'task': task_to_info(queue_task)}), 409
+    
+    # 共有キューの場合は取り込み直したタスクに置き換わっている
+    queue_task = task_queue.get_task(queue_task.id) or queue_task
+    logger.info(f"タスクをキャンセルしました: {task_id}")
+    return jsonify({'message': 'タスクをキャンセルしました', 'task': task_to_info(queue_task)})
+
+def cancel_queue_task(queue_task: Task) -> bool:
+    """
+    タスクをキャンセル（共有キューで別のワーカーが処理中のタスクは、そのワーカーに中断を要求）
+    
+    Args:
+        queue_task: キャンセルするタスク
+        
+    Returns:
+        bool: キャンセルした（要求した）場合True、すでに終了していた場合False
+    """
+    # 相乗りしたタスクは共有キューに登録していないため、このノードでキャンセルする
+    if cluster is not None and not (url_flights is not None and url_flights.is_follower(queue_task.id)):
+        return cluster.cancel(queue_task.id)
+    return task_queue.cancel(queue_task.id)
+
+@app.route('/api/events', methods=['GET'])
+def task_events():
+    """
+    タスク状態変化のSSEストリーム
+    
+    Uvicorn（run.py）ではASGI側で処理されるため、ここは開発サーバー用
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    return Response(
+        stream_with_context(event_stream(event_broker, last_event_id)),
+        headers=SSE_HEADERS
+    )
 
 def get_folders() -> List[Dict[str, str]]:
     """
@@ -288,15 +1362,7 @@ def get_folders() -> List[Dict[str, str]]:
     Returns:
         List[Dict[str, str]]: フォルダ情報のリスト
     """
-    folders = []
-    for folder_name in os.listdir(OUTPUT_DIR):
-        folder_path = os.path.join(OUTPUT_DIR, folder_name)
-        if os.path.isdir(folder_path):
-            folders.append({
-                'id': folder_name,
-                'name': folder_name
-            })
-    return folders
+    return [{'id': folder_name, 'name': folder_name} for folder_name in folder_index.folders()]
 
 @app.route('/api/folders', methods=['GET'])
 def api_get_folders():
@@ -324,6 +1390,7 @@ def create_folder():
     
     # フォルダ作成
     os.makedirs(folder_path, exist_ok=True)
+    folder_index.note_path(folder_id)
     
     return jsonify({
         'id': folder_id,
@@ -358,6 +1425,10 @@ def update_folder(folder_id):
     
     # フォルダ名変更
     os.rename(folder_path, new_path)
+    folder_index.remove(folder_id)
+    folder_index.note_path(new_id)
+    if search_index and new_id != folder_id:
+        search_index.rename(folder_id, new_id)
     
     return jsonify({
         'id': new_id,
@@ -380,77 +1451,290 @@ def delete_folder(folder_id):
     
     # フォルダと内容物を削除
     shutil.rmtree(folder_path)
+    folder_index.remove(folder_id)
+    if search_index:
+        search_index.remove(folder_id)
     
     return jsonify({
         'message': 'フォルダが削除されました'
     })
 
+def make_folder_export(folder_id: str, params: Dict[str, str], extensions: List[str]) -> FolderExport:
+    """
+    フォルダの一括ダウンロードを準備する（対象のファイルの一覧を作る）
+    
+    Args:
+        folder_id: フォルダID
+        params: クエリパラメータ
+                format（zip, tar.gz）、compression（ZIPの deflated, stored）、
+                since（この更新日時以降、UNIX時間またはISO形式）
+        extensions: ext で指定された拡張子（複数指定、またはカンマ区切り）
+    
+    Returns:
+        FolderExport: アーカイブ
+    
+    Raises:
+        FolderExportError: 指定が不正な場合、フォルダが存在しない場合
+    """
+    since = None
+    if params.get('since'):
+        since = parse_since(params['since'])
+        if since is None:
+            raise FolderExportError('since はUNIX時間またはISO形式の日時を指定してください')
+    
+    return FolderExport(
+        OUTPUT_DIR,
+        folder_id,
+        archive_format=params.get('format') or 'zip',
+        compression=params.get('compression') or Config.EXPORT_ZIP_COMPRESSION,
+        since=since,
+        extensions=[ext.strip() for value in extensions for ext in value.split(',') if ext.strip()] or None
+    )
+
+def folder_export_headers(export: FolderExport) -> List[Tuple[str, str]]:
+    """フォルダの一括ダウンロードのレスポンスヘッダー（無圧縮のZIPはサイズが決まるため Content-Length を付ける）"""
+    fallback = export.filename.encode('ascii', 'ignore').decode('ascii').replace('"', '') or f"export.{export.archive_format}"
+    headers = [
+        ('Content-Type', export.content_type),
+        ('Content-Disposition', f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(export.filename)}"),
+        ('Cache-Control', 'no-store')
+    ]
+    if export.content_length is not None:
+        headers.append(('Content-Length', str(export.content_length)))
+    return headers
+
+@app.route('/api/folders/<folder_id>/export', methods=['GET'])
+def export_folder(folder_id):
+    """フォルダの一括ダウンロードAPI（ZIP・tar.gz を生成しながら送る）"""
+    try:
+        export = make_folder_export(folder_id, request.args.to_dict(), request.args.getlist('ext'))
+    except FolderExportError as e:
+        return jsonify(e.to_dict()), e.status
+    
+    logger.info(f"フォルダの一括ダウンロード: {folder_id} ({len(export.files)}件、{export.filename})")
+    return Response(iter(export), headers=folder_export_headers(export), direct_passthrough=True)
+
+@app.route('/api/search', methods=['GET'])
+def search_documents():
+    """
+    変換したMarkdownの全文検索API
+    
+    クエリパラメータ:
+        q: 検索語（空白区切りでAND、"..." で囲むと空白を含む語）
+        folder: 絞り込むフォルダ（複数指定、またはカンマ区切り）
+        offset, limit: ページ送り（limitは最大 SEARCH_MAX_LIMIT）
+    """
+    if search_index is None:
+        return jsonify({'error': '全文検索は無効です'}), 404
+    
+    offset = parse_count(request.args.get('offset') or 0)
+    limit = parse_count(request.args.get('limit') or 20)
+    if offset is None or not limit:
+        return jsonify({'error': 'offset・limit は0以上の整数（limitは1以上）を指定してください'}), 400
+    limit = min(limit, Config.SEARCH_MAX_LIMIT)
+    
+    folders = [
+        folder.strip()
+        for value in request.args.getlist('folder')
+        for folder in value.split(',')
+        if folder.strip()
+    ]
+    
+    started = time.perf_counter()
+    try:
+        results, has_more = search_index.search(request.args.get('q', ''), folders or None, offset, limit)
+    except SearchQueryError as e:
+        return jsonify(e.to_dict()), e.status
+    
+    return jsonify({
+        'query': request.args.get('q', ''),
+        'folders': folders,
+        'results': results,
+        'offset': offset,
+        'limit': limit,
+        'has_more': has_more,
+        'took_ms': round((time.perf_counter() - started) * 1000, 2)
+    })
+
 @app.route('/api/config', methods=['GET'])
 def get_config():
     """設定情報の取得API"""
     return jsonify({
         'output_dir': OUTPUT_DIR,
         'allowed_extensions': list(ALLOWED_EXTENSIONS),
-        'default_folders': DEFAULT_FOLDERS
+        'default_folders': DEFAULT_FOLDERS,
+        'max_content_length': Config.MAX_CONTENT_LENGTH,
+        'max_upload_size': Config.MAX_UPLOAD_SIZE,
+        'upload_chunk_size': Config.UPLOAD_CHUNK_SIZE,
+        'upload_batch_max_files': Config.UPLOAD_BATCH_MAX_FILES
+    })
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """処理統計情報の取得API"""
+    return jsonify({
+        # プロセスで変換する場合はワーカープロセスごとにプールを持つため、workers の統計を参照する
+        'converters': converter_pool.stats() if converter_pool else None,
+        'conversion_cache': get_conversion_cache().stats(),
+        'http_cache': get_http_cache().stats(),
+        'tasks': task_queue.store.stats(),
+        'events': event_broker.stats(),
+        'uploads': upload_manager.stats(),
+        'upload_batches': upload_batches.stats(),
+        'admission': admission.stats(),
+        'scheduler': task_queue.scheduler.stats() if task_queue.scheduler else None,
+        'workers': task_queue.worker_stats(),
+        'journal': task_journal.stats() if task_journal else None,
+        'cluster': cluster.stats() if cluster else None,
+        'url_flights': url_flights.stats() if url_flights else None,
+        'folder_index': folder_index.stats(),
+        'search': search_index.stats() if search_index else None,
+        'preview': markdown_preview.stats()
     })
 
+@app.route('/api/scheduler', methods=['GET'])
+def get_scheduler_stats():
+    """スケジューラのレーンごとの待ち件数・実行数・待ち時間の取得API"""
+    if task_queue.scheduler is None:
+        return jsonify({'error': 'スケジューラは無効です'}), 404
+    return jsonify(task_queue.scheduler.stats())
+
 @app.route('/output/<path:filename>')
 def download_file(filename):
-    """変換されたファイルのダウンロード"""
-    # ファイルパスの検証と安全対策が必要
-    directory = os.path.dirname(filename)
-    file = os.path.basename(filename)
-    return send_from_directory(os.path.join(OUTPUT_DIR, directory), file)
+    """変換されたファイルのダウンロード（ETagによる304、範囲リクエスト、圧縮済みファイルの選択）"""
+    response = prepare_output_response(
+        OUTPUT_DIR,
+        filename,
+        request.method,
+        {name.lower(): value for name, value in request.headers.items()}
+    )
+    if response is None:
+        return jsonify({'error': 'ページが見つかりません'}), 404
+    
+    body = iter_file_range(response.body_path, response.offset, response.length) if response.body_path else []
+    return Response(body, status=response.status, headers=response.headers, direct_passthrough=True)
 
-@app.route('/explore/<path:folder_path>')
-def explore_folder(folder_path):
-    """フォルダ内のファイル一覧を表示"""
+@app.route('/api/preview/<path:filename>', methods=['GET'])
+def preview_markdown(filename):
+    """
+    MarkdownのプレビューAPI（サーバー側でHTMLに変換したものをページ単位で返す）
+    
+    クエリパラメータ:
+        page: ページ番号（0始まり、続きがあれば has_more が true）
+    """
+    page = parse_count(request.args.get('page') or 0)
+    if page is None:
+        return jsonify({'error': 'page は0以上の整数を指定してください'}), 400
+    
     try:
-        full_path = os.path.join(OUTPUT_DIR, folder_path)
-        
-        # パスのバリデーション（ディレクトリトラバーサル対策）
-        if not os.path.realpath(full_path).startswith(os.path.realpath(OUTPUT_DIR)):
-            return jsonify({'error': '無効なパスです'}), 400
-        
-        if not os.path.exists(full_path):
-            return jsonify({'error': 'フォルダが見つかりません'}), 404
-        
-        if not os.path.isdir(full_path):
-            return jsonify({'error': 'このパスはフォルダではありません'}), 400
+        source = markdown_preview.locate(filename)
+        # 変わっていなければ変換もキャッシュの読み込みもせずに304を返す
+        etag = source.etag(page)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify(markdown_preview.render_page(source, page))
+    except MarkdownPreviewError as e:
+        return jsonify(e.to_dict()), e.status
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def list_folder(folder_path: str, params: Optional[Dict[str, str]] = None) -> Tuple[Dict[str, Any], int]:
+    """
+    出力フォルダ内のファイル一覧を作成（フォルダ一覧のインデックスから返す）
+    
+    Args:
+        folder_path: OUTPUT_DIRからの相対パス
+        params: クエリパラメータ
+                sort（name, mtime, size）、order（asc, desc）、
+                since（この更新日時以降、UNIX時間またはISO形式）、offset、
+                limit（省略時は offset 以降をすべて返す）
         
-        files = []
-        for item in os.listdir(full_path):
-            item_path = os.path.join(full_path, item)
-            is_dir = os.path.isdir(item_path)
-            
-            # 最終更新日時
-            modified_time = os.path.getmtime(item_path)
-            modified_date = datetime.fromtimestamp(modified_time).strftime('%Y-%m-%d %H:%M:%S')
-            
-            file_info = {
-                'name': item,
-                'is_directory': is_dir,
-                'path': os.path.join(folder_path, item).replace('\\', '/'),
-                'modified_date': modified_date
-            }
-            
-            # ファイルサイズ（ディレクトリの場合は0）
-            if not is_dir:
-                file_info['size'] = os.path.getsize(item_path)
-                
-                # ファイル拡張子
-                _, ext = os.path.splitext(item)
-                file_info['extension'] = ext[1:] if ext else ''
-            
-            files.append(file_info)
+    Returns:
+        (レスポンスの辞書, HTTPステータスコード)
+    """
+    params = params or {}
+    sort = params.get('sort') or 'name'
+    order = params.get('order') or 'asc'
+    if order not in ('asc', 'desc'):
+        return {'error': '並び順は asc または desc を指定してください'}, 400
+    
+    offset = parse_count(params.get('offset') or 0)
+    limit = None
+    if params.get('limit'):
+        limit = parse_count(params['limit'])
+        if not limit:
+            return {'error': 'offset・limit は0以上の整数（limitは1以上）を指定してください'}, 400
+        limit = min(limit, Config.EXPLORE_MAX_LIMIT)
+    if offset is None:
+        return {'error': 'offset・limit は0以上の整数（limitは1以上）を指定してください'}, 400
+    
+    since = None
+    if params.get('since'):
+        since = parse_since(params['since'])
+        if since is None:
+            return {'error': 'since はUNIX時間またはISO形式の日時を指定してください'}, 400
+    
+    try:
+        entries, total = folder_index.list(
+            folder_path,
+            sort=sort,
+            descending=order == 'desc',
+            since=since,
+            offset=offset,
+            limit=limit
+        )
+    except FolderIndexError as e:
+        return e.to_dict(), e.status
+    
+    files = []
+    for entry in entries:
+        file_info = {
+            'name': entry.name,
+            'is_directory': entry.is_dir,
+            'path': os.path.join(folder_path, entry.name).replace('\\', '/'),
+            'modified_date': datetime.fromtimestamp(entry.mtime).strftime('%Y-%m-%d %H:%M:%S'),
+            'modified': entry.mtime
+        }
         
-        # ディレクトリを先に、その後にファイルをアルファベット順で並べる
-        files.sort(key=lambda x: (not x['is_directory'], x['name'].lower()))
+        # ファイルサイズと拡張子（ディレクトリにはなし）
+        if not entry.is_dir:
+            file_info['size'] = entry.size
+            _, ext = os.path.splitext(entry.name)
+            file_info['extension'] = ext[1:] if ext else ''
         
-        return jsonify({
-            'path': folder_path,
-            'files': files
-        })
+        files.append(file_info)
+    
+    return {
+        'path': folder_path,
+        'files': files,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'sort': sort,
+        'order': order,
+        'has_more': offset + len(files) < total
+    }, 200
+
+def parse_since(value: str) -> Optional[float]:
+    """更新日時の絞り込みの指定（UNIX時間またはISO形式の日時、不正な値はNone）"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+@app.route('/explore/<path:folder_path>')
+def explore_folder(folder_path):
+    """フォルダ内のファイル一覧を表示"""
+    try:
+        result, status = list_folder(folder_path, request.args.to_dict())
+        return jsonify(result), status
     except Exception as e:
         logger.exception(f"フォルダ探索エラー: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,586 @@
+"""
+WsgiToAsgi を経由しないネイティブASGIアプリケーション
+
+アップロード（分割アップロードのチャンクを含む）・ファイル配信・フォルダ一覧・SSEを
+イベントループ上で直接処理する。
+ファイルI/Oはスレッドプールに逃がしてイベントループを止めないようにし、
+アップロードはマルチパートを逐次解析しながら一時ファイルへ書き出す。
+それ以外の（軽量な）APIはFlaskアプリにそのまま委譲するため、app.py と同じルートを提供する
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import (NEED_DATA, Data, Epilogue, Field, File,
+                                       MultipartDecoder)
+
+import app as webapp
+from admission import AdmissionRejected
+from batches import UploadBatchError
+from config import Config
+from folder_export import FolderExportError
+from output_files import prepare_output_response
+from sse import ASGIApp, EventStreamApp, Receive, Scope, Send
+from uploads import ChunkWriter, UploadSessionError
+
+logger = logging.getLogger(__name__)
+
+# アップロードを一時ファイルに書き出す単位（これだけ溜まったらまとめて書く）
+UPLOAD_FLUSH_BYTES = 1024 * 1024
+
+# ファイル配信時の読み込み単位
+DOWNLOAD_CHUNK_BYTES = 256 * 1024
+
+# フォームのテキスト項目の最大サイズ
+MAX_FORM_FIELD_BYTES = 64 * 1024
+
+
+class UploadError(Exception):
+    """アップロード処理のエラー（HTTPステータス付き）"""
+    
+    def __init__(self, message: str, status: int = 400):
+        self.message = message
+        self.status = status
+        super().__init__(message)
+
+
+class _UploadSink:
+    """一時ファイルへの書き込みとハッシュ計算（スレッドプールで実行）"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self._file = open(path, 'wb')
+    
+    def write(self, chunk: bytes) -> None:
+        self.digest.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+    
+    def close(self) -> None:
+        self._file.close()
+    
+    def discard(self) -> None:
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class NativeASGIApp:
+    """ネイティブASGIアプリ（一部のルートをFlaskに委譲）"""
+    
+    def __init__(self, fallback: Optional[ASGIApp] = None):
+        """
+        Args:
+            fallback: ネイティブ実装していないルートを処理するアプリ（省略時はFlaskアプリ）
+        """
+        self.fallback = fallback or WsgiToAsgi(webapp.app)
+        self.events = EventStreamApp(webapp.event_broker)
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.fallback(scope, receive, send)
+            return
+        
+        method = scope['method']
+        path = scope['path']
+        
+        # 応答を開始したかどうか（開始後のエラーは500を返せないため接続を切る）
+        started = False
+        send_message = send
+        
+        async def send_tracked(message: Dict[str, Any]) -> None:
+            nonlocal started
+            if message['type'] == 'http.response.start':
+                started = True
+            await send_message(message)
+        
+        send = send_tracked
+        try:
+            if path == '/api/events' and method == 'GET':
+                await self.events(scope, receive, send)
+            elif path == '/api/upload' and method == 'POST':
+                await self.upload(scope, receive, send)
+            elif path == '/api/upload/batch' and method == 'POST':
+                await self.upload_batch(scope, receive, send)
+            elif path.startswith('/api/uploads/') and method == 'PUT' and '/' not in path[len('/api/uploads/'):]:
+                await self.upload_chunk(scope, receive, send, path[len('/api/uploads/'):])
+            elif path.startswith('/output/') and method in ('GET', 'HEAD'):
+                await self.download(scope, send, path[len('/output/'):])
+            elif path.startswith('/api/folders/') and path.endswith('/export') and method == 'GET':
+                await self.export_folder(scope, send, path[len('/api/folders/'):-len('/export')])
+            elif path.startswith('/explore/') and method == 'GET':
+                await self.explore(scope, send, path[len('/explore/'):])
+            else:
+                await self.fallback(scope, receive, send)
+        except Exception as e:
+            if started:
+                # 送信中の応答は完了させず、サーバーに接続を切らせる
+                raise
+            logger.exception(f"ASGIリクエスト処理中のエラー: {str(e)}")
+            await send_json(send, {'error': 'サーバー内部エラーが発生しました'}, 500)
+    
+    async def upload(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """ファイルアップロード処理API（マルチパートを逐次解析して一時ファイルへ書き出す）"""
+        upload_started = time.time()
+        headers = _headers(scope)
+        
+        content_length = headers.get('content-length')
+        if content_length and content_length.isdigit() and int(content_length) > Config.MAX_CONTENT_LENGTH:
+            await send_json(send, {'error': 'ファイルサイズが大きすぎます'}, 413)
+            return
+        
+        mimetype, options = parse_options_header(headers.get('content-type', ''))
+        boundary = options.get('boundary')
+        if mimetype != 'multipart/form-data' or not boundary:
+            await send_json(send, {'error': 'ファイルがアップロードされていません'}, 400)
+            return
+        
+        try:
+            # 受信中のバイト数と一時ディレクトリの上限を確認してから本文を受信する
+            with webapp.admission.receiving(_content_length(headers)):
+                filename, temp_path, source_sha256, fields = await self._receive_upload(
+                    receive, boundary.encode('latin-1')
+                )
+            upload_saved = time.time()
+        except AdmissionRejected as e:
+            await send_admission_rejected(send, e)
+            return
+        except UploadError as e:
+            await send_json(send, {'error': e.message}, e.status)
+            return
+        
+        # 処理待ちのタスク数・コストの上限を確認（断る場合は受信した一時ファイルを削除）
+        try:
+            await _run_sync(
+                webapp.admission.check,
+                webapp.estimate_file_cost(filename, await _run_sync(os.path.getsize, temp_path))
+            )
+        except AdmissionRejected as e:
+            await _run_sync(_remove_file, temp_path)
+            await send_admission_rejected(send, e)
+            return
+        
+        folder = fields.get('folder', 'default')
+        client = scope.get('client')
+        task_id = await _run_sync(
+            webapp.enqueue_file_conversion,
+            filename,
+            temp_path,
+            folder,
+            source_sha256,
+            client[0] if client else None,
+            webapp.parse_priority(fields.get('priority')),
+            None,
+            {'upload_started': upload_started, 'upload_saved': upload_saved}
+        )
+        
+        await send_json(send, {
+            'task_id': task_id,
+            'status': webapp.TaskStatus.WAITING,
+            'message': 'ファイルがアップロードされ、処理キューに追加されました'
+        })
+    
+    async def upload_batch(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """複数ファイルの一括アップロードAPI（1回のリクエストのファイルを逐次一時ファイルへ書き出し、まとめてタスクを追加）"""
+        upload_started = time.time()
+        headers = _headers(scope)
+        
+        content_length = headers.get('content-length')
+        if content_length and content_length.isdigit() and int(content_length) > Config.MAX_CONTENT_LENGTH:
+            await send_json(send, {'error': 'ファイルサイズが大きすぎます'}, 413)
+            return
+        
+        mimetype, options = parse_options_header(headers.get('content-type', ''))
+        boundary = options.get('boundary')
+        if mimetype != 'multipart/form-data' or not boundary:
+            await send_json(send, {'error': 'ファイルがアップロードされていません'}, 400)
+            return
+        
+        try:
+            with webapp.admission.receiving(_content_length(headers)):
+                files, rejected, fields = await self._receive_files(
+                    receive, boundary.encode('latin-1'), Config.UPLOAD_BATCH_MAX_FILES, strict=False
+                )
+        except AdmissionRejected as e:
+            await send_admission_rejected(send, e)
+            return
+        except UploadError as e:
+            await send_json(send, {'error': e.message}, e.status)
+            return
+        
+        if not files and not rejected:
+            await send_json(send, {'error': 'ファイルがアップロードされていません'}, 400)
+            return
+        
+        client = scope.get('client')
+        try:
+            response = await _run_sync(
+                webapp.enqueue_batch_files,
+                files,
+                rejected,
+                fields,
+                client[0] if client else None,
+                upload_started
+            )
+        except AdmissionRejected as e:
+            await send_admission_rejected(send, e)
+            return
+        except UploadBatchError as e:
+            await send_json(send, e.to_dict(), e.status)
+            return
+        
+        await send_json(send, response)
+    
+    async def _receive_upload(
+        self,
+        receive: Receive,
+        boundary: bytes
+    ) -> Tuple[str, str, str, Dict[str, str]]:
+        """
+        リクエスト本文を受信しながらファイルを一時ファイルに書き出す
+        
+        Returns:
+            (ファイル名, 一時ファイルのパス, SHA-256, フォームのテキスト項目)
+        
+        Raises:
+            UploadError: ファイルがない・形式が未対応・サイズ超過の場合
+        """
+        files, _, fields = await self._receive_files(receive, boundary, 1, strict=True)
+        if not files:
+            raise UploadError('ファイルがアップロードされていません')
+        filename, temp_path, source_sha256 = files[0]
+        return filename, temp_path, source_sha256, fields
+    
+    async def _receive_files(
+        self,
+        receive: Receive,
+        boundary: bytes,
+        max_files: int,
+        strict: bool
+    ) -> Tuple[List[Tuple[str, str, str]], List[Tuple[str, str]], Dict[str, str]]:
+        """
+        リクエスト本文を受信しながら file パートを1つずつ一時ファイルに書き出す
+        
+        Args:
+            receive: ASGIの受信関数
+            boundary: マルチパートの境界
+            max_files: 受け付けるファイル数（超えた分は読み飛ばす）
+            strict: 未対応の形式のファイルをエラーにするか（Falseなら読み飛ばして記録する）
+        
+        Returns:
+            (受信したファイルの (ファイル名, 一時ファイルのパス, SHA-256) の一覧,
+             読み飛ばしたファイルの (ファイル名, エラーメッセージ) の一覧, フォームのテキスト項目)
+        
+        Raises:
+            UploadError: 形式が未対応（strict時）・サイズ超過・中断の場合
+        """
+        # max_form_memory_size は受信チャンクごとにも適用されるため、テキスト項目の上限は自前で確認する
+        decoder = MultipartDecoder(boundary)
+        fields: Dict[str, str] = {}
+        field_name: Optional[str] = None
+        field_buffer = bytearray()
+        files: List[Tuple[str, str, str]] = []
+        rejected: List[Tuple[str, str]] = []
+        sink: Optional[_UploadSink] = None
+        filename: Optional[str] = None
+        pending: List[bytes] = []
+        pending_size = 0
+        received = 0
+        # 現在のパートの種類（'file' / 'field' / 'skip'）
+        part: Optional[str] = None
+        
+        async def flush() -> None:
+            nonlocal pending, pending_size
+            if sink and pending:
+                chunk = b''.join(pending)
+                pending, pending_size = [], 0
+                await _run_sync(sink.write, chunk)
+        
+        async def close_file() -> None:
+            # 書き込み中のファイルを閉じて受信済みに加える
+            nonlocal sink
+            if sink is not None and filename is not None:
+                await flush()
+                await _run_sync(sink.close)
+                files.append((filename, sink.path, sink.digest.hexdigest()))
+                sink = None
+        
+        try:
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    raise UploadError('アップロードが中断されました')
+                
+                body = message.get('body', b'')
+                more_body = message.get('more_body', False)
+                received += len(body)
+                if received > Config.MAX_CONTENT_LENGTH:
+                    raise UploadError('ファイルサイズが大きすぎます', 413)
+                
+                decoder.receive_data(body)
+                if not more_body:
+                    decoder.receive_data(None)
+                
+                event = decoder.next_event()
+                while event is not NEED_DATA and not isinstance(event, Epilogue):
+                    if isinstance(event, (File, Field)):
+                        await close_file()
+                    
+                    if isinstance(event, File):
+                        if event.name != 'file' or len(files) >= max_files:
+                            part = 'skip'
+                        else:
+                            filename = event.filename or ''
+                            if filename == '' or not webapp.allowed_file(filename):
+                                message_text = 'ファイルが選択されていません' if filename == '' else 'このファイル形式はサポートされていません'
+                                if strict:
+                                    raise UploadError(message_text)
+                                rejected.append((filename, message_text))
+                                part = 'skip'
+                            else:
+                                sink = await _run_sync(_UploadSink, webapp.make_temp_path(filename))
+                                part = 'file'
+                    elif isinstance(event, Field):
+                        field_name = event.name
+                        field_buffer = bytearray()
+                        part = 'field'
+                    elif isinstance(event, Data):
+                        if part == 'file':
+                            pending.append(event.data)
+                            pending_size += len(event.data)
+                            if pending_size >= UPLOAD_FLUSH_BYTES:
+                                await flush()
+                        elif part == 'field':
+                            field_buffer.extend(event.data)
+                            if len(field_buffer) > MAX_FORM_FIELD_BYTES:
+                                raise UploadError('フォームの項目が大きすぎます', 413)
+                            if not event.more_data and field_name:
+                                fields[field_name] = field_buffer.decode('utf-8', 'replace')
+                    event = decoder.next_event()
+            
+            await close_file()
+            return files, rejected, fields
+        
+        except BaseException:
+            # 途中で失敗した場合は書きかけ・受信済みの一時ファイルを削除
+            if sink:
+                await _run_sync(sink.discard)
+            for _, temp_path, _ in files:
+                await _run_sync(_remove_file, temp_path)
+            raise
+    
+    async def upload_chunk(self, scope: Scope, receive: Receive, send: Send, upload_id: str) -> None:
+        """分割アップロードのチャンク送信API（本文を受信しながら .part ファイルへ書き込む）"""
+        headers = _headers(scope)
+        
+        try:
+            # 受信中のバイト数の上限を確認し、受信が終わるまで予約しておく
+            with webapp.admission.receiving(_content_length(headers)):
+                await self._receive_chunk(receive, send, upload_id, headers)
+        except AdmissionRejected as e:
+            await send_admission_rejected(send, e)
+    
+    async def _receive_chunk(
+        self,
+        receive: Receive,
+        send: Send,
+        upload_id: str,
+        headers: Dict[str, str]
+    ) -> None:
+        """チャンクを受信して .part ファイルへ書き込む"""
+        try:
+            offset = webapp.parse_upload_offset(headers.get('upload-offset'))
+            writer: ChunkWriter = await _run_sync(webapp.upload_manager.open_chunk, upload_id, offset)
+        except UploadSessionError as e:
+            await send_json(send, e.to_dict(), e.status)
+            return
+        
+        pending: List[bytes] = []
+        pending_size = 0
+        received = 0
+        try:
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    raise UploadSessionError('アップロードが中断されました', offset=writer.start)
+                
+                body = message.get('body', b'')
+                more_body = message.get('more_body', False)
+                received += len(body)
+                if received > Config.MAX_CONTENT_LENGTH:
+                    raise UploadSessionError('チャンクが大きすぎます', 413, offset=writer.start)
+                
+                pending.append(body)
+                pending_size += len(body)
+                if pending_size >= UPLOAD_FLUSH_BYTES or not more_body:
+                    chunk = b''.join(pending)
+                    pending, pending_size = [], 0
+                    await _run_sync(writer.write, chunk)
+        except UploadSessionError as e:
+            await _run_sync(writer.abort)
+            await send_json(send, e.to_dict(), e.status)
+            return
+        except BaseException:
+            await _run_sync(writer.abort)
+            raise
+        
+        try:
+            new_offset = await _run_sync(writer.commit, headers.get('x-chunk-sha256'))
+        except UploadSessionError as e:
+            await send_json(send, e.to_dict(), e.status)
+            return
+        
+        await send_json(send, {'upload_id': upload_id, 'offset': new_offset})
+    
+    async def download(self, scope: Scope, send: Send, filename: str) -> None:
+        """変換されたファイルの配信（ETagによる304、範囲リクエスト、圧縮済みファイルの選択。読み込みはスレッドプールで行う）"""
+        response = await _run_sync(
+            prepare_output_response,
+            webapp.OUTPUT_DIR,
+            filename,
+            scope['method'],
+            _headers(scope)
+        )
+        if response is None:
+            await send_json(send, {'error': 'ページが見つかりません'}, 404)
+            return
+        
+        await send({
+            'type': 'http.response.start',
+            'status': response.status,
+            'headers': _encode_headers(response.headers)
+        })
+        
+        if response.body_path is None:
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        
+        f = await _run_sync(open, response.body_path, 'rb')
+        try:
+            await _run_sync(f.seek, response.offset)
+            remaining = response.length
+            while remaining > 0:
+                chunk = await _run_sync(f.read, min(DOWNLOAD_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            await _run_sync(f.close)
+        await send({'type': 'http.response.body', 'body': b''})
+    
+    async def export_folder(self, scope: Scope, send: Send, folder_id: str) -> None:
+        """フォルダの一括ダウンロード（アーカイブの生成とファイルの読み込みはスレッドプールで行う）"""
+        query = parse_qsl(scope.get('query_string', b'').decode('latin-1'))
+        try:
+            export = await _run_sync(
+                webapp.make_folder_export,
+                folder_id,
+                dict(query),
+                [value for name, value in query if name == 'ext']
+            )
+        except FolderExportError as e:
+            await send_json(send, e.to_dict(), e.status)
+            return
+        
+        logger.info(f"フォルダの一括ダウンロード: {folder_id} ({len(export.files)}件、{export.filename})")
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': _encode_headers(webapp.folder_export_headers(export))
+        })
+        
+        chunks = iter(export)
+        try:
+            while True:
+                chunk = await _run_sync(next, chunks, None)
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        except OSError as e:
+            # 送信を始めた後はエラーを返せないため、応答を完了させずに接続を切る
+            logger.error(f"フォルダの一括ダウンロードを中断しました: {folder_id} - {str(e)}")
+            return
+        await send({'type': 'http.response.body', 'body': b''})
+    
+    async def explore(self, scope: Scope, send: Send, folder_path: str) -> None:
+        """フォルダ内のファイル一覧（インデックスにない場合の読み込みはスレッドプールで行う）"""
+        params = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        try:
+            result, status = await _run_sync(webapp.list_folder, folder_path, params)
+        except Exception as e:
+            logger.exception(f"フォルダ探索エラー: {str(e)}")
+            result, status = {'error': str(e)}, 500
+        await send_json(send, result, status)
+
+
+async def _run_sync(func, *args):
+    """ブロッキング処理をスレッドプールで実行"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(func, *args))
+
+
+def _headers(scope: Scope) -> Dict[str, str]:
+    """リクエストヘッダーを小文字キーの辞書で取得"""
+    return {
+        name.decode('latin-1').lower(): value.decode('latin-1')
+        for name, value in scope.get('headers', [])
+    }
+
+
+def _content_length(headers: Dict[str, str]) -> int:
+    """Content-Length ヘッダーの値（ない・不正な場合は0）"""
+    value = headers.get('content-length', '')
+    return int(value) if value.isdigit() else 0
+
+
+def _remove_file(path: str) -> None:
+    """ファイルがあれば削除"""
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _encode_headers(headers: Iterable[Tuple[str, str]]) -> List[Tuple[bytes, bytes]]:
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+async def send_json(
+    send: Send,
+    data: Any,
+    status: int = 200,
+    headers: Iterable[Tuple[str, str]] = ()
+) -> None:
+    """JSONレスポンスを送信"""
+    body = json.dumps(data, ensure_ascii=False, default=str).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': _encode_headers([
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+            *headers
+        ])
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_admission_rejected(send: Send, error: AdmissionRejected) -> None:
+    """受け付けを制限した場合のレスポンス（429 と Retry-After）を送信"""
+    await send_json(send, error.to_dict(), 429, [('Retry-After', str(error.retry_after))])
+
+
+def create_asgi_app() -> NativeASGIApp:
+    """ネイティブASGIアプリを作成（setup_application の後に呼び出す）"""
+    return NativeASGIApp()
@@ -0,0 +1,254 @@
+"""
+複数ファイルの一括アップロードの進捗集計
+
+1回（または複数回）のリクエストでアップロードされたファイルの変換タスクをバッチにまとめ、
+待機中・処理中・完了・失敗の件数、バイト数、処理速度と残り時間の見積もりをバッチ単位で返す。
+件数はタスクの状態変化リスナーで増減させるため、問い合わせのたびにタスクを走査しない
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from taskqueue import FINISHED_STATUSES, Task, TaskStatus
+
+# タスクの状態ごとの集計先
+_COUNTER_OF = {
+    TaskStatus.WAITING: 'queued',
+    TaskStatus.PROCESSING: 'processing',
+    TaskStatus.SUCCESS: 'done',
+    TaskStatus.ERROR: 'failed',
+    TaskStatus.CANCELED: 'canceled'
+}
+
+
+class UploadBatchError(Exception):
+    """一括アップロードのエラー（HTTPステータス付き）"""
+    
+    def __init__(self, message: str, status: int = 400):
+        self.message = message
+        self.status = status
+        super().__init__(message)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """APIレスポンス用の辞書"""
+        return {'error': self.message}
+
+
+class UploadBatch:
+    """一括アップロードのバッチ"""
+    
+    def __init__(self, batch_id: str, folder: str, expected_files: Optional[int], expected_bytes: Optional[int]):
+        self.id = batch_id
+        self.folder = folder
+        self.expected_files = expected_files
+        self.expected_bytes = expected_bytes
+        self.created_at = datetime.now()
+        self.started = time.monotonic()
+        self.updated = self.started
+        self.finished: Optional[float] = None
+        self.task_ids: List[uuid.UUID] = []
+        self.counts = {name: 0 for name in _COUNTER_OF.values()}
+        self.bytes_total = 0
+        self.bytes_finished = 0
+        # 受け付けなかったファイル（ファイル名とエラー）
+        self.rejected: List[Dict[str, str]] = []
+    
+    @property
+    def pending(self) -> int:
+        """未完了のタスク数"""
+        return self.counts['queued'] + self.counts['processing']
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """APIレスポンス用の辞書（処理速度と残り時間の見積もりを含む）"""
+        now = self.finished or time.monotonic()
+        elapsed = max(now - self.started, 1e-6)
+        finished = len(self.task_ids) - self.pending
+        
+        # 残り時間は完了したバイト数の速度から見積もる（0バイトのファイルばかりなら件数の速度）
+        remaining_bytes = max((self.expected_bytes or 0), self.bytes_total) - self.bytes_finished
+        remaining_files = max((self.expected_files or 0), len(self.task_ids)) - finished
+        eta = None
+        if remaining_files <= 0:
+            eta = 0.0
+        elif self.bytes_finished > 0 and remaining_bytes > 0:
+            eta = remaining_bytes / (self.bytes_finished / elapsed)
+        elif finished > 0:
+            eta = remaining_files / (finished / elapsed)
+        
+        return {
+            'batch_id': self.id,
+            'folder': self.folder,
+            'created_at': self.created_at.isoformat(),
+            'files': len(self.task_ids),
+            'expected_files': self.expected_files,
+            'counts': dict(self.counts),
+            'rejected': list(self.rejected),
+            'bytes': {'total': self.bytes_total, 'finished': self.bytes_finished},
+            'elapsed': round(elapsed, 3),
+            'files_per_sec': round(finished / elapsed, 3),
+            'bytes_per_sec': round(self.bytes_finished / elapsed, 1),
+            'eta': round(eta, 1) if eta is not None else None,
+            'complete': self.finished is not None
+        }
+
+
+class UploadBatchManager:
+    """一括アップロードのバッチの管理（タスクの状態変化から件数を集計する）"""
+    
+    def __init__(self, max_batches: int = 1000, ttl: float = 3600, logger: Optional[logging.Logger] = None):
+        """
+        初期化
+        
+        Args:
+            max_batches: 保持するバッチの最大数（古いものから破棄）
+            ttl: 最後の更新から破棄するまでの秒数
+            logger: カスタムロガー（省略可）
+        """
+        self.max_batches = max(1, max_batches)
+        self.ttl = ttl
+        self.logger = logger or logging.getLogger(__name__)
+        
+        self._lock = threading.Lock()
+        self._batches: "OrderedDict[str, UploadBatch]" = OrderedDict()
+        # 集計済みのタスクの状態（タスクID -> 状態）
+        self._statuses: Dict[uuid.UUID, TaskStatus] = {}
+        self._sizes: Dict[uuid.UUID, int] = {}
+    
+    def create(
+        self,
+        folder: str,
+        expected_files: Optional[int] = None,
+        expected_bytes: Optional[int] = None
+    ) -> UploadBatch:
+        """
+        バッチを作成する
+        
+        Args:
+            folder: 保存先フォルダ
+            expected_files: 続くリクエストを含めてアップロードする予定のファイル数（残り時間の見積もりに使う）
+            expected_bytes: アップロードする予定の合計バイト数
+        
+        Returns:
+            UploadBatch: 作成したバッチ
+        """
+        batch = UploadBatch(str(uuid.uuid4()), folder, expected_files, expected_bytes)
+        with self._lock:
+            self._expire()
+            self._batches[batch.id] = batch
+        self.logger.info(f"一括アップロードを開始しました: {batch.id}")
+        return batch
+    
+    def get(self, batch_id: str) -> UploadBatch:
+        """
+        バッチを取得する
+        
+        Raises:
+            UploadBatchError: バッチが存在しない場合（404）
+        """
+        with self._lock:
+            batch = self._batches.get(batch_id)
+        if batch is None:
+            raise UploadBatchError('一括アップロードが見つかりません', 404)
+        return batch
+    
+    def add_task(self, batch_id: str, task: Task, size: int) -> None:
+        """
+        変換タスクをバッチに加える（キューへの登録前に呼び出す）
+        
+        Args:
+            batch_id: バッチID
+            task: ペイロードに batch_id を持つ変換タスク
+            size: アップロードされたファイルのサイズ
+        """
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return
+            batch.task_ids.append(task.id)
+            batch.bytes_total += size
+            batch.counts[_COUNTER_OF[task.status]] += 1
+            batch.updated = time.monotonic()
+            batch.finished = None
+            self._statuses[task.id] = task.status
+            self._sizes[task.id] = size
+    
+    def reject(self, batch_id: str, filename: str, message: str) -> None:
+        """受け付けなかったファイルを記録する"""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is not None:
+                batch.rejected.append({'filename': filename, 'error': message})
+                batch.updated = time.monotonic()
+    
+    def task_ids(self, batch_id: str) -> List[uuid.UUID]:
+        """バッチのタスクID"""
+        return list(self.get(batch_id).task_ids)
+    
+    def on_task_status(self, task: Task, previous_status: TaskStatus) -> None:
+        """
+        バッチの件数を更新する（TaskQueueの状態変化リスナー）
+        
+        Args:
+            task: 状態が変化したタスク
+            previous_status: 変化前の状態
+        """
+        batch_id = (task.payload or {}).get('batch_id')
+        if batch_id is None or task.parent_id is not None:
+            return
+        
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            counted = self._statuses.get(task.id)
+            if batch is None or counted is None or counted == task.status:
+                return
+            
+            batch.counts[_COUNTER_OF[counted]] -= 1
+            batch.counts[_COUNTER_OF[task.status]] += 1
+            self._statuses[task.id] = task.status
+            if task.status in FINISHED_STATUSES and counted not in FINISHED_STATUSES:
+                batch.bytes_finished += self._sizes.get(task.id, 0)
+            elif counted in FINISHED_STATUSES and task.status not in FINISHED_STATUSES:
+                # 再起動後の再実行など、完了扱いから戻った場合
+                batch.bytes_finished -= self._sizes.get(task.id, 0)
+            
+            batch.updated = time.monotonic()
+            expected = batch.expected_files or 0
+            if batch.pending == 0 and len(batch.task_ids) + len(batch.rejected) >= expected:
+                if batch.finished is None:
+                    batch.finished = batch.updated
+                    self.logger.info(
+                        f"一括アップロードの変換が完了しました: {batch.id} "
+                        f"(完了{batch.counts['done']}件、失敗{batch.counts['failed']}件)"
+                    )
+            else:
+                batch.finished = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """統計情報を返す"""
+        with self._lock:
+            return {
+                'batches': len(self._batches),
+                'active': sum(1 for batch in self._batches.values() if batch.finished is None),
+                'tracked_tasks': len(self._statuses)
+            }
+    
+    def _expire(self) -> None:
+        """古いバッチを破棄する（ロックを保持して呼ぶ）"""
+        now = time.monotonic()
+        expired = [
+            batch for batch in self._batches.values()
+            if now - batch.updated > self.ttl and batch.pending == 0
+        ]
+        while len(self._batches) - len(expired) >= self.max_batches:
+            oldest = next(batch for batch in self._batches.values() if batch not in expired)
+            expired.append(oldest)
+        
+        for batch in expired:
+            del self._batches[batch.id]
+            for task_id in batch.task_ids:
+                self._statuses.pop(task_id, None)
+                self._sizes.pop(task_id, None)
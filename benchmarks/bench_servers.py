@@ -0,0 +1,162 @@
+"""
+WsgiToAsgi でラップしたFlaskアプリとネイティブASGIアプリの比較ベンチマーク
+
+それぞれ run.py をサブプロセスとして起動し、同じシナリオを同じ並列度で実行して
+スループットとレイテンシ（p50/p95）を並べて表示する。標準ライブラリのみを使用する
+
+使い方:
+    python benchmarks/bench_servers.py [-c 並列数] [-n リクエスト数]
+"""
+import argparse
+import http.client
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# シナリオ: (名前, リクエスト関数を作る関数, リクエスト数の倍率)
+Scenario = Tuple[str, Callable[[str, int], Callable[[], int]], float]
+
+
+def multipart_body(filename: str, data: bytes, folder: str = 'default') -> Tuple[bytes, str]:
+    """アップロード用のマルチパート本文を作成"""
+    boundary = uuid.uuid4().hex
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8'),
+        data,
+        f'\r\n--{boundary}\r\nContent-Disposition: form-data; name="folder"\r\n\r\n{folder}\r\n'
+        f'--{boundary}--\r\n'.encode('utf-8')
+    ]
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def make_request(host: str, port: int, method: str, path: str,
+                 body: bytes = None, headers: Dict[str, str] = None) -> Callable[[], int]:
+    """1回分のリクエストを行う関数を作成（戻り値はステータスコード）"""
+    def run() -> int:
+        conn = http.client.HTTPConnection(host, port, timeout=120)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        finally:
+            conn.close()
+    return run
+
+
+def scenarios(large_upload_mb: int) -> List[Scenario]:
+    """ベンチマークのシナリオ一覧"""
+    small_body, small_type = multipart_body('small.txt', b'hello markitdown\n' * 512)
+    large_body, large_type = multipart_body('large.txt', b'x' * (large_upload_mb * 1024 * 1024))
+
+    return [
+        ('upload 8KB', lambda h, p: make_request(h, p, 'POST', '/api/upload', small_body, {'Content-Type': small_type}), 1.0),
+        (f'upload {large_upload_mb}MB', lambda h, p: make_request(h, p, 'POST', '/api/upload', large_body, {'Content-Type': large_type}), 0.1),
+        ('GET /output 4MB', lambda h, p: make_request(h, p, 'GET', '/output/default/bench-large.md'), 0.5),
+        ('GET /explore', lambda h, p: make_request(h, p, 'GET', '/explore/default'), 1.0),
+        ('GET /api/tasks', lambda h, p: make_request(h, p, 'GET', '/api/tasks'), 1.0),
+    ]
+
+
+def wait_ready(host: str, port: int, timeout: float = 60) -> None:
+    """サーバーが応答するまで待機"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if make_request(host, port, 'GET', '/api/config')() == 200:
+                return
+        except OSError:
+            time.sleep(0.3)
+    raise RuntimeError('サーバーが起動しませんでした')
+
+
+def run_scenario(request: Callable[[], int], total: int, concurrency: int) -> Dict[str, float]:
+    """シナリオを並列実行して統計を返す"""
+    latencies: List[float] = []
+    errors = 0
+
+    def timed() -> None:
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            status = request()
+            if status >= 400:
+                errors += 1
+        except OSError:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(total):
+            executor.submit(timed)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'rps': total / elapsed if elapsed else 0.0,
+        'p50': statistics.median(latencies) * 1000,
+        'p95': latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0,
+        'errors': errors
+    }
+
+
+def bench_server(mode: str, port: int, args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    """指定モードでサーバーを起動してすべてのシナリオを実行"""
+    output_dir = tempfile.mkdtemp(prefix=f'bench-{mode}-')
+    os.makedirs(os.path.join(output_dir, 'default'), exist_ok=True)
+    with open(os.path.join(output_dir, 'default', 'bench-large.md'), 'w', encoding='utf-8') as f:
+        f.write('# bench\n' + ('lorem ipsum dolor sit amet\n' * 160000))
+
+    process = subprocess.Popen(
+        [sys.executable, 'run.py', output_dir, '-p', str(port), '-H', '127.0.0.1', '-s', mode],
+        cwd=ROOT_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    results: Dict[str, Dict[str, float]] = {}
+    try:
+        wait_ready('127.0.0.1', port)
+        for name, factory, ratio in scenarios(args.large_upload_mb):
+            total = max(args.concurrency, int(args.requests * ratio))
+            results[name] = run_scenario(factory('127.0.0.1', port), total, args.concurrency)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='WsgiToAsgi とネイティブASGIの比較ベンチマーク')
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='並列数 (デフォルト: 16)')
+    parser.add_argument('-n', '--requests', type=int, default=400, help='シナリオごとの基準リクエスト数 (デフォルト: 400)')
+    parser.add_argument('--large-upload-mb', type=int, default=12, help='大きなアップロードのサイズMB (デフォルト: 12)')
+    parser.add_argument('--port', type=int, default=5900, help='使用するポートの開始番号 (デフォルト: 5900)')
+    args = parser.parse_args()
+
+    results = {
+        'wsgi': bench_server('wsgi', args.port, args),
+        'asgi': bench_server('asgi', args.port + 1, args)
+    }
+
+    print(f"並列数: {args.concurrency}")
+    print(f"{'scenario':<20} {'wsgi rps':>10} {'asgi rps':>10} {'wsgi p50':>10} {'asgi p50':>10} {'wsgi p95':>10} {'asgi p95':>10} {'errors':>8}")
+    for name in results['wsgi']:
+        w, a = results['wsgi'][name], results['asgi'][name]
+        print(f"{name:<20} {w['rps']:>10.1f} {a['rps']:>10.1f} {w['p50']:>8.1f}ms {a['p50']:>8.1f}ms "
+              f"{w['p95']:>8.1f}ms {a['p95']:>8.1f}ms {int(w['errors'])}/{int(a['errors'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,15 @@ VERSION = "1.0.1"
 # 基本設定
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 OUTPUT_DIR = os.path.join(BASE_DIR, 'output')
-TEMP_DIR = os.path.join(BASE_DIR, 'temp')
+# 共有キューで複数のノードを動かす場合は、すべてのノードから同じ一時ディレクトリを参照する
+TEMP_DIR = os.environ.get('MARKITDOWN_TEMP_DIR') or os.path.join(BASE_DIR, 'temp')
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+TASK_ARCHIVE_PATH = os.path.join(BASE_DIR, 'archive', 'tasks.jsonl')
+TASK_JOURNAL_PATH = os.path.join(BASE_DIR, 'archive', 'tasks.db')
+SEARCH_INDEX_PATH = os.path.join(BASE_DIR, 'archive', 'search.db')
+PROFILE_DIR = os.path.join(BASE_DIR, 'archive', 'profiles')
+SHARED_QUEUE_PATH = os.environ.get('MARKITDOWN_QUEUE_DB') or os.path.join(BASE_DIR, 'archive', 'queue.db')
+UPLOAD_DIR = os.path.join(TEMP_DIR, 'uploads')
 
 # デフォルトフォルダ
 DEFAULT_FOLDERS = ['default', 'report', 'document']
@@ -20,4 +28,144 @@ ALLOWED_EXTENSIONS = {
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-key-for-markitdown-app'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB制限
-    DEBUG = True
\ No newline at end of file
+    DEBUG = True
+    
+    # タスクキューのワーカー数
+    MAX_WORKERS = 4
+    
+    # タスクのスケジューリング（レーンごとに重み付きで公平に実行し、レーン内は優先度順）
+    SCHEDULER_ENABLED = True
+    SCHEDULER_LANE_KEYS = ('folder', 'client_ip')  # レーンを分けるペイロードのキー
+    SCHEDULER_MAX_RUNNING_PER_LANE = 0  # 1レーンの同時実行数の上限（0で無制限）
+    SCHEDULER_FOLDER_WEIGHTS = {}  # フォルダごとのレーンの重み（例: {'report': 0.5}、省略時は1）
+    TASK_PRIORITY_MIN = -10  # APIで指定できる優先度の範囲（大きいほど先に実行）
+    TASK_PRIORITY_MAX = 10
+    
+    # 受け付け制御（上限を超えると 429 と処理速度から求めた Retry-After を返す、0で無効）
+    ADMISSION_MAX_QUEUED_TASKS = 200  # 待機・処理中のタスク数
+    ADMISSION_MAX_QUEUED_COST = 2000  # 待機・処理中のタスクの見積もりコストの合計
+    ADMISSION_MAX_TEMP_BYTES = 10 * 1024 * 1024 * 1024  # 一時ディレクトリの使用量（10GB）
+    ADMISSION_MAX_INFLIGHT_BYTES = 512 * 1024 * 1024  # 同時に受信中のリクエスト本文の合計
+    ADMISSION_DRAIN_WINDOW = 300  # 処理速度を測る期間（秒）
+    ADMISSION_RETRY_AFTER_MAX = 300  # Retry-After の上限（秒）
+    # 見積もりコスト（1件あたり1＋種類ごとの1MBあたりのコスト×サイズ、URLは固定）
+    ADMISSION_COST_PER_MB = {
+        'pdf': 8.0, 'pptx': 4.0, 'ppt': 4.0, 'xlsx': 4.0, 'xls': 4.0, 'docx': 2.0, 'doc': 2.0,
+        'zip': 4.0, 'html': 1.0, 'htm': 1.0, 'txt': 0.2, 'log': 0.2, 'md': 0.2, 'markdown': 0.2,
+        'csv': 0.5, 'json': 0.5, 'xml': 0.5, 'default': 1.0
+    }
+    ADMISSION_URL_COST = 2.0
+    
+    # 同じURLの変換の相乗り（正規化したURLと変換オプションが同じ変換が実行中なら、その結果をコピーする）
+    URL_DEDUP_ENABLED = True
+    URL_DEDUP_FRESHNESS = 300  # 完了した変換の結果を再利用する秒数（0で実行中の相乗りのみ）
+    URL_DEDUP_MAX_ENTRIES = 1000  # 再利用のために覚えておく結果の最大数
+    
+    # URLの一括変換（URLの一覧・サイトマップを展開し、取得先のホストごとに同時実行数と間隔を制限して変換）
+    URL_BULK_MAX_URLS = 1000  # 1回の一括変換で変換するURLの上限
+    URL_BULK_SITEMAP_ESTIMATE = 100  # 受け付け時にサイトマップのURL数として見積もる件数（展開するまで不明のため）
+    URL_BULK_MAX_PER_HOST = 2  # 1ホストへの同時取得数（0で無制限、スケジューラが有効な場合のみ）
+    URL_BULK_HOST_INTERVAL = 1.0  # 同じホストへの取得を開始する最小間隔（秒）
+    
+    # MarkItDownの生成オプション（変更時はコンバータプールが再生成される）
+    CONVERTER_OPTIONS = {'enable_plugins': False}
+    
+    # 変換タスクの実行バックエンド（"thread" または "process"）
+    # PDF/PPTX/XLSXの解析はGILを保持するため、同時に多く変換する場合は "process" でワーカープロセスに分ける
+    # （プロセスは spawn で起動するため、ハンドラーとペイロードはpickle可能である必要がある）
+    CONVERSION_EXECUTOR = 'thread'
+    
+    # タスクタイプごとの1回の実行の制限時間（秒、超えるとエラー。プロセス実行ならワーカーごと強制終了）
+    TASK_TIMEOUTS = {
+        'conversion': 600,
+        'pdf_pages': 300,
+        'conversion_merge': 120,
+        'archive_member': 300,
+        'archive_merge': 120,
+        'url_batch': 120,
+        'url_batch_merge': 120
+    }
+    # ワーカープロセスの入れ替え（処理したタスク数・処理後のRSSがしきい値を超えたら作り直す、0で無効）
+    WORKER_MAX_TASKS = 200
+    WORKER_MAX_RSS = 1024 * 1024 * 1024  # 1GB
+    
+    # 大きなPDFのページ分割変換（しきい値以上のページ数ならページ範囲ごとに並列変換、0で無効）
+    PDF_SPLIT_MIN_PAGES = 40
+    PDF_SPLIT_PAGES_PER_RANGE = 10  # 1サブタスクあたりのページ数
+    
+    # ZIPアーカイブの展開変換（対応形式のメンバーごとにサブタスクで並列変換）
+    ZIP_FAN_OUT = True
+    ZIP_OUTPUT_MODE = 'combined'  # "combined"=1つのMarkdownにまとめる、"folder"=メンバーごとのファイル
+    ZIP_MAX_MEMBERS = 500  # 変換するメンバー数の上限
+    
+    # 変換結果キャッシュ（ファイル内容のSHA-256＋変換オプションをキーにする）
+    CONVERSION_CACHE_ENABLED = True
+    CONVERSION_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512MB
+    
+    # URL変換の取得元のHTTPキャッシュ（ETag / Last-Modified で条件付き再取得し、304なら変換済みのMarkdownを再利用）
+    HTTP_CACHE_ENABLED = True
+    HTTP_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512MB
+    HTTP_CACHE_MAX_ENTRY_BYTES = 64 * 1024 * 1024  # これより大きい本文は保存しない
+    HTTP_TIMEOUT = 30  # 接続・読み込みのタイムアウト（秒）
+    HTTP_POOL_CONNECTIONS = 16  # 接続を保持するホスト数
+    HTTP_POOL_MAXSIZE = 8  # 1ホストあたりの保持する接続数
+    
+    # タスクの保持ポリシー（超過・期限切れの完了タスクはアーカイブに移す）
+    TASK_RETENTION_MAX = 1000  # 保持する完了タスクの最大数
+    TASK_RETENTION_TTL = 24 * 60 * 60  # 完了タスクの保持秒数
+    
+    # タスクの永続化（SQLite・WALモード。再起動時に待機中・処理中だったタスクを再実行する）
+    TASK_JOURNAL_ENABLED = True
+    TASK_JOURNAL_FLUSH_INTERVAL = 0.5  # 書き込みをまとめる間隔（秒、異常終了時はこの間の更新が失われる）
+    
+    # 共有キュー（複数の run.py / worker.py が1つのSQLiteのキューを共有する。有効時はタスクの永続化を兼ねる）
+    # run.py --role web / worker.py で起動した場合は設定によらず有効になる
+    SHARED_QUEUE_ENABLED = os.environ.get('MARKITDOWN_SHARED_QUEUE') == '1'
+    SHARED_QUEUE_LEASE_TTL = 30  # リースの有効秒数（この間ハートビートのないワーカーのタスクは再実行する）
+    SHARED_QUEUE_HEARTBEAT_INTERVAL = 5  # リースを延長する間隔（秒）
+    SHARED_QUEUE_POLL_INTERVAL = 0.5  # タスクの取得・状態の取り込みの間隔（秒）
+    SHARED_QUEUE_MAX_ATTEMPTS = 3  # リース切れで再実行する回数の上限
+    SHARED_QUEUE_DRAIN_TIMEOUT = 60  # ワーカー停止時に実行中のタスクの完了を待つ秒数
+    
+    # タスク状態のイベント配信（SSE）
+    SSE_HEARTBEAT_INTERVAL = 15  # ハートビート間隔（秒）
+    SSE_CLIENT_QUEUE_SIZE = 256  # クライアントごとの未送信イベント上限（超えると再同期）
+    SSE_HISTORY = 1000  # 再接続時に再送できるイベント数
+    
+    # 分割アップロード（初期化→チャンク送信→完了、中断しても続きから再開できる）
+    MAX_UPLOAD_SIZE = 2 * 1024 * 1024 * 1024  # 2GB（1回のリクエストの上限は MAX_CONTENT_LENGTH）
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # クライアントに推奨するチャンクサイズ
+    UPLOAD_SESSION_TTL = 24 * 60 * 60  # 更新のないアップロードを破棄するまでの秒数
+    
+    # 複数ファイルの一括アップロード（1回のリクエストで複数のファイルを受け取り、バッチ単位で進捗を集計）
+    UPLOAD_BATCH_MAX_FILES = 500  # 1回のリクエストで受け付けるファイル数
+    UPLOAD_BATCH_MAX = 1000  # 保持するバッチの最大数
+    UPLOAD_BATCH_TTL = 60 * 60  # 完了したバッチを破棄するまでの秒数
+
+    # フォルダ一覧（/explore、/api/folders）のインデックス
+    FOLDER_INDEX_RECONCILE_INTERVAL = 30  # 一覧をディスクと突き合わせて読み込み直すまでの秒数（他のノードや手作業の変更の反映）
+    FOLDER_INDEX_MAX_DIRS = 256  # 一覧を保持するディレクトリの最大数
+    EXPLORE_MAX_LIMIT = 5000  # /explore で limit に指定できる最大件数（limit 省略時はすべて返す）
+
+    # 変換したMarkdownの全文検索（/api/search、SQLite FTS5）
+    SEARCH_INDEX_ENABLED = True
+    SEARCH_FLUSH_INTERVAL = 1.0  # 登録をまとめて書き込む間隔（秒）
+    SEARCH_RECONCILE_INTERVAL = 10 * 60  # 出力ディレクトリと突き合わせる間隔（秒、0で起動時のみ）
+    SEARCH_MAX_DOCUMENT_BYTES = 10 * 1024 * 1024  # 1ファイルから登録する本文の最大サイズ
+    SEARCH_MAX_LIMIT = 100  # 1回の検索で返す最大件数
+    SEARCH_SHORT_TERM_SCAN_LIMIT = 2000  # 2文字以下の語だけの検索で部分一致を調べる文書数（新しいものから）
+
+    # 変換結果の事前圧縮（/output で Accept-Encoding に応じて gzip・brotli のファイルをそのまま返す）
+    OUTPUT_PRECOMPRESS_ENABLED = True
+    OUTPUT_PRECOMPRESS_MIN_BYTES = 16 * 1024  # これより小さいMarkdownは圧縮しない
+
+    # フォルダの一括ダウンロード（/api/folders/<id>/export）
+    EXPORT_ZIP_COMPRESSION = 'deflated'  # ZIPの既定の圧縮方式（"stored"=無圧縮、Content-Length 付き）
+
+    # Markdownのプレビュー（/api/preview、サーバー側でHTMLに変換し、ページ単位でディスクにキャッシュ）
+    PREVIEW_PAGE_BYTES = 64 * 1024  # 1ページの目安のサイズ（元のMarkdownのバイト数）
+    PREVIEW_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 変換結果のキャッシュのサイズ上限
+
+    # 時間のかかったタスクのプロファイル（cProfile、変換結果の隣に「出力ファイル名.prof」で保存）
+    PROFILE_ENABLED = False
+    PROFILE_THRESHOLD = 5.0  # プロファイルを保存する所要時間の下限（秒）
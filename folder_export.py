@@ -0,0 +1,268 @@
+"""
+フォルダの一括ダウンロード（ZIP・tar.gz のストリーミング生成）
+
+フォルダ内のファイルを読みながらアーカイブを少しずつ生成して送り出すため、
+フォルダの大きさによらずメモリ使用量は一定で、一時ファイルも作らない。
+無圧縮のZIPはファイルの一覧からアーカイブのサイズが決まるため Content-Length を付けられる
+"""
+import os
+import tarfile
+import time
+import zipfile
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from werkzeug.security import safe_join
+
+from handlers.precompress import is_sidecar
+
+# アーカイブの形式
+EXPORT_FORMATS = ('zip', 'tar.gz')
+
+# ZIPの圧縮方式
+ZIP_COMPRESSIONS = {'deflated': zipfile.ZIP_DEFLATED, 'stored': zipfile.ZIP_STORED}
+
+# ファイルを読み出す単位
+READ_CHUNK_BYTES = 256 * 1024
+
+# ZIP64を使わない無圧縮ZIPの各部のサイズ（データディスクリプタ付き、コメント・拡張フィールドなし）
+_ZIP_LOCAL_HEADER = 30
+_ZIP_DATA_DESCRIPTOR = 16
+_ZIP_CENTRAL_HEADER = 46
+_ZIP_END_RECORD = 22
+_ZIP_MAX_ENTRIES = 0xFFFF
+
+# tar のブロックサイズとレコードサイズ
+_TAR_BLOCK = tarfile.BLOCKSIZE
+_TAR_RECORD = tarfile.RECORDSIZE
+
+
+class FolderExportError(Exception):
+    """フォルダの一括ダウンロードのエラー（HTTPステータス付き）"""
+    
+    def __init__(self, message: str, status: int = 400):
+        self.message = message
+        self.status = status
+        super().__init__(message)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """APIレスポンス用の辞書"""
+        return {'error': self.message}
+
+
+class ExportFile:
+    """アーカイブに入れるファイル（一覧を作った時点のサイズだけを読み出す）"""
+    
+    __slots__ = ('path', 'arcname', 'size', 'mtime')
+    
+    def __init__(self, path: str, arcname: str, size: int, mtime: float):
+        self.path = path
+        self.arcname = arcname
+        self.size = size
+        self.mtime = mtime
+
+
+class FolderExport:
+    """フォルダのアーカイブ（イテレータとして本文を少しずつ返す）"""
+    
+    def __init__(
+        self,
+        root: str,
+        folder_id: str,
+        archive_format: str = 'zip',
+        compression: str = 'deflated',
+        since: Optional[float] = None,
+        extensions: Optional[List[str]] = None
+    ):
+        """
+        対象のファイルの一覧を作る
+        
+        Args:
+            root: 出力ディレクトリ
+            folder_id: フォルダID（出力ディレクトリ直下のフォルダ名）
+            archive_format: アーカイブの形式（zip, tar.gz）
+            compression: ZIPの圧縮方式（deflated, stored）
+            since: この時刻（UNIX時間）以降に更新されたファイルに絞り込む
+            extensions: 含める拡張子（"md" など、Noneですべて）
+        
+        Raises:
+            FolderExportError: 形式やフォルダIDの指定が不正な場合（400）、フォルダが存在しない場合（404）
+        """
+        if archive_format not in EXPORT_FORMATS:
+            raise FolderExportError(f"形式は {', '.join(EXPORT_FORMATS)} のいずれかを指定してください")
+        if compression not in ZIP_COMPRESSIONS:
+            raise FolderExportError(f"圧縮方式は {', '.join(ZIP_COMPRESSIONS)} のいずれかを指定してください")
+        
+        # 空・"."・".." は出力ディレクトリ全体やその外を指すため、フォルダIDとして扱わない
+        if folder_id in ('', '.', '..') or '/' in folder_id or '\\' in folder_id:
+            raise FolderExportError('無効なフォルダIDです')
+        folder_path = safe_join(root, folder_id)
+        if folder_path is None or not os.path.isdir(folder_path):
+            raise FolderExportError('フォルダが見つかりません', 404)
+        
+        self.folder_id = folder_id
+        self.archive_format = archive_format
+        self.compression = compression
+        suffixes = tuple(f".{ext.lower().lstrip('.')}" for ext in extensions) if extensions else None
+        self.files = _collect_files(folder_path, folder_id, since, suffixes)
+    
+    @property
+    def filename(self) -> str:
+        """ダウンロードするファイル名"""
+        return f"{self.folder_id}.{self.archive_format}"
+    
+    @property
+    def content_type(self) -> str:
+        """Content-Type"""
+        return 'application/zip' if self.archive_format == 'zip' else 'application/gzip'
+    
+    @property
+    def content_length(self) -> Optional[int]:
+        """アーカイブのサイズ（無圧縮のZIPでZIP64を使わない場合のみ、それ以外はNone）"""
+        if self.archive_format != 'zip' or self.compression != 'stored' or len(self.files) >= _ZIP_MAX_ENTRIES:
+            return None
+        total = _ZIP_END_RECORD
+        for export_file in self.files:
+            name_length = len(export_file.arcname.encode('utf-8'))
+            total += (
+                _ZIP_LOCAL_HEADER + name_length + export_file.size + _ZIP_DATA_DESCRIPTOR
+                + _ZIP_CENTRAL_HEADER + name_length
+            )
+        # ZIP64の拡張が必要になる大きさでは、各部のサイズが変わるため見積もらない
+        return total if total <= zipfile.ZIP64_LIMIT else None
+    
+    def __iter__(self) -> Iterator[bytes]:
+        if self.archive_format == 'zip':
+            return self._iter_zip()
+        return self._iter_tar_gz()
+    
+    def _iter_zip(self) -> Iterator[bytes]:
+        """ZIPを生成する（シークできない出力に書くため、各ファイルの後ろにデータディスクリプタが付く）"""
+        sink = _StreamSink()
+        with zipfile.ZipFile(sink, 'w', compression=ZIP_COMPRESSIONS[self.compression]) as archive:
+            for export_file in self.files:
+                info = zipfile.ZipInfo(export_file.arcname, date_time=_zip_date_time(export_file.mtime))
+                info.compress_type = ZIP_COMPRESSIONS[self.compression]
+                info.external_attr = 0o644 << 16
+                # ZIP64が必要かどうかの判定に使われる
+                info.file_size = export_file.size
+                with archive.open(info, 'w') as entry:
+                    for chunk in _read_file(export_file):
+                        entry.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+                data = sink.drain()
+                if data:
+                    yield data
+        yield sink.drain()
+    
+    def _iter_tar_gz(self) -> Iterator[bytes]:
+        """tar.gz を生成する（ヘッダーとデータのブロックを順に gzip で圧縮する）"""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        written = 0
+        for export_file in self.files:
+            info = tarfile.TarInfo(export_file.arcname)
+            info.size = export_file.size
+            info.mtime = int(export_file.mtime)
+            info.mode = 0o644
+            header = info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+            written += len(header)
+            data = compressor.compress(header)
+            if data:
+                yield data
+            
+            for chunk in _read_file(export_file):
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            padding = -export_file.size % _TAR_BLOCK
+            written += export_file.size + padding
+            data = compressor.compress(b'\0' * padding)
+            if data:
+                yield data
+        
+        # 終端の2ブロックと、レコードサイズまでの埋め草
+        end = 2 * _TAR_BLOCK
+        end += -(written + end) % _TAR_RECORD
+        yield compressor.compress(b'\0' * end) + compressor.flush()
+
+
+class _StreamSink:
+    """ZipFile の書き込み先（書かれたデータを溜めておき、drain() で取り出す）"""
+    
+    def __init__(self):
+        self._chunks: List[bytes] = []
+    
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self) -> None:
+        pass
+    
+    def drain(self) -> bytes:
+        """溜まったデータを取り出す"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _collect_files(
+    folder_path: str,
+    folder_id: str,
+    since: Optional[float],
+    suffixes: Optional[Tuple[str, ...]]
+) -> List[ExportFile]:
+    """フォルダ内のファイルを再帰的に集める（事前圧縮のサイドカーは除く、パスの順）"""
+    files = []
+    pending = ['']
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(os.path.join(folder_path, current)) as iterator:
+                items = list(iterator)
+        except OSError:
+            continue
+        for item in items:
+            relative_path = f"{current}/{item.name}" if current else item.name
+            try:
+                if item.is_dir():
+                    pending.append(relative_path)
+                    continue
+                if not item.is_file() or is_sidecar(item.name) or item.name.endswith('.tmp'):
+                    continue
+                if suffixes and not item.name.lower().endswith(suffixes):
+                    continue
+                result = item.stat()
+            except OSError:
+                continue
+            if since is not None and result.st_mtime < since:
+                continue
+            files.append(ExportFile(item.path, f"{folder_id}/{relative_path}", result.st_size, result.st_mtime))
+    
+    files.sort(key=lambda export_file: export_file.arcname)
+    return files
+
+
+def _read_file(export_file: ExportFile) -> Iterator[bytes]:
+    """
+    一覧を作った時点のサイズだけファイルを読み出す
+    
+    Raises:
+        OSError: 途中でファイルが短くなった場合（Content-Length と合わなくなるため送信を中断する）
+    """
+    remaining = export_file.size
+    with open(export_file.path, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(min(READ_CHUNK_BYTES, remaining))
+            if not chunk:
+                raise OSError(f"ダウンロード中にファイルが変更されました: {export_file.arcname}")
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _zip_date_time(mtime: float) -> Tuple[int, int, int, int, int, int]:
+    """ZIPの更新日時（ZIPで表せる1980年以降に丸める）"""
+    date_time = time.localtime(mtime)[:6]
+    return max(date_time, (1980, 1, 1, 0, 0, 0))
@@ -0,0 +1,309 @@
+"""
+出力フォルダのディレクトリ一覧のインデックス
+
+ディレクトリごとの一覧を最初の参照時に os.scandir で1回だけ読み込んでメモリに保持し、
+変換の完了やフォルダの作成・名前変更・削除のたびに該当するエントリだけを更新する。
+他のノードや手作業による変更は、一定時間ごとにディスクと突き合わせて取り込む
+"""
+import logging
+import os
+import stat
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from handlers.precompress import is_sidecar
+from taskqueue import Task, TaskStatus
+
+# 並べ替えに使える項目
+SORT_KEYS = ('name', 'mtime', 'size')
+
+
+class FolderIndexError(Exception):
+    """フォルダ一覧のエラー（HTTPステータス付き）"""
+    
+    def __init__(self, message: str, status: int = 400):
+        self.message = message
+        self.status = status
+        super().__init__(message)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """APIレスポンス用の辞書"""
+        return {'error': self.message}
+
+
+class IndexEntry:
+    """ディレクトリ内の1件（ファイルまたはサブディレクトリ）"""
+    
+    __slots__ = ('name', 'is_dir', 'mtime', 'size')
+    
+    def __init__(self, name: str, is_dir: bool, mtime: float, size: int):
+        self.name = name
+        self.is_dir = is_dir
+        self.mtime = mtime
+        self.size = size
+
+
+class _Listing:
+    """1つのディレクトリの一覧と、並べ替え済みの順序のキャッシュ"""
+    
+    def __init__(self, entries: Dict[str, IndexEntry]):
+        self.entries = entries
+        self.scanned = time.monotonic()
+        # (並べ替えの項目, 降順か) -> 並べ替え済みのエントリ（変更のたびに破棄）
+        self.sorted: Dict[Tuple[str, bool], List[IndexEntry]] = {}
+    
+    def put(self, entry: IndexEntry) -> None:
+        """エントリを追加・更新する"""
+        self.entries[entry.name] = entry
+        self.sorted.clear()
+    
+    def discard(self, name: str) -> None:
+        """エントリを削除する"""
+        if self.entries.pop(name, None) is not None:
+            self.sorted.clear()
+
+
+class FolderIndex:
+    """出力フォルダのディレクトリ一覧のキャッシュ（ディレクトリ単位のLRU）"""
+    
+    def __init__(
+        self,
+        root: str,
+        reconcile_interval: float = 30,
+        max_dirs: int = 256,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        初期化
+        
+        Args:
+            root: 出力ディレクトリ
+            reconcile_interval: 一覧をディスクと突き合わせて読み込み直すまでの秒数
+            max_dirs: 一覧を保持するディレクトリの最大数（古いものから破棄）
+            logger: カスタムロガー（省略可）
+        """
+        self.root = os.path.abspath(root)
+        self.reconcile_interval = reconcile_interval
+        self.max_dirs = max(1, max_dirs)
+        self.logger = logger or logging.getLogger(__name__)
+        
+        self._lock = threading.Lock()
+        # OUTPUT_DIRからの相対パス（ルートは ""） -> 一覧
+        self._listings: "OrderedDict[str, _Listing]" = OrderedDict()
+        
+        # 統計
+        self.hits = 0
+        self.scans = 0
+        self.updates = 0
+    
+    def list(
+        self,
+        folder_path: str,
+        sort: str = 'name',
+        descending: bool = False,
+        since: Optional[float] = None,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Tuple[List[IndexEntry], int]:
+        """
+        ディレクトリ内の一覧を取得する（ディレクトリを先に並べる）
+        
+        Args:
+            folder_path: 出力ディレクトリからの相対パス
+            sort: 並べ替えの項目（name, mtime, size）
+            descending: 降順にするかどうか
+            since: この時刻（UNIX時間）以降に更新されたものに絞り込む
+            offset: 先頭から読み飛ばす件数
+            limit: 返す件数の上限（Noneで残りすべて）
+        
+        Returns:
+            (エントリの一覧, 絞り込み後の総件数)
+        
+        Raises:
+            FolderIndexError: パスが不正な場合（400）、フォルダが存在しない場合（404）
+        """
+        if sort not in SORT_KEYS:
+            raise FolderIndexError(f"並べ替えの項目は {', '.join(SORT_KEYS)} のいずれかを指定してください")
+        
+        key = self._key(folder_path)
+        listing = self._listing(key)
+        with self._lock:
+            ordered = listing.sorted.get((sort, descending))
+            if ordered is None:
+                ordered = _sort_entries(listing.entries.values(), sort, descending)
+                listing.sorted[(sort, descending)] = ordered
+        
+        if since is not None:
+            ordered = [entry for entry in ordered if entry.mtime >= since]
+        end = None if limit is None else offset + limit
+        return ordered[offset:end], len(ordered)
+    
+    def folders(self) -> List[str]:
+        """出力ディレクトリ直下のフォルダ名（名前順）"""
+        entries, _ = self.list('')
+        return [entry.name for entry in entries if entry.is_dir]
+    
+    def note_path(self, path: str) -> None:
+        """
+        作成・更新されたファイルやフォルダを一覧に反映する
+        （一覧を保持している親ディレクトリだけを、ルートまでさかのぼって更新する）
+        
+        Args:
+            path: 出力ディレクトリからの相対パス、または出力ディレクトリ内の絶対パス
+        """
+        key = self._relative(path)
+        if key is None or is_sidecar(_split(key)[1]):
+            return
+        
+        while key:
+            parent, name = _split(key)
+            entry = _stat_entry(os.path.join(self.root, key), name)
+            with self._lock:
+                listing = self._listings.get(parent)
+                if listing is not None:
+                    if entry is None:
+                        listing.discard(name)
+                    else:
+                        listing.put(entry)
+                    self.updates += 1
+            key = parent
+    
+    def remove(self, path: str) -> None:
+        """
+        削除されたファイルやフォルダを一覧から除く（フォルダの場合は配下の一覧も破棄する）
+        
+        Args:
+            path: 出力ディレクトリからの相対パス、または出力ディレクトリ内の絶対パス
+        """
+        key = self._relative(path)
+        if not key:
+            return
+        
+        with self._lock:
+            prefix = key + '/'
+            for cached in [k for k in self._listings if k == key or k.startswith(prefix)]:
+                del self._listings[cached]
+        # 親ディレクトリの更新日時も変わるため、ルートまでさかのぼって反映する
+        self.note_path(key)
+    
+    def on_task_status(self, task: Task, previous_status: TaskStatus) -> None:
+        """
+        完了した変換の出力ファイルを一覧に反映する（TaskQueueの状態変化リスナー）
+        
+        Args:
+            task: 状態が変化したタスク
+            previous_status: 変化前の状態
+        """
+        if task.status != TaskStatus.SUCCESS or previous_status == TaskStatus.SUCCESS:
+            return
+        if isinstance(task.result, dict) and task.result.get('output_path'):
+            self.note_path(task.result['output_path'])
+    
+    def stats(self) -> Dict[str, Any]:
+        """統計情報を返す"""
+        with self._lock:
+            return {
+                'directories': len(self._listings),
+                'entries': sum(len(listing.entries) for listing in self._listings.values()),
+                'reconcile_interval': self.reconcile_interval,
+                'hits': self.hits,
+                'scans': self.scans,
+                'updates': self.updates
+            }
+    
+    def _listing(self, key: str) -> _Listing:
+        """一覧を取得する（未読み込み、または突き合わせの時期を過ぎていれば読み込む）"""
+        with self._lock:
+            listing = self._listings.get(key)
+            if listing is not None and time.monotonic() - listing.scanned < self.reconcile_interval:
+                self._listings.move_to_end(key)
+                self.hits += 1
+                return listing
+        
+        # 読み込みはロックの外で行う（同時に読み込んだ場合は後の結果で置き換える）
+        listing = _Listing(self._scan(key))
+        with self._lock:
+            self._listings[key] = listing
+            self._listings.move_to_end(key)
+            while len(self._listings) > self.max_dirs:
+                self._listings.popitem(last=False)
+            self.scans += 1
+        return listing
+    
+    def _scan(self, key: str) -> Dict[str, IndexEntry]:
+        """os.scandir でディレクトリを読み込む"""
+        full_path = os.path.join(self.root, key)
+        if not os.path.isdir(full_path):
+            with self._lock:
+                self._listings.pop(key, None)
+            if os.path.exists(full_path):
+                raise FolderIndexError('このパスはフォルダではありません')
+            raise FolderIndexError('フォルダが見つかりません', 404)
+        
+        entries = {}
+        with os.scandir(full_path) as iterator:
+            for item in iterator:
+                if is_sidecar(item.name):
+                    # 事前圧縮したファイルは元のファイルの別の表現のため一覧に含めない
+                    continue
+                try:
+                    is_dir = item.is_dir()
+                    result = item.stat()
+                except OSError:
+                    # 読み込み中に削除されたもの
+                    continue
+                entries[item.name] = IndexEntry(item.name, is_dir, result.st_mtime, 0 if is_dir else result.st_size)
+        return entries
+    
+    def _key(self, folder_path: str) -> str:
+        """
+        キャッシュのキー（出力ディレクトリからの正規化した相対パス）
+        
+        Raises:
+            FolderIndexError: 出力ディレクトリの外を指すパスの場合
+        """
+        key = self._relative(os.path.join(self.root, folder_path))
+        if key is None:
+            raise FolderIndexError('無効なパスです')
+        return key
+    
+    def _relative(self, path: str) -> Optional[str]:
+        """出力ディレクトリからの相対パス（"/" 区切り、外を指す場合はNone）"""
+        full_path = os.path.realpath(os.path.join(self.root, path))
+        root = os.path.realpath(self.root)
+        if full_path == root:
+            return ''
+        if not full_path.startswith(root + os.sep):
+            return None
+        return os.path.relpath(full_path, root).replace('\\', '/')
+
+
+def _sort_entries(entries: Any, sort: str, descending: bool) -> List[IndexEntry]:
+    """ディレクトリを先に、指定の項目で並べ替える（同じ値は名前順）"""
+    ordered = sorted(entries, key=lambda entry: entry.name.lower())
+    if sort == 'mtime':
+        ordered.sort(key=lambda entry: entry.mtime, reverse=descending)
+    elif sort == 'size':
+        ordered.sort(key=lambda entry: entry.size, reverse=descending)
+    elif descending:
+        ordered.reverse()
+    ordered.sort(key=lambda entry: not entry.is_dir)
+    return ordered
+
+
+def _split(key: str) -> Tuple[str, str]:
+    """相対パスを親ディレクトリと名前に分ける"""
+    parent, _, name = key.rpartition('/')
+    return parent, name
+
+
+def _stat_entry(full_path: str, name: str) -> Optional[IndexEntry]:
+    """パスのエントリを作成する（存在しなければNone）"""
+    try:
+        result = os.stat(full_path)
+    except OSError:
+        return None
+    is_dir = stat.S_ISDIR(result.st_mode)
+    return IndexEntry(name, is_dir, result.st_mtime, 0 if is_dir else result.st_size)
@@ -0,0 +1,249 @@
+"""
+ZIPアーカイブのメンバーごとの並列変換
+
+対応形式のメンバーをそれぞれサブタスクとして並列に変換し、結果を1つのMarkdownに
+まとめるか、メンバーごとのMarkdownファイルとして保存する。
+各サブタスクはアーカイブから自分のメンバーだけを読み出すため、全体を展開しない
+"""
+import logging
+import os
+import posixpath
+import re
+import shutil
+import uuid
+import zipfile
+from typing import Any, Dict, List, Optional, Tuple
+
+from taskqueue import (Task, TaskCancelledError, TaskResult, mark_stage,
+                       raise_if_cancelled, record_metric)
+
+from .converter_pool import get_converter_pool
+from .precompress import precompress_output
+
+logger = logging.getLogger(__name__)
+
+# メンバーのサブタスクとまとめ用のタスクタイプ
+ARCHIVE_MEMBER_TASK_TYPE = 'archive_member'
+ARCHIVE_MERGE_TASK_TYPE = 'archive_merge'
+
+# 出力方式
+ZIP_OUTPUT_COMBINED = 'combined'
+ZIP_OUTPUT_FOLDER = 'folder'
+
+
+def list_supported_members(source_path: str, max_members: int) -> Optional[List[str]]:
+    """
+    アーカイブ内の変換対象のメンバーを取得する
+    
+    Args:
+        source_path: ZIPファイルのパス
+        max_members: 変換するメンバーの上限
+    
+    Returns:
+        メンバー名の一覧（ZIPとして読めない場合はNone）
+    """
+    from config import ALLOWED_EXTENSIONS
+    
+    try:
+        with zipfile.ZipFile(source_path) as archive:
+            infos = archive.infolist()
+    except (zipfile.BadZipFile, OSError) as e:
+        logger.warning(f"ZIPファイルを読み込めませんでした: {source_path} - {str(e)}")
+        return None
+    
+    members = []
+    for info in infos:
+        name = info.filename
+        basename = posixpath.basename(name)
+        if info.is_dir() or not basename or basename.startswith('.') or name.startswith('__MACOSX/'):
+            continue
+        
+        # 入れ子のZIPは展開しない
+        extension = os.path.splitext(basename)[1][1:].lower()
+        if extension == 'zip' or extension not in ALLOWED_EXTENSIONS:
+            continue
+        
+        members.append(name)
+        if len(members) >= max_members:
+            logger.warning(f"ZIPのメンバー数が上限を超えたため先頭の{max_members}件のみ変換します: {source_path}")
+            break
+    return members
+
+
+def split_zip_archive(source_path: str, filename: str) -> Optional[TaskResult]:
+    """
+    ZIPファイルを対応形式のメンバーごとのサブタスクに分割する
+    
+    Args:
+        source_path: ZIPファイルのパス
+        filename: 元のファイル名
+    
+    Returns:
+        分割した場合はサブタスクを含むTaskResult、分割しない場合はNone
+        （対応形式のメンバーがなければMarkItDownのZIP変換に任せる）
+    """
+    from config import Config
+    
+    if os.path.splitext(filename)[1].lower() != '.zip' or not Config.ZIP_FAN_OUT:
+        return None
+    
+    members = list_supported_members(source_path, Config.ZIP_MAX_MEMBERS)
+    if not members:
+        return None
+    
+    # メンバーごとの変換結果は一時ファイルに書き出し、まとめる際にアーカイブ内の順に並べる
+    parts_dir = f"{source_path}.members"
+    os.makedirs(parts_dir, exist_ok=True)
+    
+    subtasks = [
+        Task(
+            id=uuid.uuid4(),
+            type=ARCHIVE_MEMBER_TASK_TYPE,
+            name=f"{filename} の変換 ({member})",
+            payload={
+                'source_path': source_path,
+                'member': member,
+                'member_index': index,
+                'part_path': os.path.join(parts_dir, f"{index:06d}.md")
+            }
+        )
+        for index, member in enumerate(members)
+    ]
+    
+    logger.info(f"ZIPをメンバーごとに分割して変換: {filename} ({len(members)}ファイル)")
+    return TaskResult.split_into(subtasks, ARCHIVE_MERGE_TASK_TYPE, unit='files')
+
+
+def handle_archive_member_task(task: Task) -> TaskResult:
+    """
+    ZIPのメンバー1つをMarkdownに変換するタスクハンドラ（メンバーはアーカイブから直接読み出す）
+    
+    Args:
+        task: メンバーのサブタスク (source_path, member, part_path を含む)
+    
+    Returns:
+        TaskResult: 変換結果（部分ファイルのパスとメンバー名）
+    """
+    from markitdown import StreamInfo
+    
+    payload: Dict[str, Any] = task.payload
+    member: str = payload['member']
+    basename = posixpath.basename(member)
+    
+    try:
+        with zipfile.ZipFile(payload['source_path']) as archive:
+            record_metric('input_bytes', archive.getinfo(member).file_size)
+            with archive.open(member) as stream:
+                with get_converter_pool().converter() as md:
+                    mark_stage('converter_ready')
+                    result = md.convert_stream(
+                        stream,
+                        stream_info=StreamInfo(
+                            extension=os.path.splitext(basename)[1].lower(),
+                            filename=basename
+                        )
+                    )
+        mark_stage('converted')
+        raise_if_cancelled()
+        
+        with open(payload['part_path'], 'w', encoding='utf-8') as f:
+            f.write(result.text_content)
+        mark_stage('written')
+        record_metric('output_bytes', os.path.getsize(payload['part_path']))
+        
+        return TaskResult.success({'part_path': payload['part_path'], 'member': member})
+    
+    except TaskCancelledError as e:
+        logger.info(f"ZIPメンバーの変換を中断しました: {e.message}")
+        return TaskResult.failure(e.message)
+    
+    except Exception as e:
+        logger.exception(f"ZIPメンバーの変換でエラーが発生しました: {member} - {str(e)}")
+        return TaskResult.failure(f"{member} の変換失敗: {str(e)}")
+
+
+def collect_member_results(
+    names: List[str],
+    results: List[Optional[Dict[str, Any]]],
+    errors: List[Optional[str]]
+) -> Tuple[List[Tuple[str, str]], List[Dict[str, Any]]]:
+    """
+    メンバーごとの変換結果を読み込む
+    
+    Args:
+        names: メンバー名（アーカイブ内の順）
+        results: サブタスクの結果（アーカイブ内の順）
+        errors: サブタスクのエラー（アーカイブ内の順）
+    
+    Returns:
+        (成功したメンバーの (名前, Markdown) の一覧, 全メンバーの状態の一覧)
+    """
+    converted: List[Tuple[str, str]] = []
+    members: List[Dict[str, Any]] = []
+    for name, result, error in zip(names, results, errors):
+        if result and not error:
+            with open(result['part_path'], 'r', encoding='utf-8') as f:
+                converted.append((name, f.read()))
+            members.append({'name': name, 'status': 'success'})
+        else:
+            members.append({'name': name, 'status': 'error', 'error': error})
+    return converted, members
+
+
+def combine_members(archive_name: str, converted: List[Tuple[str, str]]) -> str:
+    """
+    メンバーごとのMarkdownを見出し付きで1つにまとめる
+    （一括変換と同じキーでキャッシュするため、MarkItDown のZIP変換と同じ形式にする）
+    """
+    markdown_text = f"Content from the zip file `{archive_name}`:\n\n"
+    for member, text in converted:
+        markdown_text += f"## File: {member}\n\n{text}\n\n"
+    
+    # MarkItDown が変換結果全体に行う正規化（行末の空白と連続する空行の除去）も合わせる
+    markdown_text = '\n'.join(line.rstrip() for line in re.split(r'\r?\n', markdown_text.strip()))
+    return re.sub(r'\n{3,}', '\n\n', markdown_text)
+
+
+def write_member_folder(folder_path: str, archive_name: str, converted: List[Tuple[str, str]]) -> str:
+    """
+    メンバーごとのMarkdownをフォルダに保存する（アーカイブ内のフォルダ構成を保つ）
+    
+    Args:
+        folder_path: 保存先フォルダ
+        archive_name: アーカイブのファイル名
+        converted: 成功したメンバーの (名前, Markdown) の一覧
+    
+    Returns:
+        str: 各ファイルへのリンクを並べた目次のMarkdown
+    """
+    lines = [f"# {archive_name}\n"]
+    used = set()
+    for member, text in converted:
+        relative_path = _safe_member_path(member)
+        if relative_path in used:
+            # 拡張子違いで同名になる場合は元の拡張子を残す
+            relative_path = relative_path[:-len('.md')] + os.path.splitext(member)[1] + '.md'
+        used.add(relative_path)
+        output_path = os.path.join(folder_path, *relative_path.split('/'))
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        precompress_output(output_path)
+        lines.append(f"- [{member}]({relative_path})")
+    return '\n'.join(lines) + '\n'
+
+
+def remove_member_parts(source_path: str) -> None:
+    """メンバーごとの変換結果の一時ファイルを削除"""
+    shutil.rmtree(f"{source_path}.members", ignore_errors=True)
+
+
+def _safe_member_path(member: str) -> str:
+    """メンバー名を出力フォルダ内の安全な相対パス（拡張子を.mdに置換）に変換"""
+    parts = [
+        re.sub(r'[\\:*?"<>|]', '', part)
+        for part in member.split('/')
+        if part not in ('', '.', '..')
+    ]
+    relative_path = '/'.join(part for part in parts if part) or 'member'
+    return os.path.splitext(relative_path)[0] + '.md'
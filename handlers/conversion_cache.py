@@ -0,0 +1,224 @@
+"""
+ファイルハッシュをキーにした変換結果のディスクキャッシュ
+
+同一内容のファイルを同じ変換オプションで変換した場合は、md.convert を
+実行せずに保存済みのMarkdownを再利用する
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# キャッシュファイルの拡張子
+CACHE_SUFFIX = '.md'
+
+# キーの版（保存する変換結果が変わったときに上げ、古いエントリを使わないようにする）
+# 2: ページ範囲ごとに変換したPDFの連結結果を一括変換と同じ正規化で保存
+# 3: メンバーごとに変換したZIPのまとめを一括変換と同じ形式で保存
+CACHE_KEY_VERSION = 3
+
+
+def make_cache_key(content_hash: str, extension: str, options: Dict[str, Any]) -> str:
+    """
+    キャッシュキーを作成する
+    
+    Args:
+        content_hash: アップロードされたファイル内容のSHA-256
+        extension: ファイル拡張子（MarkItDownの形式判定に影響するため含める）
+        options: コンバータ生成オプションと変換パラメータ
+    
+    Returns:
+        str: キャッシュキー（16進文字列）
+    """
+    material = json.dumps(
+        {'version': CACHE_KEY_VERSION, 'sha256': content_hash, 'ext': extension.lower(), 'options': options},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class ConversionCache:
+    """サイズ上限付きLRUの変換結果キャッシュ"""
+    
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = 512 * 1024 * 1024,
+        suffix: str = CACHE_SUFFIX,
+        name: str = '変換キャッシュ'
+    ):
+        """
+        変換キャッシュの初期化
+        
+        Args:
+            cache_dir: キャッシュの保存先ディレクトリ
+            max_bytes: キャッシュ全体のサイズ上限（バイト）
+            suffix: キャッシュファイルの拡張子
+            name: ログに出すキャッシュの名前
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.name = name
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: str) -> Optional[str]:
+        """
+        キャッシュ済みのMarkdownを取得する（取得時に最終利用日時を更新）
+        
+        Args:
+            key: キャッシュキー
+        
+        Returns:
+            キャッシュがあればMarkdownテキスト、なければNone
+        """
+        path = self._path_for(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            # LRU判定用に更新日時を最終利用日時として使う
+            os.utime(path, None)
+            return text
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"{self.name}の読み込みに失敗しました: {key} - {str(e)}")
+            return None
+    
+    def put(self, key: str, text: str) -> None:
+        """
+        Markdownをキャッシュに保存する（上限を超えた場合は古いものから削除）
+        
+        Args:
+            key: キャッシュキー
+            text: 保存するMarkdownテキスト
+        """
+        path = self._path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        # 他のワーカーと競合しないよう一時ファイルに書いてから置き換える
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"{self.name}の書き込みに失敗しました: {key} - {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += size
+            over_limit = self._total_bytes is None or self._total_bytes > self.max_bytes
+        
+        if over_limit:
+            self.evict()
+    
+    def record(self, hit: bool) -> None:
+        """ヒット/ミスを記録する"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+    
+    def evict(self) -> int:
+        """
+        上限を超えている場合、最終利用日時の古いエントリから削除する
+        
+        Returns:
+            int: 削除したエントリ数
+        """
+        entries, total = self._scan()
+        removed = 0
+        
+        if total > self.max_bytes:
+            # 上限の9割まで削減して頻繁な削除を避ける
+            target = int(self.max_bytes * 0.9)
+            entries.sort(key=lambda e: e[1])
+            for path, _, size in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    removed += 1
+                except OSError:
+                    continue
+        
+        with self._lock:
+            self._total_bytes = total
+            self.evictions += removed
+        
+        if removed:
+            logger.info(f"{self.name}から{removed}件を削除しました")
+        return removed
+    
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの統計情報を返す"""
+        entries, total = self._scan()
+        with self._lock:
+            self._total_bytes = total
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(entries),
+                'bytes': total,
+                'max_bytes': self.max_bytes
+            }
+    
+    def _path_for(self, key: str) -> str:
+        """キーに対応するキャッシュファイルのパス（先頭2文字でディレクトリを分割）"""
+        return os.path.join(self.cache_dir, key[:2], key + self.suffix)
+    
+    def _scan(self) -> Tuple[List[Tuple[str, float, int]], int]:
+        """キャッシュディレクトリを走査して (パス, 更新日時, サイズ) の一覧と合計サイズを返す"""
+        entries: List[Tuple[str, float, int]] = []
+        total = 0
+        if not os.path.isdir(self.cache_dir):
+            return entries, total
+        
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith(self.suffix):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((entry.path, st.st_mtime, st.st_size))
+                total += st.st_size
+        return entries, total
+
+
+# プロセス内で共有する変換キャッシュ
+_cache: Optional[ConversionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_conversion_cache() -> ConversionCache:
+    """プロセス共通の変換キャッシュを取得（未初期化なら設定ファイルの値で作成）"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            from config import CACHE_DIR, Config
+            _cache = ConversionCache(CACHE_DIR, Config.CONVERSION_CACHE_MAX_BYTES)
+        return _cache
@@ -5,14 +5,26 @@ import logging
 import os
 import re
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 from urllib.parse import urlparse
 
-# Markitdownライブラリをインポート
-from markitdown import MarkItDown
-
+from config import OUTPUT_DIR, Config
 # taskqueueモジュールからインポート
-from taskqueue import Task, TaskResult
+from taskqueue import (Task, TaskCancelledError, TaskResult, mark_stage,
+                       raise_if_cancelled, record_metric)
+
+from .archive import (ZIP_OUTPUT_FOLDER, collect_member_results,
+                      combine_members, list_supported_members,
+                      remove_member_parts, split_zip_archive,
+                      write_member_folder)
+from .conversion_cache import get_conversion_cache, make_cache_key
+from .converter_pool import ConverterPool, get_converter_pool
+from .http_cache import (REVALIDATED, HttpSourceCache, get_http_cache,
+                         get_http_session, is_http_url, make_variant_key)
+from .pdf_pages import join_page_parts, remove_page_parts, split_large_pdf
+from .precompress import precompress_output
+from .url_batch import (batch_elapsed, build_index, collect_url_results,
+                        summarize_pages)
 
 logger = logging.getLogger(__name__)
 
@@ -36,12 +48,18 @@ def handle_conversion_task(task: Task) -> TaskResult:
         # 出力ディレクトリが存在することを確認
         os.makedirs(output_dir, exist_ok=True)
         
-        # MarkItDownの初期化
-        md = MarkItDown(enable_plugins=False)
+        # プール済みのMarkItDownを利用
+        pool = get_converter_pool()
         
         # 日付文字列を生成（ファイル名に使用）
         date_str = datetime.now().strftime('%Y%m%d')
         
+        # 変換キャッシュにヒットしたかどうか（キャッシュ対象外はNone）
+        cache_hit = None
+        
+        # URLの取得結果（HTTPキャッシュを使わない場合はNone）
+        http_cache_status = None
+        
         if source_type == 'file':
             # ファイルパスを取得
             source_path: str = payload.get('source_path', '')
@@ -51,13 +69,54 @@ def handle_conversion_task(task: Task) -> TaskResult:
             convert_params: Dict[str, Any] = {}
             
             logger.info(f"ファイル変換開始: {source_path}")
+            if os.path.exists(source_path):
+                record_metric('input_bytes', os.path.getsize(source_path))
+            
+            # アップロード時に計算したハッシュがあれば変換キャッシュを参照
+            # （メンバーごとのファイルに分けて保存するZIPは1つのMarkdownにならないため対象外）
+            content_hash = payload.get('source_sha256')
+            cacheable = not (_is_zip(filename) and Config.ZIP_FAN_OUT and Config.ZIP_OUTPUT_MODE == ZIP_OUTPUT_FOLDER)
+            cache = get_conversion_cache() if content_hash and Config.CONVERSION_CACHE_ENABLED and cacheable else None
+            cache_key = None
+            markdown_text = None
             
-            # 変換実行
-            result = md.convert(source_path, **convert_params)
+            if cache:
+                cache_key = make_cache_key(
+                    content_hash,
+                    os.path.splitext(filename)[1],
+                    {'converter': pool.options, 'params': convert_params}
+                )
+                markdown_text = cache.get(cache_key)
+                cache_hit = markdown_text is not None
+            
+            if markdown_text is None:
+                raise_if_cancelled()
+                
+                # 大きなPDFはページ範囲ごとのサブタスクに分割して並列に変換する
+                split = split_large_pdf(source_path, filename)
+                if split is not None:
+                    return split
+                
+                # ZIPは対応形式のメンバーごとのサブタスクに分割して並列に変換する
+                split = split_zip_archive(source_path, filename)
+                if split is not None:
+                    return split
+                
+                # 変換実行
+                with pool.converter() as md:
+                    mark_stage('converter_ready')
+                    result = md.convert(source_path, **convert_params)
+                markdown_text = result.text_content
+                mark_stage('converted')
+                raise_if_cancelled()
+                
+                if cache:
+                    cache.put(cache_key, markdown_text)
+            else:
+                logger.info(f"変換キャッシュを使用: {filename} ({content_hash})")
             
             # ファイル名作成（拡張子を除く）
-            base_filename = os.path.splitext(filename)[0]
-            output_filename = f"{base_filename}.{date_str}.md"
+            output_filename = _file_output_filename(filename, date_str)
             
         elif source_type == 'url':
             url: str = payload.get('url', '')
@@ -72,16 +131,23 @@ def handle_conversion_task(task: Task) -> TaskResult:
             
             logger.info(f"URL変換開始: {url} {'(YouTube)' if is_youtube else ''}")
             
-            # 変換実行
-            result = md.convert(url, **convert_params)
+            # 変換実行（HTTPキャッシュが有効なら条件付きで再取得し、変更がなければ変換済みのMarkdownを使う）
+            # http(s) 以外のスキーム（file: や data:）は MarkItDown が直接読み込む
+            if Config.HTTP_CACHE_ENABLED and is_http_url(url):
+                markdown_text, title, http_cache_status = _convert_url_cached(
+                    get_http_cache(), pool, url, convert_params
+                )
+            else:
+                with pool.converter() as md:
+                    mark_stage('converter_ready')
+                    result = md.convert(url, **convert_params)
+                markdown_text = result.text_content
+                mark_stage('converted')
+                title = _result_title(result)
+            raise_if_cancelled()
             
             # URLの場合はサイトのタイトルを取得してファイル名を生成
-            title = "webpage"  # デフォルト値
-            
-            # メタデータからタイトルを取得
-            if hasattr(result, 'metadata') and result.metadata:
-                if result.metadata.get('title'):
-                    title = result.metadata.get('title')
+            title = title or "webpage"  # デフォルト値
             
             # ファイル名に使えない文字を除去
             title = re.sub(r'[\\/*?:"<>|]', "", title)
@@ -92,35 +158,284 @@ def handle_conversion_task(task: Task) -> TaskResult:
                 parsed_url = urlparse(url)
                 title = parsed_url.netloc
             
-            output_filename = f"{title}.{date_str}.md"
+            # 一括変換のページは一括変換のフォルダに通し番号つきで保存する（同じタイトルのページを上書きしない）
+            if 'batch_index' in payload:
+                output_filename = f"{payload['batch_index']:04d}_{title}.md"
+            else:
+                output_filename = f"{title}.{date_str}.md"
         else:
             return TaskResult.failure(f"未対応のソースタイプ: {source_type}")
         
-        # 出力パス
-        output_path = os.path.join(output_dir, output_filename)
+        result = _save_result(payload, output_dir, output_filename, markdown_text, cache_hit)
+        if http_cache_status is not None:
+            result.result['http_cache'] = http_cache_status
+        return result
+    
+    except TaskCancelledError as e:
+        logger.info(f"変換を中断しました: {e.message}")
+        return TaskResult.failure(e.message)
+    
+    except Exception as e:
+        logger.exception(f"変換タスクでエラーが発生しました: {str(e)}")
+        return TaskResult.failure(f"変換失敗: {str(e)}")
+
+def handle_conversion_merge(task: Task) -> TaskResult:
+    """
+    ページ範囲ごとに変換したPDFの結果を連結して保存するタスクハンドラ
+    
+    Args:
+        task: 分割元の変換タスク（payloadに subtask_results / subtask_errors を含む）
+        
+    Returns:
+        TaskResult: 変換結果
+    """
+    payload: Dict[str, Any] = task.payload
+    source_path: str = payload.get('source_path', '')
+    filename: str = payload.get('filename', 'unknown_file')
+    
+    try:
+        errors = [error for error in payload.get('subtask_errors', []) if error]
+        if errors:
+            return TaskResult.failure(f"変換失敗: {errors[0]}")
+        
+        markdown_text = join_page_parts(payload.get('subtask_results', []))
+        mark_stage('merged')
+        
+        # 一括変換と同じ結果になるため、通常の変換と同じキーでキャッシュする
+        content_hash = payload.get('source_sha256')
+        if content_hash and Config.CONVERSION_CACHE_ENABLED:
+            cache_key = make_cache_key(
+                content_hash,
+                os.path.splitext(filename)[1],
+                {'converter': get_converter_pool().options, 'params': {}}
+            )
+            get_conversion_cache().put(cache_key, markdown_text)
         
-        # Markdownテキストを取得してファイルに保存
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(result.text_content)
+        output_dir: str = payload.get('output_dir', f"./output/{payload.get('folder', 'default')}")
+        os.makedirs(output_dir, exist_ok=True)
+        output_filename = _file_output_filename(filename, datetime.now().strftime('%Y%m%d'))
+        return _save_result(payload, output_dir, output_filename, markdown_text, False)
+    
+    except Exception as e:
+        logger.exception(f"変換結果の連結でエラーが発生しました: {str(e)}")
+        return TaskResult.failure(f"変換失敗: {str(e)}")
+    
+    finally:
+        remove_page_parts(source_path)
+
+def handle_archive_merge(task: Task) -> TaskResult:
+    """
+    メンバーごとに変換したZIPの結果をまとめて保存するタスクハンドラ
+    
+    Args:
+        task: 分割元の変換タスク（payloadに subtask_results / subtask_errors を含む）
         
-        logger.info(f"変換完了: {output_path}")
+    Returns:
+        TaskResult: 変換結果（メンバーごとの状態を含む）
+    """
+    payload: Dict[str, Any] = task.payload
+    source_path: str = payload.get('source_path', '')
+    filename: str = payload.get('filename', 'unknown_file')
+    
+    try:
+        # サブタスクはアーカイブ内の順に作られているため、同じ順でメンバー名を取得し直す
+        names = list_supported_members(source_path, Config.ZIP_MAX_MEMBERS) or []
+        converted, members = collect_member_results(
+            names,
+            payload.get('subtask_results', []),
+            payload.get('subtask_errors', [])
+        )
+        if not converted:
+            errors = [member['error'] for member in members if member.get('error')]
+            return TaskResult.failure(f"変換失敗: {errors[0] if errors else 'ZIPに変換できるファイルがありません'}")
         
-        # 変換元のファイルを削除
-        if source_type == 'file' and os.path.exists(source_path):
-            os.remove(source_path)
-            logger.info(f"元ファイル削除: {source_path}")
+        output_dir: str = payload.get('output_dir', f"./output/{payload.get('folder', 'default')}")
+        os.makedirs(output_dir, exist_ok=True)
+        output_filename = _file_output_filename(filename, datetime.now().strftime('%Y%m%d'))
         
-        # 相対パスの作成（Webアクセス用）
-        # output_dir から見た相対パスに変換
-        from config import OUTPUT_DIR
-        relative_output_path = os.path.relpath(output_path, OUTPUT_DIR).replace('\\', '/')
+        if Config.ZIP_OUTPUT_MODE == ZIP_OUTPUT_FOLDER:
+            # メンバーごとのファイルを「アーカイブ名.変換年月日」フォルダに保存し、目次を結果にする
+            folder_name = output_filename[:-len('.md')]
+            markdown_text = write_member_folder(os.path.join(output_dir, folder_name), filename, converted)
+            mark_stage('merged')
+            output_filename = f"{folder_name}/index.md"
+        else:
+            markdown_text = combine_members(filename, converted)
+            mark_stage('merged')
+            content_hash = payload.get('source_sha256')
+            if content_hash and Config.CONVERSION_CACHE_ENABLED:
+                cache_key = make_cache_key(
+                    content_hash,
+                    os.path.splitext(filename)[1],
+                    {'converter': get_converter_pool().options, 'params': {}}
+                )
+                get_conversion_cache().put(cache_key, markdown_text)
         
-        # タスク結果を返す
-        return TaskResult.success({
-            'output_path': relative_output_path,
-            'output_filename': output_filename
-        })
+        result = _save_result(payload, output_dir, output_filename, markdown_text, False)
+        result.result['members'] = members
+        return result
     
     except Exception as e:
-        logger.exception(f"変換タスクでエラーが発生しました: {str(e)}")
-        return TaskResult.failure(f"変換失敗: {str(e)}")
\ No newline at end of file
+        logger.exception(f"ZIPの変換結果のまとめでエラーが発生しました: {str(e)}")
+        return TaskResult.failure(f"変換失敗: {str(e)}")
+    
+    finally:
+        remove_member_parts(source_path)
+
+def handle_url_batch_merge(task: Task) -> TaskResult:
+    """
+    URLの一括変換の結果をまとめるタスクハンドラ（変換したページの一覧を保存し、件数・スループットを集計）
+    
+    Args:
+        task: 一括変換タスク（payloadに batch_urls / subtask_results / subtask_errors を含む）
+        
+    Returns:
+        TaskResult: 一覧の保存結果（URLごとの状態と集計を含む）
+    """
+    payload: Dict[str, Any] = task.payload
+    
+    try:
+        pages = collect_url_results(
+            payload.get('batch_urls', []),
+            payload.get('subtask_results', []),
+            payload.get('subtask_errors', [])
+        )
+        
+        output_root: str = payload['output_root']
+        output_bytes = 0
+        for page in pages:
+            if page.get('output_path'):
+                try:
+                    output_bytes += os.path.getsize(os.path.join(output_root, page['output_path']))
+                except OSError:
+                    pass
+        summary = summarize_pages(pages, batch_elapsed(task), output_bytes)
+        summary['skipped'] = payload.get('skipped_urls', 0)
+        logger.info(
+            f"URLの一括変換完了: 成功{summary['succeeded']}件、失敗{summary['failed']}件、"
+            f"{summary['elapsed']}秒（{summary['urls_per_sec']}件/秒）"
+        )
+        if not summary['succeeded']:
+            errors = [page['error'] for page in pages if 'error' in page]
+            return TaskResult.failure(f"変換失敗: {errors[0] if errors else '変換できるURLがありません'}")
+        
+        # ページを保存した一括変換のフォルダに目次を保存する
+        output_dir: str = payload.get('output_dir', f"./output/{payload.get('folder', 'default')}")
+        batch_dir: str = payload['batch_dir']
+        os.makedirs(os.path.join(output_dir, batch_dir), exist_ok=True)
+        output_filename = f"{batch_dir}/index.md"
+        markdown_text = build_index(f"{payload.get('sitemap') or 'URL一覧'} の一括変換", pages)
+        
+        result = _save_result(payload, output_dir, output_filename, markdown_text, None)
+        result.result['pages'] = pages
+        result.result['summary'] = summary
+        return result
+    
+    except Exception as e:
+        logger.exception(f"URLの一括変換の結果のまとめでエラーが発生しました: {str(e)}")
+        return TaskResult.failure(f"変換失敗: {str(e)}")
+
+def _convert_url_cached(
+    cache: HttpSourceCache,
+    pool: ConverterPool,
+    url: str,
+    convert_params: Dict[str, Any]
+) -> Tuple[str, Optional[str], str]:
+    """
+    HTTPキャッシュを使ってURLを変換する
+    
+    Args:
+        cache: HTTPキャッシュ
+        pool: コンバータプール
+        url: 変換するURL
+        convert_params: 変換パラメータ
+        
+    Returns:
+        (Markdownテキスト, タイトル, 取得結果の種類)
+    """
+    variant = make_variant_key({'converter': pool.options, 'params': convert_params})
+    
+    with cache.fetch(url, get_http_session()) as fetched:
+        mark_stage('fetched')
+        if os.path.exists(fetched.body_path):
+            record_metric('input_bytes', os.path.getsize(fetched.body_path))
+        if fetched.not_modified:
+            cached = cache.get_markdown(fetched, variant)
+            if cached is not None:
+                logger.info(f"HTTPキャッシュを使用（304 Not Modified）: {url}")
+                return cached[0], cached[1], REVALIDATED
+        
+        raise_if_cancelled()
+        with pool.converter() as md, fetched.open() as stream:
+            mark_stage('converter_ready')
+            result = md.convert_stream(stream, stream_info=fetched.stream_info, **convert_params)
+        mark_stage('converted')
+        title = _result_title(result)
+        cache.put_markdown(fetched, variant, result.text_content, title)
+        return result.text_content, title, fetched.status
+
+def _result_title(result: Any) -> Optional[str]:
+    """変換結果のメタデータからタイトルを取得"""
+    if hasattr(result, 'metadata') and result.metadata:
+        return result.metadata.get('title') or None
+    return None
+
+def _is_zip(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() == '.zip'
+
+def _file_output_filename(filename: str, date_str: str) -> str:
+    """ファイル変換の出力ファイル名（入力ファイル名.変換年月日.md）"""
+    base_filename = os.path.splitext(filename)[0]
+    return f"{base_filename}.{date_str}.md"
+
+def _save_result(
+    payload: Dict[str, Any],
+    output_dir: str,
+    output_filename: str,
+    markdown_text: str,
+    cache_hit: Optional[bool]
+) -> TaskResult:
+    """
+    Markdownを保存して変換元の一時ファイルを削除し、タスク結果を作成
+    
+    Args:
+        payload: タスクペイロード
+        output_dir: 出力ディレクトリ
+        output_filename: 出力ファイル名
+        markdown_text: 変換結果
+        cache_hit: 変換キャッシュにヒットしたかどうか（キャッシュ対象外はNone）
+        
+    Returns:
+        TaskResult: 変換結果
+    """
+    source_type: str = payload.get('source_type', '')
+    source_path: str = payload.get('source_path', '')
+    
+    # 出力パス
+    output_path = os.path.join(output_dir, output_filename)
+    
+    # Markdownテキストを取得してファイルに保存
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(markdown_text)
+    precompress_output(output_path)
+    mark_stage('written')
+    record_metric('output_bytes', os.path.getsize(output_path))
+    
+    logger.info(f"変換完了: {output_path}")
+    
+    # 変換元のファイルを削除
+    if source_type == 'file' and os.path.exists(source_path):
+        os.remove(source_path)
+        logger.info(f"元ファイル削除: {source_path}")
+    
+    # 相対パスの作成（Webアクセス用）
+    # 出力ルート（カスタム出力ディレクトリを含む）から見た相対パスに変換
+    output_root: str = payload.get('output_root', OUTPUT_DIR)
+    relative_output_path = os.path.relpath(output_path, output_root).replace('\\', '/')
+    
+    # タスク結果を返す
+    return TaskResult.success({
+        'output_path': relative_output_path,
+        'output_filename': output_filename,
+        'cache_hit': cache_hit
+    })
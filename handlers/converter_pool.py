@@ -0,0 +1,270 @@
+"""
+MarkItDownインスタンスを再利用するためのコンバータプール
+
+タスクごとに MarkItDown を生成するとコンバータ登録やHTTPセッション生成の
+コストが毎回かかるため、ワーカー数分のインスタンスをプールして使い回す
+"""
+import itertools
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from markitdown import MarkItDown
+
+from .http_cache import get_http_session
+
+logger = logging.getLogger(__name__)
+
+# デフォルトのMarkItDown生成オプション
+DEFAULT_CONVERTER_OPTIONS: Dict[str, Any] = {'enable_plugins': False}
+
+# プールが上限まで貸し出し中のとき、返却を待ちながら設定の変更を確認する間隔（秒）
+_ACQUIRE_WAIT = 1.0
+
+
+class PooledConverter:
+    """プールで管理されるMarkItDownインスタンスと利用統計"""
+
+    _id_counter = itertools.count(1)
+
+    def __init__(self, options: Dict[str, Any], generation: int):
+        self.id = next(self._id_counter)
+        self.generation = generation
+        self.created_at = datetime.now()
+        self.last_used_at: Optional[datetime] = None
+        self.tasks_served = 0
+        # HTTP接続はプロセス内のすべてのインスタンスで共有する
+        self.md = MarkItDown(requests_session=get_http_session(), **options)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """統計情報を辞書で返す"""
+        return {
+            'id': self.id,
+            'generation': self.generation,
+            'created_at': self.created_at.isoformat(),
+            'last_used_at': self.last_used_at.isoformat() if self.last_used_at else None,
+            'tasks_served': self.tasks_served
+        }
+
+
+class ConverterPool:
+    """MarkItDownインスタンスのプール"""
+
+    def __init__(self, size: int = 4, options: Optional[Dict[str, Any]] = None):
+        """
+        コンバータプールの初期化
+
+        Args:
+            size: プールに保持するインスタンス数（ワーカー数に合わせる）
+            options: MarkItDown生成時のオプション
+        """
+        self.size = max(1, size)
+        self._options: Dict[str, Any] = dict(options or DEFAULT_CONVERTER_OPTIONS)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._idle: "queue.LifoQueue[PooledConverter]" = queue.LifoQueue()
+        self._instances: Dict[int, PooledConverter] = {}
+        # 生成中のインスタンス数（上限を超えて生成しないよう登録前から数える）
+        self._creating = 0
+
+    @property
+    def options(self) -> Dict[str, Any]:
+        """現在のMarkItDown生成オプション"""
+        return dict(self._options)
+
+    def configure(self, options: Optional[Dict[str, Any]] = None, size: Optional[int] = None) -> bool:
+        """
+        プール設定を更新する（設定が変わった場合のみ既存インスタンスを破棄）
+
+        Args:
+            options: 新しいMarkItDown生成オプション
+            size: 新しいプールサイズ
+
+        Returns:
+            bool: インスタンスが無効化された場合はTrue
+        """
+        with self._lock:
+            if size is not None:
+                self.size = max(1, size)
+
+            new_options = dict(options or DEFAULT_CONVERTER_OPTIONS)
+            if new_options == self._options:
+                return False
+
+            self._options = new_options
+            self._generation += 1
+            self._instances.clear()
+            # 待機中の古いインスタンスを破棄（貸出中のものは返却時に破棄）
+            while True:
+                try:
+                    self._idle.get_nowait()
+                except queue.Empty:
+                    break
+
+        logger.info(f"コンバータ設定が変更されたためプールを無効化しました: {new_options}")
+        return True
+
+    def warm(self, background: bool = True) -> Optional[threading.Thread]:
+        """
+        プールをサイズ分のインスタンスで事前に満たす
+
+        Args:
+            background: True=バックグラウンドスレッドで実行
+
+        Returns:
+            バックグラウンド実行時はそのスレッド
+        """
+        if not background:
+            self._fill()
+            return None
+
+        thread = threading.Thread(target=self._fill, name='converter-pool-warmup', daemon=True)
+        thread.start()
+        return thread
+
+    @contextmanager
+    def converter(self) -> Iterator[MarkItDown]:
+        """
+        プールからMarkItDownを借りるコンテキストマネージャ
+
+        Yields:
+            MarkItDown: 利用可能なインスタンス
+        """
+        entry = self._acquire()
+        try:
+            yield entry.md
+        finally:
+            entry.tasks_served += 1
+            entry.last_used_at = datetime.now()
+            self._release(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        """プールと各インスタンスの統計情報を返す"""
+        with self._lock:
+            instances: List[Dict[str, Any]] = [
+                entry.to_dict() for entry in self._instances.values()
+            ]
+            return {
+                'size': self.size,
+                'generation': self._generation,
+                'options': dict(self._options),
+                'idle': self._idle.qsize(),
+                'instances': instances
+            }
+
+    def _fill(self) -> None:
+        """不足分のインスタンスを生成してプールに追加"""
+        try:
+            while True:
+                entry = self._create()
+                if entry is None or not self._register(entry):
+                    break
+                self._idle.put(entry)
+            logger.info(f"コンバータプールのウォームアップ完了: {len(self._instances)}個")
+        except Exception as e:
+            logger.exception(f"コンバータプールのウォームアップ中のエラー: {str(e)}")
+
+    def _create(self) -> Optional[PooledConverter]:
+        """上限に空きがあればインスタンスを生成する（空きがなければNone、登録は呼び出し側で行う）"""
+        with self._lock:
+            if len(self._instances) + self._creating >= self.size:
+                return None
+            self._creating += 1
+            options = dict(self._options)
+            generation = self._generation
+        try:
+            return PooledConverter(options, generation)
+        finally:
+            with self._lock:
+                self._creating -= 1
+
+    def _register(self, entry: PooledConverter) -> bool:
+        """生成したインスタンスを現行世代として登録（上限超過・世代違いは破棄）"""
+        with self._lock:
+            if entry.generation != self._generation or len(self._instances) >= self.size:
+                return False
+            self._instances[entry.id] = entry
+            return True
+
+    def _acquire(self) -> PooledConverter:
+        """
+        待機中のインスタンスを取得する
+        なければ上限まで新規生成し、上限まで貸し出し中なら返却を待つ
+        （上限を超えて生成すると、返却時に破棄されてタスクごとに生成し直すことになるため）
+        """
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                entry = self._create()
+                if entry is not None:
+                    # 生成中に設定が変わって登録できなかった場合も、このタスクでは使う（返却時に破棄）
+                    self._register(entry)
+                    return entry
+                try:
+                    entry = self._idle.get(timeout=_ACQUIRE_WAIT)
+                except queue.Empty:
+                    # 設定の変更で貸し出し中のインスタンスが破棄された場合に備えて数え直す
+                    continue
+            if entry.generation == self._generation:
+                return entry
+
+    def _release(self, entry: PooledConverter) -> None:
+        """インスタンスをプールに返却（世代が古い・上限超過の場合は破棄）"""
+        with self._lock:
+            if entry.id not in self._instances or entry.generation != self._generation:
+                return
+        self._idle.put(entry)
+
+
+# プロセス内で共有するコンバータプール
+_pool: Optional[ConverterPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_converter_pool() -> ConverterPool:
+    """プロセス共通のコンバータプールを取得（未初期化なら作成）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConverterPool()
+        return _pool
+
+
+def init_converter_pool(
+    size: int = 4,
+    options: Optional[Dict[str, Any]] = None,
+    warm: bool = True
+) -> ConverterPool:
+    """
+    コンバータプールを初期化してバックグラウンドでウォームアップする
+
+    Args:
+        size: プールサイズ
+        options: MarkItDown生成オプション
+        warm: True=バックグラウンドでインスタンスを事前生成
+
+    Returns:
+        ConverterPool: 初期化されたプール
+    """
+    pool = get_converter_pool()
+    pool.configure(options=options, size=size)
+    if warm:
+        pool.warm(background=True)
+    return pool
+
+
+def init_worker_process(options: Optional[Dict[str, Any]] = None) -> None:
+    """
+    ワーカープロセスの初期化関数（ProcessPoolExecutorのinitializer用）
+
+    各プロセスは同時に1タスクしか処理しないため、1インスタンスを同期的に生成しておく
+
+    Args:
+        options: MarkItDown生成オプション
+    """
+    pool = init_converter_pool(size=1, options=options, warm=False)
+    pool.warm(background=False)
@@ -0,0 +1,469 @@
+"""
+URL変換の取得元のHTTPキャッシュ
+
+取得したレスポンス本文と検証子（ETag / Last-Modified）をディスクに保存し、次回は条件付きリクエストを送る。
+304 Not Modified なら保存済みの本文を使い、同じ変換オプションで変換済みのMarkdownがあれば解析もしない。
+HTTP接続はプロセス内のすべてのコンバータで1つのセッション（コネクションプール）を共有する
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, urlsplit, urlunsplit
+
+import requests
+from markitdown import StreamInfo
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# 取得結果の種類
+FETCHED = 'fetched'            # 本文を取得した（保存した）
+NOT_MODIFIED = 'not_modified'  # 304 で保存済みの本文を使った
+REVALIDATED = 'revalidated'    # 304 で変換済みのMarkdownも再利用した
+UNCACHEABLE = 'uncacheable'    # 検証子がない・no-store・大きすぎるため保存しなかった
+
+_STATUSES = (FETCHED, NOT_MODIFIED, REVALIDATED, UNCACHEABLE)
+
+_META_SUFFIX = '.json'
+_BODY_SUFFIX = '.body'
+_MARKDOWN_SUFFIX = '.md'
+
+# HTTPセッションで取得するURLのスキーム（file: や data: は MarkItDown が直接読み込む）
+HTTP_SCHEMES = ('http', 'https')
+
+# 省略できる既定のポート
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# 本文をディスクに書き込む単位
+_CHUNK_SIZE = 64 * 1024
+
+
+def is_http_url(url: str) -> bool:
+    """HTTPキャッシュを通して取得できるURL（http / https）かどうか"""
+    return urlparse(url).scheme.lower() in HTTP_SCHEMES
+
+
+def normalize_url(url: str) -> str:
+    """
+    同じページを指すURLを同じ文字列にする
+    （スキームとホスト名を小文字に、既定のポートとフラグメントを除き、空のパスを "/" にする）
+    
+    Args:
+        url: URL
+    
+    Returns:
+        str: 正規化したURL
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    if parts.username:
+        host = f"{parts.username}{':' + parts.password if parts.password else ''}@{host}"
+    return urlunsplit((scheme, host, parts.path or '/', parts.query, ''))
+
+
+def make_url_key(url: str) -> str:
+    """URLのキャッシュキー"""
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def make_variant_key(options: Dict[str, Any]) -> str:
+    """変換オプションの組み合わせのキー（変換済みMarkdownの区別に使う）"""
+    material = json.dumps(options, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()[:16]
+
+
+class HttpFetch:
+    """条件付き取得の結果（本文はファイルで持つ）"""
+    
+    def __init__(self, url: str, key: str, status: str, body_path: str, meta: Dict[str, Any], temporary: bool):
+        self.url = url
+        self.key = key
+        self.status = status
+        self.body_path = body_path
+        self.meta = meta
+        self._temporary = temporary
+    
+    @property
+    def not_modified(self) -> bool:
+        """保存済みの本文が最新だったかどうか"""
+        return self.status == NOT_MODIFIED
+    
+    @property
+    def stream_info(self) -> StreamInfo:
+        """レスポンスヘッダーから推定した形式（MarkItDown.convert_response と同じ方法で求める）"""
+        mimetype = charset = filename = extension = None
+        
+        content_type = self.meta.get('content_type')
+        if content_type:
+            parts = content_type.split(';')
+            mimetype = parts.pop(0).strip() or None
+            for part in parts:
+                part = part.strip()
+                if part.startswith('charset=') and part[len('charset='):].strip():
+                    charset = part[len('charset='):].strip()
+        
+        disposition = self.meta.get('content_disposition')
+        match = re.search(r'filename=([^;]+)', disposition) if disposition else None
+        if match:
+            filename = match.group(1).strip("\"'")
+            extension = os.path.splitext(filename)[1] or None
+        
+        final_url = self.meta.get('final_url') or self.url
+        if filename is None:
+            path = urlparse(final_url).path
+            if os.path.splitext(path)[1]:
+                filename = os.path.basename(path)
+                extension = os.path.splitext(path)[1]
+        
+        return StreamInfo(mimetype=mimetype, charset=charset, filename=filename, extension=extension, url=final_url)
+    
+    def open(self):
+        """本文を読み込むファイルを開く"""
+        return open(self.body_path, 'rb')
+    
+    def close(self) -> None:
+        """保存しなかった本文の一時ファイルを削除"""
+        if self._temporary and os.path.exists(self.body_path):
+            os.remove(self.body_path)
+    
+    def __enter__(self) -> 'HttpFetch':
+        return self
+    
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class HttpSourceCache:
+    """条件付きリクエストで再取得するURLの本文と変換済みMarkdownのディスクキャッシュ"""
+    
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = 512 * 1024 * 1024,
+        max_entry_bytes: int = 64 * 1024 * 1024,
+        timeout: float = 30
+    ):
+        """
+        HTTPキャッシュの初期化
+        
+        Args:
+            cache_dir: キャッシュの保存先ディレクトリ
+            max_bytes: キャッシュ全体のサイズ上限（バイト）
+            max_entry_bytes: 保存する本文の最大サイズ（超えた本文は変換だけして保存しない）
+            timeout: 接続・読み込みのタイムアウト（秒）
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+        self.counts: Dict[str, int] = {status: 0 for status in _STATUSES}
+        self.evictions = 0
+    
+    def fetch(self, url: str, session: requests.Session) -> HttpFetch:
+        """
+        URLを取得する（保存済みの本文があれば条件付きリクエストにする）
+        
+        Args:
+            url: 取得するURL
+            session: 使用するHTTPセッション
+        
+        Returns:
+            HttpFetch: 取得結果（with文で使い、終了時に一時ファイルを削除する）
+        
+        Raises:
+            requests.RequestException: 取得に失敗した場合（4xx/5xx を含む）
+        """
+        key = make_url_key(url)
+        meta = self._load_meta(key)
+        body_path = self._path_for(key, _BODY_SUFFIX)
+        
+        headers: Dict[str, str] = {}
+        if meta is not None and os.path.exists(body_path):
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        
+        with session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 304 and headers:
+                # 新しい検証子が返されていれば更新する
+                meta['etag'] = response.headers.get('ETag', meta.get('etag'))
+                meta['last_modified'] = response.headers.get('Last-Modified', meta.get('last_modified'))
+                meta['validated_at'] = time.time()
+                self._save_meta(key, meta)
+                return HttpFetch(url, key, NOT_MODIFIED, body_path, meta, temporary=False)
+            
+            response.raise_for_status()
+            
+            new_meta = {
+                'url': url,
+                'final_url': response.url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'content_type': response.headers.get('Content-Type'),
+                'content_disposition': response.headers.get('Content-Disposition'),
+                'version': uuid.uuid4().hex,
+                'fetched_at': time.time(),
+                'validated_at': time.time(),
+                'markdown': {}
+            }
+            
+            # 他のワーカーと競合しないよう一時ファイルに書いてから置き換える
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            tmp_path = f"{body_path}.{uuid.uuid4().hex}.tmp"
+            size = 0
+            try:
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+                        f.write(chunk)
+                        size += len(chunk)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        
+        cache_control = (response.headers.get('Cache-Control') or '').lower()
+        storable = (
+            (new_meta['etag'] or new_meta['last_modified'])
+            and 'no-store' not in cache_control
+            and size <= self.max_entry_bytes
+        )
+        if not storable:
+            return HttpFetch(url, key, UNCACHEABLE, tmp_path, new_meta, temporary=True)
+        
+        try:
+            os.replace(tmp_path, body_path)
+            self._save_meta(key, new_meta)
+        except OSError as e:
+            logger.warning(f"HTTPキャッシュの書き込みに失敗しました: {url} - {str(e)}")
+            if os.path.exists(tmp_path):
+                return HttpFetch(url, key, UNCACHEABLE, tmp_path, new_meta, temporary=True)
+        
+        self._added(size)
+        return HttpFetch(url, key, FETCHED, body_path, new_meta, temporary=False)
+    
+    def get_markdown(self, fetched: HttpFetch, variant: str) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        保存済みの本文から同じ変換オプションで変換したMarkdownを取得する
+        
+        Args:
+            fetched: 取得結果（304の場合のみ意味がある）
+            variant: 変換オプションのキー
+        
+        Returns:
+            (Markdownテキスト, タイトル)、なければNone
+        """
+        entry = fetched.meta.get('markdown', {}).get(variant)
+        if not entry or entry.get('version') != fetched.meta.get('version'):
+            return None
+        
+        try:
+            with open(self._path_for(fetched.key, f".{variant}{_MARKDOWN_SUFFIX}"), 'r', encoding='utf-8') as f:
+                return f.read(), entry.get('title')
+        except OSError:
+            return None
+    
+    def put_markdown(self, fetched: HttpFetch, variant: str, markdown_text: str, title: Optional[str]) -> None:
+        """
+        変換したMarkdownを本文と対応付けて保存する（保存しなかった本文の場合は何もしない）
+        
+        Args:
+            fetched: 取得結果
+            variant: 変換オプションのキー
+            markdown_text: 変換結果
+            title: 変換結果のタイトル
+        """
+        if fetched.status == UNCACHEABLE:
+            return
+        
+        path = self._path_for(fetched.key, f".{variant}{_MARKDOWN_SUFFIX}")
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(markdown_text)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+            
+            # 本文が別のワーカーに更新されていれば対応付けない
+            meta = self._load_meta(fetched.key)
+            if meta is None or meta.get('version') != fetched.meta.get('version'):
+                return
+            meta.setdefault('markdown', {})[variant] = {'version': meta['version'], 'title': title}
+            self._save_meta(fetched.key, meta)
+        except OSError as e:
+            logger.warning(f"HTTPキャッシュの書き込みに失敗しました: {fetched.url} - {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        
+        self._added(size)
+    
+    def record(self, status: str) -> None:
+        """取得結果の種類を記録する"""
+        with self._lock:
+            if status in self.counts:
+                self.counts[status] += 1
+    
+    def evict(self) -> int:
+        """
+        上限を超えている場合、最終利用日時の古いURLから本文と変換結果をまとめて削除する
+        
+        Returns:
+            int: 削除したURL数
+        """
+        groups, total = self._scan()
+        removed = 0
+        
+        if total > self.max_bytes:
+            # 上限の9割まで削減して頻繁な削除を避ける
+            target = int(self.max_bytes * 0.9)
+            for _, size, paths in sorted(groups.values(), key=lambda g: g[0]):
+                if total <= target:
+                    break
+                for path in paths:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                total -= size
+                removed += 1
+        
+        with self._lock:
+            self._total_bytes = total
+            self.evictions += removed
+        
+        if removed:
+            logger.info(f"HTTPキャッシュから{removed}件のURLを削除しました")
+        return removed
+    
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの統計情報を返す"""
+        groups, total = self._scan()
+        with self._lock:
+            self._total_bytes = total
+            return {
+                **self.counts,
+                'evictions': self.evictions,
+                'entries': len(groups),
+                'bytes': total,
+                'max_bytes': self.max_bytes
+            }
+    
+    def _path_for(self, key: str, suffix: str) -> str:
+        """キーに対応するファイルのパス（先頭2文字でディレクトリを分割）"""
+        return os.path.join(self.cache_dir, key[:2], key + suffix)
+    
+    def _load_meta(self, key: str) -> Optional[Dict[str, Any]]:
+        """メタデータを読み込む（LRU判定用に更新日時を最終利用日時にする）"""
+        path = self._path_for(key, _META_SUFFIX)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            os.utime(path, None)
+            return meta
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"HTTPキャッシュの読み込みに失敗しました: {key} - {str(e)}")
+            return None
+    
+    def _save_meta(self, key: str, meta: Dict[str, Any]) -> None:
+        """メタデータを書き込む"""
+        path = self._path_for(key, _META_SUFFIX)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    
+    def _added(self, size: int) -> None:
+        """書き込んだサイズを加算し、上限を超えていれば古いものを削除"""
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += size
+            over_limit = self._total_bytes is None or self._total_bytes > self.max_bytes
+        
+        if over_limit:
+            self.evict()
+    
+    def _scan(self) -> Tuple[Dict[str, Tuple[float, int, List[str]]], int]:
+        """キャッシュディレクトリを走査して URLごとの (最終利用日時, サイズ, ファイル一覧) と合計サイズを返す"""
+        groups: Dict[str, Tuple[float, int, List[str]]] = {}
+        total = 0
+        if not os.path.isdir(self.cache_dir):
+            return groups, total
+        
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                key = entry.name.split('.', 1)[0]
+                used, size, paths = groups.get(key, (0.0, 0, []))
+                if entry.name.endswith(_META_SUFFIX):
+                    used = st.st_mtime
+                paths.append(entry.path)
+                groups[key] = (used, size + st.st_size, paths)
+                total += st.st_size
+        return groups, total
+
+
+# プロセス内で共有するHTTPキャッシュとセッション
+_cache: Optional[HttpSourceCache] = None
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def get_http_cache() -> HttpSourceCache:
+    """プロセス共通のHTTPキャッシュを取得（未初期化なら設定ファイルの値で作成）"""
+    global _cache
+    with _lock:
+        if _cache is None:
+            from config import CACHE_DIR, Config
+            _cache = HttpSourceCache(
+                os.path.join(CACHE_DIR, 'http'),
+                max_bytes=Config.HTTP_CACHE_MAX_BYTES,
+                max_entry_bytes=Config.HTTP_CACHE_MAX_ENTRY_BYTES,
+                timeout=Config.HTTP_TIMEOUT
+            )
+        return _cache
+
+
+def get_http_session() -> requests.Session:
+    """
+    プロセス共通のHTTPセッションを取得（未初期化なら作成）
+    
+    コンバータプールのすべてのMarkItDownで共有し、同じホストへの接続を使い回す
+    （ワーカープロセスではプロセスごとに1つ。fork前の接続は引き継がない）
+    """
+    global _session, _session_pid
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            from config import Config
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=Config.HTTP_POOL_CONNECTIONS,
+                pool_maxsize=Config.HTTP_POOL_MAXSIZE
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+            _session_pid = os.getpid()
+        return _session
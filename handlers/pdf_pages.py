@@ -0,0 +1,195 @@
+"""
+大きなPDFのページ範囲ごとの並列変換
+
+MarkItDown の PdfConverter は pdfminer の extract_text で全ページを1つのワーカーで
+処理するため、ページ数の多いPDFはページ範囲ごとのサブタスクに分けて並列に変換し、
+ページ順に連結する（extract_text は各ページの末尾に改ページ文字を出力するため、
+範囲ごとの結果を順に連結して MarkItDown と同じ正規化を行うと一括変換と同じテキストになる）
+"""
+import logging
+import os
+import re
+import shutil
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from taskqueue import (Task, TaskCancelledError, TaskResult, mark_stage,
+                       raise_if_cancelled, record_metric)
+
+logger = logging.getLogger(__name__)
+
+# ページ範囲のサブタスクとまとめ用のタスクタイプ
+PDF_PAGES_TASK_TYPE = 'pdf_pages'
+CONVERSION_MERGE_TASK_TYPE = 'conversion_merge'
+
+
+def count_pdf_pages(path: str) -> int:
+    """
+    PDFのページ数を取得する（ページツリーの /Count を優先して使う）
+    
+    Args:
+        path: PDFファイルのパス
+    
+    Returns:
+        int: ページ数（解析できない場合は0）
+    """
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdftypes import resolve1
+    
+    try:
+        with open(path, 'rb') as f:
+            document = PDFDocument(PDFParser(f))
+            pages = resolve1(document.catalog.get('Pages'))
+            count = resolve1(pages.get('Count')) if isinstance(pages, dict) else None
+            if isinstance(count, int):
+                return count
+            return sum(1 for _ in PDFPage.create_pages(document))
+    except Exception as e:
+        logger.warning(f"PDFのページ数を取得できませんでした: {path} - {str(e)}")
+        return 0
+
+
+def plan_page_ranges(total_pages: int, pages_per_range: int) -> List[Tuple[int, int]]:
+    """
+    ページ範囲の一覧を作成する
+    
+    Args:
+        total_pages: 全ページ数
+        pages_per_range: 1範囲あたりのページ数
+    
+    Returns:
+        List[Tuple[int, int]]: (開始ページ, 終了ページ) の一覧（0始まり、終了ページは含まない）
+    """
+    pages_per_range = max(1, pages_per_range)
+    return [
+        (start, min(start + pages_per_range, total_pages))
+        for start in range(0, total_pages, pages_per_range)
+    ]
+
+
+def split_large_pdf(source_path: str, filename: str) -> Optional[TaskResult]:
+    """
+    しきい値以上のページ数のPDFをページ範囲ごとのサブタスクに分割する
+    
+    Args:
+        source_path: PDFファイルのパス
+        filename: 元のファイル名
+    
+    Returns:
+        分割した場合はサブタスクを含むTaskResult、分割しない場合はNone
+    """
+    from config import Config
+    
+    if os.path.splitext(filename)[1].lower() != '.pdf' or Config.PDF_SPLIT_MIN_PAGES <= 0:
+        return None
+    
+    total_pages = count_pdf_pages(source_path)
+    if total_pages < Config.PDF_SPLIT_MIN_PAGES:
+        return None
+    
+    ranges = plan_page_ranges(total_pages, Config.PDF_SPLIT_PAGES_PER_RANGE)
+    if len(ranges) < 2:
+        return None
+    
+    # 範囲ごとの変換結果は一時ファイルに書き出し、まとめる際にページ順に連結する
+    parts_dir = f"{source_path}.pages"
+    os.makedirs(parts_dir, exist_ok=True)
+    
+    subtasks = [
+        Task(
+            id=uuid.uuid4(),
+            type=PDF_PAGES_TASK_TYPE,
+            name=f"{filename} の変換 (p.{start + 1}-{end})",
+            payload={
+                'source_path': source_path,
+                'page_start': start,
+                'page_end': end,
+                'part_path': os.path.join(parts_dir, f"{start:06d}.md")
+            }
+        )
+        for start, end in ranges
+    ]
+    
+    logger.info(f"PDFをページ範囲ごとに分割して変換: {filename} ({total_pages}ページ, {len(ranges)}分割)")
+    return TaskResult.split_into(
+        subtasks,
+        CONVERSION_MERGE_TASK_TYPE,
+        weights=[end - start for start, end in ranges],
+        unit='pages'
+    )
+
+
+def handle_pdf_pages_task(task: Task) -> TaskResult:
+    """
+    PDFの指定ページ範囲をMarkdown（テキスト）に変換するタスクハンドラ
+    
+    Args:
+        task: ページ範囲のサブタスク (source_path, page_start, page_end, part_path を含む)
+    
+    Returns:
+        TaskResult: 変換結果（部分ファイルのパスとページ数）
+    """
+    import pdfminer.high_level
+    
+    payload: Dict[str, Any] = task.payload
+    start: int = payload['page_start']
+    end: int = payload['page_end']
+    
+    try:
+        with open(payload['source_path'], 'rb') as f:
+            text = pdfminer.high_level.extract_text(f, page_numbers=range(start, end))
+        mark_stage('converted')
+        raise_if_cancelled()
+        
+        with open(payload['part_path'], 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        mark_stage('written')
+        record_metric('output_bytes', os.path.getsize(payload['part_path']))
+        
+        return TaskResult.success({'part_path': payload['part_path'], 'pages': end - start})
+    
+    except TaskCancelledError as e:
+        logger.info(f"PDFページ範囲の変換を中断しました: {e.message}")
+        return TaskResult.failure(e.message)
+    
+    except Exception as e:
+        logger.exception(f"PDFページ範囲の変換でエラーが発生しました: p.{start + 1}-{end} - {str(e)}")
+        return TaskResult.failure(f"p.{start + 1}-{end} の変換失敗: {str(e)}")
+
+
+def join_page_parts(results: List[Optional[Dict[str, Any]]]) -> str:
+    """
+    ページ範囲ごとの変換結果をページ順に連結し、一括変換と同じ正規化を行う
+    
+    Args:
+        results: サブタスクの結果（ページ順）
+    
+    Returns:
+        str: 連結したMarkdownテキスト
+    """
+    texts = []
+    for result in results:
+        with open(result['part_path'], 'r', encoding='utf-8', newline='') as f:
+            texts.append(f.read())
+    return normalize_text(''.join(texts))
+
+
+def normalize_text(text: str) -> str:
+    """
+    MarkItDown が変換結果に行う正規化（各行末の空白・改ページ文字を除き、3つ以上続く改行を2つにまとめる）
+    
+    Args:
+        text: pdfminer の抽出結果
+    
+    Returns:
+        str: 正規化したテキスト
+    """
+    text = '\n'.join(line.rstrip() for line in re.split(r'\r?\n', text))
+    return re.sub(r'\n{3,}', '\n\n', text)
+
+
+def remove_page_parts(source_path: str) -> None:
+    """ページ範囲ごとの変換結果の一時ファイルを削除"""
+    shutil.rmtree(f"{source_path}.pages", ignore_errors=True)
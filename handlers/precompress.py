@@ -0,0 +1,150 @@
+"""
+変換結果のMarkdownの事前圧縮（gzip・brotliのサイドカーファイル）
+
+一定サイズ以上のMarkdownを書き出したときに「ファイル名.gz」「ファイル名.br」を作成しておき、
+配信時に Accept-Encoding に応じて圧縮済みのファイルをそのまま返す。
+サイドカーの更新日時は元のファイルにそろえ、元のファイルが書き換えられた場合は古いサイドカーを使わない
+（brotli は brotli パッケージがインストールされている場合のみ）
+"""
+import gzip
+import logging
+import os
+import uuid
+from typing import List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli は任意の依存
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 配信で優先する順の (Content-Encoding, サイドカーの拡張子)
+SIDECAR_ENCODINGS: Tuple[Tuple[str, str], ...] = (('br', '.br'), ('gzip', '.gz'))
+
+# 事前圧縮するファイルの拡張子
+PRECOMPRESSED_EXTENSION = '.md'
+
+# 圧縮後のサイズがこの割合を超える場合はサイドカーを作らない
+_MAX_RATIO = 0.9
+
+# 書き出し時に1回だけ圧縮するため、圧縮率を優先する
+_GZIP_LEVEL = 9
+_BROTLI_QUALITY = 9
+
+
+def is_sidecar(name: str) -> bool:
+    """事前圧縮のサイドカーファイルの名前かどうか"""
+    return any(
+        name.endswith(PRECOMPRESSED_EXTENSION + suffix)
+        for _, suffix in SIDECAR_ENCODINGS
+    )
+
+
+def fresh_sidecar(path: str, encoding: str, source_mtime_ns: int) -> Optional[Tuple[str, int]]:
+    """
+    元のファイルと同じ更新日時のサイドカーを探す
+    
+    Args:
+        path: 元のファイルのパス
+        encoding: Content-Encoding（br, gzip）
+        source_mtime_ns: 元のファイルの更新日時（ナノ秒）
+    
+    Returns:
+        (サイドカーのパス, サイズ)（ない、または古い場合はNone）
+    """
+    suffix = dict(SIDECAR_ENCODINGS)[encoding]
+    sidecar_path = path + suffix
+    try:
+        result = os.stat(sidecar_path)
+    except OSError:
+        return None
+    if result.st_mtime_ns != source_mtime_ns:
+        return None
+    return sidecar_path, result.st_size
+
+
+def write_sidecars(path: str, min_bytes: int) -> List[str]:
+    """
+    Markdownの圧縮済みサイドカーを作成する（失敗しても変換は失敗にしない）
+    
+    Args:
+        path: 書き出したMarkdownのパス
+        min_bytes: 事前圧縮する最小サイズ（これより小さいファイルは古いサイドカーを削除するだけ）
+    
+    Returns:
+        List[str]: 作成した Content-Encoding
+    """
+    written = []
+    try:
+        result = os.stat(path)
+        if not path.endswith(PRECOMPRESSED_EXTENSION) or result.st_size < min_bytes:
+            remove_sidecars(path)
+            return written
+        
+        with open(path, 'rb') as f:
+            data = f.read()
+        
+        for encoding, suffix in SIDECAR_ENCODINGS:
+            compressed = _compress(data, encoding)
+            if compressed is None or len(compressed) > len(data) * _MAX_RATIO:
+                _remove(path + suffix)
+                continue
+            _write_atomic(path + suffix, compressed, result.st_mtime_ns)
+            written.append(encoding)
+    except OSError as e:
+        logger.warning(f"Markdownの事前圧縮に失敗しました: {path} - {str(e)}")
+    return written
+
+
+def precompress_output(path: str) -> List[str]:
+    """
+    設定（OUTPUT_PRECOMPRESS_*）に従って、書き出したMarkdownのサイドカーを作成する
+    
+    Args:
+        path: 書き出したMarkdownのパス
+    
+    Returns:
+        List[str]: 作成した Content-Encoding
+    """
+    from config import Config
+    if not Config.OUTPUT_PRECOMPRESS_ENABLED:
+        return []
+    return write_sidecars(path, Config.OUTPUT_PRECOMPRESS_MIN_BYTES)
+
+
+def remove_sidecars(path: str) -> None:
+    """サイドカーを削除する"""
+    for _, suffix in SIDECAR_ENCODINGS:
+        _remove(path + suffix)
+
+
+def _compress(data: bytes, encoding: str) -> Optional[bytes]:
+    """データを圧縮する（brotliが使えない場合はNone）"""
+    if encoding == 'gzip':
+        # 同じ内容から同じバイト列になるよう、ヘッダーの日時は0にする
+        return gzip.compress(data, compresslevel=_GZIP_LEVEL, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, mode=brotli.MODE_TEXT, quality=_BROTLI_QUALITY)
+    return None
+
+
+def _write_atomic(path: str, data: bytes, mtime_ns: int) -> None:
+    """一時ファイルに書いてから置き換え、更新日時を元のファイルにそろえる"""
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.utime(temp_path, ns=(mtime_ns, mtime_ns))
+        os.replace(temp_path, path)
+    except OSError:
+        _remove(temp_path)
+        raise
+
+
+def _remove(path: str) -> None:
+    """ファイルがあれば削除する"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
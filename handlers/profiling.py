@@ -0,0 +1,85 @@
+"""
+時間のかかったタスクのプロファイル（cProfile）の保存
+
+有効にするとハンドラーを cProfile で計測しながら実行し、所要時間がしきい値以上だった場合だけ
+プロファイルを「出力ファイル名.prof」として変換結果の隣に保存する（pstats や snakeviz で開ける）。
+出力ファイルのないタスク（サブタスクへの分割やページ範囲の変換）はプロファイルの保存先に「タスクID.prof」で保存する。
+プロセスで実行する場合もワーカーへ渡せるよう、ハンドラーはモジュールの関数を包むクラスにしている
+"""
+import cProfile
+import logging
+import os
+import time
+from typing import Any, Callable, Optional
+
+from taskqueue import Task, TaskResult, record_metric
+
+logger = logging.getLogger(__name__)
+
+# プロファイルの拡張子
+PROFILE_SUFFIX = '.prof'
+
+
+class ProfiledHandler:
+    """しきい値以上の時間がかかった実行のプロファイルを保存するタスクハンドラー"""
+    
+    def __init__(self, handler: Callable[[Task], Any], threshold: float, profile_dir: str):
+        """
+        初期化
+        
+        Args:
+            handler: 計測するタスクハンドラー（モジュールの関数）
+            threshold: プロファイルを保存する所要時間の下限（秒）
+            profile_dir: 出力ファイルのないタスクのプロファイルの保存先
+        """
+        self.handler = handler
+        self.threshold = threshold
+        self.profile_dir = profile_dir
+    
+    def __call__(self, task: Task) -> Any:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # ほかのプロファイラーが動いている場合は計測せずに実行する
+            return self.handler(task)
+        
+        started = time.perf_counter()
+        try:
+            result = self.handler(task)
+        finally:
+            profiler.disable()
+        elapsed = time.perf_counter() - started
+        
+        if elapsed >= self.threshold:
+            self._save(profiler, task, result, elapsed)
+        return result
+    
+    def _save(self, profiler: cProfile.Profile, task: Task, result: Any, elapsed: float) -> None:
+        """プロファイルを保存し、保存先をタスクの計測値に記録する（失敗しても変換は失敗にしない）"""
+        output_path = _output_path(result)
+        output_root = (task.payload or {}).get('output_root')
+        if output_path is not None and output_root:
+            # 出力ルートからの相対パスで記録する（/output で取得できる）
+            recorded = output_path + PROFILE_SUFFIX
+            path = os.path.join(output_root, recorded)
+        else:
+            path = os.path.join(self.profile_dir, f"{task.id}{PROFILE_SUFFIX}")
+            recorded = path
+        
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            profiler.dump_stats(path)
+        except OSError as e:
+            logger.warning(f"プロファイルの保存に失敗しました: {path} - {str(e)}")
+            return
+        
+        logger.info(f"プロファイルを保存しました（{elapsed:.2f}秒）: {path}")
+        record_metric('profile_path', recorded)
+
+
+def _output_path(result: Any) -> Optional[str]:
+    """変換結果の出力ファイルの出力ルートからの相対パス（出力のない結果の場合はNone）"""
+    if not isinstance(result, TaskResult) or not isinstance(result.result, dict):
+        return None
+    return result.result.get('output_path') or None
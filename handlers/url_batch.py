@@ -0,0 +1,300 @@
+"""
+URLの一括変換（URLの一覧・サイトマップ）
+
+URLの一覧、またはサイトマップ（sitemap.xml、サイトマップインデックス、gzip圧縮を含む）を
+展開して重複を除き、URLごとの変換をサブタスクとして登録する。
+サブタスクはペイロードの host でスケジューラのグループに分かれ、ホストごとの同時実行数と
+取得の間隔が制限される。ページは一括変換ごとのフォルダに保存し、
+すべて終わると変換したページの一覧（index.md）を作成する
+"""
+import gzip
+import io
+import logging
+import os
+import re
+import time
+import uuid
+import xml.etree.ElementTree as ElementTree
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from taskqueue import Task, TaskCancelledError, TaskResult, raise_if_cancelled
+
+from .http_cache import get_http_session, normalize_url
+
+logger = logging.getLogger(__name__)
+
+# 一括変換と、その結果のまとめのタスクタイプ
+URL_BATCH_TASK_TYPE = 'url_batch'
+URL_BATCH_MERGE_TASK_TYPE = 'url_batch_merge'
+
+# サイトマップの名前空間と、たどるサイトマップインデックスの深さ
+_SITEMAP_NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+_SITEMAP_MAX_DEPTH = 3
+
+# 展開するサイトマップ1つあたりの最大サイズ（gzip展開後）
+_SITEMAP_MAX_BYTES = 50 * 1024 * 1024
+
+
+def url_host(url: str) -> str:
+    """URLのホスト（ポートを含む、小文字）"""
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    return f"{host}:{parts.port}" if parts.port else host
+
+
+def dedupe_urls(urls: List[str], max_urls: int) -> Tuple[List[str], int]:
+    """
+    http/https のURLだけを残し、正規化して重複を除く（最初に現れた順を保つ）
+    
+    Args:
+        urls: URLの一覧
+        max_urls: 残すURLの上限
+    
+    Returns:
+        (URLの一覧, 除いた件数)
+    """
+    seen = set()
+    unique = []
+    for url in urls:
+        if not isinstance(url, str) or urlsplit(url.strip()).scheme.lower() not in ('http', 'https'):
+            continue
+        normalized = normalize_url(url)
+        if normalized in seen or not urlsplit(normalized).hostname:
+            continue
+        seen.add(normalized)
+        unique.append(normalized)
+        if len(unique) >= max_urls:
+            logger.warning(f"URLの数が上限を超えたため先頭の{max_urls}件のみ変換します")
+            break
+    return unique, len(urls) - len(unique)
+
+
+def expand_sitemap(sitemap_url: str, max_urls: int, timeout: float) -> List[str]:
+    """
+    サイトマップからページのURLを取得する（サイトマップインデックスは一定の深さまでたどる）
+    
+    Args:
+        sitemap_url: サイトマップのURL
+        max_urls: 取得するURLの上限
+        timeout: 1回の取得のタイムアウト（秒）
+    
+    Returns:
+        ページのURLの一覧（重複を含む場合がある）
+    
+    Raises:
+        ValueError: 最初のサイトマップをXMLとして読めない場合
+    """
+    session = get_http_session()
+    urls: List[str] = []
+    visited = set()
+    pending = [(sitemap_url, 0)]
+    
+    while pending and len(urls) < max_urls:
+        url, depth = pending.pop(0)
+        if url in visited:
+            continue
+        visited.add(url)
+        raise_if_cancelled()
+        
+        try:
+            root = _fetch_sitemap(session, url, timeout)
+        except (OSError, ValueError, ElementTree.ParseError) as e:
+            if url == sitemap_url:
+                raise ValueError(f"サイトマップを読み込めませんでした: {str(e)}") from e
+            logger.warning(f"サイトマップを読み込めなかったため読み飛ばします: {url} - {str(e)}")
+            continue
+        
+        if root.tag == f"{_SITEMAP_NS}sitemapindex" or root.tag == 'sitemapindex':
+            if depth >= _SITEMAP_MAX_DEPTH:
+                logger.warning(f"サイトマップインデックスが深すぎるため読み飛ばします: {url}")
+                continue
+            pending.extend((loc, depth + 1) for loc in _locations(root, 'sitemap'))
+        else:
+            urls.extend(_locations(root, 'url'))
+    
+    return urls[:max_urls]
+
+
+def handle_url_batch_task(task: Task) -> TaskResult:
+    """
+    URLの一覧・サイトマップを展開し、URLごとの変換サブタスクに分割するタスクハンドラ
+    
+    Args:
+        task: 一括変換タスク (urls または sitemap, folder, output_dir などのpayloadを含む)
+    
+    Returns:
+        TaskResult: URLごとの変換サブタスクへの分割結果
+    """
+    from config import Config
+    
+    payload: Dict[str, Any] = task.payload
+    
+    try:
+        urls: List[str] = list(payload.get('urls') or [])
+        if payload.get('sitemap'):
+            logger.info(f"サイトマップを展開します: {payload['sitemap']}")
+            urls.extend(expand_sitemap(payload['sitemap'], Config.URL_BULK_MAX_URLS, Config.HTTP_TIMEOUT))
+        raise_if_cancelled()
+        
+        urls, skipped = dedupe_urls(urls, Config.URL_BULK_MAX_URLS)
+        if not urls:
+            return TaskResult.failure("変換できるURLがありません")
+        
+        # ページは「サイトマップのホスト名（URLの一覧は urls）.batch-タスクID.変換年月日」フォルダに保存する
+        batch_dir = batch_folder_name(task)
+        output_dir = os.path.join(payload['output_dir'], batch_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        
+        subtasks = [
+            Task(
+                id=uuid.uuid4(),
+                type='conversion',
+                name=f"URL変換: {url}",
+                payload={
+                    'source_type': 'url',
+                    'url': url,
+                    'host': url_host(url),
+                    'batch_index': index + 1,
+                    'folder': payload.get('folder', 'default'),
+                    'client_ip': payload.get('client_ip'),
+                    'output_dir': output_dir,
+                    'output_root': payload['output_root']
+                },
+                priority=task.priority,
+                cost=Config.ADMISSION_URL_COST
+            )
+            for index, url in enumerate(urls)
+        ]
+        
+        logger.info(f"URLの一括変換を分割: {task.id} ({len(urls)}件、重複・対象外{skipped}件)")
+        return TaskResult.split_into(
+            subtasks,
+            URL_BATCH_MERGE_TASK_TYPE,
+            unit='urls',
+            merge_payload={'batch_urls': urls, 'batch_dir': batch_dir, 'skipped_urls': skipped}
+        )
+    
+    except TaskCancelledError as e:
+        logger.info(f"URLの一括変換を中断しました: {e.message}")
+        return TaskResult.failure(e.message)
+    
+    except Exception as e:
+        logger.exception(f"URLの一括変換の展開でエラーが発生しました: {str(e)}")
+        return TaskResult.failure(f"URLの展開失敗: {str(e)}")
+
+
+def batch_folder_name(task: Task) -> str:
+    """一括変換のページを保存するフォルダ名"""
+    sitemap = task.payload.get('sitemap')
+    title = re.sub(r'[\\/*?:"<>|]', "", urlsplit(sitemap).netloc if sitemap else "").strip() or "urls"
+    return f"{title}.batch-{str(task.id)[:8]}.{datetime.now().strftime('%Y%m%d')}"
+
+
+def collect_url_results(
+    urls: List[str],
+    results: List[Optional[Dict[str, Any]]],
+    errors: List[Optional[str]]
+) -> List[Dict[str, Any]]:
+    """
+    URLごとのサブタスクの結果を、URLの順に状態・出力パスの一覧にする
+    
+    Args:
+        urls: サブタスクを作った順のURL
+        results: サブタスクの結果（失敗はNone）
+        errors: サブタスクのエラーメッセージ（成功はNone）
+    
+    Returns:
+        URLごとの状態（url, host, output_path / error）
+    """
+    pages = []
+    for url, result, error in zip(urls, results, errors):
+        page: Dict[str, Any] = {'url': url, 'host': url_host(url)}
+        if result is not None:
+            page['output_path'] = result.get('output_path')
+            page['output_filename'] = result.get('output_filename')
+            page['http_cache'] = result.get('http_cache')
+        else:
+            page['error'] = error or '変換に失敗しました'
+        pages.append(page)
+    return pages
+
+
+def summarize_pages(pages: List[Dict[str, Any]], elapsed: float, output_bytes: int) -> Dict[str, Any]:
+    """
+    一括変換の件数・スループットの集計
+    
+    Args:
+        pages: collect_url_results() の結果
+        elapsed: 一括変換の開始からの経過秒数
+        output_bytes: 出力したMarkdownの合計サイズ
+    
+    Returns:
+        集計（件数、ホストごとの件数、URL/秒、バイト/秒）
+    """
+    hosts: Dict[str, Dict[str, int]] = {}
+    for page in pages:
+        counts = hosts.setdefault(page['host'], {'succeeded': 0, 'failed': 0})
+        counts['failed' if 'error' in page else 'succeeded'] += 1
+    
+    succeeded = sum(1 for page in pages if 'error' not in page)
+    elapsed = max(elapsed, 1e-6)
+    return {
+        'total': len(pages),
+        'succeeded': succeeded,
+        'failed': len(pages) - succeeded,
+        'hosts': hosts,
+        'elapsed': round(elapsed, 3),
+        'urls_per_sec': round(len(pages) / elapsed, 3),
+        'output_bytes': output_bytes,
+        'bytes_per_sec': round(output_bytes / elapsed, 1)
+    }
+
+
+def build_index(title: str, pages: List[Dict[str, Any]]) -> str:
+    """変換したページの一覧のMarkdown（出力フォルダからの相対リンク）"""
+    lines = [f"# {title}", ""]
+    for page in pages:
+        if 'error' in page:
+            lines.append(f"- {page['url']} （失敗: {page['error']}）")
+        else:
+            lines.append(f"- [{page['output_filename']}](./{page['output_filename']}) - {page['url']}")
+    return "\n".join(lines) + "\n"
+
+
+def batch_elapsed(task: Task) -> float:
+    """一括変換の開始からの経過秒数"""
+    if task.started_at is None:
+        return 0.0
+    return max(0.0, time.time() - task.started_at.timestamp())
+
+
+def _fetch_sitemap(session: Any, url: str, timeout: float) -> ElementTree.Element:
+    """サイトマップを取得してXMLとして解析する（gzip圧縮にも対応）"""
+    response = session.get(url, timeout=timeout, stream=True)
+    try:
+        response.raise_for_status()
+        body = response.raw.read(_SITEMAP_MAX_BYTES + 1, decode_content=True)
+    finally:
+        response.close()
+    
+    if body[:2] == b'\x1f\x8b':
+        with gzip.GzipFile(fileobj=io.BytesIO(body)) as f:
+            body = f.read(_SITEMAP_MAX_BYTES + 1)
+    if len(body) > _SITEMAP_MAX_BYTES:
+        raise ValueError(f"サイトマップが大きすぎます: {url}")
+    return ElementTree.fromstring(body)
+
+
+def _locations(root: ElementTree.Element, entry_tag: str) -> List[str]:
+    """サイトマップの url / sitemap 要素の loc を取得する（名前空間の有無を問わない）"""
+    locations = []
+    for entry in root:
+        if entry.tag not in (f"{_SITEMAP_NS}{entry_tag}", entry_tag):
+            continue
+        for child in entry:
+            if child.tag in (f"{_SITEMAP_NS}loc", 'loc') and child.text and child.text.strip():
+                locations.append(child.text.strip())
+    return locations
+
@@ -0,0 +1,698 @@
+"""
+変換結果のMarkdownのプレビュー（サーバー側でのHTMLへの変換と、ページ単位のディスクキャッシュ）
+
+Markdownをブロック単位に解析してHTMLに変換する。本文はすべてエスケープし、タグはこのモジュールが
+生成するものだけ、リンク・画像のURLは http(s)・mailto と相対パスだけを出力するため、
+変換結果をそのまま innerHTML に入れられる。
+大きな文書はブロックの境目で一定サイズごとのページに分け、要求されたページだけを変換する
+（表・コードブロックの途中で分けた場合は、次のページに表の見出し行・コードブロックの開始行を引き継ぐ）。
+ページの区切りと変換結果は、ファイルのパス・更新日時・サイズをキーにしてディスクにキャッシュする
+"""
+import hashlib
+import html
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urljoin
+
+from werkzeug.security import safe_join
+
+from handlers.conversion_cache import ConversionCache
+
+# 変換の規則を変えたら上げる（キャッシュのキーとETagに含める）
+RENDERER_VERSION = 2
+
+# プレビューできるファイルの拡張子
+PREVIEW_EXTENSIONS = ('.md', '.markdown')
+
+# 引用・リスト・強調の入れ子の上限（これより深いものは本文として出力する）
+_MAX_DEPTH = 16
+
+# ブロックの判定
+_FENCE_RE = re.compile(r'^( {0,3})(`{3,}|~{3,})[ \t]*([^`\s]*)')
+_FENCE_CLOSE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})[ \t]*$')
+_HEADING_RE = re.compile(r'^ {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$')
+_SETEXT_RE = re.compile(r'^ {0,3}(=+|-+)[ \t]*$')
+_HR_RE = re.compile(r'^ {0,3}([-*_])(?:[ \t]*\1){2,}[ \t]*$')
+_BLOCKQUOTE_RE = re.compile(r'^ {0,3}> ?(.*)$')
+_LIST_RE = re.compile(r'^( *)([-*+]|\d{1,9}[.)])(?:[ \t]+(.*)|[ \t]*$)')
+_TABLE_SEP_RE = re.compile(r'^ {0,3}\|?[ \t]*:?-+:?[ \t]*(?:\|[ \t]*:?-+:?[ \t]*)*\|?[ \t]*$')
+_CELL_SPLIT_RE = re.compile(r'(?<!\\)\|')
+
+# 強調・打ち消し線の本文の最大文字数（閉じていない記号が多い文書で、記号ごとに残りの全文を探さないようにする）
+_MAX_EMPHASIS_CHARS = 256
+_EMPHASIS = r'.{1,%d}?' % _MAX_EMPHASIS_CHARS
+
+# インライン要素（左から順に、同じ位置では先に書いたものを優先する）
+_INLINE_RE = re.compile(
+    r'(?P<br>(?: {2,}|\\)\n)'
+    r'|(?P<ticks>`+)(?P<code>.+?)(?<!`)(?P=ticks)(?!`)'
+    r'|\\(?P<escaped>[!-/:-@\[-`{-~])'
+    r'|!\[(?P<alt>(?:[^\[\]\\]|\\.)*)\]\((?P<src>[^\s()]*)(?:\s+"(?P<img_title>[^"]*)")?\s*\)'
+    r'|\[(?P<text>(?:[^\[\]\\]|\\.|\[(?:[^\[\]\\]|\\.)*\])*)\]'
+    r'\((?P<href><[^<>\n]*>|[^\s()]*(?:\([^\s()]*\)[^\s()]*)*)(?:\s+"(?P<title>[^"]*)")?\s*\)'
+    r'|<(?P<autolink>(?:https?|mailto):[^\s<>]+)>'
+    r'|(?<![\w/])(?P<url>https?://[^\s<>"]*[^\s<>"\'.,:;!?)\]*_~])'
+    r'|\*\*(?P<strong>(?=\S)' + _EMPHASIS + r'(?<=\S))\*\*(?!\*)'
+    r'|(?<!\w)__(?P<strong_u>(?=\S)' + _EMPHASIS + r'(?<=\S))__(?!\w)'
+    r'|\*(?P<em>(?=[^\s*])' + _EMPHASIS + r'(?<=[^\s*]))\*'
+    r'|(?<!\w)_(?P<em_u>(?=[^\s_])' + _EMPHASIS + r'(?<=[^\s_]))_(?!\w)'
+    r'|~~(?P<del>(?=\S)' + _EMPHASIS + r'(?<=\S))~~',
+    re.DOTALL
+)
+
+# URLとして出力するスキーム（それ以外のリンクは文字列として表示する）
+_LINK_SCHEMES = ('http', 'https', 'mailto')
+_IMAGE_SCHEMES = ('http', 'https', 'data')
+_DATA_IMAGE_RE = re.compile(r'^data:image/(?:png|jpeg|gif|webp);base64,', re.IGNORECASE)
+_SCHEME_RE = re.compile(r'^([a-zA-Z][a-zA-Z0-9+.-]*):')
+_CONTROL_RE = re.compile(r'[\x00-\x20\x7f]')
+
+
+class MarkdownPreviewError(Exception):
+    """プレビューのエラー（HTTPステータス付き）"""
+    
+    def __init__(self, message: str, status: int = 400):
+        self.message = message
+        self.status = status
+        super().__init__(message)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """APIレスポンス用の辞書"""
+        return {'error': self.message}
+
+
+class PreviewSource:
+    """プレビューするファイル（キャッシュのキーとETagは更新日時とサイズから作る）"""
+    
+    __slots__ = ('path', 'relative', 'mtime', 'mtime_ns', 'size')
+    
+    def __init__(self, path: str, relative: str, mtime: float, mtime_ns: int, size: int):
+        self.path = path
+        self.relative = relative
+        self.mtime = mtime
+        self.mtime_ns = mtime_ns
+        self.size = size
+    
+    def cache_key(self, page_bytes: int) -> str:
+        """ページの区切りのキャッシュキー（ページのキーはこれにページ番号を付ける）"""
+        material = json.dumps(
+            [self.relative, self.mtime_ns, self.size, page_bytes, RENDERER_VERSION]
+        )
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+    
+    def etag(self, page: int) -> str:
+        """ページのETag（引用符なし）"""
+        return f"{self.mtime_ns:x}-{self.size:x}-{page}-v{RENDERER_VERSION}"
+
+
+class MarkdownPreview:
+    """出力ディレクトリのMarkdownをページ単位でHTMLに変換する（結果はディスクにキャッシュ）"""
+    
+    def __init__(
+        self,
+        root: str,
+        cache: ConversionCache,
+        page_bytes: int = 64 * 1024,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        初期化
+        
+        Args:
+            root: 出力ディレクトリ
+            cache: ページの区切りと変換結果の保存先
+            page_bytes: 1ページの目安のサイズ（元のMarkdownのバイト数）
+            logger: カスタムロガー（省略可）
+        """
+        self.root = os.path.abspath(root)
+        self.cache = cache
+        self.page_bytes = max(1024, page_bytes)
+        self.logger = logger or logging.getLogger(__name__)
+        
+        # 統計（キャッシュのヒット・ミスはキャッシュの側で数える）
+        self.renders = 0
+        self.splits = 0
+    
+    def locate(self, filename: str) -> PreviewSource:
+        """
+        プレビューするファイルを探す
+        
+        Args:
+            filename: 出力ディレクトリからの相対パス
+        
+        Returns:
+            PreviewSource: ファイル
+        
+        Raises:
+            MarkdownPreviewError: ファイルが存在しない場合（404）、Markdownでない場合（400）
+        """
+        path = safe_join(self.root, filename)
+        if path is None:
+            raise MarkdownPreviewError('ファイルが見つかりません', 404)
+        try:
+            result = os.stat(path)
+        except OSError:
+            raise MarkdownPreviewError('ファイルが見つかりません', 404)
+        if not os.path.isfile(path):
+            raise MarkdownPreviewError('ファイルが見つかりません', 404)
+        if not path.lower().endswith(PREVIEW_EXTENSIONS):
+            raise MarkdownPreviewError('プレビューできるのはMarkdownファイルのみです')
+        
+        relative = os.path.relpath(path, self.root).replace('\\', '/')
+        return PreviewSource(path, relative, result.st_mtime, result.st_mtime_ns, result.st_size)
+    
+    def render_page(self, source: PreviewSource, page: int = 0) -> Dict[str, Any]:
+        """
+        1ページ分をHTMLに変換する
+        
+        Args:
+            source: プレビューするファイル
+            page: ページ番号（0始まり）
+        
+        Returns:
+            Dict[str, Any]: HTMLとページの情報
+        
+        Raises:
+            MarkdownPreviewError: ページ番号が範囲外の場合（404）
+        """
+        key = source.cache_key(self.page_bytes)
+        pages, total_lines = self._pages(source, key)
+        if page < 0 or page >= len(pages):
+            raise MarkdownPreviewError(f"ページは0から{len(pages) - 1}の範囲で指定してください", 404)
+        
+        offset, length, line, prefix = pages[page]
+        page_key = f"{key}-{page}"
+        content = self.cache.get(page_key)
+        cached = content is not None
+        self.cache.record(cached)
+        if content is None:
+            content = self._render(source, offset, length, prefix)
+            self.cache.put(page_key, content)
+        
+        end_line = pages[page + 1][2] if page + 1 < len(pages) else total_lines
+        return {
+            'path': source.relative,
+            'page': page,
+            'pages': len(pages),
+            'has_more': page + 1 < len(pages),
+            'start_line': line + 1,
+            'end_line': end_line,
+            'total_lines': total_lines,
+            'size': source.size,
+            'modified': source.mtime,
+            'cached': cached,
+            'html': content
+        }
+    
+    def stats(self) -> Dict[str, Any]:
+        """統計情報を返す"""
+        stats = self.cache.stats()
+        stats.update({
+            'page_bytes': self.page_bytes,
+            'renders': self.renders,
+            'splits': self.splits
+        })
+        return stats
+    
+    def _pages(self, source: PreviewSource, key: str) -> Tuple[List[List[Any]], int]:
+        """ページの区切り（(オフセット, 長さ, 開始行, 引き継ぐ行) の一覧と総行数、キャッシュがなければ作成）"""
+        cached = self.cache.get(key)
+        if cached is not None:
+            try:
+                data = json.loads(cached)
+                return data['pages'], data['lines']
+            except (ValueError, KeyError):
+                pass
+        
+        try:
+            pages, total_lines = split_pages(source.path, self.page_bytes)
+        except OSError as e:
+            raise MarkdownPreviewError(f"ファイルの読み込みに失敗しました: {str(e)}", 500)
+        self.splits += 1
+        self.cache.put(key, json.dumps({'pages': pages, 'lines': total_lines}))
+        return pages, total_lines
+    
+    def _render(self, source: PreviewSource, offset: int, length: int, prefix: str) -> str:
+        """ファイルの指定範囲を読み出してHTMLに変換する"""
+        try:
+            with open(source.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(length)
+        except OSError as e:
+            raise MarkdownPreviewError(f"ファイルの読み込みに失敗しました: {str(e)}", 500)
+        
+        # 相対パスのリンク・画像は、ファイルのあるフォルダの /output/ のURLとして解決する
+        folder = os.path.dirname(source.relative)
+        base_url = '/output/' + (quote(folder) + '/' if folder else '')
+        self.renders += 1
+        return render_markdown(prefix + data.decode('utf-8', 'replace'), base_url)
+
+
+def split_pages(path: str, page_bytes: int) -> Tuple[List[List[Any]], int]:
+    """
+    Markdownをページに分ける
+    
+    ページが page_bytes を超えたら、次のブロックの境目（空行の後の字下げのない行）で区切る。
+    表の途中では行の間で区切って見出し行を、コードブロックの途中では開始行を次のページに引き継ぐ。
+    空行のないまま page_bytes の2倍を超えた場合は行の間で区切る
+    
+    Args:
+        path: Markdownのパス
+        page_bytes: 1ページの目安のサイズ（バイト）
+    
+    Returns:
+        ([オフセット, 長さ, 開始行（0始まり）, 引き継ぐ行] の一覧, 総行数)
+    """
+    pages: List[List[Any]] = []
+    page_offset, page_line, page_prefix = 0, 0, ''
+    offset, line_number = 0, 0
+    fence: Optional[Tuple[str, str]] = None
+    table_header: Optional[str] = None
+    previous, previous_blank = '', True
+    
+    with open(path, 'rb') as f:
+        for raw in f:
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            blank = not line.strip()
+            
+            size = offset - page_offset
+            if size >= page_bytes:
+                prefix = None
+                if fence is not None:
+                    closing = _FENCE_CLOSE_RE.match(line)
+                    if not (closing and closing.group(1).startswith(fence[0])):
+                        prefix = fence[1]
+                elif table_header is not None and not blank and '|' in line:
+                    prefix = table_header
+                elif previous_blank and not blank and line[:1] not in (' ', '\t'):
+                    prefix = ''
+                elif size >= page_bytes * 2:
+                    prefix = ''
+                if prefix is not None:
+                    pages.append([page_offset, size, page_line, page_prefix])
+                    page_offset, page_line, page_prefix = offset, line_number, prefix
+            
+            # コードブロック・表の中かどうかを追う
+            if fence is not None:
+                closing = _FENCE_CLOSE_RE.match(line)
+                if closing and closing.group(1).startswith(fence[0]):
+                    fence = None
+            else:
+                opening = _FENCE_RE.match(line)
+                if opening:
+                    fence = (opening.group(2), line + '\n')
+                    table_header = None
+                elif table_header is None:
+                    if '|' in previous and '|' in line and _TABLE_SEP_RE.match(line):
+                        table_header = f"{previous}\n{line}\n"
+                elif blank or '|' not in line:
+                    table_header = None
+            
+            previous, previous_blank = line, blank
+            offset += len(raw)
+            line_number += 1
+    
+    pages.append([page_offset, offset - page_offset, page_line, page_prefix])
+    return pages, line_number
+
+
+def render_markdown(text: str, base_url: str = '') -> str:
+    """
+    MarkdownをHTMLに変換する（本文はエスケープし、安全なURLだけをリンクにする）
+    
+    Args:
+        text: Markdown
+        base_url: 相対パスのリンク・画像を解決する基準のURL
+    
+    Returns:
+        str: HTML
+    """
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').expandtabs(4).split('\n')
+    return ''.join(_render_blocks(lines, base_url, 0, False))
+
+
+def _render_blocks(lines: List[str], base_url: str, depth: int, tight: bool) -> List[str]:
+    """
+    行の一覧をブロックに分けてHTMLに変換する
+    
+    Args:
+        lines: 行の一覧
+        base_url: 相対URLの基準
+        depth: 入れ子の深さ
+        tight: 段落を <p> で囲まない（項目の間に空行のないリストの中）
+    """
+    out: List[str] = []
+    paragraph: List[str] = []
+    i, n = 0, len(lines)
+    
+    while i < n:
+        line = lines[i]
+        if not line.strip():
+            _flush_paragraph(paragraph, out, base_url, depth, tight)
+            i += 1
+            continue
+        if depth >= _MAX_DEPTH:
+            paragraph.append(line)
+            i += 1
+            continue
+        
+        fence = _FENCE_RE.match(line)
+        if fence:
+            _flush_paragraph(paragraph, out, base_url, depth, tight)
+            i = _fenced_code(lines, i, fence, out)
+            continue
+        
+        if not paragraph and line.startswith('    '):
+            i = _indented_code(lines, i, out)
+            continue
+        
+        heading = _HEADING_RE.match(line)
+        if heading:
+            _flush_paragraph(paragraph, out, base_url, depth, tight)
+            level = len(heading.group(1))
+            out.append(f"<h{level}>{_inline(heading.group(2) or '', base_url, depth)}</h{level}>\n")
+            i += 1
+            continue
+        
+        setext = _SETEXT_RE.match(line)
+        if paragraph and setext:
+            level = 1 if setext.group(1).startswith('=') else 2
+            content = _inline('\n'.join(part.strip() for part in paragraph), base_url, depth)
+            out.append(f"<h{level}>{content}</h{level}>\n")
+            paragraph.clear()
+            i += 1
+            continue
+        
+        if _HR_RE.match(line):
+            _flush_paragraph(paragraph, out, base_url, depth, tight)
+            out.append('<hr>\n')
+            i += 1
+            continue
+        
+        if _BLOCKQUOTE_RE.match(line):
+            _flush_paragraph(paragraph, out, base_url, depth, tight)
+            quoted = []
+            while i < n:
+                match = _BLOCKQUOTE_RE.match(lines[i])
+                if not match:
+                    break
+                quoted.append(match.group(1))
+                i += 1
+            out.append('<blockquote>\n')
+            out.extend(_render_blocks(quoted, base_url, depth + 1, False))
+            out.append('</blockquote>\n')
+            continue
+        
+        if _is_table_start(lines, i):
+            _flush_paragraph(paragraph, out, base_url, depth, tight)
+            i = _table(lines, i, out, base_url, depth)
+            continue
+        
+        item = _LIST_RE.match(line)
+        if item and len(item.group(1)) < 4 and (
+            not paragraph or (item.group(3) and item.group(2) in ('-', '*', '+', '1.', '1)'))
+        ):
+            _flush_paragraph(paragraph, out, base_url, depth, tight)
+            i = _list(lines, i, item, out, base_url, depth)
+            continue
+        
+        paragraph.append(line)
+        i += 1
+    
+    _flush_paragraph(paragraph, out, base_url, depth, tight)
+    return out
+
+
+def _flush_paragraph(paragraph: List[str], out: List[str], base_url: str, depth: int, tight: bool) -> None:
+    """溜めた行を段落として出力する"""
+    if not paragraph:
+        return
+    text = '\n'.join(part.lstrip() for part in paragraph).rstrip()
+    content = _inline(text, base_url, depth)
+    out.append(content + '\n' if tight else f"<p>{content}</p>\n")
+    paragraph.clear()
+
+
+def _fenced_code(lines: List[str], i: int, fence: re.Match, out: List[str]) -> int:
+    """``` または ~~~ で囲まれたコードブロック（閉じていなければ最後まで）"""
+    indent, marker = len(fence.group(1)), fence.group(2)
+    language = re.sub(r'[^\w+#.-]', '', fence.group(3))[:32]
+    body = []
+    i += 1
+    while i < len(lines):
+        closing = _FENCE_CLOSE_RE.match(lines[i])
+        if closing and closing.group(1).startswith(marker[0]) and len(closing.group(1)) >= len(marker):
+            i += 1
+            break
+        body.append(_strip_indent(lines[i], indent))
+        i += 1
+    
+    attributes = f' class="language-{html.escape(language)}"' if language else ''
+    code = html.escape(''.join(line + '\n' for line in body), quote=False)
+    out.append(f"<pre><code{attributes}>{code}</code></pre>\n")
+    return i
+
+
+def _indented_code(lines: List[str], i: int, out: List[str]) -> int:
+    """4文字以上字下げされたコードブロック"""
+    body = []
+    while i < len(lines) and (lines[i].startswith('    ') or not lines[i].strip()):
+        body.append(lines[i][4:])
+        i += 1
+    while body and not body[-1].strip():
+        body.pop()
+    code = html.escape(''.join(line + '\n' for line in body), quote=False)
+    out.append(f"<pre><code>{code}</code></pre>\n")
+    return i
+
+
+def _is_table_start(lines: List[str], i: int) -> bool:
+    """表の見出し行か（次の行が列数の合う区切り行）"""
+    if i + 1 >= len(lines) or '|' not in lines[i] or '|' not in lines[i + 1]:
+        return False
+    if not _TABLE_SEP_RE.match(lines[i + 1]):
+        return False
+    return len(_split_row(lines[i])) == len(_split_row(lines[i + 1]))
+
+
+def _table(lines: List[str], i: int, out: List[str], base_url: str, depth: int) -> int:
+    """パイプ区切りの表"""
+    header = _split_row(lines[i])
+    aligns = [_alignment(cell) for cell in _split_row(lines[i + 1])]
+    i += 2
+    
+    out.append('<table>\n<thead>\n<tr>')
+    for cell, align in zip(header, aligns):
+        out.append(f"<th{align}>{_inline(cell, base_url, depth)}</th>")
+    out.append('</tr>\n</thead>\n<tbody>\n')
+    while i < len(lines) and lines[i].strip() and '|' in lines[i]:
+        cells = _split_row(lines[i])
+        # 列数は見出し行にそろえる
+        cells = (cells + [''] * len(header))[:len(header)]
+        out.append('<tr>')
+        for cell, align in zip(cells, aligns):
+            out.append(f"<td{align}>{_inline(cell, base_url, depth)}</td>")
+        out.append('</tr>\n')
+        i += 1
+    out.append('</tbody>\n</table>\n')
+    return i
+
+
+def _split_row(line: str) -> List[str]:
+    """表の行をセルに分ける（\\| はセルの区切りにしない）"""
+    row = line.strip()
+    if row.startswith('|'):
+        row = row[1:]
+    if row.endswith('|') and not row.endswith('\\|'):
+        row = row[:-1]
+    return [cell.strip().replace('\\|', '|') for cell in _CELL_SPLIT_RE.split(row)]
+
+
+def _alignment(cell: str) -> str:
+    """区切り行のセルから列の配置の属性を作る"""
+    cell = cell.strip()
+    if cell.startswith(':') and cell.endswith(':'):
+        return ' style="text-align: center"'
+    if cell.endswith(':'):
+        return ' style="text-align: right"'
+    if cell.startswith(':'):
+        return ' style="text-align: left"'
+    return ''
+
+
+def _list(lines: List[str], i: int, first: re.Match, out: List[str], base_url: str, depth: int) -> int:
+    """箇条書き・番号付きリスト（項目の中身はブロックとして再帰的に変換する）"""
+    ordered = first.group(2)[0].isdigit()
+    marker = first.group(2)[-1]
+    start = int(first.group(2)[:-1]) if ordered else 1
+    items: List[List[str]] = []
+    loose = False
+    content_indent = 0
+    n = len(lines)
+    
+    while i < n:
+        line = lines[i]
+        if not line.strip():
+            # 空行の後に字下げされた行か次の項目が続けばリストの続き
+            j = i + 1
+            while j < n and not lines[j].strip():
+                j += 1
+            if j < n and (_leading(lines[j]) >= content_indent or _is_sibling(lines[j], content_indent, ordered, marker)):
+                items[-1].append('')
+                i += 1
+                continue
+            break
+        
+        if items and _leading(line) >= content_indent:
+            items[-1].append(line[content_indent:])
+            i += 1
+            continue
+        
+        item = _LIST_RE.match(line)
+        if item and (not items or _is_sibling(line, content_indent, ordered, marker)):
+            if items and items[-1] and not items[-1][-1].strip():
+                loose = True
+            content_indent = item.start(3) if item.group(3) else item.end(2) + 1
+            # マーカーの後の空白が5文字以上の場合は、1文字だけを区切りとみなす（残りは中身の字下げ）
+            if content_indent - item.end(2) > 4:
+                content_indent = item.end(2) + 1
+            items.append([line[content_indent:]])
+            i += 1
+            continue
+        
+        # 段落の途中で字下げのない行が続く場合（遅延継続行）
+        if items[-1][-1].strip() and not _starts_block(line):
+            items[-1].append(line.strip())
+            i += 1
+            continue
+        break
+    
+    for item_lines in items:
+        while item_lines and not item_lines[-1].strip():
+            item_lines.pop()
+        if '' in item_lines:
+            loose = True
+    
+    tag = 'ol' if ordered else 'ul'
+    out.append(f'<ol start="{start}">\n' if ordered and start != 1 else f"<{tag}>\n")
+    for item_lines in items:
+        content = ''.join(_render_blocks(item_lines, base_url, depth + 1, not loose)).rstrip('\n')
+        out.append(f"<li>{content}</li>\n")
+    out.append(f"</{tag}>\n")
+    return i
+
+
+def _is_sibling(line: str, content_indent: int, ordered: bool, marker: str) -> bool:
+    """同じリストの次の項目か（マーカーの種類が同じで、前の項目の中身より字下げが浅い）"""
+    item = _LIST_RE.match(line)
+    if not item or len(item.group(1)) >= content_indent:
+        return False
+    return item.group(2)[0].isdigit() == ordered and item.group(2)[-1] == marker
+
+
+def _starts_block(line: str) -> bool:
+    """段落を中断するブロックの開始行か"""
+    return bool(
+        _HEADING_RE.match(line) or _FENCE_RE.match(line) or _HR_RE.match(line)
+        or _BLOCKQUOTE_RE.match(line) or _LIST_RE.match(line)
+    )
+
+
+def _leading(line: str) -> int:
+    """行頭の空白の数"""
+    return len(line) - len(line.lstrip(' '))
+
+
+def _strip_indent(line: str, indent: int) -> str:
+    """行頭の空白を最大 indent 文字まで取り除く"""
+    return line[min(indent, _leading(line)):]
+
+
+def _inline(text: str, base_url: str, depth: int, links: bool = True) -> str:
+    """
+    インライン要素（コード・リンク・画像・強調・改行）をHTMLに変換する
+    
+    Args:
+        text: 段落・見出し・セルの本文
+        base_url: 相対URLの基準
+        depth: 入れ子の深さ
+        links: リンクを作るかどうか（リンクの文字列の中ではリンクを入れ子にしない）
+    """
+    if depth >= _MAX_DEPTH:
+        return html.escape(text, quote=False)
+    
+    out = []
+    position = 0
+    for match in _INLINE_RE.finditer(text):
+        out.append(html.escape(text[position:match.start()], quote=False))
+        out.append(_inline_element(match, base_url, depth, links))
+        position = match.end()
+    out.append(html.escape(text[position:], quote=False))
+    return ''.join(out)
+
+
+def _inline_element(match: re.Match, base_url: str, depth: int, links: bool) -> str:
+    """_INLINE_RE に一致したインライン要素を変換する"""
+    group = match.lastgroup
+    value = match.group(group)
+    if group == 'br':
+        return '<br>\n'
+    if group == 'code':
+        code = value.replace('\n', ' ')
+        if len(code) > 2 and code.startswith(' ') and code.endswith(' ') and code.strip():
+            code = code[1:-1]
+        return f"<code>{html.escape(code, quote=False)}</code>"
+    if group == 'escaped':
+        return html.escape(value, quote=False)
+    if match.group('src') is not None:
+        alt = re.sub(r'\\(.)', r'\1', match.group('alt'))
+        url = _safe_url(match.group('src'), base_url, _IMAGE_SCHEMES)
+        if url is None:
+            return html.escape(alt, quote=False)
+        return f'<img src="{url}" alt="{html.escape(alt)}"{_title(match.group("img_title"))} loading="lazy">'
+    if match.group('href') is not None:
+        content = _inline(match.group('text'), base_url, depth + 1, False)
+        url = _safe_url(match.group('href').strip('<>'), base_url, _LINK_SCHEMES)
+        if url is None or not links:
+            return content
+        return f"<a {_link_attributes(url)}{_title(match.group('title'))}>{content}</a>"
+    if group in ('autolink', 'url'):
+        url = _safe_url(value, base_url, _LINK_SCHEMES)
+        if url is None or not links:
+            return html.escape(value, quote=False)
+        return f"<a {_link_attributes(url)}>{html.escape(value, quote=False)}</a>"
+    
+    tag = {'strong': 'strong', 'strong_u': 'strong', 'em': 'em', 'em_u': 'em', 'del': 'del'}[group]
+    return f"<{tag}>{_inline(value, base_url, depth + 1, links)}</{tag}>"
+
+
+def _safe_url(url: str, base_url: str, schemes: Tuple[str, ...]) -> Optional[str]:
+    """
+    属性に出力できるURL（許可しないスキームはNone、相対パスは base_url で解決してエスケープする）
+    """
+    url = _CONTROL_RE.sub('', url)
+    scheme = _SCHEME_RE.match(url)
+    if scheme:
+        name = scheme.group(1).lower()
+        if name not in schemes:
+            return None
+        if name == 'data' and not _DATA_IMAGE_RE.match(url):
+            return None
+    elif base_url and url and not url.startswith(('#', '/', '?')):
+        url = urljoin(base_url, url)
+    return html.escape(url)
+
+
+def _link_attributes(url: str) -> str:
+    """リンクの属性（ページ内のリンク以外は新しいタブで開く）"""
+    if url.startswith('#'):
+        return f'href="{url}"'
+    return f'href="{url}" target="_blank" rel="noopener noreferrer"'
+
+
+def _title(title: Optional[str]) -> str:
+    """title 属性"""
+    return f' title="{html.escape(title)}"' if title else ''
@@ -0,0 +1,179 @@
+"""
+変換結果のファイル配信（/output）の条件付きリクエスト・範囲リクエスト・圧縮の選択
+
+Flaskのルートとネイティブ ASGI アプリで共通の判定を行い、返すステータス・ヘッダーと
+読み出すファイルの範囲を決める（本文の送り方はそれぞれのサーバーに任せる）。
+ETag は更新日時とサイズから作る強いETagで、圧縮したものは別の表現として区別する
+"""
+import mimetypes
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from werkzeug.http import (http_date, parse_accept_header, parse_date,
+                           parse_etags, parse_range_header, quote_etag)
+from werkzeug.security import safe_join
+
+from handlers.precompress import SIDECAR_ENCODINGS, fresh_sidecar
+
+# ファイルを読み出す単位
+READ_CHUNK_BYTES = 256 * 1024
+
+
+class OutputResponse:
+    """配信するファイルの応答（body_path が None の場合は本文なし）"""
+    
+    def __init__(
+        self,
+        status: int,
+        headers: List[Tuple[str, str]],
+        body_path: Optional[str] = None,
+        offset: int = 0,
+        length: int = 0
+    ):
+        self.status = status
+        self.headers = headers
+        self.body_path = body_path
+        self.offset = offset
+        self.length = length
+
+
+def content_type(path: str) -> str:
+    """ファイルのContent-Type（Markdownはテキストとして返す）"""
+    if path.lower().endswith(('.md', '.markdown')):
+        return 'text/markdown; charset=utf-8'
+    guessed, _ = mimetypes.guess_type(path)
+    guessed = guessed or 'application/octet-stream'
+    if guessed.startswith('text/'):
+        guessed += '; charset=utf-8'
+    return guessed
+
+
+def prepare_output_response(
+    root: str,
+    filename: str,
+    method: str,
+    headers: Dict[str, str]
+) -> Optional[OutputResponse]:
+    """
+    /output/<filename> の応答を決める
+    
+    Args:
+        root: 出力ディレクトリ
+        filename: 出力ディレクトリからの相対パス
+        method: リクエストメソッド（GET, HEAD）
+        headers: リクエストヘッダー（小文字のキー）
+    
+    Returns:
+        OutputResponse: 応答（ファイルがない場合はNone）
+    """
+    path = safe_join(root, filename)
+    if path is None:
+        return None
+    try:
+        result = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    
+    # 範囲リクエストは元のファイルのバイト位置で応じるため、圧縮したものは使わない
+    range_header = headers.get('range')
+    encoding, body_path, size = None, path, result.st_size
+    if not range_header:
+        selected = _negotiate(path, headers.get('accept-encoding', ''), result.st_mtime_ns)
+        if selected is not None:
+            encoding, body_path, size = selected
+    
+    etag = quote_etag(f"{result.st_mtime_ns:x}-{result.st_size:x}" + (f"-{encoding}" if encoding else ''))
+    response_headers = [
+        ('ETag', etag),
+        ('Last-Modified', http_date(result.st_mtime)),
+        # キャッシュしたものは毎回ETagで確認させる（変わっていなければ304で本文を送らない）
+        ('Cache-Control', 'no-cache'),
+        ('Accept-Ranges', 'bytes'),
+        ('Vary', 'Accept-Encoding')
+    ]
+    
+    if _not_modified(headers, etag, result.st_mtime):
+        return OutputResponse(304, response_headers)
+    
+    response_headers.append(('Content-Type', content_type(path)))
+    if encoding:
+        response_headers.append(('Content-Encoding', encoding))
+    
+    status, offset, length = 200, 0, size
+    if range_header and _if_range_matches(headers.get('if-range'), etag, result.st_mtime):
+        parsed = parse_range_header(range_header)
+        # 複数の範囲の指定には応じず、全体を返す
+        if parsed is not None and len(parsed.ranges) == 1:
+            bounds = parsed.range_for_length(size)
+            if bounds is None:
+                response_headers.append(('Content-Range', f"bytes */{size}"))
+                response_headers.append(('Content-Length', '0'))
+                return OutputResponse(416, response_headers)
+            offset, end = bounds
+            length = end - offset
+            status = 206
+            response_headers.append(('Content-Range', f"bytes {offset}-{end - 1}/{size}"))
+    
+    response_headers.append(('Content-Length', str(length)))
+    if method == 'HEAD':
+        return OutputResponse(status, response_headers)
+    return OutputResponse(status, response_headers, body_path, offset, length)
+
+
+def iter_file_range(path: str, offset: int, length: int, chunk_size: int = READ_CHUNK_BYTES) -> Iterator[bytes]:
+    """ファイルの指定範囲を一定サイズずつ読み出す"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _negotiate(path: str, accept_encoding: str, mtime_ns: int) -> Optional[Tuple[str, str, int]]:
+    """Accept-Encoding で受け付けられる、最新のサイドカーを選ぶ（(encoding, パス, サイズ)）"""
+    if not accept_encoding:
+        return None
+    accepted = parse_accept_header(accept_encoding)
+    candidates = [
+        encoding for encoding, _ in sorted(
+            SIDECAR_ENCODINGS,
+            key=lambda item: -accepted.quality(item[0])
+        )
+        if accepted.quality(encoding) > 0
+    ]
+    for encoding in candidates:
+        sidecar = fresh_sidecar(path, encoding, mtime_ns)
+        if sidecar is not None:
+            return encoding, sidecar[0], sidecar[1]
+    return None
+
+
+def _not_modified(headers: Dict[str, str], etag: str, mtime: float) -> bool:
+    """If-None-Match（優先）か If-Modified-Since で、クライアントのものが最新かどうか"""
+    if_none_match = headers.get('if-none-match')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return etags.star_tag or etags.contains_weak(etag.strip('"'))
+    
+    if_modified_since = parse_date(headers.get('if-modified-since'))
+    if if_modified_since is not None:
+        return int(mtime) <= if_modified_since.timestamp()
+    return False
+
+
+def _if_range_matches(if_range: Optional[str], etag: str, mtime: float) -> bool:
+    """If-Range の条件が満たされるかどうか（満たされなければ範囲指定を無視して全体を返す）"""
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        # 範囲の結合には強い比較を使う
+        return if_range == etag
+    date = parse_date(if_range)
+    return date is not None and int(mtime) == int(date.timestamp())
@@ -8,7 +8,8 @@ import uvicorn
 from asgiref.wsgi import WsgiToAsgi
 
 # アプリケーションのインポート
-from app import app, setup_application
+from app import app, event_broker, setup_application
+from sse import EventStreamApp, PathDispatcher
 
 
 def parse_arguments():
@@ -22,6 +23,10 @@ def parse_arguments():
                         help='サーバーがリクエストを受け付けるホスト (デフォルト: 0.0.0.0)')
     parser.add_argument('-d', '--debug', action='store_true',
                         help='デバッグモードで実行')
+    parser.add_argument('-s', '--server', choices=['wsgi', 'asgi'], default='wsgi',
+                        help='wsgi=FlaskをWsgiToAsgiで実行、asgi=ネイティブASGIアプリで実行 (デフォルト: wsgi)')
+    parser.add_argument('-r', '--role', choices=['all', 'web'], default='all',
+                        help='all=タスクの登録と実行、web=登録のみで実行は worker.py に任せる（共有キューを使用） (デフォルト: all)')
     
     return parser.parse_args()
 
@@ -30,14 +35,22 @@ if __name__ == "__main__":
     args = parse_arguments()
     
     # アプリケーションのセットアップ
-    setup_application(args.output_path)
+    setup_application(args.output_path, role=args.role)
     
-    # FlaskアプリをASGIに変換
-    asgi_app = WsgiToAsgi(app)
+    if args.server == 'asgi':
+        # アップロード・ファイル配信・フォルダ一覧をイベントループ上で直接処理する
+        from asgi_app import create_asgi_app
+        asgi_app = create_asgi_app()
+    else:
+        # FlaskアプリをASGIに変換
+        # SSE（/api/events）はスレッドを専有しないようイベントループ上で直接処理する
+        asgi_app = PathDispatcher(WsgiToAsgi(app), {
+            '/api/events': EventStreamApp(event_broker)
+        })
     
     # ログレベルを設定
     log_level = "debug" if args.debug else "info"
     
     # Uvicornで実行
-    print(f"Markitdown WebUI サーバーを起動しています（Uvicorn）。http://{args.host}:{args.port}/")
+    print(f"Markitdown WebUI サーバーを起動しています（Uvicorn, {args.server}, {args.role}）。http://{args.host}:{args.port}/")
     uvicorn.run(asgi_app, host=args.host, port=args.port, log_level=log_level)
\ No newline at end of file
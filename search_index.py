@@ -0,0 +1,548 @@
+"""
+変換したMarkdownの全文検索インデックス（SQLite FTS5）
+
+出力ディレクトリ内の .md ファイルを FTS5 の転置インデックスに登録し、ランキング（bm25）と
+抜粋付きで検索する。日本語は単語の区切りがないため trigram トークナイザで3文字単位に分割する
+（3文字未満の語はインデックスを使えないため、3文字以上の語があれば無視し、
+3文字未満の語だけの検索は新しい文書から一定件数までを部分一致で走査する）。
+更新は状態変化リスナーやフォルダの操作から受け取り、専用スレッドでまとめて書き込む。
+起動時と一定間隔ごとに出力ディレクトリと突き合わせ、停止中や他のノードで作成されたファイルも取り込む
+"""
+import html
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from taskqueue import Task, TaskStatus
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    folder TEXT NOT NULL,
+    title TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_folder ON documents (folder);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5 (
+    title, body, tokenize = 'trigram'
+);
+"""
+
+# インデックスに登録するファイルの拡張子
+INDEXED_EXTENSION = '.md'
+
+# trigram トークナイザで検索できる最短の語の長さ
+_MIN_MATCH_LENGTH = 3
+
+# 抜粋の強調の目印（HTMLエスケープの後で <mark> に置き換える）
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+# bm25 の列ごとの重み（タイトル, 本文）
+_BM25_WEIGHTS = (10.0, 1.0)
+
+# 突き合わせでこの件数以上を登録・削除したら、インデックスを最適化してWALを書き戻す
+_OPTIMIZE_THRESHOLD = 1000
+
+
+class SearchQueryError(Exception):
+    """検索条件のエラー"""
+    
+    def __init__(self, message: str, status: int = 400):
+        self.message = message
+        self.status = status
+        super().__init__(message)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """APIレスポンス用の辞書"""
+        return {'error': self.message}
+
+
+class MarkdownSearchIndex:
+    """出力ディレクトリのMarkdownの全文検索インデックス"""
+    
+    def __init__(
+        self,
+        path: str,
+        root: str,
+        flush_interval: float = 1.0,
+        reconcile_interval: float = 600,
+        max_document_bytes: int = 10 * 1024 * 1024,
+        short_term_scan_limit: int = 2000,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        初期化（データベースとテーブルがなければ作成し、出力ディレクトリとの突き合わせを始める）
+        
+        Args:
+            path: SQLiteデータベースファイルのパス
+            root: 出力ディレクトリ
+            flush_interval: 更新をまとめて書き込む間隔（秒）
+            reconcile_interval: 出力ディレクトリと突き合わせる間隔（秒、0で起動時のみ）
+            max_document_bytes: 1ファイルから登録する本文の最大バイト数（超えた分は検索されない）
+            short_term_scan_limit: 3文字未満の語だけの検索で部分一致を調べる文書数（新しいものから）
+            logger: カスタムロガー（省略可）
+        """
+        self.path = path
+        self.root = os.path.abspath(root)
+        self.flush_interval = flush_interval
+        self.reconcile_interval = reconcile_interval
+        self.max_document_bytes = max_document_bytes
+        self.short_term_scan_limit = max(1, short_term_scan_limit)
+        self.logger = logger or logging.getLogger(__name__)
+        
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+        
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # 書き込み待ちの操作（('index', 相対パス) / ('index_dir', フォルダ) / ('rename', 旧, 新) /
+        # ('remove', 相対パス) / ('reconcile',)）
+        self._pending: List[Tuple[str, ...]] = [('reconcile',)]
+        self._closed = False
+        self._last_reconciled = time.monotonic()
+        self._local = threading.local()
+        
+        # 統計
+        self.indexed = 0
+        self.removed = 0
+        self.searches = 0
+        self.errors = 0
+        
+        self._writer = threading.Thread(target=self._run, name="MarkdownSearchIndex", daemon=True)
+        self._writer.start()
+    
+    def search(
+        self,
+        query: str,
+        folders: Optional[List[str]] = None,
+        offset: int = 0,
+        limit: int = 20
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        全文検索する（空白区切りの語をすべて含む文書を、関連度の高い順に返す）
+        
+        3文字未満の語は、3文字以上の語があれば無視する。3文字未満の語だけの場合は
+        新しく登録した short_term_scan_limit 件の文書だけを部分一致で調べる
+        
+        Args:
+            query: 検索語（空白区切りでAND、"..." で囲むと空白を含む語）
+            folders: 絞り込むフォルダ（Noneですべて）
+            offset: 先頭から読み飛ばす件数
+            limit: 返す件数
+        
+        Returns:
+            (結果（path, folder, title, snippet, score, modified_date, size）, 続きがあるかどうか)
+        
+        Raises:
+            SearchQueryError: 検索語がない場合
+        """
+        terms = _parse_terms(query)
+        if not terms:
+            raise SearchQueryError('検索語を指定してください')
+        
+        long_terms = [term for term in terms if len(term) >= _MIN_MATCH_LENGTH]
+        short_terms = [term for term in terms if len(term) < _MIN_MATCH_LENGTH]
+        
+        conditions = []
+        params: List[Any] = []
+        folder_condition = f"documents.folder IN ({', '.join('?' for _ in folders)})" if folders else None
+        if long_terms:
+            # 3文字未満の語はトークンにならず、本文の全走査になるため絞り込みに使わない
+            short_terms = []
+            conditions.append("documents_fts MATCH ?")
+            params.append(' AND '.join(_quote(term) for term in long_terms))
+        else:
+            # 部分一致は新しい文書から一定件数だけを調べる（主キーの索引で範囲を決める）
+            scan_condition = f"WHERE {folder_condition} " if folder_condition else ""
+            conditions.append(
+                f"documents_fts.rowid IN (SELECT documents.id FROM documents {scan_condition}"
+                "ORDER BY documents.id DESC LIMIT ?)"
+            )
+            params.extend([*(folders or []), self.short_term_scan_limit])
+            for term in short_terms:
+                conditions.append("(documents_fts.title LIKE ? ESCAPE '\\' OR documents_fts.body LIKE ? ESCAPE '\\')")
+                pattern = f"%{_escape_like(term)}%"
+                params.extend((pattern, pattern))
+        if folder_condition:
+            conditions.append(folder_condition)
+            params.extend(folders)
+        
+        if long_terms:
+            snippet = f"snippet(documents_fts, 1, '{_MARK_START}', '{_MARK_END}', '…', 64)"
+            score = f"bm25(documents_fts, {_BM25_WEIGHTS[0]}, {_BM25_WEIGHTS[1]})"
+            order = "score"
+        else:
+            # 部分一致だけの検索は順位を付けられないため、新しく登録した順に返す
+            # （rowid の順に走査して件数に達したら打ち切れる）
+            snippet = "substr(documents_fts.body, max(instr(documents_fts.body, ?) - 40, 1), 120)"
+            params.insert(0, short_terms[0])
+            score = "NULL"
+            order = "documents_fts.rowid DESC"
+        
+        sql = (
+            f"SELECT documents.path, documents.folder, documents.title, documents.mtime, documents.size, "
+            f"{snippet} AS snippet, {score} AS score "
+            "FROM documents_fts JOIN documents ON documents.id = documents_fts.rowid "
+            f"WHERE {' AND '.join(conditions)} ORDER BY {order} LIMIT ? OFFSET ?"
+        )
+        params.extend((limit + 1, offset))
+        
+        try:
+            rows = self._reader().execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            raise SearchQueryError(f"検索できない条件です: {str(e)}") from e
+        self.searches += 1
+        
+        results = [
+            {
+                'path': row[0],
+                'folder': row[1],
+                'title': row[2],
+                'snippet': _snippet_html(row[5] or '', short_terms),
+                'score': round(-row[6], 4) if long_terms else None,
+                'modified_date': datetime.fromtimestamp(row[3]).strftime('%Y-%m-%d %H:%M:%S'),
+                'size': row[4]
+            }
+            for row in rows[:limit]
+        ]
+        return results, len(rows) > limit
+    
+    def add(self, path: str) -> None:
+        """
+        ファイルを登録・更新する（書き込みスレッドで読み込む）
+        
+        Args:
+            path: 出力ディレクトリからの相対パス
+        """
+        self._enqueue(('index', _normalize(path)))
+    
+    def rename(self, old_path: str, new_path: str) -> None:
+        """
+        フォルダ（またはファイル）の名前変更を反映する（本文は読み込み直さない）
+        
+        Args:
+            old_path: 変更前の出力ディレクトリからの相対パス
+            new_path: 変更後の出力ディレクトリからの相対パス
+        """
+        self._enqueue(('rename', _normalize(old_path), _normalize(new_path)))
+    
+    def remove(self, path: str) -> None:
+        """
+        フォルダ（配下のすべてのファイル）またはファイルを削除する
+        
+        Args:
+            path: 出力ディレクトリからの相対パス
+        """
+        self._enqueue(('remove', _normalize(path)))
+    
+    def reconcile(self) -> None:
+        """出力ディレクトリとの突き合わせを予約する"""
+        self._enqueue(('reconcile',))
+    
+    def on_task_status(self, task: Task, previous_status: TaskStatus) -> None:
+        """
+        完了した変換の出力ファイルを登録する（TaskQueueの状態変化リスナー）
+        
+        ZIPをメンバーごとのファイルに変換した場合（出力が「フォルダ/index.md」）は
+        同じフォルダのMarkdownもまとめて登録する
+        
+        Args:
+            task: 状態が変化したタスク
+            previous_status: 変化前の状態
+        """
+        if task.status != TaskStatus.SUCCESS or previous_status == TaskStatus.SUCCESS:
+            return
+        if not isinstance(task.result, dict) or not task.result.get('output_path'):
+            return
+        
+        output_path = _normalize(task.result['output_path'])
+        if os.path.basename(output_path) == 'index.md' and task.result.get('output_filename', '').endswith('/index.md'):
+            self._enqueue(('index_dir', os.path.dirname(output_path)))
+        else:
+            self._enqueue(('index', output_path))
+    
+    def flush(self) -> None:
+        """書き込み待ちの更新をすぐに書き込む（完了は待たない）"""
+        self._wakeup.set()
+    
+    def close(self) -> None:
+        """書き込み待ちの更新を書き込んでから終了する"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup.set()
+        self._writer.join()
+    
+    def stats(self) -> Dict[str, Any]:
+        """統計情報を返す"""
+        with self._lock:
+            pending = len(self._pending)
+        try:
+            documents = self._reader().execute("SELECT count(*) FROM documents").fetchone()[0]
+        except sqlite3.Error:
+            documents = None
+        return {
+            'path': self.path,
+            'documents': documents,
+            'pending': pending,
+            'indexed': self.indexed,
+            'removed': self.removed,
+            'searches': self.searches,
+            'errors': self.errors
+        }
+    
+    def _enqueue(self, operation: Tuple[str, ...]) -> None:
+        """操作を書き込み待ちに追加"""
+        with self._lock:
+            if self._closed:
+                return
+            self._pending.append(operation)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """データベースに接続（WALモード、コミットごとのfsyncはしない）"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    
+    def _reader(self) -> sqlite3.Connection:
+        """検索用の接続（スレッドごとに1つを使い回す）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+    
+    def _run(self) -> None:
+        """書き込みスレッド（一定間隔で書き込み待ちの操作をまとめて反映する）"""
+        conn = self._connect()
+        try:
+            while True:
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                with self._lock:
+                    closed = self._closed
+                    operations = self._pending
+                    self._pending = []
+                
+                if (
+                    self.reconcile_interval > 0
+                    and time.monotonic() - self._last_reconciled >= self.reconcile_interval
+                ):
+                    operations.append(('reconcile',))
+                if operations:
+                    self._apply(conn, operations)
+                if closed:
+                    return
+        finally:
+            conn.close()
+    
+    def _apply(self, conn: sqlite3.Connection, operations: List[Tuple[str, ...]]) -> None:
+        """操作を順に反映する（同じファイルの登録はまとめて1回にする）"""
+        if any(operation[0] == 'reconcile' for operation in operations):
+            self._last_reconciled = time.monotonic()
+            # 突き合わせで全体を反映するため、それ以前の登録・削除は不要
+            last = max(i for i, operation in enumerate(operations) if operation[0] == 'reconcile')
+            operations = operations[last:]
+        
+        pending_paths: Dict[str, None] = {}
+        reconciled = 0
+        try:
+            with conn:
+                for operation in operations:
+                    kind = operation[0]
+                    if kind == 'index':
+                        pending_paths[operation[1]] = None
+                        continue
+                    if kind == 'index_dir':
+                        for path in self._list_markdown(operation[1], recursive=False):
+                            pending_paths[path] = None
+                        continue
+                    
+                    # 名前変更・削除・突き合わせの前に、それまでの登録を反映する
+                    self._index_paths(conn, list(pending_paths))
+                    pending_paths.clear()
+                    if kind == 'rename':
+                        self._rename(conn, operation[1], operation[2])
+                    elif kind == 'remove':
+                        self._remove(conn, operation[1])
+                    elif kind == 'reconcile':
+                        reconciled += self._reconcile(conn)
+                self._index_paths(conn, list(pending_paths))
+            
+            if reconciled >= _OPTIMIZE_THRESHOLD:
+                # まとめて登録した後は、FTS5の分割されたセグメントを1つにまとめて検索を速くする
+                with conn:
+                    conn.execute("INSERT INTO documents_fts (documents_fts) VALUES ('optimize')")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error as e:
+            self.errors += 1
+            self.logger.error(f"全文検索インデックスの更新に失敗しました: {str(e)}")
+    
+    def _index_paths(self, conn: sqlite3.Connection, paths: List[str]) -> None:
+        """ファイルを読み込んで登録する（存在しなければ削除する）"""
+        for path in paths:
+            full_path = os.path.join(self.root, path)
+            try:
+                result = os.stat(full_path)
+                with open(full_path, 'rb') as f:
+                    body = f.read(self.max_document_bytes).decode('utf-8', errors='ignore')
+            except FileNotFoundError:
+                self._remove(conn, path)
+                continue
+            except OSError as e:
+                self.errors += 1
+                self.logger.warning(f"全文検索インデックスに登録できませんでした: {path} - {str(e)}")
+                continue
+            self._upsert(conn, path, body, result.st_mtime, result.st_size)
+    
+    def _upsert(self, conn: sqlite3.Connection, path: str, body: str, mtime: float, size: int) -> None:
+        """文書を登録・更新する"""
+        title = _document_title(path, body)
+        row = conn.execute("SELECT id FROM documents WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            cursor = conn.execute(
+                "INSERT INTO documents (path, folder, title, mtime, size) VALUES (?, ?, ?, ?, ?)",
+                (path, _folder_of(path), title, mtime, size)
+            )
+            doc_id = cursor.lastrowid
+        else:
+            doc_id = row[0]
+            conn.execute(
+                "UPDATE documents SET title = ?, mtime = ?, size = ? WHERE id = ?",
+                (title, mtime, size, doc_id)
+            )
+            conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (doc_id,))
+        conn.execute("INSERT INTO documents_fts (rowid, title, body) VALUES (?, ?, ?)", (doc_id, title, body))
+        self.indexed += 1
+    
+    def _rename(self, conn: sqlite3.Connection, old_path: str, new_path: str) -> None:
+        """パスの接頭辞を置き換える（フォルダ名も更新する）"""
+        rows = conn.execute(
+            "SELECT id, path FROM documents WHERE path = ? OR substr(path, 1, ?) = ?",
+            (old_path, len(old_path) + 1, old_path + '/')
+        ).fetchall()
+        for doc_id, path in rows:
+            renamed = new_path + path[len(old_path):]
+            conn.execute("DELETE FROM documents WHERE path = ? AND id != ?", (renamed, doc_id))
+            conn.execute(
+                "UPDATE documents SET path = ?, folder = ? WHERE id = ?",
+                (renamed, _folder_of(renamed), doc_id)
+            )
+        conn.execute("DELETE FROM documents_fts WHERE rowid NOT IN (SELECT id FROM documents)")
+    
+    def _remove(self, conn: sqlite3.Connection, path: str) -> None:
+        """ファイル、またはフォルダ配下のすべてのファイルを削除する"""
+        ids = [
+            row[0] for row in conn.execute(
+                "SELECT id FROM documents WHERE path = ? OR substr(path, 1, ?) = ?",
+                (path, len(path) + 1, path + '/')
+            )
+        ]
+        for doc_id in ids:
+            conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (doc_id,))
+            conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+        self.removed += len(ids)
+    
+    def _reconcile(self, conn: sqlite3.Connection) -> int:
+        """出力ディレクトリと突き合わせ、追加・更新・削除されたファイルを反映する（反映した件数を返す）"""
+        started = time.monotonic()
+        known = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT path, mtime, size FROM documents")}
+        
+        changed = []
+        for path in self._list_markdown('', recursive=True):
+            try:
+                result = os.stat(os.path.join(self.root, path))
+            except OSError:
+                continue
+            if known.pop(path, None) != (result.st_mtime, result.st_size):
+                changed.append(path)
+        
+        for path in known:
+            self._remove(conn, path)
+        self._index_paths(conn, changed)
+        if changed or known:
+            self.logger.info(
+                f"全文検索インデックスを出力ディレクトリと突き合わせました: "
+                f"登録{len(changed)}件、削除{len(known)}件 ({time.monotonic() - started:.1f}秒)"
+            )
+        return len(changed) + len(known)
+    
+    def _list_markdown(self, folder_path: str, recursive: bool) -> List[str]:
+        """フォルダ内のMarkdownファイルの相対パス"""
+        paths = []
+        pending = [folder_path]
+        while pending:
+            current = pending.pop()
+            try:
+                with os.scandir(os.path.join(self.root, current)) as iterator:
+                    for item in iterator:
+                        path = f"{current}/{item.name}" if current else item.name
+                        if item.is_dir():
+                            if recursive:
+                                pending.append(path)
+                        elif item.name.endswith(INDEXED_EXTENSION):
+                            paths.append(path)
+            except OSError:
+                continue
+        return paths
+
+
+def _normalize(path: str) -> str:
+    """相対パスを "/" 区切りにそろえる"""
+    return os.path.normpath(path).replace('\\', '/').strip('/')
+
+
+def _folder_of(path: str) -> str:
+    """文書の属するフォルダ（出力ディレクトリ直下のフォルダ名）"""
+    return path.split('/', 1)[0] if '/' in path else ''
+
+
+def _document_title(path: str, body: str) -> str:
+    """文書のタイトル（最初の見出し、なければファイル名）"""
+    for line in body.splitlines()[:50]:
+        if line.startswith('#'):
+            title = line.lstrip('#').strip()
+            if title:
+                return title[:200]
+    return os.path.basename(path)
+
+
+def _parse_terms(query: str) -> List[str]:
+    """検索語を分割する（"..." で囲んだ部分は1語として扱う）"""
+    terms = []
+    for index, part in enumerate((query or '').split('"')):
+        if index % 2 == 1:
+            if part.strip():
+                terms.append(part.strip())
+        else:
+            terms.extend(part.split())
+    return terms
+
+
+def _quote(term: str) -> str:
+    """FTS5の検索式の文字列リテラル"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _escape_like(term: str) -> str:
+    """LIKEのワイルドカードをエスケープ"""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _snippet_html(snippet: str, highlight_terms: List[str]) -> str:
+    """抜粋をHTMLエスケープし、一致した部分を <mark> で囲む"""
+    for term in highlight_terms:
+        snippet = snippet.replace(term, f"{_MARK_START}{term}{_MARK_END}")
+    text = html.escape(' '.join(snippet.split()))
+    return text.replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
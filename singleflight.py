@@ -0,0 +1,261 @@
+"""
+同じURLの変換の重複実行の抑止（シングルフライト）
+
+正規化したURLと変換オプションが同じ変換が実行中なら、後から登録されたタスクは実行せずに
+実行中のタスク（リーダー）の完了を待ち、結果のMarkdownを自分のフォルダにコピーして完了する。
+完了後も鮮度の期間内は結果を再利用し、同じURLをすぐに変換し直さない
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from handlers.http_cache import normalize_url
+from handlers.precompress import precompress_output
+from taskqueue import FINISHED_STATUSES, Task, TaskStatus
+
+
+def make_flight_key(url: str, options: Dict[str, Any]) -> str:
+    """
+    重複判定のキーを作成する
+    
+    Args:
+        url: 変換するURL
+        options: 変換結果に影響するオプション（コンバータ生成オプションなど）
+    
+    Returns:
+        str: キー（16進文字列）
+    """
+    material = json.dumps({'url': normalize_url(url), 'options': options}, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class UrlSingleFlight:
+    """実行中・鮮度内の同じURLの変換にタスクを相乗りさせる"""
+    
+    def __init__(
+        self,
+        publish: Callable[[Task], Any],
+        resubmit: Callable[[Task], Any],
+        freshness: float = 300,
+        max_entries: int = 1000,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        初期化
+        
+        Args:
+            publish: 相乗りしたタスクの状態をストアに反映する関数（TaskQueue.apply_external）
+            resubmit: リーダーがキャンセルされた場合に、相乗りしていたタスクを実行し直す関数
+            freshness: 完了した変換の結果を再利用する秒数（0で実行中の相乗りのみ）
+            max_entries: 再利用のために覚えておく結果の最大数
+            logger: カスタムロガー（省略可）
+        """
+        self.publish = publish
+        self.resubmit = resubmit
+        self.freshness = freshness
+        self.max_entries = max(1, max_entries)
+        self.logger = logger or logging.getLogger(__name__)
+        
+        self._lock = threading.Lock()
+        # キー -> 実行中のリーダー、リーダーのID -> 相乗りしたタスク、相乗りしたタスクのID -> リーダーのID
+        self._inflight: Dict[str, Task] = {}
+        self._followers: Dict[UUID, List[Task]] = {}
+        self._leader_of: Dict[UUID, UUID] = {}
+        # キー -> (完了したリーダー, 完了時刻)（古い順）
+        self._fresh: "OrderedDict[str, Tuple[Task, float]]" = OrderedDict()
+        
+        # 統計
+        self.coalesced = 0
+        self.reused = 0
+    
+    def attach(self, task: Task) -> Optional[Task]:
+        """
+        同じキーの変換が実行中か鮮度内の結果があれば、タスクを相乗りさせる
+        （ペイロードの flight_key で判定する）
+        
+        Args:
+            task: 登録しようとしているタスク
+        
+        Returns:
+            Optional[Task]: 相乗りした場合はリーダー（Noneならこのタスクがリーダーとして実行する）
+        """
+        key = task.payload['flight_key']
+        with self._lock:
+            leader = self._inflight.get(key)
+            if leader is not None:
+                self._followers[leader.id].append(task)
+                self._leader_of[task.id] = leader.id
+                self.coalesced += 1
+            else:
+                leader = self._fresh_result(key)
+                if leader is None:
+                    self._inflight[key] = task
+                    self._followers[task.id] = []
+                    return None
+                self.reused += 1
+        
+        task.payload['coalesced_with'] = str(leader.id)
+        self.logger.info(f"同じURLの変換に相乗りしました: {task.id} -> {leader.id}")
+        if leader.status == TaskStatus.SUCCESS:
+            self._complete(task, leader)
+        else:
+            self.publish(task)
+        return leader
+    
+    def is_follower(self, task_id: UUID) -> bool:
+        """実行中の変換に相乗りして完了を待っているタスクかどうか"""
+        with self._lock:
+            return task_id in self._leader_of
+    
+    def on_task_status(self, task: Task, previous_status: TaskStatus) -> None:
+        """
+        リーダーの完了を相乗りしたタスクに反映する（TaskQueueの状態変化リスナー）
+        
+        Args:
+            task: 状態が変化したタスク
+            previous_status: 変化前の状態
+        """
+        if task.status not in FINISHED_STATUSES or previous_status in FINISHED_STATUSES:
+            return
+        
+        with self._lock:
+            # 相乗りしたタスクがキャンセルされた
+            leader_id = self._leader_of.pop(task.id, None)
+            if leader_id is not None:
+                followers = self._followers.get(leader_id, [])
+                self._followers[leader_id] = [f for f in followers if f.id != task.id]
+                return
+            
+            if task.id not in self._followers:
+                return
+            followers = self._followers.pop(task.id)
+            for follower in followers:
+                self._leader_of.pop(follower.id, None)
+            key = task.payload.get('flight_key')
+            # 共有キューではストアのタスクが取り込み直した別のオブジェクトになるためIDで比べる
+            inflight = self._inflight.get(key)
+            if inflight is not None and inflight.id == task.id:
+                del self._inflight[key]
+            if task.status == TaskStatus.SUCCESS and self.freshness > 0:
+                self._fresh[key] = (task, time.monotonic())
+                self._fresh.move_to_end(key)
+                while len(self._fresh) > self.max_entries:
+                    self._fresh.popitem(last=False)
+        
+        if task.status == TaskStatus.CANCELED:
+            # リーダーだけがキャンセルされた場合は、相乗りしていたタスクを改めて実行する
+            self._handoff(followers)
+            return
+        
+        for follower in followers:
+            if task.status == TaskStatus.SUCCESS:
+                self._complete(follower, task)
+            else:
+                self._fail(follower, task.error_message or '変換に失敗しました')
+    
+    def release(self, task: Task) -> None:
+        """
+        リーダーとして登録したタスクを実行しなかった場合に登録を取り消す（受け付けを断った場合など）
+        相乗りしていたタスクは改めて実行する
+        
+        Args:
+            task: attach() がNoneを返したタスク
+        """
+        with self._lock:
+            followers = self._followers.pop(task.id, [])
+            for follower in followers:
+                self._leader_of.pop(follower.id, None)
+            inflight = self._inflight.get(task.payload.get('flight_key'))
+            if inflight is not None and inflight.id == task.id:
+                del self._inflight[task.payload['flight_key']]
+        self._handoff(followers)
+    
+    def stats(self) -> Dict[str, Any]:
+        """統計情報を返す"""
+        with self._lock:
+            return {
+                'inflight': len(self._inflight),
+                'waiting_followers': len(self._leader_of),
+                'fresh': len(self._fresh),
+                'freshness': self.freshness,
+                'coalesced': self.coalesced,
+                'reused': self.reused
+            }
+    
+    def _fresh_result(self, key: str) -> Optional[Task]:
+        """鮮度内で、出力ファイルが残っている完了済みのリーダー（ロックを保持して呼ぶ）"""
+        entry = self._fresh.get(key)
+        if entry is None:
+            return None
+        leader, finished = entry
+        if time.monotonic() - finished > self.freshness or not os.path.isfile(_output_path(leader)):
+            del self._fresh[key]
+            return None
+        return leader
+    
+    def _handoff(self, followers: List[Task]) -> None:
+        """リーダーのいなくなった相乗りしたタスクを実行し直す（最初のタスクが新しいリーダーになる）"""
+        for follower in followers:
+            if follower.status in FINISHED_STATUSES:
+                continue
+            follower.payload.pop('coalesced_with', None)
+            if self.attach(follower) is None:
+                self.resubmit(follower)
+    
+    def _complete(self, follower: Task, leader: Task) -> None:
+        """リーダーの出力を相乗りしたタスクのフォルダにコピーして成功にする"""
+        if follower.status in FINISHED_STATUSES:
+            return
+        
+        try:
+            source = _output_path(leader)
+            output_filename = leader.result['output_filename']
+            target = os.path.join(follower.payload['output_dir'], output_filename)
+            if os.path.abspath(source) != os.path.abspath(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(source, target)
+                precompress_output(target)
+        except (OSError, KeyError, TypeError) as e:
+            self.logger.error(f"相乗りした変換結果のコピーに失敗しました: {follower.id} - {str(e)}")
+            self._fail(follower, f"変換結果のコピーに失敗しました: {str(e)}")
+            return
+        
+        output_root = follower.payload['output_root']
+        now = datetime.now()
+        self.publish(follower.copy(update={
+            'status': TaskStatus.SUCCESS,
+            'result': {
+                'output_path': os.path.relpath(target, output_root).replace('\\', '/'),
+                'output_filename': output_filename,
+                'cache_hit': None,
+                'coalesced_with': str(leader.id)
+            },
+            'started_at': follower.started_at or now,
+            'finished_at': now,
+            'updated_at': now
+        }))
+    
+    def _fail(self, follower: Task, message: str) -> None:
+        """相乗りしたタスクをエラーにする"""
+        if follower.status in FINISHED_STATUSES:
+            return
+        now = datetime.now()
+        self.publish(follower.copy(update={
+            'status': TaskStatus.ERROR,
+            'error_message': message,
+            'finished_at': now,
+            'updated_at': now
+        }))
+
+
+def _output_path(task: Task) -> str:
+    """完了したタスクの出力ファイルの絶対パス"""
+    return os.path.join(task.payload['output_root'], task.result['output_path'])
@@ -0,0 +1,188 @@
+"""
+Server-Sent Events によるタスク状態変化の配信
+
+Uvicorn（run.py）ではイベントループ上で配信するASGIアプリを使い、
+接続中のブラウザごとにスレッドを専有しないようにする。
+Flask開発サーバー（app.py）向けには同期ジェネレータ版を提供する
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from taskqueue.events import AsyncSubscription, Event, EventBroker, SyncSubscription
+
+# ASGIの型定義
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+# SSEレスポンスのヘッダー
+SSE_HEADERS = {
+    'Content-Type': 'text/event-stream; charset=utf-8',
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
+
+# クライアントの再接続間隔（ミリ秒）
+RETRY_MS = 3000
+
+# ハートビート（コメント行）
+HEARTBEAT = b": ping\n\n"
+
+
+def _opening(broker: EventBroker, last_event_id: Optional[str]) -> Tuple[List[bytes], int]:
+    """
+    接続直後に送るデータ（再接続間隔と取りこぼしたイベントの再送）を作成
+    
+    Returns:
+        (送信データ, 送信済みとみなす最後の連番)
+        購読開始後に届いた重複イベントを除くために連番を使う
+    """
+    chunks = [f"retry: {RETRY_MS}\n\n".encode('utf-8')]
+    sent_seq = 0
+    
+    replayed = broker.replay(last_event_id)
+    if replayed is None:
+        chunks.append(broker.resync_event('history_unavailable').encode())
+    elif replayed:
+        chunks.extend(event.encode() for event in replayed)
+        sent_seq = replayed[-1].seq
+    elif last_event_id:
+        sent_seq = int(last_event_id.split(':', 1)[1])
+    
+    return chunks, sent_seq
+
+
+def event_stream(broker: EventBroker, last_event_id: Optional[str] = None) -> Iterator[bytes]:
+    """
+    同期版のイベントストリーム（Flaskのストリーミングレスポンス用）
+    
+    Args:
+        broker: イベントブローカー
+        last_event_id: クライアントが最後に受け取ったイベントID
+    
+    Yields:
+        bytes: SSE形式のデータ
+    """
+    subscription = broker.subscribe()
+    assert isinstance(subscription, SyncSubscription)
+    try:
+        chunks, sent_seq = _opening(broker, last_event_id)
+        for chunk in chunks:
+            yield chunk
+        
+        while True:
+            if subscription.overflowed:
+                subscription.overflowed = False
+                yield broker.resync_event('client_overflow').encode()
+            
+            event = subscription.get(timeout=broker.heartbeat_interval)
+            if event is None:
+                yield HEARTBEAT
+            elif event.seq > sent_seq:
+                sent_seq = event.seq
+                yield event.encode()
+    finally:
+        broker.unsubscribe(subscription)
+
+
+class EventStreamApp:
+    """イベントループ上でSSEを配信するASGIアプリ"""
+    
+    def __init__(self, broker: EventBroker):
+        self.broker = broker
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            return
+        
+        last_event_id = self._last_event_id(scope)
+        subscription = self.broker.subscribe(asyncio.get_running_loop())
+        assert isinstance(subscription, AsyncSubscription)
+        
+        # 切断を検知するため受信側を別タスクで監視
+        disconnected = asyncio.Event()
+        
+        async def watch_disconnect() -> None:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    disconnected.set()
+                    return
+        
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in SSE_HEADERS.items()]
+            })
+            
+            chunks, sent_seq = _opening(self.broker, last_event_id)
+            for chunk in chunks:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            
+            while not disconnected.is_set():
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    await self._send_event(send, self.broker.resync_event('client_overflow'))
+                
+                event = await self._next_event(subscription, disconnected)
+                if disconnected.is_set():
+                    break
+                if event is None:
+                    await send({'type': 'http.response.body', 'body': HEARTBEAT, 'more_body': True})
+                elif event.seq > sent_seq:
+                    sent_seq = event.seq
+                    await self._send_event(send, event)
+        except OSError:
+            # クライアント側で切断された
+            pass
+        finally:
+            self.broker.unsubscribe(subscription)
+            watcher.cancel()
+    
+    async def _next_event(self, subscription: AsyncSubscription, disconnected: asyncio.Event) -> Optional[Event]:
+        """次のイベントを待機（ハートビート間隔でタイムアウト、切断時は即時に戻る）"""
+        getter = asyncio.ensure_future(subscription.get(self.broker.heartbeat_interval))
+        stopper = asyncio.ensure_future(disconnected.wait())
+        done, pending = await asyncio.wait({getter, stopper}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        return getter.result() if getter in done else None
+    
+    @staticmethod
+    async def _send_event(send: Send, event: Event) -> None:
+        await send({'type': 'http.response.body', 'body': event.encode(), 'more_body': True})
+    
+    @staticmethod
+    def _last_event_id(scope: Scope) -> Optional[str]:
+        """Last-Event-IDヘッダー（またはクエリのlastEventId）を取得"""
+        for name, value in scope.get('headers', []):
+            if name == b'last-event-id':
+                return value.decode('latin-1')
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        values = query.get('lastEventId')
+        return values[0] if values else None
+
+
+class PathDispatcher:
+    """指定パスだけ別のASGIアプリに振り分けるミドルウェア"""
+    
+    def __init__(self, default_app: ASGIApp, routes: Dict[str, ASGIApp]):
+        """
+        Args:
+            default_app: 振り分け対象外のリクエストを処理するアプリ
+            routes: パス -> ASGIアプリ
+        """
+        self.default_app = default_app
+        self.routes = routes
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] == 'http':
+            app = self.routes.get(scope.get('path', ''))
+            if app is not None:
+                await app(scope, receive, send)
+                return
+        await self.default_app(scope, receive, send)
@@ -19,6 +19,13 @@ document.addEventListener('DOMContentLoaded', () => {
     applyPreferences();
 });
 
+// サーバーの設定（/api/config）
+const appConfig = {
+    max_content_length: 16 * 1024 * 1024,
+    upload_chunk_size: 8 * 1024 * 1024,
+    upload_batch_max_files: 500
+};
+
 /**
  * UI全般の初期化
  */
@@ -29,6 +36,7 @@ function initUI() {
     fetch('/api/config')
         .then(response => response.json())
         .then(config => {
+            Object.assign(appConfig, config);
             console.log('アプリケーション設定を読み込みました', config);
         })
         .catch(error => {
@@ -501,38 +509,224 @@ function initDropArea() {
 }
 
 /**
- * ファイル処理
+ * ファイル処理（複数ファイルは一括アップロードとしてまとめて送り、バッチ単位で進捗を表示）
  */
 function handleFiles(files) {
     // 現在のアクティブフォルダを取得
     const activeFolder = document.querySelector('.folder-button.active');
     const folderId = activeFolder ? activeFolder.getAttribute('data-folder') : 'default';
     
-    // アップロードするファイル数をカウント
-    let totalFiles = files.length;
-    let processedFiles = 0;
+    if (files.length === 1) {
+        uploadFile(files[0], folderId);
+        return;
+    }
+    uploadBatch(Array.from(files), folderId);
+}
+
+/**
+ * 複数ファイルの一括アップロード
+ * バッチを作成し、小さなファイルは1回のリクエストに収まる分ずつまとめて送信、
+ * 大きなファイルは分割アップロードでバッチに加える。
+ * 個々のタスクはSSE・差分取得でタスク一覧に反映され、バッチ全体の進捗はパネルに表示する
+ */
+async function uploadBatch(files, folder) {
+    const totalBytes = files.reduce((sum, file) => sum + file.size, 0);
     
-    // 5ファイル以上の場合は通知
-    if(totalFiles > 4) {
-        showToast({
-            type: 'info',
-            title: `${totalFiles}個のファイルを処理します`,
-            message: '処理が完了するまでお待ちください'
-        });
+    let batch;
+    try {
+        batch = await fetchWithRetryAfter(() => fetch('/api/batches', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ folder: folder, expected_files: files.length, expected_bytes: totalBytes })
+        })).then(response => parseUploadResponse(response));
+    } catch (error) {
+        showToast({ type: 'error', title: 'アップロードエラー', message: error.message });
+        return;
     }
     
-    // 各ファイルをアップロード
-    Array.from(files).forEach(file => {
-        uploadFile(file, folderId, () => {
-            processedFiles++;
-            if(processedFiles === totalFiles && totalFiles > 1) {
-                showToast({
-                    type: 'success',
-                    title: 'アップロード完了',
-                    message: `${totalFiles}個のファイルの処理が開始されました`
-                });
-            }
+    const tracker = addBatchPanel(batch, files.length);
+    const onWait = seconds => setBatchMessage(tracker, `混雑中（${seconds}秒後に再送）`);
+    
+    // 分割アップロードが必要な大きなファイルと、まとめて送るファイルに分ける
+    const large = files.filter(file => file.size > appConfig.upload_chunk_size);
+    const groups = groupBatchFiles(files.filter(file => file.size <= appConfig.upload_chunk_size));
+    let sent = 0;
+    
+    for (const group of groups) {
+        const formData = new FormData();
+        formData.append('folder', folder);
+        formData.append('batch_id', batch.batch_id);
+        group.forEach(file => formData.append('file', file));
+        
+        setBatchMessage(tracker, `アップロード中 ${sent}/${files.length}`);
+        try {
+            const data = await fetchWithRetryAfter(() => fetch('/api/upload/batch', {
+                method: 'POST',
+                body: formData
+            }), onWait).then(response => parseUploadResponse(response));
+            renderBatch(tracker, data.batch);
+        } catch (error) {
+            tracker.failedUploads += group.length;
+            showToast({ type: 'error', title: 'アップロードエラー', message: `${group.length}個のファイル: ${error.message}` });
+        }
+        sent += group.length;
+    }
+    
+    for (const file of large) {
+        try {
+            await uploadFileInChunks(
+                file,
+                folder,
+                percent => setBatchMessage(tracker, `アップロード中 ${sent}/${files.length}（${file.name} ${percent}%）`),
+                onWait,
+                batch.batch_id
+            );
+        } catch (error) {
+            tracker.failedUploads++;
+            showToast({ type: 'error', title: 'アップロードエラー', message: `${file.name}: ${error.message}` });
+        }
+        sent++;
+    }
+    
+    tracker.uploading = false;
+    setBatchMessage(tracker, '');
+    pollBatch(tracker);
+}
+
+/**
+ * 1回のリクエストに収まるようにファイルをまとめる（本文の上限とファイル数の上限）
+ */
+function groupBatchFiles(files) {
+    // マルチパートの区切りやヘッダーの分の余裕を見込む
+    const limit = appConfig.max_content_length * 0.9;
+    const groups = [];
+    let group = [];
+    let size = 0;
+    
+    files.forEach(file => {
+        const partSize = file.size + 1024;
+        if (group.length > 0 && (size + partSize > limit || group.length >= appConfig.upload_batch_max_files)) {
+            groups.push(group);
+            group = [];
+            size = 0;
+        }
+        group.push(file);
+        size += partSize;
+    });
+    if (group.length > 0) {
+        groups.push(group);
+    }
+    return groups;
+}
+
+/**
+ * 一括アップロードのパネルを追加
+ */
+function addBatchPanel(batch, totalFiles) {
+    const panel = document.createElement('div');
+    panel.className = 'batch-item';
+    panel.setAttribute('data-batch-id', batch.batch_id);
+    panel.innerHTML = `
+        <div class="batch-header">
+            <span class="batch-title"></span>
+            <button class="cancel-task" title="一括アップロードをキャンセル" aria-label="一括アップロードをキャンセル">
+                <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><circle cx="12" cy="12" r="10"></circle><line x1="15" y1="9" x2="9" y2="15"></line><line x1="9" y1="9" x2="15" y2="15"></line></svg>
+            </button>
+        </div>
+        <progress class="batch-progress" max="100" value="0"></progress>
+        <div class="batch-counts"></div>
+        <div class="batch-message"></div>
+    `;
+    panel.querySelector('.batch-title').textContent = `${totalFiles}個のファイル（${batch.folder}）`;
+    document.getElementById('batch-list').prepend(panel);
+    
+    const tracker = {
+        id: batch.batch_id,
+        panel: panel,
+        totalFiles: totalFiles,
+        failedUploads: 0,
+        uploading: true
+    };
+    panel.querySelector('.cancel-task').addEventListener('click', (e) => cancelBatch(tracker, e.currentTarget));
+    renderBatch(tracker, batch);
+    return tracker;
+}
+
+/**
+ * バッチの件数・バイト数・残り時間をパネルに表示
+ */
+function renderBatch(tracker, batch) {
+    const counts = batch.counts;
+    const finished = counts.done + counts.failed + counts.canceled + batch.rejected.length + tracker.failedUploads;
+    const percent = tracker.totalFiles ? Math.floor(finished * 100 / tracker.totalFiles) : 100;
+    tracker.panel.querySelector('.batch-progress').value = percent;
+    
+    let text = `待機中 ${counts.queued} / 処理中 ${counts.processing} / 完了 ${counts.done} / 失敗 ${counts.failed + batch.rejected.length + tracker.failedUploads}`;
+    if (counts.canceled) {
+        text += ` / キャンセル ${counts.canceled}`;
+    }
+    text += ` ・ ${formatFileSize(batch.bytes.finished)} / ${formatFileSize(batch.bytes.total)}`;
+    if (batch.eta !== null && counts.queued + counts.processing > 0) {
+        text += ` ・ 残り約${Math.ceil(batch.eta)}秒`;
+    }
+    tracker.panel.querySelector('.batch-counts').textContent = text;
+    tracker.pending = counts.queued + counts.processing;
+    tracker.panel.querySelector('.cancel-task').disabled = tracker.pending === 0 && !tracker.uploading;
+}
+
+/**
+ * パネルの補足メッセージ（アップロード中・混雑中）を表示
+ */
+function setBatchMessage(tracker, message) {
+    tracker.panel.querySelector('.batch-message').textContent = message;
+}
+
+/**
+ * アップロードの完了後、変換が終わるまでバッチの状態を定期的に取得
+ */
+function pollBatch(tracker) {
+    fetch(`/api/batches/${tracker.id}`, { cache: 'no-store' })
+    .then(response => parseUploadResponse(response))
+    .then(batch => {
+        renderBatch(tracker, batch);
+        if (tracker.pending > 0) {
+            setTimeout(() => pollBatch(tracker), 1000);
+            return;
+        }
+        
+        const failed = batch.counts.failed + batch.rejected.length + tracker.failedUploads;
+        showToast({
+            type: failed ? 'warning' : 'success',
+            title: '一括アップロードの変換が完了しました',
+            message: `完了 ${batch.counts.done}件${failed ? ` / 失敗 ${failed}件` : ''}`
         });
+        tracker.panel.classList.add('batch-complete');
+        setTimeout(() => tracker.panel.remove(), 10000);
+    })
+    .catch(error => {
+        // バッチが破棄された（サーバー再起動など）場合は表示をやめる
+        setBatchMessage(tracker, error.message);
+        if (error.status !== 404) {
+            setTimeout(() => pollBatch(tracker), 5000);
+        }
+    });
+}
+
+/**
+ * 一括アップロードの未完了のタスクをすべてキャンセル
+ */
+function cancelBatch(tracker, button) {
+    button.disabled = true;
+    
+    fetch(`/api/batches/${tracker.id}`, { method: 'DELETE' })
+    .then(response => parseUploadResponse(response))
+    .then(data => {
+        renderBatch(tracker, data.batch);
+        showToast({ type: 'success', title: 'キャンセルしました', message: data.message });
+    })
+    .catch(error => {
+        button.disabled = false;
+        showToast({ type: 'error', title: 'エラー', message: error.message });
     });
 }
 
@@ -556,19 +750,18 @@ function uploadFile(file, folder, callback) {
         folder: folder
     });
     
-    // アップロードリクエスト
-    fetch('/api/upload', {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => {
-        if (!response.ok) {
-            return response.json().then(data => {
-                throw new Error(data.error || 'ファイルのアップロードに失敗しました');
-            });
-        }
-        return response.json();
-    })
+    // サーバーが混雑している間は Retry-After の秒数だけ待ってから再送する
+    const onWait = seconds => showRetryWait(tempTaskId, seconds);
+    
+    // 1回のリクエストに収まらないファイルは分割アップロード（中断しても再開できる）
+    const request = file.size > appConfig.upload_chunk_size
+        ? uploadFileInChunks(file, folder, percent => showUploadProgress(tempTaskId, percent), onWait)
+        : fetchWithRetryAfter(() => fetch('/api/upload', {
+            method: 'POST',
+            body: formData
+        }), onWait).then(response => parseUploadResponse(response));
+    
+    request
     .then(data => {
         // 仮のタスクを正式なタスクで置き換え
         replaceTask(tempTaskId, {
@@ -595,6 +788,143 @@ function uploadFile(file, folder, callback) {
     });
 }
 
+/**
+ * アップロードAPIのレスポンスを解析（エラー時は例外）
+ */
+function parseUploadResponse(response) {
+    return response.json().then(data => {
+        if (!response.ok) {
+            const error = new Error(data.error || 'ファイルのアップロードに失敗しました');
+            error.status = response.status;
+            error.data = data;
+            throw error;
+        }
+        return data;
+    });
+}
+
+/**
+ * 分割アップロード
+ * 初期化→チャンク送信→完了の順に行い、アップロードIDを localStorage に保存して
+ * ページの再読み込みや通信断の後も受信済みの位置から再開する
+ */
+async function uploadFileInChunks(file, folder, onProgress, onWait, batchId = null) {
+    const resumeKey = `markitdown-upload:${folder}:${file.name}:${file.size}:${file.lastModified}`;
+    let session = null;
+    
+    // 前回中断したアップロードがあれば受信済みのオフセットを確認
+    const savedId = localStorage.getItem(resumeKey);
+    if (savedId) {
+        const response = await fetch(`/api/uploads/${savedId}`);
+        if (response.ok) {
+            session = await response.json();
+        } else {
+            localStorage.removeItem(resumeKey);
+        }
+    }
+    
+    if (!session) {
+        session = await fetchWithRetryAfter(() => fetch('/api/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size, folder: folder })
+        }), onWait).then(response => parseUploadResponse(response));
+        localStorage.setItem(resumeKey, session.upload_id);
+    }
+    
+    const chunkSize = Math.min(session.chunk_size || appConfig.upload_chunk_size, appConfig.max_content_length);
+    let offset = session.offset;
+    let failures = 0;
+    
+    while (offset < file.size) {
+        onProgress(Math.floor(offset * 100 / file.size));
+        const chunk = file.slice(offset, Math.min(offset + chunkSize, file.size));
+        const headers = { 'Upload-Offset': String(offset) };
+        const checksum = await sha256Hex(chunk);
+        if (checksum) {
+            headers['X-Chunk-Sha256'] = checksum;
+        }
+        
+        try {
+            const data = await fetchWithRetryAfter(() => fetch(`/api/uploads/${session.upload_id}`, {
+                method: 'PUT',
+                headers: headers,
+                body: chunk
+            }), onWait).then(response => parseUploadResponse(response));
+            offset = data.offset;
+            failures = 0;
+        } catch (error) {
+            // オフセットのずれやチェックサム不一致はサーバーの受信位置から再送する
+            if (error.data && typeof error.data.offset === 'number') {
+                offset = error.data.offset;
+            }
+            failures++;
+            if (failures > 3 || error.status === 404 || error.status === 413) {
+                throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+        }
+    }
+    
+    onProgress(100);
+    const result = await fetchWithRetryAfter(() => fetch(`/api/uploads/${session.upload_id}/finalize`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(batchId ? { batch_id: batchId } : {})
+    }), onWait).then(response => parseUploadResponse(response));
+    localStorage.removeItem(resumeKey);
+    return result;
+}
+
+/**
+ * 混雑（429）で断られた場合は Retry-After の秒数だけ待って再送する
+ * （再送の上限に達した場合は最後のレスポンスをそのまま返す）
+ */
+async function fetchWithRetryAfter(makeRequest, onWait, maxAttempts = 10) {
+    for (let attempt = 1; ; attempt++) {
+        const response = await makeRequest();
+        if (response.status !== 429 || attempt >= maxAttempts) {
+            return response;
+        }
+        const seconds = parseInt(response.headers.get('Retry-After'), 10) || 5;
+        if (onWait) onWait(seconds);
+        await new Promise(resolve => setTimeout(resolve, seconds * 1000));
+    }
+}
+
+/**
+ * 再送までの待ち時間をステータス欄に表示
+ */
+function showRetryWait(taskId, seconds) {
+    const row = document.querySelector(`#task-list tr[data-task-id="${taskId}"]`);
+    if (row) {
+        const statusCell = row.querySelector('td:nth-child(3)');
+        statusCell.innerHTML = `<span class="status-badge status-waiting">混雑中（${seconds}秒後に再送）</span>`;
+    }
+}
+
+/**
+ * BlobのSHA-256を16進文字列で計算（Web Crypto が使えない環境では null）
+ */
+async function sha256Hex(blob) {
+    if (!window.crypto || !window.crypto.subtle) {
+        return null;
+    }
+    const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+/**
+ * アップロードの進捗をステータス欄に表示
+ */
+function showUploadProgress(taskId, percent) {
+    const row = document.querySelector(`#task-list tr[data-task-id="${taskId}"]`);
+    if (row) {
+        const statusCell = row.querySelector('td:nth-child(3)');
+        statusCell.innerHTML = `<span class="status-badge status-waiting">アップロード中 ${percent}%</span>`;
+    }
+}
+
 /**
  * URLフォームの初期化
  */
@@ -624,8 +954,8 @@ function initUrlForm() {
             folder: folderId
         });
         
-        // URL処理リクエスト
-        fetch('/api/url', {
+        // URL処理リクエスト（混雑時は Retry-After の秒数だけ待って再送）
+        fetchWithRetryAfter(() => fetch('/api/url', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -634,7 +964,7 @@ function initUrlForm() {
                 url: url,
                 folder: folderId
             })
-        })
+        }), seconds => showRetryWait(tempTaskId, seconds))
         .then(response => {
             if (!response.ok) {
                 return response.json().then(data => {
@@ -719,8 +1049,16 @@ function initModals() {
     // コピーボタンの実装
     if (copyMarkdownBtn) {
         copyMarkdownBtn.addEventListener('click', () => {
-            const markdownContent = document.getElementById('markdown-preview').textContent;
-            navigator.clipboard.writeText(markdownContent)
+            // プレビューはHTMLに変換済みのため、元のMarkdownを取得してコピーする
+            const markdownUrl = document.getElementById('download-file').getAttribute('href');
+            fetch(markdownUrl, { cache: 'no-cache' })
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error('ファイルの読み込みに失敗しました');
+                    }
+                    return response.text();
+                })
+                .then(markdownContent => navigator.clipboard.writeText(markdownContent))
                 .then(() => {
                     showToast({
                         type: 'success',
@@ -776,66 +1114,168 @@ function initTaskQueue() {
     // 初期タスク一覧の読み込み
     loadTasks();
     
-    // 定期的なタスク更新
-    setInterval(loadTasks, 5000);
+    // 状態変化はSSEで受け取り、接続できない間はポーリングで更新
+    initTaskEvents();
+    setInterval(() => {
+        if (!taskEvents.connected) {
+            loadTasks();
+        }
+    }, 5000);
+    
+    // SSE接続中も、破棄されたタスクの反映のためにまれに差分を取得
+    setInterval(loadTasks, 60000);
+}
+
+/**
+ * タスクイベント（SSE）の接続状態
+ */
+const taskEvents = {
+    source: null,
+    connected: false
+};
+
+/**
+ * タスク状態変化のSSEを購読
+ */
+function initTaskEvents() {
+    if (!window.EventSource) return;
+    
+    const source = new EventSource('/api/events');
+    taskEvents.source = source;
+    
+    source.addEventListener('open', () => {
+        // 切断中の変更を取りこぼさないよう接続時に差分を取得
+        taskEvents.connected = true;
+        loadTasks();
+    });
+    
+    source.addEventListener('error', () => {
+        // ブラウザが自動で再接続する（Last-Event-IDで取りこぼしを再送）
+        taskEvents.connected = false;
+    });
+    
+    source.addEventListener('task', (e) => {
+        const data = JSON.parse(e.data);
+        applyTaskDelta({ tasks: [data.task], removed: [], reset: false });
+    });
+    
+    source.addEventListener('resync', () => {
+        // サーバー側で履歴が失われた場合は差分APIで再同期
+        loadTasks();
+    });
 }
 
 /**
- * タスク一覧の読み込み
+ * タスク一覧の差分取得の状態
+ * epoch: サーバーのタスクストアの識別子（再起動で変わる）
+ * version: サーバーから最後に受け取った一覧のバージョン
+ * etag: 前回のレスポンスのETag（変化がなければ304が返る）
+ */
+const taskSync = {
+    epoch: null,
+    version: null,
+    etag: null,
+    loading: false
+};
+
+/**
+ * タスク一覧の読み込み（前回のバージョン以降の差分のみを取得）
  */
 function loadTasks() {
-    fetch('/api/tasks')
-        .then(response => response.json())
-        .then(tasks => {
-            // タスクリストをすべて更新
-            const taskList = document.getElementById('task-list');
-            const noTasksMessage = document.getElementById('no-tasks-message');
-            
-            // 既存のタスクIDを記録
-            const existingTaskIds = new Set();
-            document.querySelectorAll('#task-list tr[data-task-id]').forEach(row => {
-                const taskId = row.getAttribute('data-task-id');
-                if (!taskId.startsWith('temp-')) {
-                    existingTaskIds.add(taskId);
-                }
-            });
-            
-            // サーバーからのタスクを処理
-            tasks.forEach(task => {
-                // インデックスにタスク情報を追加（成功したタスクの場合）
-                indexTaskResult(task.id, task);
-                
-                if (existingTaskIds.has(task.id)) {
-                    // 既存のタスクを更新（全タスクデータを渡す）
-                    updateTaskStatus(task.id, task.status, task);
-                    existingTaskIds.delete(task.id);
-                } else {
-                    // 新しいタスクを追加
-                    addTaskToTable(task);
-                }
-            });
+    if (taskSync.loading) return;
+    taskSync.loading = true;
+    
+    let url = `/api/tasks?since=${taskSync.version === null ? 0 : taskSync.version}`;
+    if (taskSync.epoch) {
+        url += `&epoch=${encodeURIComponent(taskSync.epoch)}`;
+    }
+    const headers = {};
+    if (taskSync.etag) {
+        headers['If-None-Match'] = taskSync.etag;
+    }
+    
+    fetch(url, { headers: headers, cache: 'no-store' })
+        .then(response => {
+            // 変化なし
+            if (response.status === 304) {
+                return null;
+            }
+            taskSync.etag = response.headers.get('ETag');
+            return response.json();
+        })
+        .then(delta => {
+            if (!delta) return;
             
-            // サーバーにないタスクは削除（定期的な整理）
-            existingTaskIds.forEach(taskId => {
-                const row = document.querySelector(`#task-list tr[data-task-id="${taskId}"]`);
-                if (row) {
-                    row.remove();
-                }
-            });
+            applyTaskDelta(delta);
+            taskSync.epoch = delta.epoch;
+            taskSync.version = delta.version;
             
-            // タスクがあるかどうかで空メッセージの表示切り替え
-            if (taskList.children.length === 0) {
-                noTasksMessage.style.display = 'flex';
-            } else {
-                noTasksMessage.style.display = 'none';
+            // 差分が複数ページに分かれている場合は続けて取得
+            if (delta.has_more) {
+                taskSync.loading = false;
+                loadTasks();
             }
-            
-            // 現在のフィルターを適用
-            applyTaskFilter();
         })
         .catch(error => {
             console.error('タスク一覧の読み込みに失敗しました', error);
+        })
+        .finally(() => {
+            taskSync.loading = false;
+        });
+}
+
+/**
+ * タスク一覧の差分をテーブルに反映
+ */
+function applyTaskDelta(delta) {
+    const taskList = document.getElementById('task-list');
+    const noTasksMessage = document.getElementById('no-tasks-message');
+    
+    // 全件が返された場合はサーバーにないタスクを削除するため既存IDを記録
+    const staleTaskIds = new Set();
+    if (delta.reset) {
+        document.querySelectorAll('#task-list tr[data-task-id]').forEach(row => {
+            const taskId = row.getAttribute('data-task-id');
+            if (!taskId.startsWith('temp-')) {
+                staleTaskIds.add(taskId);
+            }
         });
+    }
+    
+    // 変更されたタスクを処理
+    delta.tasks.forEach(task => {
+        // インデックスにタスク情報を追加（成功したタスクの場合）
+        indexTaskResult(task.id, task);
+        
+        const row = document.querySelector(`#task-list tr[data-task-id="${task.id}"]`);
+        if (row) {
+            // 既存のタスクを更新（全タスクデータを渡す）
+            updateTaskStatus(task.id, task.status, task);
+        } else {
+            // 新しいタスクを追加
+            addTaskToTable(task);
+        }
+        staleTaskIds.delete(task.id);
+    });
+    
+    // サーバーで破棄されたタスクを削除
+    delta.removed.forEach(taskId => staleTaskIds.add(taskId));
+    staleTaskIds.forEach(taskId => {
+        const row = document.querySelector(`#task-list tr[data-task-id="${taskId}"]`);
+        if (row) {
+            row.remove();
+        }
+    });
+    
+    // タスクがあるかどうかで空メッセージの表示切り替え
+    if (taskList.children.length === 0) {
+        noTasksMessage.style.display = 'flex';
+    } else {
+        noTasksMessage.style.display = 'none';
+    }
+    
+    // 現在のフィルターを適用
+    applyTaskFilter();
 }
 
 /**
@@ -858,7 +1298,12 @@ function addTaskToTable(task) {
     if (existingRow) {
         // ステータスのみ更新
         const statusCell = existingRow.querySelector('td:nth-child(3)');
-        updateStatusCell(statusCell, task.status);
+        updateStatusCell(statusCell, task.status, task.progress);
+        renderTaskMembers(existingRow, task.members);
+        const cancelBtn = existingRow.querySelector('.cancel-task');
+        if (cancelBtn) {
+            cancelBtn.disabled = !isCancellable(task.id, task.status);
+        }
         return;
     }
     
@@ -892,7 +1337,7 @@ function addTaskToTable(task) {
     row.innerHTML = `
         <td>${dateStr}<br />${timeStr}</td>
         <td title="${task.filename}">${displayFilename}</td>
-        <td>${getStatusBadge(task.status)}</td>
+        <td>${getStatusBadge(task.status, task.progress)}</td>
         <td>${task.folder}</td>
         <td class="task-actions-cell">
             <button class="view-result" title="結果を表示" ${task.status !== 'success' ? 'disabled' : ''}>
@@ -901,8 +1346,26 @@ function addTaskToTable(task) {
                     <circle cx="12" cy="12" r="3"></circle>
                 </svg>
             </button>
+            <button class="cancel-task" title="キャンセル" ${isCancellable(task.id, task.status) ? '' : 'disabled'}>
+                <svg xmlns="http://www.w3.org/2000/svg" width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round">
+                    <line x1="18" y1="6" x2="6" y2="18"></line>
+                    <line x1="6" y1="6" x2="18" y2="18"></line>
+                </svg>
+            </button>
         </td>
     `;
+    renderTaskMembers(row, task.members);
+    
+    // キャンセルボタンのイベントリスナー（行のIDはアップロード完了時に仮IDから置き換わる）
+    const cancelBtn = row.querySelector('.cancel-task');
+    if (cancelBtn) {
+        cancelBtn.addEventListener('click', () => {
+            const taskId = row.getAttribute('data-task-id');
+            if (isCancellable(taskId, row.getAttribute('data-status'))) {
+                cancelTask(taskId, cancelBtn);
+            }
+        });
+    }
     
     // 結果表示ボタンのイベントリスナー
     const viewResultBtn = row.querySelector('.view-result');
@@ -954,7 +1417,7 @@ function updateTaskStatus(taskId, status, taskData) {
     const row = document.querySelector(`#task-list tr[data-task-id="${taskId}"]`);
     if (row) {
         const statusCell = row.querySelector('td:nth-child(3)');
-        updateStatusCell(statusCell, status);
+        updateStatusCell(statusCell, status, taskData ? taskData.progress : null);
         
         // ステータス属性も更新
         row.setAttribute('data-status', status);
@@ -974,6 +1437,9 @@ function updateTaskStatus(taskId, status, taskData) {
             if (taskData.filename) {
                 row.setAttribute('data-filename', taskData.filename);
             }
+            
+            // ZIPのメンバーごとの状態
+            renderTaskMembers(row, taskData.members);
         }
         
         // 成功時にはビューボタンを有効化
@@ -983,21 +1449,114 @@ function updateTaskStatus(taskId, status, taskData) {
                 viewBtn.disabled = false;
             }
         }
+        
+        // 終了したタスクはキャンセルできない
+        const cancelBtn = row.querySelector('.cancel-task');
+        if (cancelBtn) {
+            cancelBtn.disabled = !isCancellable(row.getAttribute('data-task-id'), status);
+        }
     }
 }
 
+/**
+ * タスクをキャンセルできるか（サーバーに登録済みで待機中・処理中）
+ */
+function isCancellable(taskId, status) {
+    return Boolean(taskId) && !String(taskId).startsWith('temp-') &&
+        (status === 'waiting' || status === 'processing');
+}
+
+/**
+ * タスクのキャンセルを要求（状態の更新はレスポンスとSSEで反映）
+ */
+function cancelTask(taskId, button) {
+    button.disabled = true;
+    
+    fetch(`/api/tasks/${taskId}`, {
+        method: 'DELETE',
+    })
+    .then(response => {
+        return response.json().then(data => {
+            // すでに終了していた場合（409）も最新の状態を反映する
+            if (data.task) {
+                updateTaskStatus(taskId, data.task.status, data.task);
+            }
+            if (!response.ok) {
+                throw new Error(data.error || 'タスクのキャンセルに失敗しました');
+            }
+            return data;
+        });
+    })
+    .then(() => {
+        showToast({
+            type: 'success',
+            title: 'キャンセルしました',
+            message: 'タスクをキャンセルしました'
+        });
+    })
+    .catch(error => {
+        const row = document.querySelector(`#task-list tr[data-task-id="${taskId}"]`);
+        button.disabled = !isCancellable(taskId, row ? row.getAttribute('data-status') : null);
+        showToast({
+            type: 'error',
+            title: 'エラー',
+            message: error.message
+        });
+    });
+}
+
+/**
+ * ZIPのメンバーごとの状態をファイル名の下に表示（開閉状態は維持）
+ */
+function renderTaskMembers(row, members) {
+    if (!members || members.length === 0) return;
+    
+    const nameCell = row.querySelector('td:nth-child(2)');
+    let details = nameCell.querySelector('.task-members');
+    if (!details) {
+        details = document.createElement('details');
+        details.className = 'task-members';
+        nameCell.appendChild(details);
+    }
+    
+    const done = members.filter(member => member.status === 'success' || member.status === 'error').length;
+    const summary = document.createElement('summary');
+    summary.textContent = `${members.length}ファイル中${done}件完了`;
+    
+    const list = document.createElement('ul');
+    members.forEach(member => {
+        const item = document.createElement('li');
+        const name = document.createElement('span');
+        name.textContent = member.name;
+        if (member.error) {
+            name.title = member.error;
+        }
+        item.appendChild(name);
+        item.insertAdjacentHTML('beforeend', getStatusBadge(member.status));
+        list.appendChild(item);
+    });
+    
+    details.replaceChildren(summary, list);
+}
+
 /**
  * ステータスセルを更新
  */
-function updateStatusCell(cell, status) {
+function updateStatusCell(cell, status, progress) {
     // バッジで更新
-    cell.innerHTML = getStatusBadge(status);
+    cell.innerHTML = getStatusBadge(status, progress);
 }
 
+// 進捗の単位の表示名
+const progressUnits = {
+    pages: 'ページ',
+    tasks: '件'
+};
+
 /**
- * ステータスバッジを生成
+ * ステータスバッジを生成（処理中で進捗があれば「完了数/全体」を併記）
  */
-function getStatusBadge(status) {
+function getStatusBadge(status, progress) {
     let icon = '';
     let text = '';
     
@@ -1009,6 +1568,9 @@ function getStatusBadge(status) {
         case 'processing':
             icon = '<svg xmlns="http://www.w3.org/2000/svg" width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M21 12a9 9 0 1 1-6.219-8.56"></path></svg>';
             text = '処理中';
+            if (progress && progress.total) {
+                text += ` ${progress.done}/${progress.total}${progressUnits[progress.unit] || ''}`;
+            }
             break;
         case 'success':
             icon = '<svg xmlns="http://www.w3.org/2000/svg" width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M22 11.08V12a10 10 0 1 1-5.93-9.14"></path><polyline points="22 4 12 14.01 9 11.01"></polyline></svg>';
@@ -1143,8 +1705,8 @@ function findAndPreviewMarkdownFile(folder, originalFilename) {
     
     // URLの場合は特別処理（URLはそのままでは使えないため）
     if (baseName.startsWith('http')) {
-        // フォルダ内のすべてのMarkdownファイルを取得
-        fetch(`/explore/${folder}`)
+        // フォルダ内のファイルを更新日時の新しい順に取得
+        fetch(`/explore/${folder}?sort=mtime&order=desc`)
             .then(response => {
                 if (!response.ok) {
                     throw new Error('フォルダ内容の取得に失敗しました');
@@ -1246,26 +1808,23 @@ function previewMarkdownFile(filePath, fileName) {
     downloadLink.href = `/output/${filePath}`;
     downloadLink.download = fileName;
     
-    // 読み込み表示
+    // 読み込み表示（別のファイルを開いた後に届いた応答は捨てる）
+    markdownPreview.dataset.path = filePath;
+    markdownPreview.classList.add('rendered');
     markdownPreview.innerHTML = '<div class="loading-spinner"></div><p>読み込み中...</p>';
     
-    // ファイル内容を取得
-    fetch(`/output/${filePath}`)
-        .then(response => {
-            if (!response.ok) {
-                throw new Error('ファイルの読み込みに失敗しました');
-            }
-            return response.text();
-        })
-        .then(markdown => {
-            // マークダウンをそのまま表示（コピー可能にする）
-            markdownPreview.textContent = markdown;
-            
+    // 最初のページだけを表示し、続きはスクロールに合わせて読み込む
+    loadPreviewPage(filePath, 0)
+        .then(() => {
             // モーダルを表示
             openModal(previewModal);
         })
         .catch(error => {
-            markdownPreview.innerHTML = `<p class="error">エラー: ${error.message}</p>`;
+            markdownPreview.innerHTML = '';
+            const message = document.createElement('p');
+            message.className = 'error';
+            message.textContent = `エラー: ${error.message}`;
+            markdownPreview.appendChild(message);
             
             // モーダルを表示
             openModal(previewModal);
@@ -1279,44 +1838,85 @@ function previewMarkdownFile(filePath, fileName) {
 }
 
 /**
- * 非常に単純なマークダウンからHTMLへの変換関数
- * 注: 実際の実装では、marked.jsなどのライブラリを使用することをお勧めします
+ * プレビューの1ページ分を取得して追加する（HTMLはサーバー側で変換・エスケープ済み）
  */
-function convertMarkdownToHtml(markdown) {
-    if (!markdown) return '';
-    
-    let html = markdown
-        // エスケープ
-        .replace(/&/g, '&amp;')
-        .replace(/</g, '&lt;')
-        .replace(/>/g, '&gt;')
-        
-        // 見出し
-        .replace(/^### (.*$)/gm, '<h3>$1</h3>')
-        .replace(/^## (.*$)/gm, '<h2>$1</h2>')
-        .replace(/^# (.*$)/gm, '<h1>$1</h1>')
-        
-        // 強調
-        .replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>')
-        .replace(/\*(.*?)\*/g, '<em>$1</em>')
-        
-        // リンク
-        .replace(/\[([^\]]+)\]\(([^)]+)\)/g, '<a href="$2" target="_blank">$1</a>')
-        
-        // コード
-        .replace(/`([^`]+)`/g, '<code>$1</code>')
-        
-        // リスト
-        .replace(/^\s*- (.*$)/gm, '<li>$1</li>')
-        .replace(/(<li>.*<\/li>\n)+/g, '<ul>$&</ul>')
-        
-        // 段落
-        .replace(/^(?!<[uh123456]|<li|<\/ul>)(.*$)/gm, '<p>$1</p>')
+function loadPreviewPage(filePath, page) {
+    const markdownPreview = document.getElementById('markdown-preview');
+    
+    // 変わっていなければETagで確認して304になり、ブラウザのキャッシュを使う
+    return fetch(`/api/preview/${filePath}?page=${page}`, { cache: 'no-cache' })
+        .then(response => response.json().then(data => {
+            if (!response.ok) {
+                throw new Error(data.error || 'ファイルの読み込みに失敗しました');
+            }
+            return data;
+        }))
+        .then(data => {
+            if (markdownPreview.dataset.path !== filePath) {
+                return;
+            }
+            if (page === 0) {
+                markdownPreview.innerHTML = '';
+            }
+            
+            const section = document.createElement('div');
+            section.className = 'markdown-preview-page';
+            section.innerHTML = data.html;
+            markdownPreview.appendChild(section);
+            
+            if (data.has_more) {
+                appendPreviewMore(filePath, data);
+            }
+        });
+}
+
+/**
+ * プレビューの続きを読み込むボタン（画面に入ったら自動で読み込む）
+ */
+function appendPreviewMore(filePath, data) {
+    const markdownPreview = document.getElementById('markdown-preview');
+    const more = document.createElement('div');
+    more.className = 'markdown-preview-more';
+    const button = document.createElement('button');
+    button.className = 'btn btn-sm btn-secondary';
+    button.textContent = `続きを表示（${data.end_line} / ${data.total_lines} 行）`;
+    more.appendChild(button);
+    markdownPreview.appendChild(more);
+    
+    let loading = false;
+    let observer = null;
+    const loadMore = () => {
+        if (loading) return;
+        loading = true;
+        button.disabled = true;
+        button.textContent = '読み込み中...';
+        if (observer) {
+            observer.disconnect();
+        }
         
-        // 空の段落を削除
-        .replace(/<p><\/p>/g, '');
+        loadPreviewPage(filePath, data.page + 1)
+            .then(() => more.remove())
+            .catch(error => {
+                loading = false;
+                button.disabled = false;
+                button.textContent = '続きを表示';
+                showToast({
+                    type: 'error',
+                    title: 'ファイル読み込みエラー',
+                    message: error.message
+                });
+            });
+    };
     
-    return html;
+    button.addEventListener('click', loadMore);
+    if ('IntersectionObserver' in window) {
+        observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadMore();
+            }
+        }, { rootMargin: '200px' });
+        observer.observe(more);
+    }
 }
 
 /**
@@ -2,17 +2,49 @@
 TaskQueue - concurrent.futures.ThreadPoolExecutorを使ったシンプルなタスク処理
 """
 
-from .exceptions import TaskQueueError
-from .queue import TaskHandler, TaskQueue, create_queue
-from .task import Task, TaskResult, TaskStatus
+from .exceptions import (TaskCancelledError, TaskQueueError,
+                         WorkerTerminatedError)
+from .broker import (ROLE_ALL, ROLE_WEB, ROLE_WORKER, SharedQueueNode,
+                     SQLiteTaskBroker)
+from .events import EventBroker
+from .instrument import mark_stage, record_metric, stage_durations
+from .journal import SQLiteTaskJournal
+from .queue import (EXECUTOR_PROCESS, EXECUTOR_THREAD, StatusListener,
+                    TaskHandler, TaskQueue, create_queue, raise_if_cancelled)
+from .scheduler import FairScheduler
+from .store import FINISHED_STATUSES, TaskChanges, TaskStore
+from .task import Task, TaskResult, TaskSplit, TaskStatus
+from .workers import ProcessWorkerPool
 
 __version__ = "1.0.0"
 __all__ = [
     "TaskQueueError",
+    "TaskCancelledError",
+    "WorkerTerminatedError",
     "Task",
     "TaskStatus",
     "TaskResult",
+    "TaskSplit",
     "TaskQueue",
+    "FairScheduler",
+    "ProcessWorkerPool",
     "TaskHandler",
+    "StatusListener",
+    "EventBroker",
+    "TaskStore",
+    "TaskChanges",
+    "SQLiteTaskJournal",
+    "SQLiteTaskBroker",
+    "SharedQueueNode",
+    "FINISHED_STATUSES",
     "create_queue",
+    "raise_if_cancelled",
+    "mark_stage",
+    "record_metric",
+    "stage_durations",
+    "EXECUTOR_THREAD",
+    "EXECUTOR_PROCESS",
+    "ROLE_ALL",
+    "ROLE_WEB",
+    "ROLE_WORKER",
 ]
\ No newline at end of file
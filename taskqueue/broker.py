@@ -0,0 +1,666 @@
+"""
+複数のプロセス・ノードで共有するタスクキュー（SQLite）
+Webノードはタスクを登録するだけで、ワーカーノードがリース（期限付きの占有権）を取得して実行する
+ワーカーは実行中のタスクのリースを定期的に延長し（ハートビート）、期限の切れたタスクは別のワーカーが再実行する
+各ノードは更新番号（seq）で差分を取り込み、すべてのワーカーのタスクの状態を自分のタスクストアに反映する
+（共有ファイルシステム上のSQLiteを使うため、外部のブローカーは不要）
+"""
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from uuid import UUID, uuid4
+
+from .journal import _COLUMNS, _add_missing_columns, _row_task, _task_row
+from .queue import TaskQueue
+from .store import FINISHED_STATUSES
+from .task import Task, TaskStatus
+
+# ノードの役割
+ROLE_ALL = "all"        # 登録と実行の両方
+ROLE_WEB = "web"        # 登録のみ（状態の表示用に他ノードの状態を取り込む）
+ROLE_WORKER = "worker"  # 実行のみ
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 1,
+    payload TEXT,
+    result TEXT,
+    error_message TEXT,
+    progress TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    timings TEXT,
+    metrics TEXT,
+    seq INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS tasks_seq ON tasks (seq);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (status, priority, created_at);
+CREATE TABLE IF NOT EXISTS nodes (
+    node_id TEXT PRIMARY KEY,
+    role TEXT NOT NULL,
+    host TEXT,
+    pid INTEGER,
+    running INTEGER NOT NULL DEFAULT 0,
+    started_at REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+"""
+
+# 次の更新番号（書き込みトランザクション内で1行ずつ採番する）
+_NEXT_SEQ = "(SELECT COALESCE(MAX(seq), 0) + 1 FROM tasks)"
+
+_FINISHED_VALUES = tuple(status.value for status in FINISHED_STATUSES)
+
+# 差分を1回に取り込む件数
+_SYNC_BATCH = 500
+
+
+class SQLiteTaskBroker:
+    """SQLiteのテーブルを複数ノードで共有するタスクキューとして使うブローカー"""
+    
+    def __init__(
+        self,
+        path: str,
+        lease_ttl: float = 30.0,
+        max_attempts: int = 3,
+        max_finished: Optional[int] = 1000,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        ブローカーの初期化（データベースとテーブルがなければ作成）
+        
+        Args:
+            path: SQLiteデータベースファイルのパス（すべてのノードから同じファイルを参照する）
+            lease_ttl: リースの有効秒数（この間ハートビートがなければ別のワーカーが再実行する）
+            max_attempts: リース切れで再実行する回数の上限（超えるとエラーにする）
+            max_finished: 保持する完了タスクの最大数（None=無制限）
+            logger: カスタムロガー（省略可）
+        """
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self.max_attempts = max(1, max_attempts)
+        self.max_finished = max_finished
+        self.logger = logger or logging.getLogger(__name__)
+        
+        # 接続はスレッドごとに作る
+        self._local = threading.local()
+        
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+        _add_missing_columns(self._connection())
+    
+    def enqueue(self, task: Task) -> None:
+        """
+        タスクを登録（待機中としてどのワーカーからも取得できる）
+        
+        Args:
+            task: 登録するタスク
+        """
+        self.enqueue_many([task])
+    
+    def enqueue_many(self, tasks: List[Task]) -> None:
+        """
+        複数のタスクを1つのトランザクションで登録
+        
+        Args:
+            tasks: 登録するタスク
+        """
+        with self._transaction() as conn:
+            for task in tasks:
+                conn.execute(
+                    f"INSERT INTO tasks ({', '.join(_COLUMNS)}, seq) "
+                    f"VALUES ({', '.join('?' for _ in _COLUMNS)}, {_NEXT_SEQ})",
+                    _task_row(task)
+                )
+    
+    def claim(self, node_id: str, limit: int) -> List[Task]:
+        """
+        待機中のタスクのリースを取得する（優先度の高い順、同じ優先度は登録順）
+        
+        Args:
+            node_id: 取得するノードのID
+            limit: 取得する最大件数
+        
+        Returns:
+            List[Task]: リースを取得したタスク
+        """
+        if limit <= 0:
+            return []
+        
+        expires = time.time() + self.lease_ttl
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT * FROM tasks WHERE status = ? AND lease_owner IS NULL AND cancel_requested = 0 "
+                "ORDER BY priority DESC, created_at LIMIT ?",
+                (TaskStatus.WAITING.value, limit)
+            ).fetchall()
+            for row in rows:
+                conn.execute(
+                    f"UPDATE tasks SET lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                    f"seq = {_NEXT_SEQ} WHERE id = ?",
+                    (node_id, expires, row['id'])
+                )
+        return [_row_task(row) for row in rows]
+    
+    def report(self, node_id: str, rows: List[Tuple[Any, ...]]) -> int:
+        """
+        実行中のタスクの状態・結果を書き込む（リースを持っているタスクのみ）
+        
+        Args:
+            node_id: 報告するノードのID
+            rows: タスクの行（_task_row の形式）
+        
+        Returns:
+            int: 書き込んだ件数
+        """
+        assignments = ', '.join(f"{column} = ?" for column in _COLUMNS[1:])
+        written = 0
+        with self._transaction() as conn:
+            for row in rows:
+                cursor = conn.execute(
+                    f"UPDATE tasks SET {assignments}, seq = {_NEXT_SEQ} WHERE id = ? AND lease_owner = ?",
+                    (*row[1:], row[0], node_id)
+                )
+                written += cursor.rowcount
+        return written
+    
+    def renew(self, node_id: str, task_ids: List[str]) -> Tuple[Set[str], Set[str]]:
+        """
+        リースを延長する（ハートビート）
+        
+        Args:
+            node_id: ノードID
+            task_ids: 実行中のタスクID
+        
+        Returns:
+            (キャンセルが要求されたタスクID, リースを失ったタスクID)
+        """
+        canceled: Set[str] = set()
+        lost: Set[str] = set()
+        if not task_ids:
+            return canceled, lost
+        
+        expires = time.time() + self.lease_ttl
+        with self._transaction() as conn:
+            for task_id in task_ids:
+                cursor = conn.execute(
+                    "UPDATE tasks SET lease_expires = ? WHERE id = ? AND lease_owner = ?",
+                    (expires, task_id, node_id)
+                )
+                if cursor.rowcount == 0:
+                    lost.add(task_id)
+                    continue
+                row = conn.execute("SELECT cancel_requested FROM tasks WHERE id = ?", (task_id,)).fetchone()
+                if row['cancel_requested']:
+                    canceled.add(task_id)
+        return canceled, lost
+    
+    def reap(self) -> int:
+        """
+        リースの期限が切れたタスクを待機中に戻す（再実行の上限を超えたものはエラーにする）
+        
+        Returns:
+            int: 処理したタスク数
+        """
+        now = datetime.now().isoformat()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT id, attempts, cancel_requested FROM tasks WHERE lease_owner IS NOT NULL "
+                f"AND lease_expires < ? AND status NOT IN ({', '.join('?' for _ in _FINISHED_VALUES)})",
+                (time.time(), *_FINISHED_VALUES)
+            ).fetchall()
+            for row in rows:
+                if row['cancel_requested']:
+                    status, message = TaskStatus.CANCELED, "キャンセルされました"
+                elif row['attempts'] >= self.max_attempts:
+                    status, message = TaskStatus.ERROR, "ワーカーの応答が途絶えたため中止しました"
+                else:
+                    conn.execute(
+                        f"UPDATE tasks SET status = ?, lease_owner = NULL, lease_expires = NULL, started_at = NULL, "
+                        f"progress = NULL, updated_at = ?, seq = {_NEXT_SEQ} WHERE id = ?",
+                        (TaskStatus.WAITING.value, now, row['id'])
+                    )
+                    continue
+                conn.execute(
+                    f"UPDATE tasks SET status = ?, error_message = ?, finished_at = ?, updated_at = ?, "
+                    f"seq = {_NEXT_SEQ} WHERE id = ?",
+                    (status.value, message, now, now, row['id'])
+                )
+        
+        if rows:
+            self.logger.warning(f"リースの期限が切れたタスクを回収しました: {len(rows)}件")
+        return len(rows)
+    
+    def cancel(self, task_id: str) -> bool:
+        """
+        タスクをキャンセル（待機中ならその場で、実行中なら実行しているワーカーに要求する）
+        
+        Args:
+            task_id: タスクID
+        
+        Returns:
+            bool: キャンセルした（要求した）場合True
+        """
+        now = datetime.now().isoformat()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status, lease_owner FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            if row is None or row['status'] in _FINISHED_VALUES:
+                return False
+            
+            if row['lease_owner'] is None:
+                conn.execute(
+                    f"UPDATE tasks SET status = ?, error_message = ?, finished_at = ?, updated_at = ?, "
+                    f"seq = {_NEXT_SEQ} WHERE id = ?",
+                    (TaskStatus.CANCELED.value, "キャンセルされました", now, now, task_id)
+                )
+            else:
+                conn.execute(
+                    f"UPDATE tasks SET cancel_requested = 1, seq = {_NEXT_SEQ} WHERE id = ?",
+                    (task_id,)
+                )
+        return True
+    
+    def changes_since(self, seq: int, limit: int = _SYNC_BATCH) -> List[Tuple[int, Optional[str], bool, Task]]:
+        """
+        指定した更新番号より後に更新されたタスクを取得
+        
+        Args:
+            seq: 取り込み済みの更新番号
+            limit: 取得する最大件数
+        
+        Returns:
+            (更新番号, リースを持つノードID, キャンセル要求の有無, タスク) のリスト（更新順）
+        """
+        rows = self._connection().execute(
+            "SELECT * FROM tasks WHERE seq > ? ORDER BY seq LIMIT ?",
+            (seq, limit)
+        ).fetchall()
+        return [(row['seq'], row['lease_owner'], bool(row['cancel_requested']), _row_task(row)) for row in rows]
+    
+    def register_node(self, node_id: str, role: str, running: int) -> None:
+        """
+        ノードの生存を記録（ハートビート）
+        
+        Args:
+            node_id: ノードID
+            role: ノードの役割
+            running: 実行中のタスク数
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO nodes (node_id, role, host, pid, running, started_at, last_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (node_id) DO UPDATE SET running = excluded.running, last_seen = excluded.last_seen",
+                (node_id, role, socket.gethostname(), os.getpid(), running, now, now)
+            )
+    
+    def remove_node(self, node_id: str) -> None:
+        """ノードの登録を削除（正常に停止した場合）"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+    
+    def prune(self) -> None:
+        """保持件数を超えた古い完了タスクと、応答のなくなったノードを削除"""
+        with self._transaction() as conn:
+            if self.max_finished is not None:
+                conn.execute(
+                    f"DELETE FROM tasks WHERE status IN ({', '.join('?' for _ in _FINISHED_VALUES)}) "
+                    "AND id NOT IN (SELECT id FROM tasks WHERE status IN "
+                    f"({', '.join('?' for _ in _FINISHED_VALUES)}) ORDER BY seq DESC LIMIT ?)",
+                    (*_FINISHED_VALUES, *_FINISHED_VALUES, self.max_finished)
+                )
+            conn.execute("DELETE FROM nodes WHERE last_seen < ?", (time.time() - self.lease_ttl * 10,))
+    
+    def stats(self) -> Dict[str, Any]:
+        """状態ごとのタスク数とノードの一覧を返す"""
+        conn = self._connection()
+        now = time.time()
+        by_status = {
+            row['status']: row['count']
+            for row in conn.execute("SELECT status, COUNT(*) AS count FROM tasks GROUP BY status")
+        }
+        nodes = [
+            {
+                'node_id': row['node_id'],
+                'role': row['role'],
+                'host': row['host'],
+                'pid': row['pid'],
+                'running': row['running'],
+                'last_seen': round(now - row['last_seen'], 1),
+                'alive': now - row['last_seen'] < self.lease_ttl
+            }
+            for row in conn.execute("SELECT * FROM nodes ORDER BY started_at")
+        ]
+        return {
+            'path': self.path,
+            'lease_ttl': self.lease_ttl,
+            'by_status': by_status,
+            'nodes': nodes
+        }
+    
+    def _connection(self) -> sqlite3.Connection:
+        """
+        このスレッドの接続（ロールバックジャーナル、トランザクションは明示的に開始する）
+        
+        WALは共有メモリを使うため同じホストのプロセス間でしか使えず、ネットワークファイルシステム上では
+        動作しない。複数のノードから共有するキューは、ファイルロックだけで排他するロールバックジャーナルを使う
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+    
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """書き込みトランザクション（他のノードの書き込みとは直列化される）"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+class SharedQueueNode:
+    """
+    共有キューに参加するノード
+    
+    タスクの登録、リースの取得と実行（ワーカーの場合）、実行結果の報告、他ノードの状態の取り込みを
+    1つのバックグラウンドスレッドで行う
+    """
+    
+    def __init__(
+        self,
+        broker: SQLiteTaskBroker,
+        task_queue: TaskQueue,
+        role: str = ROLE_ALL,
+        capacity: int = 4,
+        poll_interval: float = 0.5,
+        heartbeat_interval: float = 5.0,
+        prune_interval: float = 60.0,
+        prepare: Optional[Callable[[Task], None]] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        ノードの初期化
+        
+        Args:
+            broker: 共有キューのブローカー
+            task_queue: タスクを実行し、状態を保持するローカルのタスクキュー
+            role: ノードの役割（"all" / "web" / "worker"）
+            capacity: 同時に取得するタスク数の上限（ローカルのスケジューラで順に実行する）
+            poll_interval: 取得・報告・取り込みの間隔（秒）
+            heartbeat_interval: リースを延長する間隔（秒、リースの有効秒数より十分短くする）
+            prune_interval: 古い完了タスクを削除する間隔（秒）
+            prepare: 取得したタスクを実行する前に呼ぶ関数（コールバックの設定など）
+            logger: カスタムロガー（省略可）
+        """
+        if role not in (ROLE_ALL, ROLE_WEB, ROLE_WORKER):
+            raise ValueError(f"不明なノードの役割: {role}")
+        
+        self.broker = broker
+        self.task_queue = task_queue
+        self.role = role
+        self.capacity = max(1, capacity)
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.prune_interval = prune_interval
+        self.prepare = prepare
+        self.logger = logger or logging.getLogger(__name__)
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:6]}"
+        
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._claiming = self.runs_tasks
+        # このノードがリースを持つタスクと、書き込み待ちの報告
+        self._owned: Dict[UUID, Task] = {}
+        self._reports: Dict[UUID, Tuple[Any, ...]] = {}
+        # 取り込み済みの更新番号
+        self._seq = 0
+        self._thread: Optional[threading.Thread] = None
+        
+        if self.runs_tasks:
+            task_queue.add_listener(self._on_task_status)
+    
+    @property
+    def runs_tasks(self) -> bool:
+        """このノードでタスクを実行するかどうか"""
+        return self.role in (ROLE_ALL, ROLE_WORKER)
+    
+    def start(self) -> None:
+        """既存のタスクを取り込んでからバックグラウンドスレッドを開始"""
+        self._sync()
+        self.broker.register_node(self.node_id, self.role, 0)
+        self._thread = threading.Thread(target=self._run, name="SharedQueueNode", daemon=True)
+        self._thread.start()
+        self.logger.info(f"共有キューに参加しました: {self.node_id} ({self.role})")
+    
+    def stop(self, drain_timeout: float = 0) -> None:
+        """
+        ノードを停止（新しいタスクは取得せず、報告を書き込んでから終了する）
+        
+        Args:
+            drain_timeout: 実行中のタスクの完了を待つ秒数（終わらなかったタスクはリース切れ後に別のワーカーが再実行する）
+        """
+        if self._thread is None or self._stopped.is_set():
+            return
+        
+        self._claiming = False
+        deadline = time.monotonic() + drain_timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._owned:
+                    break
+            time.sleep(0.2)
+        
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        try:
+            self._flush()
+            self.broker.remove_node(self.node_id)
+        except sqlite3.Error as e:
+            self.logger.warning(f"共有キューからの離脱処理に失敗しました: {str(e)}")
+    
+    def enqueue(self, task: Task) -> Task:
+        """
+        タスクを共有キューに登録し、ローカルのストアにも反映する
+        
+        Args:
+            task: 登録するタスク
+        
+        Returns:
+            Task: ローカルのストア上のタスク
+        """
+        self.broker.enqueue(task)
+        self._wakeup.set()
+        return self.task_queue.apply_external(task)
+    
+    def enqueue_many(self, tasks: List[Task]) -> List[Task]:
+        """
+        複数のタスクを1つのトランザクションで共有キューに登録し、ローカルのストアにも反映する
+        
+        Args:
+            tasks: 登録するタスク
+        
+        Returns:
+            List[Task]: ローカルのストア上のタスク
+        """
+        self.broker.enqueue_many(tasks)
+        self._wakeup.set()
+        return [self.task_queue.apply_external(task) for task in tasks]
+    
+    def cancel(self, task_id: UUID) -> bool:
+        """
+        タスクをキャンセル（このノードで実行中ならその場で、それ以外は共有キューを通じて）
+        
+        Args:
+            task_id: タスクID
+        
+        Returns:
+            bool: キャンセルした（要求した）場合True
+        """
+        with self._lock:
+            owned = task_id in self._owned
+        if owned:
+            return self.task_queue.cancel(task_id)
+        
+        if not self.broker.cancel(str(task_id)):
+            return False
+        self._sync()
+        return True
+    
+    def stats(self) -> Dict[str, Any]:
+        """ノードと共有キューの統計情報を返す"""
+        with self._lock:
+            owned = len(self._owned)
+            pending = len(self._reports)
+        return {
+            'node_id': self.node_id,
+            'role': self.role,
+            'capacity': self.capacity,
+            'owned': owned,
+            'pending_reports': pending,
+            'seq': self._seq,
+            'broker': self.broker.stats()
+        }
+    
+    def _on_task_status(self, task: Task, previous_status: TaskStatus) -> None:
+        """このノードが実行中のタスクの更新を報告待ちに追加（TaskQueueの状態変化リスナー）"""
+        if task.parent_id is not None:
+            return
+        with self._lock:
+            if task.id not in self._owned:
+                return
+            self._reports[task.id] = _task_row(task)
+        if task.status in FINISHED_STATUSES:
+            self._wakeup.set()
+    
+    def _run(self) -> None:
+        """報告・ハートビート・取得・取り込みを繰り返すバックグラウンドスレッド"""
+        last_heartbeat = time.monotonic()
+        last_pruned = 0.0
+        while not self._stopped.is_set():
+            try:
+                self._flush()
+                
+                now = time.monotonic()
+                if now - last_heartbeat >= self.heartbeat_interval:
+                    last_heartbeat = now
+                    self._heartbeat()
+                if now - last_pruned >= self.prune_interval:
+                    last_pruned = now
+                    self.broker.prune()
+                
+                if self._claiming:
+                    self._claim()
+                self._sync()
+            except Exception as e:
+                self.logger.exception(f"共有キューの処理中にエラーが発生しました: {str(e)}")
+            
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+    
+    def _flush(self) -> None:
+        """報告待ちの更新をまとめて書き込み、完了したタスクのリースを手放す"""
+        with self._lock:
+            reports = self._reports
+            self._reports = {}
+        if not reports:
+            return
+        
+        try:
+            self.broker.report(self.node_id, list(reports.values()))
+        except sqlite3.Error:
+            # 次の周期で再送する（その間に新しい報告があればそちらを優先）
+            with self._lock:
+                self._reports = {**reports, **self._reports}
+            raise
+        
+        with self._lock:
+            for task_id, row in reports.items():
+                if row[3] in _FINISHED_VALUES and task_id not in self._reports:
+                    self._owned.pop(task_id, None)
+    
+    def _heartbeat(self) -> None:
+        """リースを延長し、キャンセル要求・リース切れを反映して、期限切れのタスクを回収する"""
+        with self._lock:
+            task_ids = [str(task_id) for task_id in self._owned]
+        canceled, lost = self.broker.renew(self.node_id, task_ids)
+        
+        for task_id in lost:
+            # 別のワーカーが再実行しているため、ここでの実行は報告せずに止める
+            self.logger.warning(f"タスクのリースを失いました: {task_id}")
+            with self._lock:
+                self._owned.pop(UUID(task_id), None)
+                self._reports.pop(UUID(task_id), None)
+            self.task_queue.cancel(UUID(task_id))
+        for task_id in canceled - lost:
+            self.task_queue.cancel(UUID(task_id))
+        
+        self.broker.reap()
+        self.broker.register_node(self.node_id, self.role, len(task_ids) - len(lost))
+    
+    def _claim(self) -> None:
+        """空き枠の分だけタスクを取得してローカルのタスクキューで実行する"""
+        with self._lock:
+            free = self.capacity - len(self._owned)
+        if free <= 0:
+            return
+        
+        for task in self.broker.claim(self.node_id, free):
+            with self._lock:
+                self._owned[task.id] = task
+            try:
+                if self.prepare:
+                    self.prepare(task)
+                self.task_queue.add_task(task)
+            except Exception as e:
+                self.logger.error(f"共有キューのタスクを実行できません: {task.id} - {str(e)}")
+                task.status = TaskStatus.ERROR
+                task.finished_at = datetime.now()
+                task.error_message = f"内部エラー: {str(e)}"
+                with self._lock:
+                    self._reports[task.id] = _task_row(task)
+    
+    def _sync(self) -> None:
+        """他のノードで登録・更新されたタスクをローカルのストアに取り込む"""
+        with self._sync_lock:
+            while True:
+                changes = self.broker.changes_since(self._seq)
+                for seq, owner, cancel_requested, task in changes:
+                    self._seq = seq
+                    if owner == self.node_id:
+                        # 自分の実行中のタスクは取り込まない（他ノードからのキャンセル要求だけ反映する）
+                        if cancel_requested and task.status not in FINISHED_STATUSES:
+                            self.task_queue.cancel(task.id)
+                        continue
+                    self.task_queue.apply_external(task)
+                if len(changes) < _SYNC_BATCH:
+                    return
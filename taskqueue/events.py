@@ -0,0 +1,229 @@
+"""
+タスク状態変化のイベント配信（Server-Sent Events用のブローカー）
+
+ワーカースレッドから publish されたイベントを、接続中の各クライアントの
+有界キューへ配る。キューが溢れたクライアントには再同期イベントを送る
+"""
+import asyncio
+import itertools
+import json
+import logging
+import queue
+import threading
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+# 再同期を要求するイベント種別
+RESYNC_EVENT = "resync"
+
+
+class Event:
+    """配信イベント"""
+    
+    def __init__(self, event_id: str, seq: int, event_type: str, data: Dict[str, Any]):
+        self.id = event_id
+        self.seq = seq
+        self.type = event_type
+        self.data = data
+    
+    def encode(self) -> bytes:
+        """SSE形式にエンコード"""
+        payload = json.dumps(self.data, ensure_ascii=False, default=str)
+        # 連番0（再同期など履歴に残らないイベント）はIDを付けず、クライアントの最終IDを維持させる
+        lines = [f"id: {self.id}"] if self.seq else []
+        lines.append(f"event: {self.type}")
+        lines.extend(f"data: {line}" for line in payload.splitlines() or [""])
+        return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+class Subscription:
+    """クライアントごとの有界イベントキュー（基底クラス）"""
+    
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.overflowed = False
+        self.dropped = 0
+    
+    def deliver(self, event: Event) -> None:
+        """イベントを配送（ワーカースレッドから呼ばれる）"""
+        raise NotImplementedError
+
+
+class SyncSubscription(Subscription):
+    """スレッドで待機するクライアント用（開発サーバーのFlaskルートで使用）"""
+    
+    def __init__(self, maxsize: int):
+        super().__init__(maxsize)
+        self.queue: "queue.Queue[Event]" = queue.Queue(maxsize=maxsize)
+    
+    def deliver(self, event: Event) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self._overflow()
+    
+    def get(self, timeout: float) -> Optional[Event]:
+        """イベントを待機（タイムアウト時はNone）"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+    
+    def _overflow(self) -> None:
+        """溢れたら溜まっているイベントを破棄して再同期を要求"""
+        self.overflowed = True
+        while True:
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                break
+
+
+class AsyncSubscription(Subscription):
+    """イベントループで待機するクライアント用（ASGIで使用、スレッドを専有しない）"""
+    
+    def __init__(self, maxsize: int, loop: asyncio.AbstractEventLoop):
+        super().__init__(maxsize)
+        self.loop = loop
+        self.queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize=maxsize)
+    
+    def deliver(self, event: Event) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # イベントループが既に閉じている
+            pass
+    
+    async def get(self, timeout: float) -> Optional[Event]:
+        """イベントを待機（タイムアウト時はNone）"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+    
+    def _put(self, event: Event) -> None:
+        """イベントループ上でキューに追加（溢れたら破棄して再同期を要求）"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+
+
+class EventBroker:
+    """イベントの採番・履歴保持・配信を行うブローカー"""
+    
+    def __init__(
+        self,
+        history: int = 1000,
+        client_queue_size: int = 256,
+        heartbeat_interval: float = 15.0,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        イベントブローカーの初期化
+        
+        Args:
+            history: 再接続時の再送用に保持するイベント数
+            client_queue_size: クライアントごとの未送信イベントの上限
+            heartbeat_interval: ハートビートを送る間隔（秒）
+            logger: カスタムロガー（省略可）
+        """
+        self.client_queue_size = max(1, client_queue_size)
+        self.heartbeat_interval = heartbeat_interval
+        self.logger = logger or logging.getLogger(__name__)
+        
+        # イベントIDは「epoch:連番」（再起動前のIDを見分けるため）
+        self.epoch = uuid.uuid4().hex[:12]
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._history: Deque[Event] = deque(maxlen=max(1, history))
+        self._subscribers: Set[Subscription] = set()
+    
+    def publish(self, event_type: str, data: Dict[str, Any]) -> Event:
+        """
+        イベントを採番して全クライアントに配信する（スレッドセーフ）
+        
+        Args:
+            event_type: イベント種別
+            data: イベントデータ
+        
+        Returns:
+            Event: 配信したイベント
+        """
+        with self._lock:
+            seq = next(self._seq)
+            event = Event(f"{self.epoch}:{seq}", seq, event_type, data)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        
+        for subscriber in subscribers:
+            subscriber.deliver(event)
+        return event
+    
+    def subscribe(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscription:
+        """
+        クライアントを登録する
+        
+        Args:
+            loop: 指定時はイベントループで待機する購読を作成（ASGI用）
+        
+        Returns:
+            Subscription: 購読
+        """
+        if loop is not None:
+            subscription: Subscription = AsyncSubscription(self.client_queue_size, loop)
+        else:
+            subscription = SyncSubscription(self.client_queue_size)
+        
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """クライアントの登録を解除"""
+        with self._lock:
+            self._subscribers.discard(subscription)
+    
+    def replay(self, last_event_id: Optional[str]) -> Optional[List[Event]]:
+        """
+        指定IDより後のイベントを履歴から取得する
+        
+        Args:
+            last_event_id: クライアントが最後に受け取ったイベントID
+        
+        Returns:
+            再送するイベントの一覧。履歴から辿れない場合はNone（再同期が必要）
+        """
+        if not last_event_id:
+            return []
+        
+        epoch, _, seq_str = last_event_id.partition(":")
+        if epoch != self.epoch or not seq_str.isdigit():
+            return None
+        
+        last_seq = int(seq_str)
+        with self._lock:
+            events = list(self._history)
+        
+        if events and events[0].seq > last_seq + 1:
+            return None
+        return [event for event in events if event.seq > last_seq]
+    
+    def resync_event(self, reason: str) -> Event:
+        """再同期を要求するイベント（履歴には残さない）"""
+        return Event(f"{self.epoch}:0", 0, RESYNC_EVENT, {'reason': reason})
+    
+    def stats(self) -> Dict[str, Any]:
+        """ブローカーの統計情報"""
+        with self._lock:
+            return {
+                'epoch': self.epoch,
+                'clients': len(self._subscribers),
+                'history': len(self._history),
+                'last_seq': self._history[-1].seq if self._history else 0
+            }
@@ -9,4 +9,12 @@ class TaskQueueError(Exception):
     def __init__(self, message: str, details: Optional[Any] = None):
         self.message = message
         self.details = details
-        super().__init__(message)
\ No newline at end of file
+        super().__init__(message)
+
+
+class WorkerTerminatedError(TaskQueueError):
+    """ワーカープロセスが終了したためタスクの結果を受け取れなかった"""
+
+
+class TaskCancelledError(TaskQueueError):
+    """タスクのキャンセル（タイムアウトを含む）が要求された"""
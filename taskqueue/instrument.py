@@ -0,0 +1,153 @@
+"""
+タスクの処理段階ごとの時刻と、実行時の計測値（CPU時間・RSS）の記録
+
+ハンドラーは mark_stage() / record_metric() で処理の区切りと計測値を記録する。
+ワーカースレッド・ワーカープロセスのどちらで実行しても、記録は TaskResult に載せて
+親プロセスのタスク（Task.timings / Task.metrics）に反映される
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+# キューが記録する段階（ハンドラーは任意の名前の段階を加えられる）
+STAGE_ENQUEUED = "enqueued"            # キューに登録
+STAGE_STARTED = "started"              # ワーカーでハンドラーの実行を開始
+STAGE_FINISHED = "finished"            # ハンドラーの実行を終了
+STAGE_CALLBACK_DONE = "callback_done"  # 完了時のコールバックを実行
+
+# 実行中のタスクの記録（ワーカースレッドごと）
+_local = threading.local()
+
+# このプロセスで実行中の記録の数（ほかに実行中のタスクがなければピークRSSをリセットする）
+_active = 0
+_active_lock = threading.Lock()
+
+
+class TaskRecorder:
+    """実行中のタスクの記録"""
+    
+    __slots__ = ('timings', 'metrics')
+    
+    def __init__(self):
+        # 段階名 -> UNIX時間
+        self.timings: Dict[str, float] = {}
+        self.metrics: Dict[str, Any] = {}
+
+
+def mark_stage(stage: str) -> None:
+    """
+    実行中のタスクが処理の段階に達した時刻を記録する（タスクの外で呼び出した場合は何もしない）
+    
+    Args:
+        stage: 段階名（"converted" など）
+    """
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is not None:
+        recorder.timings[stage] = time.time()
+
+
+def record_metric(name: str, value: Any) -> None:
+    """
+    実行中のタスクの計測値を記録する（タスクの外で呼び出した場合は何もしない）
+    
+    Args:
+        name: 計測値の名前（"input_bytes" など）
+        value: JSONに変換できる値
+    """
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is not None:
+        recorder.metrics[name] = value
+
+
+@contextmanager
+def recording() -> Iterator[TaskRecorder]:
+    """
+    ハンドラーの実行を記録する（開始・終了の時刻、CPU時間、RSSとピークRSS）
+    
+    ピークRSSはプロセス単位の値のため、スレッドで並行して実行しているタスクがある場合は
+    それらを含めた最大値になる
+    
+    Yields:
+        TaskRecorder: 記録
+    """
+    global _active
+    recorder = TaskRecorder()
+    with _active_lock:
+        _active += 1
+        if _active == 1:
+            _reset_peak_rss()
+    
+    previous = getattr(_local, 'recorder', None)
+    _local.recorder = recorder
+    recorder.timings[STAGE_STARTED] = time.time()
+    cpu_started = time.thread_time()
+    try:
+        yield recorder
+    finally:
+        recorder.timings[STAGE_FINISHED] = time.time()
+        recorder.metrics['cpu_seconds'] = round(time.thread_time() - cpu_started, 4)
+        rss = current_rss()
+        if rss:
+            recorder.metrics['rss'] = rss
+        peak = peak_rss()
+        if peak:
+            recorder.metrics['rss_peak'] = max(peak, rss)
+        recorder.metrics['pid'] = os.getpid()
+        _local.recorder = previous
+        with _active_lock:
+            _active -= 1
+
+
+def stage_durations(timings: Dict[str, float]) -> Dict[str, float]:
+    """
+    段階ごとの所要時間（前の段階からその段階に達するまでの秒数、時刻の順）
+    
+    Args:
+        timings: 段階名 -> UNIX時間
+    
+    Returns:
+        Dict[str, float]: 段階名 -> 秒数（最初の段階は含まない）
+    """
+    ordered = sorted(timings.items(), key=lambda item: item[1])
+    return {
+        stage: round(at - ordered[index - 1][1], 4)
+        for index, (stage, at) in enumerate(ordered)
+        if index > 0
+    }
+
+
+def current_rss() -> int:
+    """このプロセスの現在のRSS（取得できない環境では0）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
+
+
+def peak_rss() -> int:
+    """このプロセスのピークRSS（最後にリセットしてからの最大値、取得できない環境では0）"""
+    return _status_bytes('VmHWM')
+
+
+def _reset_peak_rss() -> None:
+    """ピークRSSを現在の値にリセットする（Linux 4.0 以降、できない環境では何もしない）"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _status_bytes(field: str) -> int:
+    """/proc/self/status の kB 単位の値をバイトで返す（取得できない環境では0）"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
@@ -0,0 +1,331 @@
+"""
+SQLite（WALモード）へのタスクの永続化
+タスクの内容・状態遷移・結果を状態変化リスナーで受け取り、専用スレッドでまとめて書き込む
+（呼び出し元のスレッドではディスクに触れず、同じタスクの連続した更新は1行にまとめる）
+再起動時は未完了のタスクと直近の完了タスクを読み込んで復元できる
+（サブタスクは記録しない。未完了の分割元は再起動後に分割からやり直す）
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from .store import FINISHED_STATUSES
+from .task import Task, TaskStatus
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 1,
+    payload TEXT,
+    result TEXT,
+    error_message TEXT,
+    progress TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    timings TEXT,
+    metrics TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, updated_at);
+CREATE TABLE IF NOT EXISTS transitions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT NOT NULL,
+    previous TEXT,
+    status TEXT NOT NULL,
+    at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transitions_task ON transitions (task_id);
+"""
+
+_COLUMNS = (
+    'id', 'type', 'name', 'status', 'priority', 'cost', 'payload', 'result',
+    'error_message', 'progress', 'created_at', 'updated_at', 'started_at', 'finished_at',
+    'timings', 'metrics'
+)
+
+# 後から追加した列（既存のデータベースには ALTER TABLE で追加する）
+_ADDED_COLUMNS = (('timings', 'TEXT'), ('metrics', 'TEXT'))
+
+_UPSERT = (
+    f"INSERT OR REPLACE INTO tasks ({', '.join(_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in _COLUMNS)})"
+)
+
+_FINISHED_VALUES = tuple(status.value for status in FINISHED_STATUSES)
+
+
+def _dumps(value: Any) -> Optional[str]:
+    """JSON文字列に変換（Noneはそのまま）"""
+    if value is None:
+        return None
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _add_missing_columns(conn: sqlite3.Connection) -> None:
+    """古いバージョンで作成した tasks テーブルに、後から追加した列を加える"""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+    for column, column_type in _ADDED_COLUMNS:
+        if column in existing:
+            continue
+        try:
+            conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} {column_type}")
+        except sqlite3.OperationalError:
+            # 同時に起動した他のノードが先に追加した場合
+            if column not in {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}:
+                raise
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    """ISO 8601形式の文字列に変換（Noneはそのまま）"""
+    return value.isoformat() if value else None
+
+
+def _task_row(task: Task) -> Tuple[Any, ...]:
+    """タスクをテーブルの行に変換（_COLUMNS の順、コールバックは保存しない）"""
+    return (
+        str(task.id),
+        task.type,
+        task.name,
+        task.status.value,
+        task.priority,
+        task.cost,
+        _dumps(task.payload),
+        _dumps(task.result),
+        task.error_message,
+        _dumps(task.progress),
+        _isoformat(task.created_at),
+        _isoformat(task.updated_at),
+        _isoformat(task.started_at),
+        _isoformat(task.finished_at),
+        _dumps(task.timings),
+        _dumps(task.metrics)
+    )
+
+
+def _row_task(row: sqlite3.Row) -> Task:
+    """テーブルの行からタスクを復元"""
+    return Task(
+        id=UUID(row['id']),
+        type=row['type'],
+        name=row['name'],
+        status=TaskStatus(row['status']),
+        priority=row['priority'],
+        cost=row['cost'],
+        payload=json.loads(row['payload']) if row['payload'] else {},
+        result=json.loads(row['result']) if row['result'] else None,
+        error_message=row['error_message'],
+        progress=json.loads(row['progress']) if row['progress'] else None,
+        created_at=datetime.fromisoformat(row['created_at']),
+        updated_at=datetime.fromisoformat(row['updated_at']),
+        started_at=datetime.fromisoformat(row['started_at']) if row['started_at'] else None,
+        finished_at=datetime.fromisoformat(row['finished_at']) if row['finished_at'] else None,
+        timings=json.loads(row['timings']) if row['timings'] else {},
+        metrics=json.loads(row['metrics']) if row['metrics'] else {}
+    )
+
+
+class SQLiteTaskJournal:
+    """タスクの状態変化をSQLiteに記録するジャーナル"""
+    
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 0.5,
+        batch_size: int = 500,
+        max_finished: Optional[int] = 1000,
+        prune_interval: float = 60,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        ジャーナルの初期化（データベースとテーブルがなければ作成）
+        
+        Args:
+            path: SQLiteデータベースファイルのパス
+            flush_interval: 書き込みをまとめる間隔（秒）
+            batch_size: この件数の更新が溜まったら間隔を待たずに書き込む
+            max_finished: 保持する完了タスクの最大数（None=無制限）
+            prune_interval: 古い完了タスクを削除する間隔（秒）
+            logger: カスタムロガー（省略可）
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.max_finished = max_finished
+        self.prune_interval = prune_interval
+        self.logger = logger or logging.getLogger(__name__)
+        
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+            _add_missing_columns(conn)
+        
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # 書き込み待ちのタスク（ID -> 行）と状態遷移
+        self._pending: Dict[str, Tuple[Any, ...]] = {}
+        self._transitions: List[Tuple[str, Optional[str], str, str]] = []
+        self._closed = False
+        self._last_pruned = 0.0
+        
+        # 統計
+        self.flushes = 0
+        self.written = 0
+        self.errors = 0
+        
+        self._writer = threading.Thread(target=self._run, name="SQLiteTaskJournal", daemon=True)
+        self._writer.start()
+    
+    def record(self, task: Task, previous_status: Optional[TaskStatus] = None) -> None:
+        """
+        タスクの現在の内容を書き込み待ちに追加（TaskQueueの状態変化リスナー）
+        
+        Args:
+            task: 状態が変化したタスク
+            previous_status: 変化前の状態（進捗のみの更新では現在の状態と同じ）
+        """
+        if task.parent_id is not None:
+            return
+        
+        row = _task_row(task)
+        with self._lock:
+            if self._closed:
+                return
+            self._pending[row[0]] = row
+            if previous_status != task.status:
+                self._transitions.append((
+                    row[0],
+                    previous_status.value if previous_status else None,
+                    task.status.value,
+                    datetime.now().isoformat()
+                ))
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+    
+    def load(self) -> Tuple[List[Task], List[Task]]:
+        """
+        復元するタスクを読み込む
+        
+        Returns:
+            (未完了のタスク（登録順）, 完了タスク（完了した順、max_finished件まで）)
+        """
+        with closing(self._connect()) as conn:
+            conn.row_factory = sqlite3.Row
+            unfinished = conn.execute(
+                f"SELECT * FROM tasks WHERE status NOT IN ({', '.join('?' for _ in _FINISHED_VALUES)}) "
+                "ORDER BY created_at",
+                _FINISHED_VALUES
+            ).fetchall()
+            finished = conn.execute(
+                f"SELECT * FROM tasks WHERE status IN ({', '.join('?' for _ in _FINISHED_VALUES)}) "
+                "ORDER BY updated_at DESC LIMIT ?",
+                (*_FINISHED_VALUES, self.max_finished if self.max_finished is not None else -1)
+            ).fetchall()
+        
+        return (
+            [_row_task(row) for row in unfinished],
+            [_row_task(row) for row in reversed(finished)]
+        )
+    
+    def flush(self) -> None:
+        """書き込み待ちの更新をすぐに書き込む（書き込みスレッド以外から呼ぶ場合は完了を待たない）"""
+        self._wakeup.set()
+    
+    def close(self) -> None:
+        """書き込み待ちの更新を書き込んでから終了する"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup.set()
+        self._writer.join()
+    
+    def stats(self) -> Dict[str, Any]:
+        """ジャーナルの統計情報を返す"""
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'path': self.path,
+            'pending': pending,
+            'flushes': self.flushes,
+            'written': self.written,
+            'errors': self.errors
+        }
+    
+    def _connect(self) -> sqlite3.Connection:
+        """データベースに接続（WALモード、コミットごとのfsyncはしない）"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    
+    def _run(self) -> None:
+        """書き込みスレッド（一定間隔か件数が溜まったらまとめて書き込む）"""
+        conn = self._connect()
+        try:
+            while True:
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                with self._lock:
+                    closed = self._closed
+                self._write(conn)
+                if closed:
+                    return
+                
+                if time.monotonic() - self._last_pruned >= self.prune_interval:
+                    self._last_pruned = time.monotonic()
+                    self._prune(conn)
+        finally:
+            conn.close()
+    
+    def _write(self, conn: sqlite3.Connection) -> None:
+        """書き込み待ちの更新を1つのトランザクションで書き込む"""
+        with self._lock:
+            rows = list(self._pending.values())
+            transitions = self._transitions
+            self._pending = {}
+            self._transitions = []
+        if not rows and not transitions:
+            return
+        
+        try:
+            with conn:
+                conn.executemany(_UPSERT, rows)
+                conn.executemany(
+                    "INSERT INTO transitions (task_id, previous, status, at) VALUES (?, ?, ?, ?)",
+                    transitions
+                )
+            self.flushes += 1
+            self.written += len(rows)
+        except sqlite3.Error as e:
+            self.errors += 1
+            self.logger.error(f"タスクの永続化に失敗しました: {str(e)}")
+    
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        """保持件数を超えた古い完了タスクと、その状態遷移を削除"""
+        if self.max_finished is None:
+            return
+        
+        try:
+            with conn:
+                conn.execute(
+                    f"DELETE FROM tasks WHERE status IN ({', '.join('?' for _ in _FINISHED_VALUES)}) "
+                    "AND id NOT IN (SELECT id FROM tasks WHERE status IN "
+                    f"({', '.join('?' for _ in _FINISHED_VALUES)}) ORDER BY updated_at DESC LIMIT ?)",
+                    (*_FINISHED_VALUES, *_FINISHED_VALUES, self.max_finished)
+                )
+                conn.execute("DELETE FROM transitions WHERE task_id NOT IN (SELECT id FROM tasks)")
+        except sqlite3.Error as e:
+            self.logger.warning(f"古いタスクの削除に失敗しました: {str(e)}")
@@ -1,19 +1,121 @@
 """
 concurrent.futures.ThreadPoolExecutorを使った極小のタスクキュー
 即時実行とタスク単位のワーカー数指定をサポート
+タスクタイプ単位でワーカープロセスでの実行も選択可能
+タスクタイプ単位の制限時間とキャンセルに対応（プロセス実行のタスクはワーカーごと強制終了する）
+ハンドラーはタスクをサブタスクに分割して並列実行し、結果をまとめることもできる
+スケジューラを指定すると、優先度とレーンごとの公平性に従って実行順を決める
 """
 import concurrent.futures
+import heapq
+import itertools
 import logging
-from concurrent.futures import Future, ThreadPoolExecutor
+import pickle
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Callable, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from uuid import UUID
 
-from .task import Task, TaskResult, TaskStatus
+from .exceptions import (TaskCancelledError, TaskQueueError,
+                         WorkerTerminatedError)
+from .instrument import (STAGE_CALLBACK_DONE, STAGE_ENQUEUED, STAGE_STARTED,
+                         recording)
+from .scheduler import FairScheduler
+from .store import FINISHED_STATUSES, TaskStore
+from .task import Task, TaskResult, TaskSplit, TaskStatus
+from .workers import ProcessWorkerPool
 
 # タスクハンドラーの型定義
 TaskHandler = Callable[[Task], Any]
 
+# 状態変化リスナーの型定義（タスク, 変化前の状態）
+StatusListener = Callable[[Task, TaskStatus], None]
+
+# 実行バックエンドの種類
+EXECUTOR_THREAD = "thread"
+EXECUTOR_PROCESS = "process"
+EXECUTOR_BACKENDS = (EXECUTOR_THREAD, EXECUTOR_PROCESS)
+
+_logger = logging.getLogger(__name__)
+
+# ワーカースレッドで実行中のタスクのキャンセル要求
+_current = threading.local()
+
+
+def run_handler(task: Task, handler: TaskHandler) -> TaskResult:
+    """
+    ハンドラーを実行して結果をTaskResultにまとめる
+    （ワーカースレッド・ワーカープロセスの両方で使用するためモジュール関数にしている）
+    
+    Args:
+        task: 処理するタスク
+        handler: 処理ハンドラー
+        
+    Returns:
+        TaskResult: 処理結果（ハンドラーがTaskResultを返した場合はそのまま）
+                    処理段階の時刻と計測値は timings / metrics に入る
+    """
+    with recording() as recorder:
+        try:
+            _logger.debug(f"タスク処理開始: {task.id} ({task.name})")
+            result = handler(task)
+            if not isinstance(result, TaskResult):
+                result = TaskResult.success(result)
+        except TaskCancelledError as e:
+            _logger.info(f"タスクの処理を中断しました: {task.id} ({task.name})")
+            result = TaskResult.failure(e.message)
+        except Exception as e:
+            error_msg = f"タスク処理エラー: {str(e)}"
+            _logger.exception(error_msg)
+            result = TaskResult.failure(error_msg)
+    
+    result.timings = recorder.timings
+    result.metrics = recorder.metrics
+    return result
+
+
+def raise_if_cancelled() -> None:
+    """
+    実行中のタスクにキャンセル（タイムアウトを含む）が要求されていれば中断する
+    スレッドで実行するハンドラーが処理の区切りで呼び出す
+    （プロセス実行のタスクはワーカーごと強制終了するため、ここでは何もしない）
+    
+    Raises:
+        TaskCancelledError: キャンセルが要求されている場合
+    """
+    event = getattr(_current, 'cancel_event', None)
+    if event is not None and event.is_set():
+        raise TaskCancelledError("タスクの処理を中断しました")
+
+
+def _apply_recording(task: Task, result: TaskResult) -> None:
+    """
+    ハンドラーの実行中の記録をタスクに反映する
+    （分割したタスクはまとめの実行の記録で上書きするが、実行の開始は最初の実行の時刻を残す）
+    """
+    for stage, at in result.timings.items():
+        if stage == STAGE_STARTED and stage in task.timings:
+            continue
+        task.timings[stage] = at
+    task.metrics.update(result.metrics)
+
+
+class _TaskGroup:
+    """分割されたタスクのサブタスクの実行状況"""
+    
+    def __init__(self, parent_id: UUID, split: TaskSplit):
+        self.parent_id = parent_id
+        self.split = split
+        self.child_ids = [subtask.id for subtask in split.subtasks]
+        self.index = {child_id: i for i, child_id in enumerate(self.child_ids)}
+        self.results: List[Any] = [None] * len(self.child_ids)
+        self.errors: List[Optional[str]] = [None] * len(self.child_ids)
+        self.remaining = len(self.child_ids)
+        self.done_weight = 0
+        self.total_weight = sum(split.weights)
+
 
 class TaskQueue:
     """最小限のタスクキュー実装"""
@@ -22,7 +124,14 @@ class TaskQueue:
         self,
         default_max_workers: int = 4,
         auto_start: bool = True,
-        logger: Optional[logging.Logger] = None
+        logger: Optional[logging.Logger] = None,
+        process_workers: Optional[int] = None,
+        process_initializer: Optional[Callable[..., None]] = None,
+        process_initargs: Tuple[Any, ...] = (),
+        task_store: Optional[TaskStore] = None,
+        scheduler: Optional[FairScheduler] = None,
+        worker_max_tasks: int = 0,
+        worker_max_rss: int = 0
     ):
         """
         タスクキューの初期化
@@ -31,25 +140,117 @@ class TaskQueue:
             default_max_workers: デフォルトのワーカー数（タスク単位で上書き可能）
             auto_start: True=タスク追加時に自動実行、False=start()で一括実行
             logger: カスタムロガー（省略可）
+            process_workers: プロセスバックエンドのワーカープロセス数（省略時はdefault_max_workers）
+            process_initializer: ワーカープロセス起動時に実行する初期化関数（省略可）
+            process_initargs: 初期化関数の引数
+            task_store: タスクの保持ポリシーを持つストア（省略時は完了タスクを1000件まで保持）
+            scheduler: 実行順を決めるスケジューラ（省略時は追加順にすぐ実行環境へ投入）
+            worker_max_tasks: この数のタスクを処理したワーカープロセスを入れ替える（0=入れ替えない）
+            worker_max_rss: タスク処理後のRSSがこの値を超えたワーカープロセスを入れ替える（0=入れ替えない）
         """
         self.default_max_workers = max(1, default_max_workers)
         self.auto_start = auto_start
         self.logger = logger or logging.getLogger(__name__)
+        self.process_workers = max(1, process_workers or self.default_max_workers)
+        self._process_initializer = process_initializer
+        self._process_initargs = process_initargs
+        self.worker_max_tasks = worker_max_tasks
+        self.worker_max_rss = worker_max_rss
         
-        # タスク処理用ハンドラー
+        # タスク処理用ハンドラーと実行バックエンド、制限時間（秒）
         self._handlers: Dict[str, TaskHandler] = {}
+        self._backends: Dict[str, str] = {}
+        self._timeouts: Dict[str, float] = {}
         
         # タスク管理
-        self._tasks: Dict[UUID, Task] = {}
+        self._tasks = task_store if task_store is not None else TaskStore(logger=self.logger)
         self._futures: Dict[UUID, Future] = {}
         
+        # 状態変化の通知先
+        self._listeners: List[StatusListener] = []
+        
+        # 分割されたタスク（分割元のID -> サブタスクの実行状況）
+        self._groups: Dict[UUID, _TaskGroup] = {}
+        self._groups_lock = threading.Lock()
+        
+        # 実行順のスケジューラ（指定時は空き枠ができるまで待機中のまま保持）
+        self._scheduler = scheduler
+        # グループの開始間隔で待たせているタスクを取り出し直すタイマー
+        self._dispatch_timer: Optional[threading.Timer] = None
+        self._dispatch_timer_lock = threading.Lock()
+        
+        # 中止の要求（タスクID -> (確定させる状態, メッセージ)）とスレッド実行のキャンセル要求
+        self._aborts: Dict[UUID, Tuple[TaskStatus, str]] = {}
+        self._cancel_events: Dict[UUID, threading.Event] = {}
+        
+        # 実行中のサブタスク -> 分割元のタスクID（中止後もハンドラーの終了を待てるように保持）
+        self._running_parents: Dict[UUID, UUID] = {}
+        
+        # 制限時間の監視（(期限, 登録順, タスクID, Future, 制限時間) のヒープ）
+        self._deadlines: List[Tuple[float, int, UUID, Future, float]] = []
+        self._deadline_sequence = itertools.count()
+        self._deadline_cond = threading.Condition()
+        self._watchdog: Optional[threading.Thread] = None
+        self._closed = False
+        
         # メインの実行環境
         self._executor = ThreadPoolExecutor(max_workers=self.default_max_workers)
+        
+        # プロセスバックエンド（必要になった時点で作成）
+        self._process_executor: Optional[ProcessWorkerPool] = None
+        self._process_lock = threading.Lock()
     
-    def register_handler(self, task_type: str, handler: TaskHandler) -> None:
-        """タスクタイプに対応するハンドラーを登録"""
-        self.logger.debug(f"ハンドラー登録: {task_type}")
+    def register_handler(
+        self,
+        task_type: str,
+        handler: TaskHandler,
+        executor: str = EXECUTOR_THREAD,
+        timeout: Optional[float] = None
+    ) -> None:
+        """
+        タスクタイプに対応するハンドラーを登録
+        
+        Args:
+            task_type: タスクタイプ
+            handler: 処理ハンドラー（processの場合はpickle可能なモジュールレベル関数）
+            executor: 実行バックエンド（"thread" または "process"）
+            timeout: 1回の実行の制限時間（秒、超えるとエラーで終了。省略時は無制限）
+            
+        Raises:
+            ValueError: 未対応の実行バックエンドが指定された場合
+        """
+        if executor not in EXECUTOR_BACKENDS:
+            raise ValueError(f"未対応の実行バックエンド: {executor}")
+        
+        self.logger.debug(f"ハンドラー登録: {task_type} ({executor})")
         self._handlers[task_type] = handler
+        self._backends[task_type] = executor
+        if timeout:
+            self._timeouts[task_type] = timeout
+        else:
+            self._timeouts.pop(task_type, None)
+        
+        # プロセスバックエンドはワーカープロセスを事前に起動しておく
+        if executor == EXECUTOR_PROCESS:
+            self.warm_process_pool()
+    
+    def add_listener(self, listener: StatusListener) -> None:
+        """
+        タスクの状態変化リスナーを登録（状態が変わった直後に呼び出される）
+        
+        Args:
+            listener: (タスク, 変化前の状態) を受け取る関数
+        """
+        self._listeners.append(listener)
+    
+    def remove_listener(self, listener: StatusListener) -> None:
+        """状態変化リスナーの登録を解除"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+    
+    def warm_process_pool(self) -> None:
+        """プロセスバックエンドのワーカープロセスを事前に起動する"""
+        self._get_process_executor()
     
     def add_task(
         self,
@@ -70,12 +271,22 @@ class TaskQueue:
             
         Raises:
             ValueError: タスクタイプにハンドラーが登録されていない場合
+            TaskQueueError: プロセス実行のタスクのペイロードがpickleできない場合
         """
         if task.type not in self._handlers:
             raise ValueError(f"未登録のタスクタイプ: {task.type}")
         
-        # タスク登録
-        self._tasks[task.id] = task
+        if self._backends.get(task.type) == EXECUTOR_PROCESS:
+            try:
+                pickle.dumps(task.payload)
+            except Exception as e:
+                raise TaskQueueError(f"タスクのペイロードをpickleできません: {task.id}", details=str(e))
+        
+        # タスク登録（状態は変わらないが、永続化などのためリスナーに通知する）
+        # 他のノードで登録されたタスクは、最初に登録された時刻を残す
+        task.timings.setdefault(STAGE_ENQUEUED, time.time())
+        self._tasks.add(task)
+        self._notify(task, task.status)
         self.logger.debug(f"タスク追加: {task.id} - {task.name}")
         
         # 即時実行するかどうか
@@ -101,7 +312,7 @@ class TaskQueue:
             raise KeyError(f"タスクが見つかりません: {task_id}")
         
         # すでに実行中/完了済みのタスクは再実行しない
-        task = self._tasks[task_id]
+        task = self._tasks.get(task_id)
         if task.status in (TaskStatus.PROCESSING, TaskStatus.SUCCESS):
             return
         
@@ -114,27 +325,150 @@ class TaskQueue:
         Args:
             workers: 実行に使用するワーカー数（省略時はデフォルト値）
         """
-        # 待機中のタスクを取得
-        waiting_tasks = [
-            task for task in self._tasks.values() 
-            if task.status == TaskStatus.WAITING
-        ]
+        # 待機中のタスクを取得（状態索引から取得するため全件走査しない）
+        waiting_tasks = self._tasks.by_status(TaskStatus.WAITING)
         
         # すべて実行
         for task in waiting_tasks:
             self._execute_task(task, workers)
     
+    def cancel(self, task_id: UUID) -> bool:
+        """
+        タスクをキャンセル
+        待機中のタスクは実行せずに、プロセス実行中のタスクはワーカーごと強制終了して、
+        スレッド実行中のタスクは状態を先に確定してキャンセルする（分割中のタスクはサブタスクも中止）
+        
+        Args:
+            task_id: キャンセルするタスクID
+            
+        Returns:
+            bool: キャンセルした場合True（見つからない・完了済みの場合False）
+        """
+        return self._abort(task_id, TaskStatus.CANCELED, "キャンセルされました")
+    
+    def apply_external(self, task: Task) -> Task:
+        """
+        他のプロセス・ノードで登録・更新されたタスクをストアに反映してリスナーに通知（実行はしない）
+        このキューで実行中・実行待ちのタスクは、ローカルの状態を優先して反映しない
+        
+        Args:
+            task: 反映するタスク
+        
+        Returns:
+            Task: ストア上のタスク
+        """
+        local = task.id in self._futures or task.id in self._groups
+        if local or (self._scheduler is not None and self._scheduler.is_queued(task.id)):
+            return self._tasks.get(task.id) or task
+        
+        current = self._tasks.get(task.id)
+        self._tasks.add(task)
+        self._notify(task, current.status if current else task.status)
+        return task
+    
     def get_task(self, task_id: UUID) -> Optional[Task]:
         """タスクIDによりタスクを取得"""
         return self._tasks.get(task_id)
     
+    def list_tasks(
+        self,
+        statuses: Optional[List[TaskStatus]] = None,
+        folder: Optional[str] = None
+    ) -> List[Task]:
+        """
+        保持しているタスクの一覧を取得（登録日時順）
+        
+        Args:
+            statuses: 絞り込む状態（省略時はすべて）
+            folder: 絞り込むフォルダ（省略時はすべて）
+            
+        Returns:
+            List[Task]: タスクの一覧
+        """
+        # 期限切れの完了タスクを先に破棄
+        self._tasks.prune()
+        
+        if folder is not None:
+            tasks = self._tasks.by_folder(folder)
+            if statuses:
+                tasks = [task for task in tasks if task.status in statuses]
+        elif statuses:
+            tasks = self._tasks.by_status(*statuses)
+        else:
+            tasks = self._tasks.values()
+        
+        return sorted(tasks, key=lambda task: task.created_at)
+    
+    def set_progress(self, task: Task, done: int, total: int, unit: str = "tasks") -> None:
+        """
+        タスクの進捗を更新してリスナーに通知（状態は変わらない）
+        
+        Args:
+            task: 対象タスク
+            done: 完了した量
+            total: 全体の量
+            unit: 単位（"pages" など）
+        """
+        task.progress = {'done': done, 'total': total, 'unit': unit}
+        self._tasks.touch(task)
+        self._notify(task, task.status)
+    
+    @property
+    def store(self) -> TaskStore:
+        """タスクストア"""
+        return self._tasks
+    
+    @property
+    def scheduler(self) -> Optional[FairScheduler]:
+        """実行順のスケジューラ（未指定ならNone）"""
+        return self._scheduler
+    
+    def worker_stats(self) -> Optional[Dict[str, Any]]:
+        """ワーカープロセスの統計情報（プロセスバックエンド未使用ならNone）"""
+        with self._process_lock:
+            executor = self._process_executor
+        return executor.stats() if executor else None
+    
     def is_done(self, task_id: UUID) -> bool:
         """タスクが完了しているかどうかを確認"""
-        if task_id not in self._tasks:
+        task = self._tasks.get(task_id)
+        if task is None:
+            return False
+        
+        return task.status in FINISHED_STATUSES
+    
+    def after_handlers(self, task_id: UUID, callback: Callable[[], None]) -> bool:
+        """
+        タスクとそのサブタスクのハンドラーがまだ実行中の場合、すべて終了してから callback を呼び出す
+        （スレッドで実行中のタスクは中止しても状態だけ先に確定するため、ハンドラーが使うファイルの後片付けに使う）
+        
+        Args:
+            task_id: タスクID
+            callback: ハンドラーがすべて終了したときに呼び出す関数
+            
+        Returns:
+            bool: 実行中のハンドラーがあり、終了後に呼び出す場合True（Falseの場合は呼び出さない）
+        """
+        running = [
+            future for running_id, future in list(self._futures.items())
+            if (running_id == task_id or self._running_parents.get(running_id) == task_id) and not future.done()
+        ]
+        if not running:
             return False
         
-        task = self._tasks[task_id]
-        return task.status in (TaskStatus.SUCCESS, TaskStatus.ERROR, TaskStatus.CANCELED)
+        remaining = [len(running)]
+        lock = threading.Lock()
+        
+        def stopped(_future: Future) -> None:
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            callback()
+        
+        for future in running:
+            future.add_done_callback(stopped)
+        return True
     
     def wait(self, task_id: UUID, timeout: Optional[float] = None) -> bool:
         """
@@ -165,7 +499,33 @@ class TaskQueue:
         Args:
             wait: 実行中のタスクの終了を待つかどうか
         """
+        with self._deadline_cond:
+            self._closed = True
+            self._deadline_cond.notify_all()
+        with self._dispatch_timer_lock:
+            if self._dispatch_timer is not None:
+                self._dispatch_timer.cancel()
+                self._dispatch_timer = None
+        
         self._executor.shutdown(wait=wait)
+        with self._process_lock:
+            if self._process_executor:
+                self._process_executor.shutdown(wait=wait)
+                self._process_executor = None
+    
+    def _get_process_executor(self) -> ProcessWorkerPool:
+        """プロセスバックエンドのエグゼキュータを取得（未作成なら作成）"""
+        with self._process_lock:
+            if self._process_executor is None:
+                self._process_executor = ProcessWorkerPool(
+                    max_workers=self.process_workers,
+                    initializer=self._process_initializer,
+                    initargs=self._process_initargs,
+                    max_tasks_per_worker=self.worker_max_tasks,
+                    max_rss_bytes=self.worker_max_rss,
+                    logger=self.logger
+                )
+            return self._process_executor
     
     def _execute_task(self, task: Task, workers: Optional[int] = None) -> None:
         """
@@ -179,56 +539,276 @@ class TaskQueue:
         if task.id in self._futures and not self._futures[task.id].done():
             return
         
-        # ワーカー数を決定
-        max_workers = workers or self.default_max_workers
+        # スケジューラがあれば待ち行列に入れ、空き枠の範囲で実行する
+        if self._scheduler is not None:
+            if task.status != TaskStatus.WAITING:
+                self._set_status(task, TaskStatus.WAITING)
+            self._scheduler.push(task, workers, self._lane_of(task))
+            self._dispatch()
+            return
+        
+        self._start(task, workers)
+    
+    def _start(self, task: Task, workers: Optional[int] = None) -> None:
+        """
+        タスクを処理中にして実行環境に投入（内部メソッド）
         
+        Args:
+            task: 実行するタスク
+            workers: このタスク専用のワーカー数（省略時はデフォルト値）
+        """
         # タスク状態を処理中に更新
-        task.status = TaskStatus.PROCESSING
-        task.updated_at = datetime.now()
+        task.started_at = datetime.now()
+        self._set_status(task, TaskStatus.PROCESSING)
         
-        # 専用のエグゼキュータを作成（タスクごとにワーカー数を分離）
-        if workers:
-            executor = ThreadPoolExecutor(max_workers=max_workers)
-        else:
-            executor = self._executor
+        self._submit(task, task.type, workers)
+    
+    def _lane_of(self, task: Task) -> str:
+        """タスクのレーン（サブタスクは分割元と同じレーンで実行する）"""
+        parent = self._tasks.get(task.parent_id) if task.parent_id is not None else None
+        return self._scheduler.lane_of(parent or task)
+    
+    def _dispatch(self) -> None:
+        """スケジューラから空き枠の分だけタスクを取り出して実行（内部メソッド）"""
+        while True:
+            item = self._scheduler.pop()
+            if item is None:
+                self._schedule_dispatch(self._scheduler.next_ready_in())
+                return
+            
+            task, workers = item
+            
+            # 待っている間に削除・実行されたタスクは枠を返して読み飛ばす
+            current = self._tasks.get(task.id)
+            if current is not task or task.status in (TaskStatus.PROCESSING, TaskStatus.SUCCESS):
+                self._scheduler.release(task.id)
+                continue
+            
+            try:
+                self._start(task, workers)
+            except Exception as e:
+                self._scheduler.release(task.id)
+                task.error_message = f"内部エラー: {str(e)}"
+                task.finished_at = datetime.now()
+                self._set_status(task, TaskStatus.ERROR)
+                self.logger.exception(f"タスクの投入に失敗しました: {task.id} - {str(e)}")
+    
+    def _schedule_dispatch(self, delay: Optional[float]) -> None:
+        """開始間隔で待たせているタスクが実行できるようになった時点で取り出し直す（内部メソッド）"""
+        if delay is None or self._closed:
+            return
         
-        # ハンドラーを取得して実行
-        handler = self._handlers[task.type]
+        with self._dispatch_timer_lock:
+            if self._dispatch_timer is not None and self._dispatch_timer.is_alive():
+                return
+            self._dispatch_timer = threading.Timer(delay, self._dispatch_later)
+            self._dispatch_timer.daemon = True
+            self._dispatch_timer.start()
+    
+    def _dispatch_later(self) -> None:
+        """タイマーからの取り出し直し（内部メソッド）"""
+        with self._dispatch_timer_lock:
+            self._dispatch_timer = None
+        if not self._closed:
+            self._dispatch()
+    
+    def _submit(
+        self,
+        task: Task,
+        handler_type: str,
+        workers: Optional[int] = None,
+        worker_task: Optional[Task] = None
+    ) -> None:
+        """
+        タスクをハンドラーのバックエンドに投入（内部メソッド）
+        
+        Args:
+            task: 状態を管理するタスク
+            handler_type: 実行するハンドラーのタスクタイプ
+            workers: このタスク専用のワーカー数（省略時はデフォルト値）
+            worker_task: ハンドラーに渡すタスク（省略時はtask）
+        """
+        # ハンドラーを取得
+        handler = self._handlers[handler_type]
+        dedicated: Optional[Executor] = None
+        
+        if self._backends.get(handler_type) == EXECUTOR_PROCESS:
+            # ワーカープロセスで実行（コールバックはpickleできないため除外して送る）
+            # タスクIDをキーにして、中止時にそのワーカーだけを強制終了できるようにする
+            worker_task = worker_task or task.copy(exclude={'callback'})
+            future = self._get_process_executor().submit_keyed(task.id, run_handler, worker_task, handler)
+        else:
+            # 専用のエグゼキュータを作成（タスクごとにワーカー数を分離）
+            if workers:
+                dedicated = ThreadPoolExecutor(max_workers=workers)
+            executor = dedicated or self._executor
+            
+            # タスクを実行（処理をFutureに委任、キャンセル要求はハンドラーが raise_if_cancelled() で確認）
+            cancel_event = self._cancel_events[task.id] = threading.Event()
+            future = executor.submit(self._process_task, worker_task or task, handler, cancel_event)
         
-        # タスクを実行（処理をFutureに委任）
-        future = executor.submit(self._process_task, task, handler)
         self._futures[task.id] = future
+        if task.parent_id is not None:
+            self._running_parents[task.id] = task.parent_id
         
-        # コールバック設定
+        # 制限時間があれば監視する
+        timeout = self._timeouts.get(handler_type)
+        if timeout:
+            self._watch_deadline(task.id, future, timeout)
+        
+        # コールバック設定（親プロセスで状態更新とコールバックを行う）
         future.add_done_callback(
-            lambda f: self._task_completed(task.id, f, executor if workers else None)
+            lambda f: self._task_completed(task.id, f, dedicated)
         )
     
-    def _process_task(self, task: Task, handler: TaskHandler) -> TaskResult:
+    def _set_status(self, task: Task, status: TaskStatus) -> None:
+        """
+        タスクの状態を更新してリスナーに通知
+        
+        Args:
+            task: 対象タスク
+            status: 新しい状態
+        """
+        previous = task.status
+        self._tasks.set_status(task, status)
+        self._notify(task, previous)
+    
+    def _notify(self, task: Task, previous: TaskStatus) -> None:
+        """状態変化リスナーに通知"""
+        for listener in list(self._listeners):
+            try:
+                listener(task, previous)
+            except Exception as e:
+                self.logger.exception(f"状態変化リスナー実行中のエラー: {str(e)}")
+    
+    def _process_task(self, task: Task, handler: TaskHandler, cancel_event: threading.Event) -> TaskResult:
         """
         タスク処理実行（ワーカースレッドで実行）
         
         Args:
             task: 処理するタスク
             handler: 処理ハンドラー
+            cancel_event: キャンセル要求（raise_if_cancelled() で参照）
             
         Returns:
             TaskResult: 処理結果
         """
+        _current.cancel_event = cancel_event
         try:
-            self.logger.debug(f"タスク処理開始: {task.id} ({task.name})")
-            result = handler(task)
-            return TaskResult.success(result)
-        except Exception as e:
-            error_msg = f"タスク処理エラー: {str(e)}"
-            self.logger.exception(error_msg)
-            return TaskResult.failure(error_msg)
+            return run_handler(task, handler)
+        finally:
+            _current.cancel_event = None
+    
+    def _watch_deadline(self, task_id: UUID, future: Future, timeout: float) -> None:
+        """
+        実行の制限時間を登録（監視スレッドは初回に起動）
+        
+        Args:
+            task_id: タスクID
+            future: 実行中のFuture
+            timeout: 制限時間（秒）
+        """
+        with self._deadline_cond:
+            heapq.heappush(
+                self._deadlines,
+                (time.monotonic() + timeout, next(self._deadline_sequence), task_id, future, timeout)
+            )
+            if self._watchdog is None:
+                self._watchdog = threading.Thread(target=self._watch_deadlines, name="TaskQueue-watchdog", daemon=True)
+                self._watchdog.start()
+            self._deadline_cond.notify()
+    
+    def _watch_deadlines(self) -> None:
+        """制限時間を過ぎたタスクを中止する監視スレッド"""
+        while True:
+            with self._deadline_cond:
+                while True:
+                    if self._closed:
+                        return
+                    
+                    # 完了済みの実行は読み飛ばす
+                    while self._deadlines and self._deadlines[0][3].done():
+                        heapq.heappop(self._deadlines)
+                    
+                    now = time.monotonic()
+                    if self._deadlines and self._deadlines[0][0] <= now:
+                        _, _, task_id, future, timeout = heapq.heappop(self._deadlines)
+                        break
+                    self._deadline_cond.wait(self._deadlines[0][0] - now if self._deadlines else None)
+            
+            # 同じタスクが再実行されている場合は古い実行の期限なので無視する
+            if self._futures.get(task_id) is future and not future.done():
+                self.logger.warning(f"タスクが制限時間を超えました: {task_id} ({timeout}秒)")
+                self._abort(task_id, TaskStatus.ERROR, f"タイムアウトしました（{timeout:g}秒）")
+    
+    def _abort(self, task_id: UUID, status: TaskStatus, message: str) -> bool:
+        """
+        タスクを中止して状態を確定する（内部メソッド）
+        
+        Args:
+            task_id: 中止するタスクID
+            status: 確定させる状態（キャンセルはCANCELED、タイムアウトはERROR）
+            message: エラーメッセージ
+            
+        Returns:
+            bool: 中止した場合True
+        """
+        task = self._tasks.get(task_id)
+        if task is None or task.status in FINISHED_STATUSES:
+            return False
+        
+        # 分割中のタスクはサブタスクもすべて中止（まとめは行わない）
+        with self._groups_lock:
+            group = self._groups.pop(task_id, None)
+        if group is not None:
+            for child_id in group.child_ids:
+                self._abort(child_id, status, message)
+            if not group.split.keep_subtasks:
+                for child_id in group.child_ids:
+                    self._tasks.remove(child_id)
+        
+        # スケジューラで待機中、または実行環境に投入していないタスク
+        if self._scheduler is not None and self._scheduler.remove(task_id) is not None:
+            self._finish(task, status, message)
+            return True
+        future = self._futures.get(task_id)
+        if future is None or future.done():
+            self._finish(task, status, message)
+            return True
+        
+        # 完了処理で状態を確定する
+        self._aborts[task_id] = (status, message)
+        event = self._cancel_events.get(task_id)
+        if event is not None:
+            event.set()
+        
+        # 実行前なら取り消し、プロセス実行中ならワーカーごと強制終了
+        if future.cancel():
+            return True
+        with self._process_lock:
+            process_executor = self._process_executor
+        if process_executor is not None and process_executor.kill(task_id):
+            return True
+        
+        # スレッドは止められないため状態だけ先に確定する（実行枠はハンドラーが終わるまで使用中のまま、
+        # ハンドラーが使うファイルの後片付けは after_handlers() で終了を待ってから行う）
+        self._finish(task, status, message)
+        return True
+    
+    def _finish(self, task: Task, status: TaskStatus, message: str) -> None:
+        """中止したタスクの状態を確定（内部メソッド）"""
+        task.finished_at = datetime.now()
+        task.error_message = message
+        self._set_status(task, status)
+        task.callback = None
+        if task.parent_id is not None:
+            self._subtask_finished(task)
     
     def _task_completed(
         self,
         task_id: UUID,
         future: Future,
-        executor: Optional[ThreadPoolExecutor] = None
+        executor: Optional[Executor] = None
     ) -> None:
         """
         タスク完了時の処理（コールバック）
@@ -238,39 +818,56 @@ class TaskQueue:
             future: タスク実行のFutureオブジェクト
             executor: タスク専用のエグゼキュータ（あれば）
         """
-        # Futureの登録解除
-        self._futures.pop(task_id, None)
+        # Futureの登録解除（再実行されている場合は新しい実行の登録を残す）
+        if self._futures.get(task_id) is future:
+            del self._futures[task_id]
+            self._cancel_events.pop(task_id, None)
+            self._running_parents.pop(task_id, None)
+        abort = self._aborts.pop(task_id, None)
+        
+        # スケジューラの実行枠を解放（分割元のまとめは枠を使わずに実行している）
+        released = self._scheduler is not None and self._scheduler.release(task_id)
         
         # タスク専用のエグゼキュータがあればシャットダウン
         if executor:
             executor.shutdown(wait=False)
         
         # タスクが削除されていないか確認
-        if task_id not in self._tasks:
+        task = self._tasks.get(task_id)
+        if task is None or task.status in FINISHED_STATUSES:
+            # 削除済み、またはスレッド実行中に中止して状態を確定済み
+            if released:
+                self._dispatch()
             return
         
-        task = self._tasks[task_id]
-        
         try:
-            # キャンセルされたかチェック
-            if future.cancelled():
-                task.status = TaskStatus.CANCELED
-                task.updated_at = datetime.now()
-                self.logger.debug(f"タスクがキャンセルされました: {task_id}")
+            # キャンセル・タイムアウトで中止されたかチェック
+            if future.cancelled() or (abort is not None and future.exception() is not None):
+                status, message = abort or (TaskStatus.CANCELED, None)
+                task.finished_at = datetime.now()
+                task.error_message = message
+                self._set_status(task, status)
+                self.logger.debug(f"タスクを中止しました: {task_id} - {message}")
                 return
             
             # 結果を取得
             result = future.result()
+            _apply_recording(task, result)
+            
+            # サブタスクに分割された場合は処理中のまま、すべて終わってからまとめる
+            if result.success and result.split is not None:
+                self._start_split(task, result.split)
+                return
             
             # 成功/失敗に基づいて状態を更新
+            task.finished_at = datetime.now()
             if result.success:
-                task.status = TaskStatus.SUCCESS
                 task.result = result.result
+                self._set_status(task, TaskStatus.SUCCESS)
             else:
-                task.status = TaskStatus.ERROR
                 task.error_message = result.error
+                self._set_status(task, TaskStatus.ERROR)
             
-            task.updated_at = datetime.now()
             self.logger.debug(f"タスク完了: {task_id} - 状態: {task.status}")
             
             # タスクにコールバックがある場合は実行
@@ -279,23 +876,144 @@ class TaskQueue:
                     task.callback(result)
                 except Exception as e:
                     self.logger.exception(f"タスクコールバック実行中のエラー: {str(e)}")
+                task.timings[STAGE_CALLBACK_DONE] = time.time()
+                # 完了の通知は済んでいるため、記録した計測値を保存・配信されるよう改めて通知する（状態は変わらない）
+                self._tasks.touch(task)
+                self._notify(task, task.status)
+        
+        except WorkerTerminatedError as e:
+            # ワーカープロセスが異常終了した（プール側でログ出力済み）
+            task.error_message = f"内部エラー: {e.message}"
+            task.finished_at = datetime.now()
+            self._set_status(task, TaskStatus.ERROR)
         
         except Exception as e:
             # 想定外のエラー
-            task.status = TaskStatus.ERROR
             task.error_message = f"内部エラー: {str(e)}"
-            task.updated_at = datetime.now()
+            task.finished_at = task.finished_at or datetime.now()
+            self._set_status(task, TaskStatus.ERROR)
             self.logger.exception(f"タスク完了処理中のエラー: {str(e)}")
+        
+        finally:
+            if task.status in FINISHED_STATUSES:
+                # 完了したタスクがクロージャを保持し続けないようコールバックを解放
+                task.callback = None
+                
+                # サブタスクの場合は分割元に結果を反映
+                if task.parent_id is not None:
+                    self._subtask_finished(task)
+            
+            # 空いた枠で次のタスクを実行
+            if released:
+                self._dispatch()
+    
+    def _start_split(self, task: Task, split: TaskSplit) -> None:
+        """
+        サブタスクを登録して実行する（内部メソッド）
+        
+        Args:
+            task: 分割元のタスク
+            split: ハンドラーが返した分割内容
+            
+        Raises:
+            TaskQueueError: まとめ用のハンドラーが登録されていない場合
+        """
+        if split.merge_type not in self._handlers:
+            raise TaskQueueError(f"未登録のまとめ用タスクタイプ: {split.merge_type}")
+        
+        group = _TaskGroup(task.id, split)
+        self.logger.debug(f"タスク分割: {task.id} -> {len(group.child_ids)}個のサブタスク")
+        self.set_progress(task, 0, group.total_weight, split.unit)
+        
+        if not split.subtasks:
+            self._merge(task, group)
+            return
+        
+        with self._groups_lock:
+            self._groups[task.id] = group
+        
+        for subtask in split.subtasks:
+            subtask.parent_id = task.id
+            self.add_task(subtask, execute_now=True)
+    
+    def _subtask_finished(self, subtask: Task) -> None:
+        """
+        サブタスクの完了を分割元に反映し、すべて終わったら結果をまとめる（内部メソッド）
+        
+        Args:
+            subtask: 完了したサブタスク
+        """
+        with self._groups_lock:
+            group = self._groups.get(subtask.parent_id)
+            if group is None or subtask.id not in group.index:
+                return
+            
+            index = group.index.pop(subtask.id)
+            if subtask.status == TaskStatus.SUCCESS:
+                group.results[index] = subtask.result
+            else:
+                group.errors[index] = subtask.error_message or subtask.status.value
+            group.remaining -= 1
+            group.done_weight += group.split.weights[index]
+            complete = group.remaining == 0
+            if complete:
+                del self._groups[subtask.parent_id]
+        
+        parent = self._tasks.get(subtask.parent_id)
+        if parent is None:
+            return
+        
+        self.set_progress(parent, group.done_weight, group.total_weight, group.split.unit)
+        if complete:
+            self._merge(parent, group)
+    
+    def _merge(self, task: Task, group: _TaskGroup) -> None:
+        """
+        サブタスクの結果をまとめるハンドラーを実行（内部メソッド）
+        
+        Args:
+            task: 分割元のタスク
+            group: サブタスクの実行状況
+        """
+        if not group.split.keep_subtasks:
+            for child_id in group.child_ids:
+                self._tasks.remove(child_id)
+        
+        # 分割元のペイロードは変えず、結果を加えたコピーをハンドラーに渡す
+        merge_task = task.copy(
+            update={'payload': {
+                **task.payload,
+                **group.split.merge_payload,
+                'subtask_results': group.results,
+                'subtask_errors': group.errors
+            }},
+            exclude={'callback'}
+        )
+        self._submit(task, group.split.merge_type, worker_task=merge_task)
 
 
 def create_queue(
     default_max_workers: int = 4,
     auto_start: bool = True,
-    logger: Optional[logging.Logger] = None
+    logger: Optional[logging.Logger] = None,
+    process_workers: Optional[int] = None,
+    process_initializer: Optional[Callable[..., None]] = None,
+    process_initargs: Tuple[Any, ...] = (),
+    task_store: Optional[TaskStore] = None,
+    scheduler: Optional[FairScheduler] = None,
+    worker_max_tasks: int = 0,
+    worker_max_rss: int = 0
 ) -> TaskQueue:
     """タスクキューを簡単に作成するヘルパー関数"""
     return TaskQueue(
         default_max_workers=default_max_workers,
         auto_start=auto_start,
-        logger=logger
+        logger=logger,
+        process_workers=process_workers,
+        process_initializer=process_initializer,
+        process_initargs=process_initargs,
+        task_store=task_store,
+        scheduler=scheduler,
+        worker_max_tasks=worker_max_tasks,
+        worker_max_rss=worker_max_rss
     )
\ No newline at end of file
@@ -0,0 +1,437 @@
+"""
+優先度付きの重み付き公平スケジューラ
+タスクをペイロードの値（フォルダ・クライアントなど）ごとのレーンに振り分け、
+レーン間はストライドスケジューリングで重みに応じて公平に、レーン内は優先度順に取り出す
+レーンごとの同時実行数の上限と、待ち件数・待ち時間の統計をサポート
+グループ（ペイロードの値、例: 取得先のホスト）ごとの同時実行数と開始間隔も制限できる
+"""
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from .task import Task
+
+# ストライドの基準値（重み1のレーンは1件取り出すごとにこの値だけ進む）
+_STRIDE = 1.0
+
+
+class _Entry:
+    """待機中のタスク"""
+    
+    __slots__ = ('task', 'workers', 'lane', 'group', 'sequence', 'enqueued_at', 'removed')
+    
+    def __init__(self, task: Task, workers: Optional[int], lane: str, group: Optional[str], sequence: int):
+        self.task = task
+        self.workers = workers
+        self.lane = lane
+        self.group = group
+        self.sequence = sequence
+        self.enqueued_at = time.monotonic()
+        self.removed = False
+
+
+class _Lane:
+    """
+    レーン（同じキーを持つタスクの待ち行列と統計）
+    
+    待ち行列はグループごとのヒープに分けて持ち、制限中のグループのタスクを読み飛ばしても
+    同じレーンの他のグループのタスクをグループの数だけの比較で取り出せるようにする
+    """
+    
+    def __init__(self, name: str, weight: float):
+        self.name = name
+        self.weight = weight
+        # グループ -> (-優先度, 登録順, エントリ) のヒープ（グループのないタスクはNone）
+        self.groups: Dict[Optional[str], List[Tuple[int, int, _Entry]]] = {}
+        self.queued = 0
+        self.running = 0
+        self.pass_value = 0.0
+        self.dispatched = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_active = time.monotonic()
+    
+    def push(self, entry: _Entry) -> None:
+        """エントリをグループのヒープに追加"""
+        heap = self.groups.setdefault(entry.group, [])
+        heapq.heappush(heap, (-entry.task.priority, entry.sequence, entry))
+    
+    def group_head(self, group: Optional[str]) -> Optional[_Entry]:
+        """グループの先頭の待機中エントリ（削除済みは読み飛ばし、空になったヒープは破棄）"""
+        heap = self.groups.get(group)
+        while heap and heap[0][2].removed:
+            heapq.heappop(heap)
+        if not heap:
+            self.groups.pop(group, None)
+            return None
+        return heap[0][2]
+    
+    def heads(self) -> List[Tuple[Optional[str], _Entry]]:
+        """グループごとの先頭の待機中エントリ"""
+        heads = []
+        for group in list(self.groups):
+            entry = self.group_head(group)
+            if entry is not None:
+                heads.append((group, entry))
+        return heads
+    
+    def head(self) -> Optional[_Entry]:
+        """レーン全体の先頭の待機中エントリ"""
+        return min(
+            (entry for _, entry in self.heads()),
+            key=lambda entry: (-entry.task.priority, entry.sequence),
+            default=None
+        )
+    
+    def take(self, entry: _Entry) -> None:
+        """グループの先頭のエントリをヒープから取り出す"""
+        heapq.heappop(self.groups[entry.group])
+        if not self.groups[entry.group]:
+            del self.groups[entry.group]
+    
+    def entries(self) -> List[_Entry]:
+        """待機中のエントリ（順不同）"""
+        return [entry for heap in self.groups.values() for _, _, entry in heap if not entry.removed]
+
+
+class FairScheduler:
+    """レーン間の公平性と優先度を考慮してタスクの実行順を決めるスケジューラ"""
+    
+    def __init__(
+        self,
+        max_running: int,
+        max_running_per_lane: Optional[int] = None,
+        lane_keys: Sequence[str] = ("folder",),
+        weights: Optional[Dict[str, float]] = None,
+        default_lane: str = "default",
+        idle_lane_ttl: float = 600,
+        group_key: Optional[str] = None,
+        max_running_per_group: Optional[int] = None,
+        group_interval: float = 0
+    ):
+        """
+        スケジューラの初期化
+        
+        Args:
+            max_running: 全体の同時実行数
+            max_running_per_lane: レーンごとの同時実行数の上限（None=上限なし）
+            lane_keys: レーン名に使うペイロードのキー（値を "/" でつないでレーン名にする）
+            weights: レーンの重み（レーン名、またはレーン名の先頭の値をキーにする。省略時は1）
+            default_lane: キーの値がない場合に使う値
+            idle_lane_ttl: 待機・実行中のタスクがないレーンの統計を保持する秒数
+            group_key: 同時実行数と開始間隔を制限するグループのペイロードのキー（値のないタスクは制限しない）
+            max_running_per_group: グループごとの同時実行数の上限（None=上限なし）
+            group_interval: 同じグループのタスクを開始する最小間隔（秒）
+        """
+        self.max_running = max(1, max_running)
+        self.max_running_per_lane = max_running_per_lane if max_running_per_lane and max_running_per_lane > 0 else None
+        self.lane_keys = tuple(lane_keys)
+        self.weights = dict(weights or {})
+        self.default_lane = default_lane
+        self.idle_lane_ttl = idle_lane_ttl
+        self.group_key = group_key
+        self.max_running_per_group = max_running_per_group if max_running_per_group and max_running_per_group > 0 else None
+        self.group_interval = max(0.0, group_interval)
+        
+        self._lock = threading.RLock()
+        self._lanes: Dict[str, _Lane] = {}
+        self._entries: Dict[UUID, _Entry] = {}
+        # 実行中のタスク（ID -> (レーン名, グループ)）
+        self._running: Dict[UUID, Tuple[str, Optional[str]]] = {}
+        # グループごとの実行中のタスク数と最後に開始した時刻
+        self._group_running: Dict[str, int] = {}
+        self._group_started: Dict[str, float] = {}
+        # グループの開始間隔のために待たせているタスクが実行できるようになる時刻
+        self._ready_at: Optional[float] = None
+        self._sequence = itertools.count()
+        # 仮想時間（最後に取り出したレーンのパス値、新しく動き出したレーンの起点にする）
+        self._virtual_time = 0.0
+    
+    def lane_of(self, task: Task) -> str:
+        """
+        タスクのレーン名を求める
+        
+        Args:
+            task: 対象タスク
+        
+        Returns:
+            str: レーン名（例: "report/192.0.2.10"）
+        """
+        payload = task.payload or {}
+        values = []
+        for key in self.lane_keys:
+            value = payload.get(key)
+            values.append(str(value) if value not in (None, '') else self.default_lane)
+        return '/'.join(values) or self.default_lane
+    
+    def push(
+        self,
+        task: Task,
+        workers: Optional[int] = None,
+        lane: Optional[str] = None
+    ) -> str:
+        """
+        タスクを待ち行列に追加
+        
+        Args:
+            task: 追加するタスク
+            workers: このタスク専用のワーカー数（取り出し時にそのまま返す）
+            lane: レーン名（省略時はペイロードから求める）
+        
+        Returns:
+            str: 追加したレーン名
+        """
+        lane_name = lane or self.lane_of(task)
+        with self._lock:
+            if task.id in self._entries or task.id in self._running:
+                return lane_name
+            
+            self._prune_idle_lanes()
+            target = self._lanes.get(lane_name)
+            if target is None:
+                target = self._lanes[lane_name] = _Lane(lane_name, self._weight_of(lane_name))
+            
+            # しばらく空だったレーンが溜め込んだ分だけ割り込まないよう、パス値を仮想時間に揃える
+            if target.queued == 0 and target.running == 0:
+                target.pass_value = max(target.pass_value, self._virtual_time)
+            
+            entry = _Entry(task, workers, lane_name, self._group_of(task), next(self._sequence))
+            target.push(entry)
+            target.queued += 1
+            target.last_active = time.monotonic()
+            self._entries[task.id] = entry
+            return lane_name
+    
+    def pop(self) -> Optional[Tuple[Task, Optional[int]]]:
+        """
+        次に実行するタスクを取り出して実行中にする
+        優先度の最も高いタスクを持つレーンのうち、パス値の最も小さいレーンから取り出す
+        
+        Returns:
+            (タスク, ワーカー数)。空き枠がないか、実行できるタスクがない場合はNone
+        """
+        with self._lock:
+            if len(self._running) >= self.max_running:
+                return None
+            
+            now = time.monotonic()
+            self._ready_at = None
+            best: Optional[Tuple[Tuple[int, float, int], _Lane, _Entry]] = None
+            for lane in self._lanes.values():
+                if lane.queued == 0:
+                    continue
+                if self.max_running_per_lane is not None and lane.running >= self.max_running_per_lane:
+                    continue
+                entry = self._next_in_lane(lane, now)
+                if entry is None:
+                    continue
+                # 同じ優先度・パス値のレーンは先頭のタスクの登録順で選ぶ
+                key = (-entry.task.priority, lane.pass_value, entry.sequence)
+                if best is None or key < best[0]:
+                    best = (key, lane, entry)
+            
+            if best is None:
+                return None
+            
+            _, lane, entry = best
+            lane.take(entry)
+            del self._entries[entry.task.id]
+            
+            wait = now - entry.enqueued_at
+            lane.queued -= 1
+            lane.running += 1
+            lane.dispatched += 1
+            lane.total_wait += wait
+            lane.max_wait = max(lane.max_wait, wait)
+            lane.last_active = now
+            self._virtual_time = lane.pass_value
+            lane.pass_value += _STRIDE / lane.weight
+            self._running[entry.task.id] = (lane.name, entry.group)
+            if entry.group is not None:
+                self._group_running[entry.group] = self._group_running.get(entry.group, 0) + 1
+                self._group_started[entry.group] = now
+            return entry.task, entry.workers
+    
+    def next_ready_in(self) -> Optional[float]:
+        """
+        グループの開始間隔のために待たせているタスクが、実行できるようになるまでの秒数
+        （直前の pop() がNoneを返した場合に、呼び出し側が再度 pop() する時期を決めるのに使う）
+        
+        Returns:
+            秒数（開始間隔で待たせているタスクがなければNone）
+        """
+        with self._lock:
+            if self._ready_at is None:
+                return None
+            return max(0.0, self._ready_at - time.monotonic())
+    
+    def release(self, task_id: UUID) -> bool:
+        """
+        実行の終わったタスクの枠を解放
+        
+        Args:
+            task_id: タスクID
+        
+        Returns:
+            bool: 実行中として管理していたタスクだった場合True
+        """
+        with self._lock:
+            running = self._running.pop(task_id, None)
+            if running is None:
+                return False
+            lane_name, group = running
+            if group is not None:
+                remaining = self._group_running.get(group, 1) - 1
+                if remaining > 0:
+                    self._group_running[group] = remaining
+                else:
+                    self._group_running.pop(group, None)
+            lane = self._lanes.get(lane_name)
+            if lane is not None:
+                lane.running -= 1
+                lane.last_active = time.monotonic()
+            return True
+    
+    def remove(self, task_id: UUID) -> Optional[Task]:
+        """
+        待機中のタスクを待ち行列から外す
+        
+        Args:
+            task_id: タスクID
+        
+        Returns:
+            外したタスク（待機中でなければNone）
+        """
+        with self._lock:
+            entry = self._entries.pop(task_id, None)
+            if entry is None:
+                return None
+            entry.removed = True
+            lane = self._lanes.get(entry.lane)
+            if lane is not None:
+                lane.queued -= 1
+            return entry.task
+    
+    def is_queued(self, task_id: UUID) -> bool:
+        """タスクが待ち行列にあるかどうか"""
+        with self._lock:
+            return task_id in self._entries
+    
+    def position(self, task_id: UUID) -> Optional[int]:
+        """
+        レーン内の待ち順位を取得（0始まり）
+        
+        Args:
+            task_id: タスクID
+        
+        Returns:
+            順位（待機中でなければNone）
+        """
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is None:
+                return None
+            target = (-entry.task.priority, entry.sequence)
+            return sum(
+                1 for other in self._lanes[entry.lane].entries()
+                if (-other.task.priority, other.sequence) < target
+            )
+    
+    @property
+    def queued(self) -> int:
+        """待機中のタスク数"""
+        with self._lock:
+            return len(self._entries)
+    
+    @property
+    def running(self) -> int:
+        """実行中のタスク数"""
+        with self._lock:
+            return len(self._running)
+    
+    def stats(self) -> Dict[str, Any]:
+        """スケジューラとレーンごとの統計情報を返す"""
+        now = time.monotonic()
+        with self._lock:
+            lanes = []
+            for lane in sorted(self._lanes.values(), key=lambda lane: lane.name):
+                head = lane.head()
+                oldest = min(
+                    (entry.enqueued_at for entry in lane.entries()),
+                    default=None
+                )
+                lanes.append({
+                    'lane': lane.name,
+                    'weight': lane.weight,
+                    'queued': lane.queued,
+                    'running': lane.running,
+                    'dispatched': lane.dispatched,
+                    'avg_wait': round(lane.total_wait / lane.dispatched, 3) if lane.dispatched else None,
+                    'max_wait': round(lane.max_wait, 3),
+                    'oldest_wait': round(now - oldest, 3) if oldest is not None else None,
+                    'next_priority': head.task.priority if head else None
+                })
+            return {
+                'max_running': self.max_running,
+                'max_running_per_lane': self.max_running_per_lane,
+                'lane_keys': list(self.lane_keys),
+                'group_key': self.group_key,
+                'max_running_per_group': self.max_running_per_group,
+                'group_interval': self.group_interval,
+                'running_groups': dict(self._group_running),
+                'queued': len(self._entries),
+                'running': len(self._running),
+                'lanes': lanes
+            }
+    
+    def _group_of(self, task: Task) -> Optional[str]:
+        """タスクのグループ（グループのキーがないか値がなければNone）"""
+        if self.group_key is None:
+            return None
+        value = (task.payload or {}).get(self.group_key)
+        return str(value) if value not in (None, '') else None
+    
+    def _group_available(self, group: Optional[str], now: float) -> bool:
+        """グループのタスクを今開始できるか（開始間隔で待たせる場合は再開時刻を記録、ロック取得済みで呼び出す）"""
+        if group is None:
+            return True
+        if self.max_running_per_group is not None and self._group_running.get(group, 0) >= self.max_running_per_group:
+            return False
+        if self.group_interval:
+            ready_at = self._group_started.get(group, float('-inf')) + self.group_interval
+            if ready_at > now:
+                self._ready_at = ready_at if self._ready_at is None else min(self._ready_at, ready_at)
+                return False
+        return True
+    
+    def _next_in_lane(self, lane: _Lane, now: float) -> Optional[_Entry]:
+        """
+        レーン内で次に実行できるエントリ（ロック取得済みで呼び出す）
+        グループごとの先頭のうち、制限中でないグループの最も優先度の高いエントリを選ぶ
+        """
+        best: Optional[_Entry] = None
+        for group, entry in lane.heads():
+            if best is not None and (-entry.task.priority, entry.sequence) >= (-best.task.priority, best.sequence):
+                continue
+            if self._group_available(group, now):
+                best = entry
+        return best
+    
+    def _weight_of(self, lane_name: str) -> float:
+        """レーンの重み（レーン名→先頭の値の順に探す）"""
+        weight = self.weights.get(lane_name)
+        if weight is None:
+            weight = self.weights.get(lane_name.split('/', 1)[0], 1)
+        return max(float(weight), 0.01)
+    
+    def _prune_idle_lanes(self) -> None:
+        """しばらく使われていない空のレーンを破棄（ロック取得済みで呼び出す）"""
+        now = time.monotonic()
+        for name in [
+            name for name, lane in self._lanes.items()
+            if lane.queued == 0 and lane.running == 0 and now - lane.last_active > self.idle_lane_ttl
+        ]:
+            del self._lanes[name]
@@ -0,0 +1,352 @@
+"""
+保持ポリシー付きのタスクストア
+ID・状態・フォルダでの索引と、古い完了タスクのアーカイブをサポート
+変更ごとにバージョンを採番し、指定バージョン以降の差分を取得できる
+"""
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+
+from .task import Task, TaskStatus
+
+# 完了扱いの状態
+FINISHED_STATUSES = (TaskStatus.SUCCESS, TaskStatus.ERROR, TaskStatus.CANCELED)
+
+
+class TaskChanges:
+    """指定バージョン以降のタスクの差分"""
+    
+    def __init__(
+        self,
+        tasks: List[Task],
+        removed: List[UUID],
+        version: int,
+        reset: bool = False,
+        has_more: bool = False
+    ):
+        self.tasks = tasks
+        self.removed = removed
+        self.version = version
+        self.reset = reset
+        self.has_more = has_more
+
+
+class TaskStore:
+    """タスクの保持と索引を行うストア"""
+    
+    def __init__(
+        self,
+        max_finished: Optional[int] = 1000,
+        finished_ttl: Optional[float] = None,
+        archive_path: Optional[str] = None,
+        folder_key: str = "folder",
+        logger: Optional[logging.Logger] = None,
+        max_removals: int = 10000
+    ):
+        """
+        タスクストアの初期化
+        
+        Args:
+            max_finished: 保持する完了タスクの最大数（None=無制限）
+            finished_ttl: 完了タスクを保持する秒数（None=無制限）
+            archive_path: 破棄したタスクを追記するJSON Linesファイル（None=アーカイブしない）
+            folder_key: フォルダ索引に使うペイロードのキー
+            logger: カスタムロガー（省略可）
+            max_removals: 差分取得用に記録しておく削除履歴の件数
+        """
+        self.max_finished = max_finished
+        self.finished_ttl = finished_ttl
+        self.archive_path = archive_path
+        self.folder_key = folder_key
+        self.logger = logger or logging.getLogger(__name__)
+        
+        self._lock = threading.RLock()
+        self._tasks: Dict[UUID, Task] = {}
+        self._by_status: Dict[TaskStatus, Set[UUID]] = {status: set() for status in TaskStatus}
+        self._by_folder: Dict[str, Set[UUID]] = {}
+        self._by_parent: Dict[UUID, Set[UUID]] = {}
+        # 完了した順に並べた完了タスク（ID -> 完了日時）
+        self._finished: "OrderedDict[UUID, datetime]" = OrderedDict()
+        self.archived_count = 0
+        
+        # 差分取得用のバージョン管理（変更順に並べたID -> 変更時のバージョン）
+        # epochはストアの生成ごとに変わり、再起動後の古いバージョンを見分けるために使う
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        self._changes: "OrderedDict[UUID, int]" = OrderedDict()
+        self._removals: Deque[Tuple[int, UUID]] = deque()
+        self._max_removals = max(1, max_removals)
+        # これ以前のバージョンからは削除履歴を辿れない
+        self._removals_floor = 0
+    
+    def __len__(self) -> int:
+        return len(self._tasks)
+    
+    def __contains__(self, task_id: object) -> bool:
+        return task_id in self._tasks
+    
+    def add(self, task: Task) -> None:
+        """タスクを登録（同じIDがあれば置き換え）"""
+        with self._lock:
+            if task.id in self._tasks:
+                self._unindex(self._tasks[task.id])
+            self._tasks[task.id] = task
+            self._index(task)
+            self._mark_changed(task.id)
+            if task.status in FINISHED_STATUSES:
+                self._finished[task.id] = task.updated_at
+        self.prune()
+    
+    def get(self, task_id: UUID) -> Optional[Task]:
+        """タスクIDによりタスクを取得"""
+        return self._tasks.get(task_id)
+    
+    def remove(self, task_id: UUID) -> Optional[Task]:
+        """タスクを削除（アーカイブはしない）"""
+        with self._lock:
+            task = self._tasks.pop(task_id, None)
+            if task:
+                self._unindex(task)
+                self._finished.pop(task_id, None)
+                self._mark_removed(task_id)
+            return task
+    
+    def values(self) -> List[Task]:
+        """保持しているすべてのタスク"""
+        with self._lock:
+            return list(self._tasks.values())
+    
+    def set_status(self, task: Task, status: TaskStatus) -> None:
+        """
+        タスクの状態を更新して索引を付け替える
+        
+        Args:
+            task: 対象タスク
+            status: 新しい状態
+        """
+        with self._lock:
+            if task.id in self._tasks:
+                self._by_status[task.status].discard(task.id)
+                self._by_status[status].add(task.id)
+            
+            task.status = status
+            task.updated_at = datetime.now()
+            
+            if task.id in self._tasks:
+                self._mark_changed(task.id)
+                
+                # 完了タスクは完了順の末尾に移動する
+                self._finished.pop(task.id, None)
+                if status in FINISHED_STATUSES:
+                    self._finished[task.id] = task.updated_at
+        
+        if status in FINISHED_STATUSES:
+            self.prune()
+    
+    def touch(self, task: Task) -> None:
+        """状態以外（結果や進捗など）が更新されたタスクを変更済みとして記録"""
+        with self._lock:
+            task.updated_at = datetime.now()
+            if task.id in self._tasks:
+                self._mark_changed(task.id)
+    
+    def changes_since(self, since: int, limit: Optional[int] = None) -> TaskChanges:
+        """
+        指定バージョンより後に変更・削除されたタスクを取得する
+        
+        Args:
+            since: クライアントが最後に受け取ったバージョン
+            limit: 1回で返す変更タスクの最大数（省略時は無制限）
+            
+        Returns:
+            TaskChanges: 変更されたタスク（変更順）と削除されたID
+        """
+        with self._lock:
+            # サーバー再起動や削除履歴の欠落で差分が作れない場合は全件を返す
+            if since > self.version or since < self._removals_floor:
+                tasks = sorted(self._tasks.values(), key=lambda task: task.created_at)
+                return TaskChanges(tasks, [], self.version, reset=True)
+            
+            # 変更順の末尾から遡るので、コストは変更件数に比例する
+            changed: List[Tuple[int, UUID]] = []
+            for task_id, version in reversed(self._changes.items()):
+                if version <= since:
+                    break
+                changed.append((version, task_id))
+            changed.reverse()
+            
+            upto = self.version
+            has_more = False
+            if limit is not None and len(changed) > limit:
+                changed = changed[:limit]
+                upto = changed[-1][0]
+                has_more = True
+            
+            removed: List[UUID] = []
+            for version, task_id in reversed(self._removals):
+                if version <= since:
+                    break
+                if version <= upto:
+                    removed.append(task_id)
+            removed.reverse()
+            tasks = [self._tasks[task_id] for _, task_id in changed]
+            return TaskChanges(tasks, removed, upto, has_more=has_more)
+    
+    def by_status(self, *statuses: TaskStatus) -> List[Task]:
+        """指定した状態のタスクを取得"""
+        with self._lock:
+            return [
+                self._tasks[task_id]
+                for status in statuses
+                for task_id in self._by_status[status]
+            ]
+    
+    def by_folder(self, folder: str) -> List[Task]:
+        """指定したフォルダのタスクを取得"""
+        with self._lock:
+            return [self._tasks[task_id] for task_id in self._by_folder.get(folder, ())]
+    
+    def children(self, parent_id: UUID) -> List[Task]:
+        """指定したタスクのサブタスクを取得（登録日時順）"""
+        with self._lock:
+            tasks = [self._tasks[task_id] for task_id in self._by_parent.get(parent_id, ())]
+        return sorted(tasks, key=lambda task: task.created_at)
+    
+    def count_by_status(self) -> Dict[str, int]:
+        """状態ごとのタスク数"""
+        with self._lock:
+            return {status.value: len(ids) for status, ids in self._by_status.items()}
+    
+    def prune(self, now: Optional[datetime] = None) -> int:
+        """
+        保持ポリシーに従って古い完了タスクを破棄する
+        
+        Args:
+            now: 基準日時（省略時は現在日時）
+        
+        Returns:
+            int: 破棄したタスク数
+        """
+        now = now or datetime.now()
+        evicted: List[Task] = []
+        
+        with self._lock:
+            # TTLを超えた完了タスク（完了順に並んでいるので先頭から確認）
+            if self.finished_ttl is not None:
+                deadline = now - timedelta(seconds=self.finished_ttl)
+                while self._finished:
+                    task_id, finished_at = next(iter(self._finished.items()))
+                    if finished_at > deadline:
+                        break
+                    evicted.append(self._evict(task_id))
+            
+            # 件数上限を超えた完了タスク
+            if self.max_finished is not None:
+                while len(self._finished) > self.max_finished:
+                    task_id = next(iter(self._finished))
+                    evicted.append(self._evict(task_id))
+        
+        if evicted:
+            self._archive(evicted)
+        return len(evicted)
+    
+    def stats(self) -> Dict[str, Any]:
+        """ストアの統計情報を返す"""
+        with self._lock:
+            return {
+                'tasks': len(self._tasks),
+                'finished': len(self._finished),
+                'archived': self.archived_count,
+                'epoch': self.epoch,
+                'version': self.version,
+                'by_status': self.count_by_status(),
+                'max_finished': self.max_finished,
+                'finished_ttl': self.finished_ttl
+            }
+    
+    def _folder_of(self, task: Task) -> Optional[str]:
+        """タスクのフォルダ（ペイロードから取得）"""
+        folder = task.payload.get(self.folder_key) if task.payload else None
+        return folder if isinstance(folder, str) else None
+    
+    def _mark_changed(self, task_id: UUID) -> None:
+        """バージョンを進めてタスクを変更順の末尾に移動（ロック取得済みで呼び出す）"""
+        self.version += 1
+        self._changes.pop(task_id, None)
+        self._changes[task_id] = self.version
+    
+    def _mark_removed(self, task_id: UUID) -> None:
+        """バージョンを進めて削除履歴に記録（ロック取得済みで呼び出す）"""
+        self.version += 1
+        self._changes.pop(task_id, None)
+        if len(self._removals) >= self._max_removals:
+            self._removals_floor = self._removals.popleft()[0]
+        self._removals.append((self.version, task_id))
+    
+    def _index(self, task: Task) -> None:
+        """索引にタスクを追加"""
+        self._by_status[task.status].add(task.id)
+        folder = self._folder_of(task)
+        if folder is not None:
+            self._by_folder.setdefault(folder, set()).add(task.id)
+        if task.parent_id is not None:
+            self._by_parent.setdefault(task.parent_id, set()).add(task.id)
+    
+    def _unindex(self, task: Task) -> None:
+        """索引からタスクを削除"""
+        self._by_status[task.status].discard(task.id)
+        folder = self._folder_of(task)
+        if folder is not None and folder in self._by_folder:
+            self._by_folder[folder].discard(task.id)
+            if not self._by_folder[folder]:
+                del self._by_folder[folder]
+        if task.parent_id is not None and task.parent_id in self._by_parent:
+            self._by_parent[task.parent_id].discard(task.id)
+            if not self._by_parent[task.parent_id]:
+                del self._by_parent[task.parent_id]
+    
+    def _evict(self, task_id: UUID) -> Task:
+        """ストアからタスクを取り除く（ロック取得済みで呼び出す）"""
+        self._finished.pop(task_id, None)
+        task = self._tasks.pop(task_id)
+        self._unindex(task)
+        self._mark_removed(task_id)
+        self.archived_count += 1
+        return task
+    
+    def _archive(self, tasks: Iterable[Task]) -> None:
+        """破棄したタスクの要約をJSON Linesで追記する"""
+        if not self.archive_path:
+            return
+        
+        try:
+            os.makedirs(os.path.dirname(self.archive_path) or '.', exist_ok=True)
+            with open(self.archive_path, 'a', encoding='utf-8') as f:
+                for task in tasks:
+                    f.write(json.dumps(self._summarize(task), ensure_ascii=False, default=str))
+                    f.write('\n')
+        except OSError as e:
+            self.logger.warning(f"タスクのアーカイブに失敗しました: {str(e)}")
+    
+    def _summarize(self, task: Task) -> Dict[str, Any]:
+        """アーカイブ用にペイロードやコールバックを除いたタスクの要約"""
+        record: Dict[str, Any] = {
+            'id': str(task.id),
+            'type': task.type,
+            'name': task.name,
+            'status': task.status.value,
+            'folder': self._folder_of(task),
+            'created_at': task.created_at.isoformat(),
+            'updated_at': task.updated_at.isoformat()
+        }
+        if task.error_message:
+            record['error'] = task.error_message
+        if isinstance(task.result, dict):
+            record['result'] = task.result
+        return record
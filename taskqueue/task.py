@@ -5,7 +5,7 @@ from __future__ import annotations
 
 from datetime import datetime
 from enum import Enum
-from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+from typing import Any, Callable, Dict, Generic, List, Optional, TypeVar
 from uuid import UUID, uuid4
 
 from pydantic import BaseModel, Field
@@ -33,25 +33,77 @@ class Task(BaseModel):
     status: TaskStatus = Field(default=TaskStatus.WAITING)
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
     error_message: Optional[str] = None
     result: Optional[Any] = None
+    # 優先度（大きいほど先に実行、スケジューラ使用時のみ有効）
+    priority: int = 0
+    # 見積もりコスト（受け付け制御で処理待ちの量を数えるのに使用）
+    cost: float = 1.0
+    # サブタスクの場合は分割元のタスクID
+    parent_id: Optional[UUID] = None
+    # 進捗（done / total / unit）
+    progress: Optional[Dict[str, Any]] = None
+    # 処理段階ごとの時刻（段階名 -> UNIX時間）
+    timings: Dict[str, float] = Field(default_factory=dict)
+    # 実行時の計測値（CPU時間・ピークRSS・入出力のバイト数など）
+    metrics: Dict[str, Any] = Field(default_factory=dict)
     callback: Optional[Callable[[TaskResult], None]] = None
     
     class Config:
         arbitrary_types_allowed = True
 
 
+class TaskSplit:
+    """
+    タスクのサブタスクへの分割
+    
+    サブタスクはワーカーで並列に実行され、すべて終わると分割元のタスクを
+    merge_type のハンドラーで実行する（ペイロードに各サブタスクの結果が入る）
+    """
+    def __init__(
+        self,
+        subtasks: List[Task],
+        merge_type: str,
+        weights: Optional[List[int]] = None,
+        unit: str = "tasks",
+        keep_subtasks: bool = False,
+        merge_payload: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Args:
+            subtasks: サブタスク（この順序で結果を受け取る）
+            merge_type: 結果をまとめるハンドラーのタスクタイプ
+            weights: 進捗計算用の各サブタスクの重み（省略時はすべて1）
+            unit: 進捗の単位（"pages" など）
+            keep_subtasks: まとめた後もサブタスクをストアに残すかどうか
+            merge_payload: まとめる際にペイロードに加える値（分割時に求めた情報の受け渡し用）
+        """
+        self.subtasks = subtasks
+        self.merge_type = merge_type
+        self.weights = weights or [1] * len(subtasks)
+        self.unit = unit
+        self.keep_subtasks = keep_subtasks
+        self.merge_payload = merge_payload or {}
+
+
 class TaskResult(Generic[R]):
     """タスク実行結果"""
     def __init__(
         self,
         success: bool,
         result: Optional[R] = None,
-        error: Optional[str] = None
+        error: Optional[str] = None,
+        split: Optional[TaskSplit] = None
     ):
         self.success = success
         self.result = result
         self.error = error
+        self.split = split
+        # ハンドラーの実行中の記録（run_handler が設定し、親プロセスでタスクに反映する）
+        self.timings: Dict[str, float] = {}
+        self.metrics: Dict[str, Any] = {}
 
     @classmethod
     def success(cls, result: Optional[R] = None) -> TaskResult[R]:
@@ -61,4 +113,17 @@ class TaskResult(Generic[R]):
     @classmethod
     def failure(cls, error: str) -> TaskResult[R]:
         """失敗結果を作成"""
-        return cls(False, None, error)
\ No newline at end of file
+        return cls(False, None, error)
+    
+    @classmethod
+    def split_into(
+        cls,
+        subtasks: List[Task],
+        merge_type: str,
+        weights: Optional[List[int]] = None,
+        unit: str = "tasks",
+        keep_subtasks: bool = False,
+        merge_payload: Optional[Dict[str, Any]] = None
+    ) -> TaskResult[R]:
+        """サブタスクへの分割結果を作成（タスクは処理中のまま）"""
+        return cls(True, split=TaskSplit(subtasks, merge_type, weights, unit, keep_subtasks, merge_payload))
\ No newline at end of file
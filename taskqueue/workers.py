@@ -0,0 +1,359 @@
+"""
+タスク単位で強制終了できるワーカープロセスのプール
+ProcessPoolExecutor と違い、実行中のタスクのワーカーだけを終了して作り直せる（タイムアウト・キャンセル用）
+一定数のタスクを処理したワーカーや、メモリ使用量（RSS）がしきい値を超えたワーカーは入れ替える
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .exceptions import WorkerTerminatedError
+from .instrument import current_rss
+
+# ワーカーの終了を待つ秒数（超えたら強制終了）
+_STOP_TIMEOUT = 5.0
+
+# 待機中のワーカーが親プロセスの生存を確認する間隔（秒）
+_PARENT_CHECK_INTERVAL = 1.0
+
+# ワーカープロセスの起動方法（ジャーナル・検索索引の書き込みやディスパッチのスレッドが動いているプロセスから
+# fork すると、ほかのスレッドが保持していたロックを引き継いでワーカーが止まることがあるため spawn にする）
+_START_METHOD = 'spawn'
+
+
+def _worker_main(conn, initializer: Optional[Callable[..., None]], initargs: Tuple[Any, ...]) -> None:
+    """
+    ワーカープロセスの本体（関数を受け取って実行し、結果とRSSを返す）
+    
+    Args:
+        conn: 親プロセスとのパイプ
+        initializer: 起動時に実行する初期化関数
+        initargs: 初期化関数の引数
+    """
+    if initializer is not None:
+        initializer(*initargs)
+    
+    parent = os.getppid()
+    while True:
+        try:
+            # 親プロセスが異常終了した場合に残り続けないよう、待機中は親の生存を確認する
+            # （後から起動したワーカーが他のワーカーのパイプを引き継ぐため、EOFだけでは検知できない）
+            while not conn.poll(_PARENT_CHECK_INTERVAL):
+                if os.getppid() != parent:
+                    return
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        
+        fn, args, kwargs = message
+        try:
+            reply = (True, fn(*args, **kwargs))
+        except BaseException as e:
+            reply = (False, e)
+        
+        try:
+            conn.send((*reply, current_rss()))
+        except Exception as e:
+            # 結果をpickleできない場合は例外として返す
+            conn.send((False, WorkerTerminatedError(f"結果を返せませんでした: {str(e)}"), current_rss()))
+
+
+class _WorkItem:
+    """投入された処理"""
+    
+    __slots__ = ('key', 'fn', 'args', 'kwargs', 'future')
+    
+    def __init__(self, key: Optional[Hashable], fn: Callable[..., Any], args: Tuple[Any, ...], kwargs: Dict[str, Any]):
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+
+
+class _Worker:
+    """ワーカープロセスとその状態（親プロセス側）"""
+    
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.tasks_done = 0
+        self.rss = 0
+        self.current: Optional[_WorkItem] = None
+        self.killed = False
+
+
+class ProcessWorkerPool(Executor):
+    """タスク単位の強制終了とワーカーの入れ替えに対応したプロセスプール"""
+    
+    def __init__(
+        self,
+        max_workers: int,
+        initializer: Optional[Callable[..., None]] = None,
+        initargs: Tuple[Any, ...] = (),
+        max_tasks_per_worker: int = 0,
+        max_rss_bytes: int = 0,
+        mp_context: Optional[Any] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        プロセスプールの初期化（ワーカープロセスはすぐに起動する）
+        
+        Args:
+            max_workers: ワーカープロセス数
+            initializer: ワーカープロセス起動時に実行する初期化関数（省略可）
+            initargs: 初期化関数の引数
+            max_tasks_per_worker: この数のタスクを処理したワーカーを入れ替える（0=入れ替えない）
+            max_rss_bytes: タスク処理後のRSSがこの値を超えたワーカーを入れ替える（0=入れ替えない）
+            mp_context: multiprocessing のコンテキスト（省略時は spawn）
+            logger: カスタムロガー（省略可）
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.max_rss_bytes = max_rss_bytes
+        self.logger = logger or logging.getLogger(__name__)
+        self._initializer = initializer
+        self._initargs = initargs
+        self._context = mp_context or multiprocessing.get_context(_START_METHOD)
+        
+        self._queue: "queue.Queue[Optional[_WorkItem]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers: List[Optional[_Worker]] = [None] * self.max_workers
+        # 実行中の処理のキー -> ワーカー
+        self._running: Dict[Hashable, _Worker] = {}
+        self._shutdown = False
+        
+        # 統計
+        self.completed = 0
+        self.recycled = 0
+        self.killed = 0
+        self.crashed = 0
+        
+        self._threads = [
+            threading.Thread(target=self._manage, args=(slot,), name=f"ProcessWorkerPool-{slot}", daemon=True)
+            for slot in range(self.max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+    
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """処理を投入（キーなし、強制終了の対象にならない）"""
+        return self.submit_keyed(None, fn, *args, **kwargs)
+    
+    def submit_keyed(self, key: Optional[Hashable], fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """
+        キー付きで処理を投入
+        
+        Args:
+            key: kill() で指定するキー（タスクIDなど）
+            fn: ワーカープロセスで実行する関数（pickle可能なモジュールレベル関数）
+        
+        Returns:
+            Future: 処理結果
+        
+        Raises:
+            RuntimeError: シャットダウン後に投入された場合
+        """
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("シャットダウン後のプールには投入できません")
+            item = _WorkItem(key, fn, args, kwargs)
+            self._queue.put(item)
+        return item.future
+    
+    def kill(self, key: Hashable) -> bool:
+        """
+        指定したキーの処理を実行中のワーカーを強制終了する
+        （Futureは WorkerTerminatedError で完了し、ワーカーは作り直される）
+        
+        Args:
+            key: submit_keyed() で指定したキー
+        
+        Returns:
+            bool: 実行中の処理があった場合True
+        """
+        with self._lock:
+            worker = self._running.get(key)
+            if worker is None:
+                return False
+            worker.killed = True
+            self.killed += 1
+        
+        self.logger.warning(f"ワーカープロセスを強制終了します: pid={worker.process.pid} ({key})")
+        worker.process.kill()
+        return True
+    
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        """
+        プールをシャットダウン
+        
+        Args:
+            wait: 実行中の処理とワーカーの終了を待つかどうか
+            cancel_futures: 待機中の処理をキャンセルするかどうか
+        """
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+        
+        if cancel_futures:
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item.future.cancel()
+        
+        for _ in self._threads:
+            self._queue.put(None)
+        
+        if wait:
+            for thread in self._threads:
+                thread.join()
+    
+    def stats(self) -> Dict[str, Any]:
+        """プールの統計情報を返す"""
+        with self._lock:
+            workers = [
+                {
+                    'pid': worker.process.pid,
+                    'tasks_done': worker.tasks_done,
+                    'rss': worker.rss,
+                    'busy': worker.current is not None
+                }
+                for worker in self._workers if worker is not None
+            ]
+            return {
+                'max_workers': self.max_workers,
+                'pending': self._queue.qsize(),
+                'completed': self.completed,
+                'recycled': self.recycled,
+                'killed': self.killed,
+                'crashed': self.crashed,
+                'max_tasks_per_worker': self.max_tasks_per_worker,
+                'max_rss_bytes': self.max_rss_bytes,
+                'workers': workers
+            }
+    
+    def _spawn(self, slot: int) -> _Worker:
+        """ワーカープロセスを起動"""
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self._initializer, self._initargs),
+            daemon=True
+        )
+        process.start()
+        # 子プロセス側の端を閉じておき、子が終了したら recv() が EOFError になるようにする
+        child_conn.close()
+        
+        worker = _Worker(process, parent_conn)
+        with self._lock:
+            self._workers[slot] = worker
+        return worker
+    
+    def _stop(self, slot: int, worker: _Worker) -> None:
+        """ワーカープロセスを終了させる（応答しなければ強制終了）"""
+        with self._lock:
+            if self._workers[slot] is worker:
+                self._workers[slot] = None
+        
+        try:
+            if worker.process.is_alive():
+                worker.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        worker.process.join(_STOP_TIMEOUT)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+        worker.conn.close()
+    
+    def _manage(self, slot: int) -> None:
+        """ワーカーの枠ごとの管理スレッド（処理を1件ずつワーカープロセスに渡して結果を待つ）"""
+        worker: Optional[_Worker] = self._spawn(slot)
+        
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if not item.future.set_running_or_notify_cancel():
+                continue
+            
+            if worker is None or not worker.process.is_alive():
+                if worker is not None:
+                    self._stop(slot, worker)
+                worker = self._spawn(slot)
+            
+            current = worker
+            with self._lock:
+                current.current = item
+                if item.key is not None:
+                    self._running[item.key] = current
+            
+            try:
+                try:
+                    worker.conn.send((item.fn, item.args, item.kwargs))
+                except (OSError, ValueError) as e:
+                    raise EOFError(str(e))
+                except Exception as e:
+                    # 関数や引数をpickleできない（パイプには何も書き込まれていない）
+                    item.future.set_exception(e)
+                    continue
+                
+                ok, value, rss = worker.conn.recv()
+            
+            except (EOFError, OSError):
+                # 強制終了された、またはワーカーが異常終了した
+                killed = worker.killed
+                with self._lock:
+                    if not killed:
+                        self.crashed += 1
+                message = "ワーカープロセスを強制終了しました" if killed else "ワーカープロセスが異常終了しました"
+                if not killed:
+                    self.logger.error(f"{message}: pid={worker.process.pid} (exitcode={worker.process.exitcode})")
+                item.future.set_exception(WorkerTerminatedError(message, details=worker.process.exitcode))
+                self._stop(slot, worker)
+                
+                # 次の処理を待たせないよう、すぐに作り直す
+                worker = None if self._shutdown else self._spawn(slot)
+                continue
+            
+            finally:
+                with self._lock:
+                    current.current = None
+                    if item.key is not None and self._running.get(item.key) is current:
+                        del self._running[item.key]
+            
+            worker.tasks_done += 1
+            worker.rss = rss
+            with self._lock:
+                self.completed += 1
+            
+            if ok:
+                item.future.set_result(value)
+            else:
+                item.future.set_exception(value)
+            
+            # 処理数・メモリ使用量のしきい値を超えたワーカーは入れ替える
+            reason = None
+            if self.max_tasks_per_worker and worker.tasks_done >= self.max_tasks_per_worker:
+                reason = f"{worker.tasks_done}件処理"
+            elif self.max_rss_bytes and rss > self.max_rss_bytes:
+                reason = f"RSS {rss // (1024 * 1024)}MB"
+            if reason:
+                self.logger.info(f"ワーカープロセスを入れ替えます: pid={worker.process.pid} ({reason})")
+                with self._lock:
+                    self.recycled += 1
+                self._stop(slot, worker)
+                worker = self._spawn(slot)
+        
+        if worker is not None:
+            self._stop(slot, worker)
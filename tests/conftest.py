@@ -0,0 +1,87 @@
+"""
+テスト共通のフィクスチャ
+
+webapp はアプリケーションの保存先（出力・一時・キャッシュ・ジャーナルなど）をすべて tmp_path の下に向けて
+setup_application() を実行し、終了時にキューとバックグラウンドのスレッドを止める
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def webapp(tmp_path, monkeypatch):
+    import app as web
+    from batches import UploadBatchManager
+    from handlers import conversion_cache, http_cache
+    from uploads import UploadManager
+    
+    temp_dir = str(tmp_path / 'temp')
+    archive_dir = tmp_path / 'archive'
+    paths = {
+        'TEMP_DIR': temp_dir,
+        'CACHE_DIR': str(tmp_path / 'cache'),
+        'TASK_ARCHIVE_PATH': str(archive_dir / 'tasks.jsonl'),
+        'TASK_JOURNAL_PATH': str(archive_dir / 'tasks.db'),
+        'SEARCH_INDEX_PATH': str(archive_dir / 'search.db'),
+        'SHARED_QUEUE_PATH': str(archive_dir / 'queue.db'),
+        'PROFILE_DIR': str(archive_dir / 'profiles'),
+        'OUTPUT_DIR': web.OUTPUT_DIR
+    }
+    for name, value in paths.items():
+        monkeypatch.setattr(web, name, value)
+    
+    # setup_application が設定するグローバルは、前のテストの値を引き継がないよう空にしておく
+    for name in ('task_queue', 'admission', 'converter_pool', 'task_journal', 'cluster', 'url_flights',
+                 'folder_index', 'search_index', 'markdown_preview'):
+        monkeypatch.setattr(web, name, None, raising=False)
+    monkeypatch.setattr(web, 'upload_manager', UploadManager(
+        os.path.join(temp_dir, 'uploads'),
+        max_size=web.Config.MAX_UPLOAD_SIZE,
+        session_ttl=web.Config.UPLOAD_SESSION_TTL,
+        logger=web.logger
+    ))
+    monkeypatch.setattr(web, 'upload_batches', UploadBatchManager(
+        max_batches=web.Config.UPLOAD_BATCH_MAX,
+        ttl=web.Config.UPLOAD_BATCH_TTL,
+        logger=web.logger
+    ))
+    monkeypatch.setattr(conversion_cache, '_cache', conversion_cache.ConversionCache(
+        str(tmp_path / 'cache'), web.Config.CONVERSION_CACHE_MAX_BYTES
+    ))
+    monkeypatch.setattr(http_cache, '_cache', http_cache.HttpSourceCache(str(tmp_path / 'cache' / 'http')))
+    
+    web.setup_application(str(tmp_path / 'output'))
+    yield web
+    
+    if web.cluster is not None:
+        web.cluster.stop()
+    web.task_queue.shutdown(wait=True)
+    if web.task_journal is not None:
+        web.task_journal.close()
+    if web.search_index is not None:
+        web.search_index.close()
+    # 事前生成の途中でプロセスが終了すると、ネイティブのライブラリがスレッドごと異常終了することがある
+    for thread in threading.enumerate():
+        if thread.name == 'converter-pool-warmup':
+            thread.join()
+
+
+@pytest.fixture
+def client(webapp):
+    return webapp.app.test_client()
+
+
+def wait_for(predicate, timeout=30, interval=0.05):
+    """predicate() が真になるまで待つ（タイムアウトしたら最後の値を返す）"""
+    deadline = time.monotonic() + timeout
+    while True:
+        value = predicate()
+        if value or time.monotonic() >= deadline:
+            return value
+        time.sleep(interval)
@@ -0,0 +1,117 @@
+"""
+受け付け制御（admission.py）の 429 応答と Retry-After・受信中バイト数の上限の確認
+"""
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import AdmissionController, AdmissionRejected
+from taskqueue import Task, TaskStatus, TaskStore
+
+
+def _finish(controller, store, cost=1.0):
+    task = Task(type='conversion', name='done', payload={}, cost=cost)
+    store.add(task)
+    store.set_status(task, TaskStatus.SUCCESS)
+    controller.on_task_status(task, TaskStatus.PROCESSING)
+
+
+def _wait(store, cost=1.0):
+    task = Task(type='conversion', name='waiting', payload={}, cost=cost)
+    store.add(task)
+    return task
+
+
+def test_retry_after_follows_drain_rate(tmp_path):
+    store = TaskStore()
+    controller = AdmissionController(store, str(tmp_path), max_queued_cost=10, retry_after_max=60)
+    _wait(store, cost=10)
+    
+    # 処理速度を測れていない間は既定の秒数
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.check(30)
+    assert excinfo.value.reason == 'queue_cost'
+    assert excinfo.value.retry_after == controller.retry_after_default
+    
+    # 直近1秒に2件（コスト2）完了 → 超過分のコスト30を処理する見込みは15秒
+    _finish(controller, store)
+    _finish(controller, store)
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.check(30)
+    assert excinfo.value.retry_after == 15
+    
+    # 見込みが上限を超える場合は retry_after_max に収める
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.check(1000)
+    assert excinfo.value.retry_after == 60
+    assert controller.stats()['rejected'] == {'queue_cost': 3}
+
+
+def test_queue_limits_admit_first_large_task(tmp_path):
+    store = TaskStore()
+    controller = AdmissionController(store, str(tmp_path), max_queued_tasks=2, max_queued_cost=10)
+    
+    # キューが空なら上限を超えるコストのタスクも受け付ける
+    controller.check(50)
+    _wait(store)
+    controller.check(5, count=1)
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.check(1, count=2)
+    assert excinfo.value.reason == 'queue_depth'
+
+
+def test_receiving_limits_inflight_bytes(tmp_path):
+    controller = AdmissionController(TaskStore(), str(tmp_path), max_inflight_bytes=100, retry_after_min=2)
+    
+    # 受信中のリクエストがなければ上限を超える本文も受け付ける
+    with controller.receiving(150):
+        assert controller.stats()['inflight_bytes'] == 150
+        with pytest.raises(AdmissionRejected) as excinfo:
+            with controller.receiving(1):
+                pass
+        assert excinfo.value.reason == 'inflight_bytes'
+        assert excinfo.value.retry_after == 2
+    
+    with controller.receiving(60):
+        with controller.receiving(40):
+            assert controller.stats()['inflight_bytes'] == 100
+        with pytest.raises(AdmissionRejected):
+            with controller.receiving(41):
+                pass
+    
+    # 受信が終われば（例外で終わっても）予約を解放する
+    with pytest.raises(RuntimeError):
+        with controller.receiving(80):
+            raise RuntimeError('disconnected')
+    assert controller.stats()['inflight_bytes'] == 0
+
+
+def test_upload_rejected_with_429(client, webapp, monkeypatch):
+    monkeypatch.setattr(webapp.admission, 'max_inflight_bytes', 1024)
+    
+    with webapp.admission.receiving(1000):
+        response = client.post(
+            '/api/upload',
+            data={'file': (io.BytesIO(b'x' * 100), 'sample.txt')},
+            content_type='multipart/form-data'
+        )
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == str(webapp.admission.retry_after_min)
+    assert response.get_json()['reason'] == 'inflight_bytes'
+    assert webapp.task_queue.list_tasks() == []
+    
+    # 一時ディレクトリの上限を超える本文も受信前に断る
+    monkeypatch.setattr(webapp.admission, 'max_temp_bytes', 50)
+    response = client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(b'x' * 100), 'sample.txt')},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 429
+    assert response.get_json()['reason'] == 'temp_bytes'
+    assert response.headers['Retry-After'] == str(webapp.admission.retry_after_default)
+    assert os.listdir(webapp.TEMP_DIR) == []
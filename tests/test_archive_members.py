@@ -0,0 +1,69 @@
+"""
+ZIPのメンバーごとに変換してまとめた結果が、MarkItDown の一括変換と同じになることの確認
+"""
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markitdown import MarkItDown, StreamInfo
+
+from handlers.archive import handle_archive_member_task, split_zip_archive
+from handlers.conversion_handler import handle_archive_merge
+from taskqueue import Task
+
+MEMBERS = {
+    'readme.txt': 'Plain text member\nwith two lines\n',
+    'data/table.csv': 'name,count\napple,3\nbanana,5\n',
+    'docs/page.html': '<html><body><h1>Title</h1><p>Some <b>bold</b> text.</p></body></html>',
+    'notes.md': '# Notes\n\n- first\n- second\n'
+}
+
+
+def test_fan_out_matches_single_pass(tmp_path):
+    zip_path = str(tmp_path / 'upload.zip')
+    with zipfile.ZipFile(zip_path, 'w') as archive:
+        for name, text in MEMBERS.items():
+            archive.writestr(name, text)
+    
+    with open(zip_path, 'rb') as f:
+        expected = MarkItDown(enable_plugins=False).convert_stream(
+            f, stream_info=StreamInfo(extension='.zip', filename='docs.zip')
+        ).text_content
+    
+    split = split_zip_archive(zip_path, 'docs.zip').split
+    assert [task.payload['member'] for task in split.subtasks] == list(MEMBERS)
+    
+    # サブタスクは完了順に関係なく、アーカイブ内の順の結果として分割元に渡される
+    results = [None] * len(split.subtasks)
+    for index in reversed(range(len(split.subtasks))):
+        result = handle_archive_member_task(split.subtasks[index])
+        assert result.success, result.error
+        results[index] = result.result
+    
+    merge_task = Task(
+        type=split.merge_type,
+        name='docs.zip',
+        payload={
+            'source_type': 'file',
+            'source_path': zip_path,
+            'filename': 'docs.zip',
+            'output_dir': str(tmp_path / 'output'),
+            'subtask_results': results,
+            'subtask_errors': [None] * len(results)
+        }
+    )
+    result = handle_archive_merge(merge_task)
+    assert result.success, result.error
+    assert [member['status'] for member in result.result['members']] == ['success'] * len(MEMBERS)
+    
+    output_path = os.path.join(str(tmp_path / 'output'), os.path.basename(result.result['output_path']))
+    with open(output_path, encoding='utf-8') as f:
+        merged = f.read()
+    assert '## File: docs/page.html' in merged
+    assert merged == expected
+    
+    # まとめ終わったらメンバーごとの一時ファイルと変換元を削除する
+    assert not os.path.exists(f"{zip_path}.members")
+    assert not os.path.exists(zip_path)
@@ -0,0 +1,134 @@
+"""
+ネイティブASGIアプリ（逐次解析するアップロードとエラー時の応答）の確認
+"""
+import asyncio
+import hashlib
+import json
+import uuid
+
+import pytest
+from asgiref.testing import ApplicationCommunicator
+
+from conftest import wait_for
+from taskqueue import TaskStatus
+
+BOUNDARY = 'test-boundary-1234'
+
+
+def _multipart(fields, files):
+    """マルチパートの本文を作成する（files は (項目名, ファイル名, 内容) の一覧）"""
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8')
+        )
+    for name, filename, data in files:
+        parts.append(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8') + data + b'\r\n'
+        )
+    parts.append(f'--{BOUNDARY}--\r\n'.encode('utf-8'))
+    return b''.join(parts)
+
+
+def _scope(method, path, headers=(), query_string=b''):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode('utf-8'),
+        'root_path': '',
+        'query_string': query_string,
+        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80)
+    }
+
+
+async def _call(app, method, path, body=b'', headers=(), chunk_size=None):
+    """リクエストを送り (ステータス, ヘッダー, 本文) を返す（chunk_size ごとに分けて本文を送る）"""
+    communicator = ApplicationCommunicator(app, _scope(method, path, headers))
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] if chunk_size and body else [body]
+    for i, chunk in enumerate(chunks):
+        await communicator.send_input({'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1})
+    
+    start = await communicator.receive_output(10)
+    body = b''
+    while True:
+        message = await communicator.receive_output(10)
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    await communicator.wait(10)
+    return start['status'], dict((k.decode(), v.decode()) for k, v in start['headers']), body
+
+
+@pytest.fixture
+def asgi(webapp):
+    from asgi_app import create_asgi_app
+    return create_asgi_app()
+
+
+def test_streamed_upload_is_received_and_converted(webapp, asgi):
+    data = b'# streamed upload\n\n' + b'line of text\n' * 20000
+    body = _multipart({'folder': 'default'}, [('file', 'streamed.md', data)])
+    headers = [('content-type', f'multipart/form-data; boundary={BOUNDARY}'), ('content-length', str(len(body)))]
+    
+    # 本文を境界の途中で切れる大きさに分けて送る
+    status, _, response = asyncio.run(_call(asgi, 'POST', '/api/upload', body, headers, chunk_size=7919))
+    
+    assert status == 200, response
+    task_id = uuid.UUID(json.loads(response)['task_id'])
+    task = webapp.task_queue.get_task(task_id)
+    assert task.payload['source_sha256'] == hashlib.sha256(data).hexdigest()
+    assert task.payload['source_size'] == len(data)
+    assert task.timings['upload_saved'] >= task.timings['upload_started']
+    
+    assert wait_for(lambda: webapp.task_queue.is_done(task_id))
+    assert task.status == TaskStatus.SUCCESS, task.error_message
+
+
+def test_upload_of_unsupported_type_is_rejected(webapp, asgi):
+    body = _multipart({}, [('file', 'program.exe', b'MZ')])
+    headers = [('content-type', f'multipart/form-data; boundary={BOUNDARY}'), ('content-length', str(len(body)))]
+    
+    status, _, response = asyncio.run(_call(asgi, 'POST', '/api/upload', body, headers))
+    
+    assert status == 400
+    assert 'error' in json.loads(response)
+    assert webapp.task_queue.list_tasks() == []
+
+
+def test_error_before_response_start_returns_500(asgi, monkeypatch):
+    async def broken(scope, send, folder_path):
+        raise RuntimeError('broken listing')
+    
+    monkeypatch.setattr(asgi, 'explore', broken)
+    status, headers, response = asyncio.run(_call(asgi, 'GET', '/explore/default'))
+    
+    assert status == 500
+    assert headers['content-type'] == 'application/json'
+    assert 'error' in json.loads(response)
+
+
+def test_error_after_response_start_is_not_followed_by_a_500(asgi, monkeypatch):
+    async def broken(scope, send, folder_path):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        raise RuntimeError('broken after start')
+    
+    monkeypatch.setattr(asgi, 'explore', broken)
+    
+    async def scenario():
+        communicator = ApplicationCommunicator(asgi, _scope('GET', '/explore/default'))
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        start = await communicator.receive_output(10)
+        # 2つ目の http.response.start は送らず、例外のままサーバーに接続を切らせる
+        with pytest.raises(RuntimeError, match='broken after start'):
+            await communicator.receive_output(10)
+        return start
+    
+    assert asyncio.run(scenario())['status'] == 200
+
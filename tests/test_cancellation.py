@@ -0,0 +1,146 @@
+"""
+タスクのキャンセル・制限時間による中止と、ワーカープロセスの入れ替えの確認
+"""
+import io
+import os
+import sys
+import threading
+import time
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import wait_for
+from taskqueue import (EXECUTOR_PROCESS, Task, TaskQueue, TaskStatus,
+                       raise_if_cancelled)
+
+
+def _sleep_in_worker(task):
+    """開始したことをファイルで知らせてから止まり続けるハンドラー（ワーカープロセスで実行）"""
+    with open(task.payload['started_path'], 'w'):
+        pass
+    time.sleep(60)
+    return 'finished'
+
+
+def _worker_pid(task):
+    return os.getpid()
+
+
+@pytest.fixture
+def process_queue():
+    queue = TaskQueue(default_max_workers=2, process_workers=1)
+    queue.register_handler('sleep', _sleep_in_worker, executor=EXECUTOR_PROCESS)
+    queue.register_handler('sleep_limited', _sleep_in_worker, executor=EXECUTOR_PROCESS, timeout=1)
+    queue.register_handler('pid', _worker_pid, executor=EXECUTOR_PROCESS)
+    yield queue
+    queue.shutdown(wait=True)
+
+
+def _upload(client, name='sample.txt'):
+    response = client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(b'cancel me\n'), name)},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 200
+    return uuid.UUID(response.get_json()['task_id'])
+
+
+def test_cancel_waiting_task_removes_source(client, webapp, monkeypatch):
+    # 実行枠を空けないようにして、待機中のままキャンセルする
+    monkeypatch.setattr(webapp.task_queue.scheduler, 'max_running', 0)
+    task_id = _upload(client)
+    task = webapp.task_queue.get_task(task_id)
+    assert task.status == TaskStatus.WAITING
+    assert os.path.exists(task.payload['source_path'])
+    
+    response = client.delete(f"/api/tasks/{task_id}")
+    assert response.status_code == 200
+    assert task.status == TaskStatus.CANCELED
+    assert not os.path.exists(task.payload['source_path'])
+    assert webapp.task_queue.scheduler.queued == 0
+    
+    response = client.delete(f"/api/tasks/{task_id}")
+    assert response.status_code == 409
+
+
+def test_cancel_running_thread_task_keeps_source_until_handler_stops(client, webapp):
+    started = threading.Event()
+    release = threading.Event()
+    seen = []
+    
+    def blocking(task):
+        started.set()
+        release.wait(30)
+        seen.append(os.path.exists(task.payload['source_path']))
+        raise_if_cancelled()
+        return {'unreachable': True}
+    
+    webapp.task_queue.register_handler('conversion', blocking)
+    task_id = _upload(client)
+    task = webapp.task_queue.get_task(task_id)
+    assert started.wait(10)
+    
+    # スレッドは止められないため状態だけ先に確定し、ハンドラーが読み込み中の一時ファイルは残す
+    response = client.delete(f"/api/tasks/{task_id}")
+    assert response.status_code == 200
+    assert task.status == TaskStatus.CANCELED
+    assert os.path.exists(task.payload['source_path'])
+    
+    release.set()
+    assert wait_for(lambda: not os.path.exists(task.payload['source_path']))
+    assert seen == [True]
+    assert task.status == TaskStatus.CANCELED
+    assert task.result is None
+
+
+def test_cancel_running_process_task_kills_worker(process_queue, tmp_path):
+    started_path = str(tmp_path / 'started')
+    task = process_queue.add_task(Task(type='sleep', name='sleep', payload={'started_path': started_path}))
+    assert wait_for(lambda: os.path.exists(started_path))
+    
+    assert process_queue.cancel(task.id)
+    assert wait_for(lambda: process_queue.is_done(task.id))
+    assert task.status == TaskStatus.CANCELED
+    assert process_queue.worker_stats()['killed'] == 1
+    
+    # 強制終了したワーカーは作り直され、次のタスクを実行できる
+    follow_up = process_queue.add_task(Task(type='pid', name='pid', payload={}))
+    assert wait_for(lambda: process_queue.is_done(follow_up.id))
+    assert follow_up.status == TaskStatus.SUCCESS
+    assert process_queue.worker_stats()['crashed'] == 0
+
+
+def test_process_task_past_deadline_is_killed(process_queue, tmp_path):
+    started_path = str(tmp_path / 'started')
+    task = process_queue.add_task(Task(type='sleep_limited', name='sleep', payload={'started_path': started_path}))
+    
+    assert wait_for(lambda: process_queue.is_done(task.id), timeout=20)
+    assert os.path.exists(started_path)
+    assert task.status == TaskStatus.ERROR
+    assert 'タイムアウト' in task.error_message
+    assert process_queue.worker_stats()['killed'] == 1
+
+
+def test_worker_is_replaced_after_max_tasks():
+    queue = TaskQueue(default_max_workers=1, process_workers=1, worker_max_tasks=2)
+    queue.register_handler('pid', _worker_pid, executor=EXECUTOR_PROCESS)
+    try:
+        pids = []
+        for _ in range(3):
+            task = queue.add_task(Task(type='pid', name='pid', payload={}))
+            assert wait_for(lambda: queue.is_done(task.id))
+            assert task.status == TaskStatus.SUCCESS
+            pids.append(task.result)
+        
+        # 2件処理したワーカーは入れ替え、3件目は新しいワーカープロセスで実行する
+        assert pids[0] == pids[1] != pids[2]
+        stats = queue.worker_stats()
+        assert stats['recycled'] == 1
+        assert stats['completed'] == 3
+        assert [worker['tasks_done'] for worker in stats['workers']] == [1]
+    finally:
+        queue.shutdown(wait=True)
@@ -0,0 +1,83 @@
+"""
+コンバータプール（MarkItDownインスタンスの再利用）の確認
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handlers.converter_pool import ConverterPool
+
+
+def _borrow(pool):
+    """インスタンスを1回借りて返し、借りたインスタンスのIDを返す"""
+    entry = pool._acquire()
+    pool._release(entry)
+    return entry.id
+
+
+def test_one_instance_serves_many_tasks():
+    pool = ConverterPool(size=1)
+    
+    mds = []
+    for _ in range(3):
+        with pool.converter() as md:
+            mds.append(md)
+    
+    assert mds[0] is mds[1] is mds[2]
+    stats = pool.stats()
+    assert len(stats['instances']) == 1
+    assert stats['instances'][0]['tasks_served'] == 3
+
+
+def test_full_pool_waits_for_a_returned_instance():
+    pool = ConverterPool(size=1)
+    borrowed = []
+    
+    def worker():
+        with pool.converter() as md:
+            borrowed.append(md)
+    
+    with pool.converter() as first:
+        thread = threading.Thread(target=worker)
+        thread.start()
+        time.sleep(0.2)
+        # 上限まで貸し出し中なので、上限を超えて生成せずに返却を待つ
+        assert borrowed == []
+    thread.join(timeout=5)
+    
+    assert borrowed == [first]
+    stats = pool.stats()
+    assert len(stats['instances']) == 1
+    assert stats['instances'][0]['tasks_served'] == 2
+
+
+def test_changing_options_invalidates_instances():
+    pool = ConverterPool(size=1)
+    before = _borrow(pool)
+    assert _borrow(pool) == before
+    
+    assert pool.configure(options={'enable_plugins': False, 'keep_data_uris': True})
+    after = _borrow(pool)
+    
+    assert after != before
+    stats = pool.stats()
+    assert stats['generation'] == 1
+    assert [entry['id'] for entry in stats['instances']] == [after]
+    # 同じ設定での再設定では破棄しない
+    assert not pool.configure(options={'enable_plugins': False, 'keep_data_uris': True})
+    assert _borrow(pool) == after
+
+
+def test_instance_borrowed_across_a_reconfigure_is_dropped():
+    pool = ConverterPool(size=1)
+    with pool.converter() as old:
+        pool.configure(options={'enable_plugins': False, 'keep_data_uris': True})
+        # 貸し出し中の古いインスタンスは数えないため、新しい設定のインスタンスを待たずに作る
+        with pool.converter() as new:
+            assert new is not old
+    
+    with pool.converter() as md:
+        assert md is new
@@ -0,0 +1,104 @@
+"""
+タスクの状態変化のSSE配信（/api/events）の確認
+"""
+import asyncio
+import io
+import os
+import sys
+
+from asgiref.testing import ApplicationCommunicator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sse import EventStreamApp
+from taskqueue import EventBroker
+
+
+def _scope(headers=()):
+    return {
+        'type': 'http',
+        'method': 'GET',
+        'path': '/api/events',
+        'query_string': b'',
+        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+    }
+
+
+async def _open(app, headers=()):
+    """SSEに接続し、(通信相手, 開始メッセージ, 再接続間隔の行) を返す"""
+    communicator = ApplicationCommunicator(app, _scope(headers))
+    start = await communicator.receive_output(5)
+    retry = await communicator.receive_output(5)
+    return communicator, start, retry
+
+
+async def _close(communicator):
+    await communicator.send_input({'type': 'http.disconnect'})
+    await communicator.wait(5)
+
+
+def test_published_events_are_streamed():
+    broker = EventBroker(heartbeat_interval=30)
+    
+    async def scenario():
+        communicator, start, retry = await _open(EventStreamApp(broker))
+        event = broker.publish('task', {'task': {'id': 'first'}})
+        message = await communicator.receive_output(5)
+        await _close(communicator)
+        return start, retry, event, message
+    
+    start, retry, event, message = asyncio.run(scenario())
+    
+    assert start['status'] == 200
+    assert (b'content-type', b'text/event-stream; charset=utf-8') in start['headers']
+    assert retry['body'].startswith(b'retry:')
+    assert message['body'] == event.encode()
+    assert f"id: {event.id}".encode() in message['body']
+    assert broker.stats()['clients'] == 0
+
+
+def test_reconnect_replays_missed_events():
+    broker = EventBroker(heartbeat_interval=30)
+    first = broker.publish('task', {'n': 1})
+    missed = [broker.publish('task', {'n': n}) for n in (2, 3)]
+    
+    async def scenario():
+        communicator, _, _ = await _open(EventStreamApp(broker), [('last-event-id', first.id)])
+        replayed = [await communicator.receive_output(5) for _ in missed]
+        await _close(communicator)
+        return replayed
+    
+    assert [message['body'] for message in asyncio.run(scenario())] == [event.encode() for event in missed]
+
+
+def test_unknown_last_event_id_asks_for_resync():
+    broker = EventBroker(heartbeat_interval=30)
+    broker.publish('task', {'n': 1})
+    
+    async def scenario():
+        communicator, _, _ = await _open(EventStreamApp(broker), [('last-event-id', 'old-epoch:5')])
+        message = await communicator.receive_output(5)
+        await _close(communicator)
+        return message
+    
+    body = asyncio.run(scenario())['body']
+    assert b'history_unavailable' in body
+
+
+def test_task_status_changes_are_published(webapp, client):
+    subscription = webapp.event_broker.subscribe()
+    try:
+        response = client.post('/api/upload', data={'file': (io.BytesIO(b'# hello\n'), 'hello.md')})
+        task_id = response.get_json()['task_id']
+        
+        statuses = []
+        while 'success' not in statuses:
+            event = subscription.get(timeout=30)
+            assert event is not None
+            if event.type == 'task' and event.data['task']['id'] == task_id:
+                statuses.append(event.data['task']['status'])
+    finally:
+        webapp.event_broker.unsubscribe(subscription)
+    
+    assert statuses[0] == 'waiting'
+    assert 'processing' in statuses
@@ -0,0 +1,107 @@
+"""
+フォルダの一括ダウンロード（FolderExport）の対象ファイル・アーカイブの内容・Content-Length の確認
+"""
+import io
+import os
+import sys
+import tarfile
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from folder_export import FolderExport, FolderExportError
+
+FILES = {
+    'report.md': b'# report\n' * 100,
+    'sub/nested.md': b'# nested\n',
+    'sub/data.csv': b'a,b\n1,2\n',
+    '日本語/メモ.md': '# メモ\n'.encode('utf-8'),
+    'empty.md': b''
+}
+
+# 一覧に含めないファイル（事前圧縮のサイドカーと書き込み途中の一時ファイル）
+EXCLUDED = {
+    'report.md.gz': b'\x1f\x8b',
+    'report.md.br': b'br',
+    'sub/nested.md.0123abcd.tmp': b'partial'
+}
+
+
+@pytest.fixture
+def root(tmp_path):
+    for name, data in {**FILES, **EXCLUDED}.items():
+        path = tmp_path / 'docs' / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    (tmp_path / 'outside.md').write_bytes(b'# outside\n')
+    return str(tmp_path)
+
+
+def _expected(names=None):
+    return {f"docs/{name}": data for name, data in FILES.items() if names is None or name in names}
+
+
+@pytest.mark.parametrize('folder_id', ['', '.', '..', 'docs/sub', '..\\docs'])
+def test_invalid_folder_ids_are_rejected(root, folder_id):
+    with pytest.raises(FolderExportError) as error:
+        FolderExport(root, folder_id)
+    assert error.value.status == 400
+
+
+def test_missing_folder_and_bad_options(root):
+    with pytest.raises(FolderExportError) as error:
+        FolderExport(root, 'missing')
+    assert error.value.status == 404
+    with pytest.raises(FolderExportError):
+        FolderExport(root, 'docs', archive_format='rar')
+    with pytest.raises(FolderExportError):
+        FolderExport(root, 'docs', compression='lzma')
+
+
+@pytest.mark.parametrize('compression', ['stored', 'deflated'])
+def test_zip_contains_only_outputs(root, compression):
+    export = FolderExport(root, 'docs', compression=compression)
+    data = b''.join(export)
+    
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert {name: archive.read(name) for name in archive.namelist()} == _expected()
+    
+    # 無圧縮のZIPは一覧から求めたサイズと実際に生成したバイト数が一致する
+    if compression == 'stored':
+        assert export.content_length == len(data)
+    else:
+        assert export.content_length is None
+
+
+def test_tar_gz_and_filters(root):
+    export = FolderExport(root, 'docs', archive_format='tar.gz', extensions=['MD'])
+    assert export.content_length is None
+    assert export.filename == 'docs.tar.gz'
+    with tarfile.open(fileobj=io.BytesIO(b''.join(export)), mode='r:gz') as archive:
+        contents = {member.name: archive.extractfile(member).read() for member in archive.getmembers()}
+    assert contents == _expected({'report.md', 'sub/nested.md', '日本語/メモ.md', 'empty.md'})
+    
+    # 更新日時で絞り込む
+    recent = os.path.join(root, 'docs', 'sub', 'data.csv')
+    os.utime(recent, (2_000_000_000, 2_000_000_000))
+    export = FolderExport(root, 'docs', since=1_999_999_999)
+    assert [export_file.arcname for export_file in export.files] == ['docs/sub/data.csv']
+
+
+def test_export_route_sends_content_length(client, webapp):
+    folder = os.path.join(webapp.OUTPUT_DIR, 'default')
+    with open(os.path.join(folder, 'a.md'), 'wb') as f:
+        f.write(b'# a\n' * 1000)
+    with open(os.path.join(folder, 'a.md.gz'), 'wb') as f:
+        f.write(b'\x1f\x8b')
+    
+    response = client.get('/api/folders/default/export?compression=stored')
+    assert response.status_code == 200
+    assert int(response.headers['Content-Length']) == len(response.data)
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert archive.namelist() == ['default/a.md']
+    
+    assert client.get('/api/folders/missing/export').status_code == 404
@@ -0,0 +1,130 @@
+"""
+出力フォルダの一覧のインデックス（FolderIndex）の差分更新と、/explore のページ分割の確認
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from folder_index import FolderIndex, FolderIndexError
+
+
+def _write(path, data=b'# doc\n'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _names(index, folder=''):
+    entries, _ = index.list(folder)
+    return [entry.name for entry in entries]
+
+
+@pytest.fixture
+def root(tmp_path):
+    _write(str(tmp_path / 'docs' / 'a.md'), b'aaaa')
+    _write(str(tmp_path / 'docs' / 'nested' / 'b.md'))
+    _write(str(tmp_path / 'top.md'))
+    return str(tmp_path)
+
+
+def test_listing_is_scanned_once_and_updated_incrementally(root):
+    index = FolderIndex(root, reconcile_interval=3600)
+    assert _names(index) == ['docs', 'top.md']
+    assert _names(index, 'docs') == ['nested', 'a.md']
+    assert index.stats()['scans'] == 2
+    
+    # ディスクだけの変更は、突き合わせの時期まで一覧に出ない
+    _write(os.path.join(root, 'docs', 'c.md'), b'cc')
+    assert _names(index, 'docs') == ['nested', 'a.md']
+    
+    # 通知したファイルだけを反映し、読み込み直さない
+    index.note_path('docs/c.md')
+    entries, total = index.list('docs', sort='size', descending=True)
+    assert [(entry.name, entry.size) for entry in entries] == [('nested', 0), ('a.md', 4), ('c.md', 2)]
+    assert total == 3
+    
+    # 新しいサブフォルダ内のファイルは、一覧を保持している祖先までさかのぼって反映する
+    _write(os.path.join(root, 'new', 'deep', 'd.md'))
+    index.note_path(os.path.join(root, 'new', 'deep', 'd.md'))
+    assert _names(index) == ['docs', 'new', 'top.md']
+    assert index.stats()['scans'] == 2
+    
+    # 出力ディレクトリの外は無視する
+    index.note_path('../outside.md')
+    assert _names(index) == ['docs', 'new', 'top.md']
+
+
+def test_remove_drops_entry_and_cached_subfolders(root):
+    index = FolderIndex(root, reconcile_interval=3600)
+    _names(index)
+    _names(index, 'docs')
+    _names(index, 'docs/nested')
+    assert index.stats()['directories'] == 3
+    
+    os.rename(os.path.join(root, 'docs'), os.path.join(root, 'renamed'))
+    index.remove('docs')
+    index.note_path('renamed')
+    assert _names(index) == ['renamed', 'top.md']
+    assert index.stats()['directories'] == 1
+    assert _names(index, 'renamed/nested') == ['b.md']
+    
+    with pytest.raises(FolderIndexError) as error:
+        index.list('docs')
+    assert error.value.status == 404
+
+
+def test_sidecars_are_hidden(root):
+    _write(os.path.join(root, 'docs', 'a.md.gz'))
+    _write(os.path.join(root, 'docs', 'a.md.br'))
+    index = FolderIndex(root, reconcile_interval=3600)
+    assert _names(index, 'docs') == ['nested', 'a.md']
+    
+    # 後から作成したサイドカーを通知しても一覧に加えない
+    _write(os.path.join(root, 'docs', 'nested', 'b.md.gz'))
+    _names(index, 'docs/nested')
+    index.note_path('docs/nested/b.md.gz')
+    assert _names(index, 'docs/nested') == ['b.md']
+
+
+def test_invalid_requests(root):
+    index = FolderIndex(root)
+    with pytest.raises(FolderIndexError) as error:
+        index.list('../')
+    assert error.value.status == 400
+    with pytest.raises(FolderIndexError) as error:
+        index.list('top.md')
+    assert error.value.status == 400
+    with pytest.raises(FolderIndexError):
+        index.list('docs', sort='owner')
+
+
+def test_explore_returns_all_entries_unless_limited(client, webapp, monkeypatch):
+    monkeypatch.setattr(webapp.Config, 'EXPLORE_MAX_LIMIT', 3)
+    for i in range(5):
+        _write(os.path.join(webapp.OUTPUT_DIR, 'default', f"file{i}.md"))
+    webapp.folder_index.note_path('default')
+    for i in range(5):
+        webapp.folder_index.note_path(f"default/file{i}.md")
+    
+    # limit を省略した場合は上限に関係なくすべて返す
+    data = client.get('/explore/default').get_json()
+    assert [entry['name'] for entry in data['files']] == [f"file{i}.md" for i in range(5)]
+    assert data['limit'] is None
+    assert not data['has_more']
+    
+    # 指定した limit は上限に収める
+    data = client.get('/explore/default?limit=10').get_json()
+    assert [entry['name'] for entry in data['files']] == ['file0.md', 'file1.md', 'file2.md']
+    assert data['limit'] == 3
+    assert data['total'] == 5
+    assert data['has_more']
+    
+    data = client.get('/explore/default?offset=3').get_json()
+    assert [entry['name'] for entry in data['files']] == ['file3.md', 'file4.md']
+    assert not data['has_more']
+    
+    assert client.get('/explore/default?limit=0').status_code == 400
+    assert client.get('/explore/default?order=up').status_code == 400
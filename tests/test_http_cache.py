@@ -0,0 +1,106 @@
+"""
+URL変換のHTTPキャッシュ（条件付きリクエストによる再取得）の確認
+
+ローカルのスタブHTTPサーバーが ETag を返し、If-None-Match が一致すれば 304 を返す
+"""
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handlers import conversion_handler
+from handlers.http_cache import FETCHED, REVALIDATED, HttpSourceCache
+from taskqueue import Task
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """server.page の (ETag, 本文) を返し、受け取った If-None-Match を記録する"""
+    
+    def do_GET(self):
+        etag, body = self.server.page
+        self.server.requests.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    monkeypatch.setenv('NO_PROXY', '127.0.0.1,localhost')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.page = ('"v1"', b"<html><head><title>Stub</title></head><body><p>first version</p></body></html>")
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def http_cache(tmp_path, monkeypatch):
+    cache = HttpSourceCache(str(tmp_path / 'http'))
+    monkeypatch.setattr(conversion_handler, 'get_http_cache', lambda: cache)
+    monkeypatch.setattr(conversion_handler.Config, 'HTTP_CACHE_ENABLED', True)
+    return cache
+
+
+def _convert(url, tmp_path):
+    """URLの変換タスクを実行し、(結果, 出力したMarkdown) を返す"""
+    task = Task(
+        type='conversion',
+        name='url',
+        payload={'source_type': 'url', 'url': url, 'output_dir': str(tmp_path / 'out'), 'output_root': str(tmp_path)}
+    )
+    result = conversion_handler.handle_conversion_task(task)
+    assert result.success, result.error
+    with open(tmp_path / result.result['output_path'], encoding='utf-8') as f:
+        return result.result, f.read()
+
+
+def test_unchanged_page_is_revalidated(stub_server, http_cache, tmp_path):
+    url = f"http://127.0.0.1:{stub_server.server_port}/page.html"
+    
+    first, markdown = _convert(url, tmp_path)
+    assert first['http_cache'] == FETCHED
+    assert 'first version' in markdown
+    
+    second, markdown = _convert(url, tmp_path)
+    assert second['http_cache'] == REVALIDATED
+    assert 'first version' in markdown
+    assert stub_server.requests == [None, '"v1"']
+
+
+def test_changed_page_is_fetched_again(stub_server, http_cache, tmp_path):
+    url = f"http://127.0.0.1:{stub_server.server_port}/page.html"
+    _convert(url, tmp_path)
+    
+    stub_server.page = ('"v2"', b"<html><head><title>Stub</title></head><body><p>second version</p></body></html>")
+    result, markdown = _convert(url, tmp_path)
+    assert result['http_cache'] == FETCHED
+    assert 'second version' in markdown
+    assert stub_server.requests == [None, '"v1"']
+
+
+def test_file_url_bypasses_http_cache(http_cache, tmp_path):
+    page = tmp_path / 'local.html'
+    page.write_text("<html><head><title>Local</title></head><body><p>local file</p></body></html>", encoding='utf-8')
+    
+    result, markdown = _convert(page.as_uri(), tmp_path)
+    assert 'http_cache' not in result
+    assert 'local file' in markdown
@@ -0,0 +1,81 @@
+"""
+ジャーナルに記録したタスクの再起動時の復元（recover_tasks）の確認
+"""
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import wait_for
+from taskqueue import SQLiteTaskJournal, TaskStatus
+
+
+def _source(webapp, name):
+    os.makedirs(webapp.TEMP_DIR, exist_ok=True)
+    path = os.path.join(webapp.TEMP_DIR, f"restart_{name}")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"{name} before restart\n")
+    return path
+
+
+def test_unfinished_tasks_are_requeued_or_failed(webapp, tmp_path):
+    journal_path = str(tmp_path / 'restart.db')
+    journal = SQLiteTaskJournal(journal_path, flush_interval=0.05)
+    
+    waiting = webapp.make_file_task('waiting.txt', _source(webapp, 'waiting.txt'), 'default')
+    journal.record(waiting)
+    
+    running = webapp.make_file_task('running.txt', _source(webapp, 'running.txt'), 'default')
+    running.status = TaskStatus.PROCESSING
+    running.started_at = datetime.now()
+    journal.record(running, TaskStatus.WAITING)
+    stale_parts = f"{running.payload['source_path']}.pages"
+    os.makedirs(stale_parts)
+    
+    lost = webapp.make_file_task('lost.txt', _source(webapp, 'lost.txt'), 'default')
+    lost.status = TaskStatus.PROCESSING
+    journal.record(lost, TaskStatus.WAITING)
+    os.remove(lost.payload['source_path'])
+    
+    done = webapp.make_file_task('done.txt', _source(webapp, 'done.txt'), 'default')
+    done.status = TaskStatus.SUCCESS
+    done.finished_at = datetime.now()
+    done.result = {'output_path': 'default/done.md'}
+    journal.record(done, TaskStatus.PROCESSING)
+    os.remove(done.payload['source_path'])
+    journal.close()
+    
+    # 再起動後のキューに復元する
+    restarted = SQLiteTaskJournal(journal_path, flush_interval=0.05)
+    webapp.recover_tasks(restarted)
+    queue = webapp.task_queue
+    
+    # 完了タスクは一覧に戻すだけで再実行しない
+    restored_done = queue.get_task(done.id)
+    assert restored_done.status == TaskStatus.SUCCESS
+    assert restored_done.result == {'output_path': 'default/done.md'}
+    
+    # 一時ファイルが残っていない未完了タスクは再実行せずにエラーにする
+    restored_lost = queue.get_task(lost.id)
+    assert restored_lost.status == TaskStatus.ERROR
+    assert '一時ファイルが見つからない' in restored_lost.error_message
+    assert not os.path.exists(stale_parts)
+    
+    # 待機中・処理中だったタスクは最初から実行し直す
+    for task in (waiting, running):
+        assert wait_for(lambda: queue.is_done(task.id))
+        restored = queue.get_task(task.id)
+        assert restored.status == TaskStatus.SUCCESS, restored.error_message
+        assert restored.started_at is not None
+        assert not os.path.exists(task.payload['source_path'])
+        with open(os.path.join(webapp.OUTPUT_DIR, restored.result['output_path']), encoding='utf-8') as f:
+            assert 'before restart' in f.read()
+    
+    # 再実行できなかったことはジャーナルにも記録する
+    restarted.close()
+    reopened = SQLiteTaskJournal(journal_path)
+    _, finished = reopened.load()
+    reopened.close()
+    statuses = {task.id: task.status for task in finished}
+    assert statuses == {done.id: TaskStatus.SUCCESS, lost.id: TaskStatus.ERROR}
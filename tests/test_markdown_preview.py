@@ -0,0 +1,34 @@
+"""
+Markdownのプレビューのインライン要素の変換の確認
+
+閉じていない強調の記号が多い文書でも、記号ごとに残りの全文を探して遅くならないこと
+"""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markdown_preview import render_markdown
+
+
+def test_emphasis_is_rendered():
+    rendered = render_markdown('**bold** *em* _em_ __bold__ ~~del~~ *across\nlines*')
+    assert '<strong>bold</strong>' in rendered
+    assert rendered.count('<em>') == 3
+    assert '<del>del</del>' in rendered
+
+
+@pytest.mark.parametrize('marker', ['*a ', '_a ', '**a ', '__a ', '~~a ', '*a\n'])
+def test_unmatched_markers_render_in_linear_time(marker):
+    text = marker * 20000
+    
+    started = time.perf_counter()
+    rendered = render_markdown(text)
+    elapsed = time.perf_counter() - started
+    
+    assert '<em>' not in rendered and '<strong>' not in rendered and '<del>' not in rendered
+    # 以前は記号ごとに残りの全文を探していたため数十秒かかっていた
+    assert elapsed < 3
@@ -0,0 +1,158 @@
+"""
+変換結果のファイル配信（/output）の ETag・304・範囲リクエスト・事前圧縮したファイルの選択の確認
+"""
+import gzip
+import os
+import sys
+
+import pytest
+from werkzeug.http import http_date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handlers.precompress import write_sidecars
+from output_files import iter_file_range, prepare_output_response
+
+BODY = ''.join(f"- 項目{i}: 変換結果の本文\n" for i in range(2000)).encode('utf-8')
+
+
+@pytest.fixture
+def output(tmp_path):
+    root = str(tmp_path)
+    path = os.path.join(root, 'default', 'doc.md')
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(BODY)
+    assert 'gzip' in write_sidecars(path, 1024)
+    return root, path
+
+
+def _get(root, **headers):
+    return _request(root, 'GET', **headers)
+
+
+def _request(root, method, **headers):
+    response = prepare_output_response(
+        root, 'default/doc.md', method, {name.replace('_', '-'): value for name, value in headers.items()}
+    )
+    response.header_map = dict(response.headers)
+    return response
+
+
+def _body(response):
+    return b''.join(iter_file_range(response.body_path, response.offset, response.length, chunk_size=1000))
+
+
+def test_etag_and_conditional_requests(output):
+    root, path = output
+    response = _get(root)
+    assert response.status == 200
+    assert _body(response) == BODY
+    etag = response.header_map['ETag']
+    assert response.header_map['Content-Length'] == str(len(BODY))
+    assert response.header_map['Content-Type'] == 'text/markdown; charset=utf-8'
+    
+    not_modified = _get(root, if_none_match=etag)
+    assert not_modified.status == 304
+    assert not_modified.body_path is None
+    assert not_modified.header_map['ETag'] == etag
+    assert _get(root, if_none_match=f"W/{etag}").status == 304
+    assert _get(root, if_none_match='*').status == 304
+    assert _get(root, if_modified_since=http_date(os.stat(path).st_mtime)).status == 304
+    
+    # If-None-Match がある場合は If-Modified-Since より優先する
+    assert _get(root, if_none_match='"other"', if_modified_since=http_date(os.stat(path).st_mtime)).status == 200
+    
+    head = _request(root, 'HEAD')
+    assert head.status == 200
+    assert head.body_path is None
+    assert head.header_map['Content-Length'] == str(len(BODY))
+    
+    assert prepare_output_response(root, 'default/missing.md', 'GET', {}) is None
+    assert prepare_output_response(root, '../outside.md', 'GET', {}) is None
+    assert prepare_output_response(root, 'default', 'GET', {}) is None
+
+
+def test_precompressed_sidecar_is_a_separate_representation(output):
+    root, path = output
+    plain = _get(root)
+    compressed = _get(root, accept_encoding='br;q=0, gzip')
+    
+    assert compressed.header_map['Content-Encoding'] == 'gzip'
+    assert compressed.header_map['ETag'] != plain.header_map['ETag']
+    assert compressed.header_map['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(_body(compressed)) == BODY
+    assert int(compressed.header_map['Content-Length']) < len(BODY)
+    assert _get(root, accept_encoding='gzip', if_none_match=compressed.header_map['ETag']).status == 304
+    
+    # 圧縮を受け付けない場合は元のファイルを返す
+    assert 'Content-Encoding' not in _get(root, accept_encoding='identity, gzip;q=0').header_map
+
+
+def test_stale_sidecar_is_not_served(output):
+    root, path = output
+    updated = BODY + '- 追記\n'.encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(updated)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    
+    # 更新日時の異なるサイドカーは古い内容のため使わない
+    response = _get(root, accept_encoding='gzip')
+    assert 'Content-Encoding' not in response.header_map
+    assert _body(response) == updated
+
+
+def test_range_requests(output):
+    root, path = output
+    etag = _get(root).header_map['ETag']
+    size = len(BODY)
+    
+    # 範囲は元のファイルのバイト位置で返すため、圧縮したものは使わない
+    partial = _get(root, range='bytes=10-19', accept_encoding='gzip')
+    assert partial.status == 206
+    assert partial.header_map['Content-Range'] == f"bytes 10-19/{size}"
+    assert partial.header_map['Content-Length'] == '10'
+    assert 'Content-Encoding' not in partial.header_map
+    assert _body(partial) == BODY[10:20]
+    
+    suffix = _get(root, range='bytes=-5')
+    assert _body(suffix) == BODY[-5:]
+    
+    # 複数の範囲には応じずに全体を返す
+    assert _get(root, range='bytes=0-1,5-6').status == 200
+    
+    unsatisfiable = _get(root, range=f"bytes={size}-")
+    assert unsatisfiable.status == 416
+    assert unsatisfiable.header_map['Content-Range'] == f"bytes */{size}"
+    assert unsatisfiable.body_path is None
+
+
+def test_if_range(output):
+    root, path = output
+    etag = _get(root).header_map['ETag']
+    last_modified = http_date(os.stat(path).st_mtime)
+    
+    assert _get(root, range='bytes=0-9', if_range=etag).status == 206
+    assert _get(root, range='bytes=0-9', if_range=last_modified).status == 206
+    
+    # 変わったファイルや弱いETagの場合は範囲指定を無視して全体を返す
+    stale = _get(root, range='bytes=0-9', if_range='"0-0"')
+    assert stale.status == 200
+    assert _body(stale) == BODY
+    assert _get(root, range='bytes=0-9', if_range=f"W/{etag}").status == 200
+    assert _get(root, range='bytes=0-9', if_range=http_date(0)).status == 200
+
+
+def test_output_route(client, webapp):
+    path = os.path.join(webapp.OUTPUT_DIR, 'default', 'route.md')
+    with open(path, 'wb') as f:
+        f.write(BODY)
+    
+    response = client.get('/output/default/route.md', headers={'Range': 'bytes=0-3'})
+    assert response.status_code == 206
+    assert response.data == BODY[:4]
+    
+    etag = response.headers['ETag']
+    assert client.get('/output/default/route.md', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/output/default/missing.md').status_code == 404
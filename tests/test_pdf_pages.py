@@ -0,0 +1,68 @@
+"""
+ページ範囲ごとに変換して連結した結果が、MarkItDown の一括変換と同じになることの確認
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markitdown import MarkItDown
+
+from handlers.pdf_pages import (handle_pdf_pages_task, join_page_parts,
+                                plan_page_ranges)
+from taskqueue import Task
+
+
+def _write_pdf(path, pages):
+    """テキストだけのPDFを作成する（各ページは行の一覧）"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        stream = b"BT /F1 12 Tf 14 TL 72 720 Td " + b" ".join(
+            b"(" + line.encode('latin-1') + b") Tj T*" for line in lines
+        ) + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % len(pages)
+    
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_split_conversion_matches_single_pass(tmp_path):
+    pdf_path = str(tmp_path / 'doc.pdf')
+    pages = [[f"Page {number} line {line}   " for line in range(3)] + [""] * 3 for number in range(7)]
+    _write_pdf(pdf_path, pages)
+    
+    expected = MarkItDown(enable_plugins=False).convert(pdf_path).text_content
+    
+    results = []
+    for start, end in plan_page_ranges(len(pages), 3):
+        part_path = str(tmp_path / f"{start:06d}.md")
+        task = Task(
+            type='pdf_pages',
+            name='pages',
+            payload={'source_path': pdf_path, 'page_start': start, 'page_end': end, 'part_path': part_path}
+        )
+        result = handle_pdf_pages_task(task)
+        assert result.success, result.error
+        results.append(result.result)
+    
+    merged = join_page_parts(results)
+    assert 'Page 6 line 2' in merged
+    assert not merged.endswith('\x0c')
+    assert merged == expected
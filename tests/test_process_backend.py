@@ -0,0 +1,75 @@
+"""
+変換タスクのプロセスバックエンド（ワーカープロセスでの実行）の確認
+"""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handlers.conversion_handler import handle_conversion_task
+from handlers.converter_pool import init_worker_process
+from taskqueue import EXECUTOR_PROCESS, Task, TaskQueue, TaskQueueError, TaskStatus
+
+
+@pytest.fixture
+def process_queue():
+    queue = TaskQueue(
+        default_max_workers=2,
+        process_workers=1,
+        process_initializer=init_worker_process,
+        process_initargs=({'enable_plugins': False},)
+    )
+    queue.register_handler('conversion', handle_conversion_task, executor=EXECUTOR_PROCESS, timeout=120)
+    yield queue
+    queue.shutdown(wait=True)
+
+
+def test_conversion_runs_in_a_worker_process(process_queue, tmp_path):
+    source = tmp_path / 'note.txt'
+    source.write_text('hello from a worker process\n', encoding='utf-8')
+    
+    statuses = []
+    callbacks = []
+    done = threading.Event()
+    
+    def listener(task, previous):
+        statuses.append((previous, task.status))
+    
+    process_queue.add_listener(listener)
+    task = Task(
+        type='conversion',
+        name='note',
+        payload={
+            'source_type': 'file',
+            'source_path': str(source),
+            'filename': 'note.txt',
+            'output_dir': str(tmp_path / 'out'),
+            'output_root': str(tmp_path)
+        }
+    )
+    task.callback = lambda result: (callbacks.append(result), done.set())
+    process_queue.add_task(task)
+    
+    assert done.wait(60)
+    assert task.status == TaskStatus.SUCCESS, task.error_message
+    
+    # ハンドラーは子プロセスで、リスナーとコールバックは親プロセスで実行される
+    workers = process_queue.worker_stats()['workers']
+    assert workers and all(worker['pid'] != os.getpid() for worker in workers)
+    assert process_queue._process_executor._context.get_start_method() == 'spawn'
+    assert callbacks[0].success
+    assert (TaskStatus.PROCESSING, TaskStatus.SUCCESS) in statuses
+    
+    with open(tmp_path / callbacks[0].result['output_path'], encoding='utf-8') as f:
+        assert 'hello from a worker process' in f.read()
+
+
+def test_unpicklable_payload_is_rejected(process_queue):
+    task = Task(type='conversion', name='bad', payload={'source_type': 'file', 'hook': threading.Lock()})
+    
+    with pytest.raises(TaskQueueError):
+        process_queue.add_task(task)
+    assert process_queue.get_task(task.id) is None
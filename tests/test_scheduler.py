@@ -0,0 +1,109 @@
+"""
+重み付き公平スケジューラ（FairScheduler）の取り出し順の確認
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from taskqueue import FairScheduler, Task
+
+
+def _task(name, priority=0, **payload):
+    return Task(type='conversion', name=name, payload=payload, priority=priority)
+
+
+def _pop_name(scheduler):
+    item = scheduler.pop()
+    return item[0].name if item else None
+
+
+def _drain(scheduler, count):
+    """取り出してすぐ完了させることを count 回繰り返した順"""
+    names = []
+    for _ in range(count):
+        task, _ = scheduler.pop()
+        scheduler.release(task.id)
+        names.append(task.name)
+    return names
+
+
+def test_lanes_are_served_in_proportion_to_weight():
+    scheduler = FairScheduler(max_running=1, weights={'heavy': 3, 'light': 1})
+    for i in range(8):
+        scheduler.push(_task(f"heavy-{i}", folder='heavy'))
+    for i in range(8):
+        scheduler.push(_task(f"light-{i}", folder='light'))
+    
+    # 重み3のレーンは重み1のレーンの3倍取り出され、各レーン内は登録順
+    order = _drain(scheduler, 8)
+    assert order == ['heavy-0', 'light-0', 'heavy-1', 'heavy-2', 'heavy-3', 'light-1', 'heavy-4', 'heavy-5']
+    assert scheduler.stats()['lanes'][0]['dispatched'] == 6
+
+
+def test_priority_wins_over_lane_fairness():
+    scheduler = FairScheduler(max_running=1)
+    scheduler.push(_task('a-low', folder='a'))
+    scheduler.push(_task('a-next', folder='a'))
+    scheduler.push(_task('b-high', priority=5, folder='b'))
+    scheduler.push(_task('a-high', priority=5, folder='a'))
+    
+    # 優先度の高いタスクはパス値に関係なく先に取り出し、同じ条件なら登録順
+    assert _drain(scheduler, 4) == ['b-high', 'a-high', 'a-low', 'a-next']
+
+
+def test_group_limit_skips_busy_group_without_blocking_lane():
+    scheduler = FairScheduler(max_running=4, group_key='host', max_running_per_group=1)
+    scheduler.push(_task('first', host='example.com'))
+    scheduler.push(_task('second', host='example.com'))
+    scheduler.push(_task('other', host='example.org'))
+    scheduler.push(_task('plain'))
+    
+    first, _ = scheduler.pop()
+    assert first.name == 'first'
+    
+    # 実行中のホストのタスクは読み飛ばし、同じレーンの他のグループから取り出す
+    assert _pop_name(scheduler) == 'other'
+    assert _pop_name(scheduler) == 'plain'
+    assert _pop_name(scheduler) is None
+    assert scheduler.stats()['running_groups'] == {'example.com': 1, 'example.org': 1}
+    
+    scheduler.release(first.id)
+    assert _pop_name(scheduler) == 'second'
+
+
+def test_group_interval_delays_next_start():
+    scheduler = FairScheduler(max_running=4, group_key='host', group_interval=0.2)
+    scheduler.push(_task('first', host='example.com'))
+    scheduler.push(_task('second', host='example.com'))
+    
+    first, _ = scheduler.pop()
+    scheduler.release(first.id)
+    
+    # 完了していても開始間隔が空くまでは取り出さず、再開までの秒数を返す
+    assert scheduler.pop() is None
+    wait = scheduler.next_ready_in()
+    assert wait is not None and 0 < wait <= 0.2
+    
+    time.sleep(wait + 0.01)
+    assert _pop_name(scheduler) == 'second'
+    assert scheduler.next_ready_in() is None
+
+
+def test_lane_limit_and_removed_tasks():
+    scheduler = FairScheduler(max_running=4, max_running_per_lane=1)
+    removed = _task('removed', folder='a')
+    scheduler.push(removed)
+    scheduler.push(_task('a-1', folder='a'))
+    scheduler.push(_task('a-2', folder='a'))
+    scheduler.push(_task('b-1', folder='b'))
+    
+    assert scheduler.remove(removed.id) is removed
+    assert scheduler.position(removed.id) is None
+    
+    # レーンごとの上限に達したレーンからは取り出さない
+    assert _pop_name(scheduler) == 'a-1'
+    assert _pop_name(scheduler) == 'b-1'
+    assert _pop_name(scheduler) is None
+    assert scheduler.queued == 1 and scheduler.running == 2
@@ -0,0 +1,136 @@
+"""
+変換したMarkdownの全文検索インデックス（MarkdownSearchIndex）の登録・名前変更・削除・順位・抜粋の確認
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import wait_for
+from search_index import MarkdownSearchIndex, SearchQueryError
+
+
+def _write(root, path, text):
+    full_path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def _paths(index, query, folders=None):
+    results, _ = index.search(query, folders)
+    return [result['path'] for result in results]
+
+
+@pytest.fixture
+def make_index(tmp_path):
+    root = str(tmp_path / 'output')
+    os.makedirs(root)
+    indexes = []
+    
+    def make(**kwargs):
+        index = MarkdownSearchIndex(
+            str(tmp_path / 'search.db'), root, flush_interval=0.05, reconcile_interval=0, **kwargs
+        )
+        indexes.append(index)
+        return index
+    
+    make.root = root
+    yield make
+    for index in indexes:
+        index.close()
+
+
+def _documents(index, count):
+    index.flush()
+    return wait_for(lambda: index.stats()['documents'] == count)
+
+
+def test_existing_and_added_files_are_ranked(make_index):
+    root = make_index.root
+    _write(root, 'docs/body.md', '# 議事録\n\n来週から全文検索エンジンの評価を始める。\n')
+    _write(root, 'docs/title.md', '# 全文検索エンジンの設計\n\nインデックスの構成について。\n')
+    _write(root, 'docs/skip.txt', '全文検索エンジン\n')
+    for i in range(3):
+        _write(root, f"other/{i}.md", f"# 日報{i}\n\n特記事項なし\n")
+    index = make_index()
+    
+    # 起動時の突き合わせで既存のMarkdownだけを登録する
+    assert _documents(index, 5)
+    results, has_more = index.search('全文検索エンジン')
+    assert [result['path'] for result in results] == ['docs/title.md', 'docs/body.md']
+    assert results[0]['title'] == '全文検索エンジンの設計'
+    assert results[0]['folder'] == 'docs'
+    assert results[0]['score'] > results[1]['score']
+    assert not has_more
+    
+    # 空白区切りの語はすべてを含む文書に絞り込む
+    assert _paths(index, '全文検索 評価を始') == ['docs/body.md']
+    
+    _write(root, 'notes/new.md', '# メモ\n\n全文検索エンジンの候補を比較した。\n')
+    index.add('notes/new.md')
+    assert _documents(index, 6)
+    assert _paths(index, '全文検索エンジン', folders=['notes']) == ['notes/new.md']
+    
+    with pytest.raises(SearchQueryError):
+        index.search('   ')
+
+
+def test_folder_rename_and_delete(make_index):
+    root = make_index.root
+    _write(root, 'old/a.md', '# 見積書\n\n見積金額の内訳\n')
+    _write(root, 'old/sub/b.md', '# 請求書\n\n見積金額との差額\n')
+    index = make_index()
+    assert _documents(index, 2)
+    
+    os.rename(os.path.join(root, 'old'), os.path.join(root, 'new'))
+    index.rename('old', 'new')
+    index.flush()
+    assert wait_for(lambda: sorted(_paths(index, '見積金額')) == ['new/a.md', 'new/sub/b.md'])
+    results, _ = index.search('見積金額', folders=['new'])
+    assert {result['folder'] for result in results} == {'new'}
+    assert _paths(index, '見積金額', folders=['old']) == []
+    
+    index.remove('new')
+    assert _documents(index, 0)
+    assert _paths(index, '見積金額') == []
+
+
+def test_short_terms_do_not_scan_everything(make_index):
+    root = make_index.root
+    for i in range(3):
+        _write(root, f"docs/{i}.md", f"# 文書{i}\n\nQA 全文検索の記録 {i}\n")
+    index = make_index(short_term_scan_limit=2)
+    assert _documents(index, 3)
+    
+    # 3文字以上の語があれば、2文字以下の語は絞り込みに使わない
+    assert len(_paths(index, 'ZZ 全文検索')) == 3
+    
+    # 2文字以下の語だけの場合は、新しく登録した文書から上限の件数だけを調べる
+    newest = _paths(index, 'qa')
+    assert len(newest) == 2
+    _write(root, 'docs/late.md', '# 追加\n\nQA の追記\n')
+    index.add('docs/late.md')
+    assert _documents(index, 4)
+    assert _paths(index, 'qa')[0] == 'docs/late.md'
+    assert len(_paths(index, 'qa')) == 2
+
+
+def test_snippets_are_escaped(make_index):
+    root = make_index.root
+    _write(root, 'docs/html.md', '# 埋め込み\n\n<script>alert(1)</script> 危険な記述 & <b>ok</b>\n')
+    index = make_index()
+    assert _documents(index, 1)
+    
+    results, _ = index.search('危険な記述')
+    snippet = results[0]['snippet']
+    assert '<script>' not in snippet
+    assert '&lt;script&gt;' in snippet
+    assert '<mark>危険な記述</mark>' in snippet
+    assert '&amp;' in snippet
+    
+    results, _ = index.search('ok')
+    assert results[0]['snippet'].endswith('&lt;b&gt;<mark>ok</mark>&lt;/b&gt;')
+    assert results[0]['score'] is None
@@ -0,0 +1,112 @@
+"""
+1つのデータベースファイルを共有する複数ノードの共有キュー（SQLiteTaskBroker / SharedQueueNode）の確認
+"""
+import os
+import sys
+import threading
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import wait_for
+from taskqueue import Task, TaskQueue, TaskStatus
+from taskqueue.broker import (ROLE_WEB, ROLE_WORKER, SharedQueueNode,
+                              SQLiteTaskBroker)
+
+
+class Cluster:
+    """同じデータベースファイルに参加するノードと、ハンドラーを実行したノードの記録"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.nodes = []
+        self.runs = []
+        self._lock = threading.Lock()
+    
+    def node(self, name, role, lease_ttl=30.0, max_attempts=3):
+        queue = TaskQueue(default_max_workers=2)
+        
+        def handler(task):
+            with self._lock:
+                self.runs.append((name, task.id))
+            return {'node': name}
+        
+        queue.register_handler('echo', handler)
+        node = SharedQueueNode(
+            SQLiteTaskBroker(self.path, lease_ttl=lease_ttl, max_attempts=max_attempts),
+            queue,
+            role=role,
+            capacity=2,
+            poll_interval=0.05,
+            heartbeat_interval=0.1
+        )
+        node.start()
+        self.nodes.append(node)
+        return node
+    
+    def stop(self):
+        for node in self.nodes:
+            node.stop()
+            node.task_queue.shutdown(wait=True)
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    cluster = Cluster(str(tmp_path / 'queue.db'))
+    yield cluster
+    cluster.stop()
+
+
+def _status(node, task):
+    local = node.task_queue.get_task(task.id)
+    return local.status if local is not None else None
+
+
+def test_each_task_is_claimed_exactly_once(cluster):
+    web = cluster.node('web', ROLE_WEB)
+    cluster.node('worker-1', ROLE_WORKER)
+    cluster.node('worker-2', ROLE_WORKER)
+    
+    tasks = web.enqueue_many([Task(type='echo', name=f"echo-{i}", payload={}) for i in range(30)])
+    assert all(_status(web, task) == TaskStatus.WAITING for task in tasks)
+    
+    # 実行結果は共有キューを通じてWebノードにも取り込まれる
+    assert wait_for(lambda: all(_status(web, task) == TaskStatus.SUCCESS for task in tasks))
+    counts = Counter(task_id for _, task_id in cluster.runs)
+    assert set(counts) == {task.id for task in tasks}
+    assert set(counts.values()) == {1}
+    
+    # Webノードはタスクを登録するだけで、ハンドラーを実行しない
+    assert all(name != 'web' for name, _ in cluster.runs)
+    assert {web.task_queue.get_task(task.id).result['node'] for task in tasks} <= {'worker-1', 'worker-2'}
+    assert web.stats()['owned'] == 0
+
+
+def test_expired_lease_is_claimed_again(cluster):
+    broker = SQLiteTaskBroker(cluster.path, lease_ttl=0.2)
+    task = Task(type='echo', name='orphan', payload={})
+    broker.enqueue(task)
+    
+    # 応答の途絶えたノードがリースを取ったまま止まった状態にする
+    assert [claimed.id for claimed in broker.claim('lost-node', 1)] == [task.id]
+    assert broker.claim('other-node', 1) == []
+    
+    worker = cluster.node('worker', ROLE_WORKER, lease_ttl=0.2)
+    assert wait_for(lambda: _status(worker, task) == TaskStatus.SUCCESS)
+    assert cluster.runs == [('worker', task.id)]
+
+
+def test_expired_lease_past_max_attempts_fails(cluster):
+    broker = SQLiteTaskBroker(cluster.path, lease_ttl=0.2, max_attempts=1)
+    task = Task(type='echo', name='orphan', payload={})
+    broker.enqueue(task)
+    broker.claim('lost-node', 1)
+    
+    # 期限切れの回収はどのノードも行うため、すべてのノードで同じ上限にする
+    web = cluster.node('web', ROLE_WEB, lease_ttl=0.2, max_attempts=1)
+    cluster.node('worker', ROLE_WORKER, lease_ttl=0.2, max_attempts=1)
+    assert wait_for(lambda: _status(web, task) == TaskStatus.ERROR)
+    assert '応答が途絶えた' in web.task_queue.get_task(task.id).error_message
+    assert cluster.runs == []
@@ -0,0 +1,153 @@
+"""
+同じURLの変換の相乗り（UrlSingleFlight）の確認
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import wait_for
+from taskqueue import TaskResult, TaskStatus, raise_if_cancelled
+
+URL = 'https://example.com/page'
+
+
+class FakeConverter:
+    """URLを取得せずに、gate が開くまで待ってから固定のMarkdownを出力する変換ハンドラー"""
+    
+    def __init__(self):
+        self.calls = []
+        self.gate = threading.Event()
+        self.failures = 0
+    
+    def __call__(self, task):
+        self.calls.append(task.id)
+        self.gate.wait(10)
+        raise_if_cancelled()
+        if self.failures:
+            self.failures -= 1
+            return TaskResult.failure('変換失敗: 取得できませんでした')
+        
+        payload = task.payload
+        output_path = os.path.join(payload['output_dir'], 'page.md')
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(f"# page {len(self.calls)}\n")
+        return TaskResult.success({
+            'output_path': os.path.relpath(output_path, payload['output_root']).replace('\\', '/'),
+            'output_filename': 'page.md',
+            'cache_hit': None
+        })
+
+
+@pytest.fixture
+def converter(webapp):
+    converter = FakeConverter()
+    webapp.task_queue.register_handler('conversion', converter)
+    yield converter
+    converter.gate.set()
+
+
+def _convert(client, url=URL, folder='default'):
+    response = client.post('/api/url', json={'url': url, 'folder': folder})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def _task(webapp, data):
+    return webapp.task_queue.get_task(uuid.UUID(data['task_id']))
+
+
+def _finished(webapp, data):
+    assert wait_for(lambda: webapp.task_queue.is_done(uuid.UUID(data['task_id'])))
+    return _task(webapp, data)
+
+
+def test_concurrent_requests_share_one_conversion(client, webapp, converter):
+    leader = _convert(client)
+    assert wait_for(lambda: converter.calls)
+    
+    # 表記の違う同じURLは、実行中の変換に相乗りして別のフォルダに結果を受け取る
+    follower = _convert(client, 'HTTPS://Example.com:443/page#top', folder='other')
+    assert follower['coalesced_with'] == leader['task_id']
+    assert follower['status'] == TaskStatus.WAITING
+    assert webapp.url_flights.is_follower(uuid.UUID(follower['task_id']))
+    
+    converter.gate.set()
+    assert _finished(webapp, leader).status == TaskStatus.SUCCESS
+    result = _finished(webapp, follower).result
+    assert result['coalesced_with'] == leader['task_id']
+    assert result['output_path'] == 'other/page.md'
+    with open(os.path.join(webapp.OUTPUT_DIR, 'other', 'page.md'), encoding='utf-8') as f:
+        assert f.read() == '# page 1\n'
+    assert len(converter.calls) == 1
+    assert webapp.url_flights.stats()['coalesced'] == 1
+
+
+def test_fresh_result_is_reused_until_it_expires(client, webapp, converter):
+    converter.gate.set()
+    first = _convert(client)
+    assert _finished(webapp, first).status == TaskStatus.SUCCESS
+    
+    # 鮮度内は変換せずに完了済みの結果をコピーする
+    reused = _convert(client, folder='copy')
+    assert reused['coalesced_with'] == first['task_id']
+    assert reused['status'] == TaskStatus.SUCCESS
+    assert len(converter.calls) == 1
+    assert webapp.url_flights.stats()['reused'] == 1
+    
+    # 出力ファイルが消えた結果は使わずに変換し直す
+    os.remove(os.path.join(webapp.OUTPUT_DIR, 'default', 'page.md'))
+    second = _convert(client)
+    assert 'coalesced_with' not in second
+    assert _finished(webapp, second).status == TaskStatus.SUCCESS
+    assert len(converter.calls) == 2
+    
+    # 鮮度の期間が過ぎた結果も使わない
+    webapp.url_flights.freshness = 0.05
+    time.sleep(0.1)
+    late = _convert(client, folder='late')
+    assert 'coalesced_with' not in late
+    assert _finished(webapp, late).status == TaskStatus.SUCCESS
+    assert len(converter.calls) == 3
+
+
+def test_failed_conversion_fails_followers_and_is_not_reused(client, webapp, converter):
+    converter.failures = 1
+    leader = _convert(client)
+    assert wait_for(lambda: converter.calls)
+    follower = _convert(client, folder='other')
+    assert follower['coalesced_with'] == leader['task_id']
+    
+    converter.gate.set()
+    assert _finished(webapp, leader).status == TaskStatus.ERROR
+    failed = _finished(webapp, follower)
+    assert failed.status == TaskStatus.ERROR
+    assert failed.error_message == '変換失敗: 取得できませんでした'
+    
+    # 失敗した結果は覚えないため、次の要求は改めて変換する
+    retry = _convert(client)
+    assert 'coalesced_with' not in retry
+    assert _finished(webapp, retry).status == TaskStatus.SUCCESS
+    assert len(converter.calls) == 2
+
+
+def test_canceled_leader_hands_off_to_follower(client, webapp, converter):
+    leader = _convert(client)
+    assert wait_for(lambda: converter.calls)
+    follower = _convert(client, folder='other')
+    assert follower['coalesced_with'] == leader['task_id']
+    
+    # リーダーだけがキャンセルされた場合は、相乗りしていたタスクを改めて実行する
+    assert client.delete(f"/api/tasks/{leader['task_id']}").status_code == 200
+    converter.gate.set()
+    resubmitted = _finished(webapp, follower)
+    assert resubmitted.status == TaskStatus.SUCCESS
+    assert 'coalesced_with' not in resubmitted.result
+    assert resubmitted.result['output_path'] == 'other/page.md'
+    assert converter.calls == [uuid.UUID(leader['task_id']), uuid.UUID(follower['task_id'])]
+    assert _task(webapp, leader).status == TaskStatus.CANCELED
@@ -0,0 +1,157 @@
+"""
+サイトマップの展開（expand_sitemap）とURLの重複除去（dedupe_urls）の上限の確認
+"""
+import gzip
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handlers import url_batch
+from handlers.url_batch import dedupe_urls, expand_sitemap
+
+NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def _urlset(*urls, namespace=True):
+    xmlns = f' xmlns="{NS}"' if namespace else ''
+    entries = ''.join(f"<url><loc> {url} </loc><lastmod>2024-01-01</lastmod></url>" for url in urls)
+    return f'<?xml version="1.0"?><urlset{xmlns}>{entries}</urlset>'.encode('utf-8')
+
+
+def _index(*sitemaps):
+    entries = ''.join(f"<sitemap><loc>{url}</loc></sitemap>" for url in sitemaps)
+    return f'<sitemapindex xmlns="{NS}">{entries}</sitemapindex>'.encode('utf-8')
+
+
+class FakeRaw:
+    def __init__(self, body):
+        self.body = body
+    
+    def read(self, amount, decode_content=False):
+        return self.body[:amount]
+
+
+class FakeResponse:
+    def __init__(self, body, status):
+        self.raw = FakeRaw(body)
+        self.status = status
+    
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise OSError(f"HTTP {self.status}")
+    
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """URLごとの本文を返すセッション（登録のないURLは404）"""
+    
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+    
+    def get(self, url, timeout=None, stream=False):
+        self.requested.append(url)
+        body = self.pages.get(url)
+        return FakeResponse(body or b'', 200 if body is not None else 404)
+
+
+@pytest.fixture
+def site(monkeypatch):
+    session = FakeSession({})
+    monkeypatch.setattr(url_batch, 'get_http_session', lambda: session)
+    return session
+
+
+def test_urlset_with_and_without_namespace(site):
+    site.pages['https://example.com/sitemap.xml'] = _urlset('https://example.com/a', 'https://example.com/b')
+    site.pages['https://example.com/plain.xml'] = _urlset('https://example.com/c', namespace=False)
+    
+    assert expand_sitemap('https://example.com/sitemap.xml', 10, 5) == ['https://example.com/a', 'https://example.com/b']
+    assert expand_sitemap('https://example.com/plain.xml', 10, 5) == ['https://example.com/c']
+
+
+def test_url_limit_stops_fetching(site):
+    site.pages['https://example.com/index.xml'] = _index('https://example.com/1.xml', 'https://example.com/2.xml')
+    site.pages['https://example.com/1.xml'] = _urlset(*[f"https://example.com/p{i}" for i in range(5)])
+    site.pages['https://example.com/2.xml'] = _urlset('https://example.com/never')
+    
+    # 上限に達したら残りのサイトマップは取得しない
+    urls = expand_sitemap('https://example.com/index.xml', 3, 5)
+    assert urls == ['https://example.com/p0', 'https://example.com/p1', 'https://example.com/p2']
+    assert 'https://example.com/2.xml' not in site.requested
+
+
+def test_index_depth_and_loops_are_bounded(site):
+    # 自分自身を含むインデックスの連鎖（深さ4のサイトマップまでたどり着かない）
+    for depth in range(4):
+        site.pages[f"https://example.com/index{depth}.xml"] = _index(
+            f"https://example.com/index{depth}.xml",
+            f"https://example.com/index{depth + 1}.xml",
+            f"https://example.com/pages{depth}.xml"
+        )
+        site.pages[f"https://example.com/pages{depth}.xml"] = _urlset(f"https://example.com/depth{depth}")
+    site.pages['https://example.com/index4.xml'] = _urlset('https://example.com/too-deep')
+    
+    urls = expand_sitemap('https://example.com/index0.xml', 100, 5)
+    assert sorted(urls) == [f"https://example.com/depth{depth}" for depth in range(3)]
+    assert site.requested.count('https://example.com/index0.xml') == 1
+    assert 'https://example.com/index4.xml' not in site.requested
+
+
+def test_gzip_and_size_limit(site, monkeypatch):
+    site.pages['https://example.com/sitemap.xml.gz'] = gzip.compress(_urlset('https://example.com/zipped'))
+    assert expand_sitemap('https://example.com/sitemap.xml.gz', 10, 5) == ['https://example.com/zipped']
+    
+    # 展開後の大きさで判定するため、圧縮率の高いサイトマップも上限で止める
+    monkeypatch.setattr(url_batch, '_SITEMAP_MAX_BYTES', 1024)
+    site.pages['https://example.com/bomb.xml.gz'] = gzip.compress(
+        _urlset(*[f"https://example.com/{'x' * 50}{i}" for i in range(100)])
+    )
+    assert len(site.pages['https://example.com/bomb.xml.gz']) < 1024
+    with pytest.raises(ValueError, match='大きすぎます'):
+        expand_sitemap('https://example.com/bomb.xml.gz', 10, 5)
+
+
+def test_broken_child_sitemaps_are_skipped(site):
+    site.pages['https://example.com/index.xml'] = _index(
+        'https://example.com/missing.xml',
+        'https://example.com/broken.xml',
+        'https://example.com/ok.xml'
+    )
+    site.pages['https://example.com/broken.xml'] = b'<urlset><url>'
+    site.pages['https://example.com/ok.xml'] = _urlset('https://example.com/ok')
+    
+    assert expand_sitemap('https://example.com/index.xml', 10, 5) == ['https://example.com/ok']
+    
+    # 最初のサイトマップを読めない場合はエラーにする
+    with pytest.raises(ValueError):
+        expand_sitemap('https://example.com/missing.xml', 10, 5)
+    with pytest.raises(ValueError):
+        expand_sitemap('https://example.com/broken.xml', 10, 5)
+
+
+def test_dedupe_urls_normalizes_and_limits():
+    urls = [
+        'https://Example.com:443/a#top',
+        'https://example.com/a',
+        'ftp://example.com/file',
+        'javascript:alert(1)',
+        'https:///no-host',
+        None,
+        'http://example.com/b',
+        'https://example.org/c',
+        'https://example.org/d'
+    ]
+    unique, skipped = dedupe_urls(urls, 100)
+    assert unique == ['https://example.com/a', 'http://example.com/b', 'https://example.org/c', 'https://example.org/d']
+    assert skipped == len(urls) - 4
+    
+    # 上限を超えた分も除いた件数に数える
+    unique, skipped = dedupe_urls(urls, 2)
+    assert unique == ['https://example.com/a', 'http://example.com/b']
+    assert skipped == len(urls) - 2
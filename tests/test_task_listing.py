@@ -0,0 +1,82 @@
+"""
+タスク一覧の差分取得（バージョン・ETag・絞り込み）の確認
+"""
+from taskqueue import Task, TaskStatus
+
+
+def _add(webapp, name, folder='default'):
+    task = Task(type='conversion', name=name, payload={'folder': folder})
+    webapp.task_queue.store.add(task)
+    return task
+
+
+def _delta(client, since, **params):
+    query = {'since': since, **params}
+    response = client.get('/api/tasks', query_string=query)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_unchanged_listing_returns_304(webapp, client):
+    first = client.get('/api/tasks?since=0')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    
+    assert client.get('/api/tasks?since=0', headers={'If-None-Match': etag}).status_code == 304
+    
+    _add(webapp, 'new')
+    changed = client.get('/api/tasks?since=0', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_delta_returns_only_changes_since_version(webapp, client):
+    old = _add(webapp, 'old')
+    start = _delta(client, 0)
+    assert [task['id'] for task in start['tasks']] == [str(old.id)]
+    
+    new = _add(webapp, 'new')
+    delta = _delta(client, start['version'], epoch=start['epoch'])
+    
+    assert not delta['reset']
+    assert [task['id'] for task in delta['tasks']] == [str(new.id)]
+    assert delta['version'] > start['version']
+    
+    # 別のストア（再起動前）のepochからは全件を返す
+    reset = _delta(client, delta['version'], epoch='another-epoch')
+    assert reset['reset']
+    assert {task['id'] for task in reset['tasks']} == {str(old.id), str(new.id)}
+
+
+def test_task_leaving_the_filter_is_reported_as_removed(webapp, client):
+    store = webapp.task_queue.store
+    pending = _add(webapp, 'pending')
+    other = _add(webapp, 'other folder', folder='report')
+    
+    start = _delta(client, 0, status='waiting', folder='default')
+    assert [task['id'] for task in start['tasks']] == [str(pending.id)]
+    
+    store.set_status(pending, TaskStatus.PROCESSING)
+    store.set_status(other, TaskStatus.PROCESSING)
+    delta = _delta(client, start['version'], epoch=start['epoch'], status='waiting', folder='default')
+    
+    assert delta['tasks'] == []
+    assert str(pending.id) in delta['removed']
+    
+    # 絞り込みに戻ったタスクは再び一覧に含める
+    store.set_status(pending, TaskStatus.WAITING)
+    again = _delta(client, delta['version'], epoch=delta['epoch'], status='waiting', folder='default')
+    assert [task['id'] for task in again['tasks']] == [str(pending.id)]
+    assert again['removed'] == []
+
+
+def test_delta_pages_with_has_more(webapp, client):
+    start = _delta(client, 0)
+    added = [_add(webapp, f"task-{i}") for i in range(3)]
+    
+    first = _delta(client, start['version'], epoch=start['epoch'], limit=2)
+    assert first['has_more']
+    second = _delta(client, first['version'], epoch=first['epoch'], limit=2)
+    assert not second['has_more']
+    
+    assert [task['id'] for task in first['tasks'] + second['tasks']] == [str(task.id) for task in added]
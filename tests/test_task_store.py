@@ -0,0 +1,80 @@
+"""
+タスクストアの保持ポリシー（件数・期間の上限とアーカイブ）の確認
+"""
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from taskqueue import Task, TaskQueue, TaskStatus, TaskStore
+
+
+def _finish(store, name, status=TaskStatus.SUCCESS, folder='default'):
+    task = Task(type='conversion', name=name, payload={'folder': folder})
+    store.add(task)
+    store.set_status(task, status)
+    return task
+
+
+def _archived(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_oldest_finished_tasks_are_evicted_and_archived(tmp_path):
+    archive = tmp_path / 'tasks.jsonl'
+    store = TaskStore(max_finished=3, archive_path=str(archive))
+    waiting = Task(type='conversion', name='waiting', payload={'folder': 'default'})
+    store.add(waiting)
+    
+    finished = [_finish(store, f"done-{i}") for i in range(5)]
+    
+    # 完了した順に古いものから破棄し、未完了のタスクは件数に数えない
+    assert all(task.id not in store for task in finished[:2])
+    assert all(task.id in store for task in finished[2:])
+    assert waiting.id in store
+    assert store.stats()['archived'] == 2
+    assert len(store.by_folder('default')) == 4
+    assert [record['name'] for record in _archived(archive)] == ['done-0', 'done-1']
+    assert _archived(archive)[0]['status'] == 'success'
+    assert 'payload' not in _archived(archive)[0]
+
+
+def test_finished_tasks_expire_after_ttl(tmp_path):
+    store = TaskStore(max_finished=None, finished_ttl=60, archive_path=str(tmp_path / 'tasks.jsonl'))
+    running = Task(type='conversion', name='running')
+    store.add(running)
+    store.set_status(running, TaskStatus.PROCESSING)
+    done = _finish(store, 'done', TaskStatus.ERROR)
+    
+    assert store.prune(now=datetime.now() + timedelta(seconds=30)) == 0
+    assert store.prune(now=datetime.now() + timedelta(seconds=120)) == 1
+    
+    assert done.id not in store
+    assert running.id in store
+    assert [record['status'] for record in _archived(tmp_path / 'tasks.jsonl')] == ['error']
+
+
+def test_evicted_tasks_are_reported_as_removed():
+    store = TaskStore(max_finished=1)
+    first = _finish(store, 'first')
+    version = store.version
+    
+    second = _finish(store, 'second')
+    changes = store.changes_since(version)
+    
+    assert [task.id for task in changes.tasks] == [second.id]
+    assert changes.removed == [first.id]
+
+
+def test_queue_keeps_the_configured_empty_store():
+    store = TaskStore(max_finished=5)
+    queue = TaskQueue(default_max_workers=1, task_store=store)
+    try:
+        # 空のストアも偽にならないよう、指定されたストアをそのまま使う
+        assert len(store) == 0
+        assert queue.store is store
+    finally:
+        queue.shutdown()
@@ -0,0 +1,70 @@
+"""
+完了時のコールバックの後に記録する計測値（callback_done）が状態変化リスナーに届くことの確認
+"""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import wait_for
+from taskqueue import SQLiteTaskJournal, Task, TaskQueue, TaskStatus
+from taskqueue.instrument import STAGE_CALLBACK_DONE, STAGE_FINISHED
+
+
+@pytest.fixture
+def queue():
+    queue = TaskQueue(default_max_workers=1)
+    queue.register_handler('echo', lambda task: {'echo': task.name})
+    yield queue
+    queue.shutdown(wait=True)
+
+
+def test_listener_sees_callback_done(queue):
+    notified = []
+    lock = threading.Lock()
+    
+    def listener(task, previous_status):
+        with lock:
+            notified.append((task.status, previous_status, dict(task.timings)))
+    
+    queue.add_listener(listener)
+    called = []
+    task = Task(type='echo', name='timed', payload={})
+    task.callback = called.append
+    queue.add_task(task)
+    
+    assert wait_for(lambda: any(STAGE_CALLBACK_DONE in timings for _, _, timings in notified))
+    assert called and called[0].success
+    
+    # 完了の通知の後に、状態を変えずに計測値を載せた通知がもう一度届く
+    completed = [
+        timings for status, previous, timings in notified
+        if status == TaskStatus.SUCCESS and previous != TaskStatus.SUCCESS
+    ]
+    assert len(completed) == 1
+    assert STAGE_CALLBACK_DONE not in completed[0]
+    status, previous, timings = notified[-1]
+    assert status == previous == TaskStatus.SUCCESS
+    assert timings[STAGE_CALLBACK_DONE] >= timings[STAGE_FINISHED]
+    
+    # 差分取得でも変更として返す
+    assert task.id in {changed.id for changed in queue.store.changes_since(0).tasks}
+
+
+def test_journal_keeps_callback_done(queue, tmp_path):
+    journal = SQLiteTaskJournal(str(tmp_path / 'journal.db'), flush_interval=0.05)
+    queue.add_listener(journal.record)
+    task = Task(type='echo', name='journaled', payload={})
+    task.callback = lambda result: None
+    queue.add_task(task)
+    assert wait_for(lambda: STAGE_CALLBACK_DONE in task.timings)
+    journal.close()
+    
+    reopened = SQLiteTaskJournal(str(tmp_path / 'journal.db'))
+    _, finished = reopened.load()
+    reopened.close()
+    assert [restored.id for restored in finished] == [task.id]
+    assert finished[0].timings == pytest.approx(task.timings)
@@ -0,0 +1,91 @@
+"""
+一括アップロード（/api/upload/batch）のバッチの集計と、保存に失敗した場合の一時ファイルの後始末の確認
+"""
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import wait_for
+
+
+def _post_batch(client, files, **fields):
+    data = {'file': [(io.BytesIO(content), name) for name, content in files]}
+    data.update(fields)
+    return client.post('/api/upload/batch', data=data, content_type='multipart/form-data')
+
+
+def _batch(client, batch_id):
+    response = client.get(f"/api/batches/{batch_id}")
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def _temp_files(webapp):
+    return os.listdir(webapp.TEMP_DIR) if os.path.isdir(webapp.TEMP_DIR) else []
+
+
+def test_batch_counts_files_bytes_and_rejections(client, webapp):
+    response = _post_batch(
+        client,
+        [('a.txt', b'alpha\n'), ('program.exe', b'MZ'), ('b.txt', b'bravo bravo\n')],
+        folder='default',
+        expected_files='4'
+    )
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [task['filename'] for task in data['tasks']] == ['a.txt', 'b.txt']
+    assert data['rejected'] == [{'filename': 'program.exe', 'error': 'このファイル形式はサポートされていません'}]
+    batch_id = data['batch_id']
+    
+    assert wait_for(lambda: _batch(client, batch_id)['counts']['done'] == 2)
+    batch = _batch(client, batch_id)
+    assert batch['files'] == 2
+    assert batch['bytes'] == {'total': 18, 'finished': 18}
+    assert batch['counts']['queued'] == batch['counts']['processing'] == 0
+    # 予定のファイル数（受け付けなかったものを含む）に届くまでは完了にしない
+    assert not batch['complete']
+    
+    # 同じバッチに続きのファイルを追加する
+    response = _post_batch(client, [('c.txt', b'charlie\n')], batch_id=batch_id)
+    assert response.status_code == 200
+    assert response.get_json()['batch_id'] == batch_id
+    assert wait_for(lambda: _batch(client, batch_id)['complete'])
+    batch = _batch(client, batch_id)
+    assert batch['files'] == 3
+    assert batch['counts']['done'] == 3
+    assert batch['bytes']['total'] == 26
+    assert batch['eta'] == 0.0
+
+
+def test_unknown_batch_removes_received_files(client, webapp):
+    response = _post_batch(client, [('a.txt', b'alpha\n'), ('b.txt', b'bravo\n')], batch_id='missing')
+    
+    assert response.status_code == 404
+    assert _temp_files(webapp) == []
+
+
+def test_failed_save_removes_saved_and_partial_files(client, webapp, monkeypatch):
+    save_upload = webapp.save_upload
+    calls = []
+    
+    def failing_save(file, temp_path):
+        calls.append(temp_path)
+        if len(calls) < 3:
+            return save_upload(file, temp_path)
+        with open(temp_path, 'wb') as f:
+            f.write(b'partial')
+        raise OSError(28, 'No space left on device')
+    
+    monkeypatch.setattr(webapp, 'save_upload', failing_save)
+    batches_before = webapp.upload_batches.stats()['batches']
+    response = _post_batch(client, [(f"{name}.txt", b'data\n') for name in 'abcd'], folder='default')
+    
+    # 保存済みの2件と書きかけの1件を削除し、バッチもタスクも作らない
+    assert response.status_code == 500
+    assert 'error' in response.get_json()
+    assert len(calls) == 3
+    assert _temp_files(webapp) == []
+    assert webapp.upload_batches.stats()['batches'] == batches_before
+    assert webapp.task_queue.list_tasks() == []
@@ -0,0 +1,79 @@
+"""
+アップロードの受信時のハッシュ計算と、同じ内容のファイルの変換キャッシュの確認
+"""
+import hashlib
+import io
+import os
+import uuid
+
+from markitdown import MarkItDown
+
+from conftest import wait_for
+from handlers.conversion_cache import get_conversion_cache
+from taskqueue import TaskStatus
+from uploads import ReceivingFile
+
+
+def _upload(client, data, name='report.txt'):
+    response = client.post('/api/upload', data={'file': (io.BytesIO(data), name), 'folder': 'default'})
+    assert response.status_code == 200, response.get_json()
+    return uuid.UUID(response.get_json()['task_id'])
+
+
+def _finished(webapp, task_id):
+    assert wait_for(lambda: webapp.task_queue.is_done(task_id))
+    return webapp.task_queue.get_task(task_id)
+
+
+def test_upload_is_hashed_while_received(webapp, client, monkeypatch):
+    data = b'x' * (700 * 1024) + b'\nend\n'
+    kept = []
+    keep = ReceivingFile.keep
+    
+    def spy(self, path):
+        kept.append(path)
+        return keep(self, path)
+    
+    monkeypatch.setattr(ReceivingFile, 'keep', spy)
+    task = _finished(webapp, _upload(client, data))
+    
+    # 受信したファイルを一時ファイルとして移しただけで、読み直して保存し直していない
+    assert kept == [task.payload['source_path']]
+    assert task.payload['source_sha256'] == hashlib.sha256(data).hexdigest()
+    assert not [name for name in os.listdir(webapp.TEMP_DIR) if name.startswith('receiving-')]
+
+
+def test_rejected_upload_leaves_no_received_file(webapp, client):
+    response = client.post('/api/upload', data={'file': (io.BytesIO(b'data'), 'program.exe')})
+    
+    assert response.status_code == 400
+    assert not [name for name in os.listdir(webapp.TEMP_DIR) if name.startswith('receiving-')]
+
+
+def test_identical_upload_is_a_cache_hit(webapp, client, monkeypatch):
+    converted = []
+    convert = MarkItDown.convert
+    
+    def counting_convert(self, source, **kwargs):
+        converted.append(source)
+        return convert(self, source, **kwargs)
+    
+    monkeypatch.setattr(MarkItDown, 'convert', counting_convert)
+    data = b'# same content\n\nuploaded twice\n'
+    cache = get_conversion_cache()
+    
+    first = _finished(webapp, _upload(client, data, 'first.md'))
+    assert first.status == TaskStatus.SUCCESS
+    assert first.result['cache_hit'] is False
+    assert len(converted) == 1
+    
+    second = _finished(webapp, _upload(client, data, 'second.md'))
+    assert second.status == TaskStatus.SUCCESS
+    assert second.result['cache_hit'] is True
+    # 2回目は MarkItDown で変換せずにキャッシュの結果を使う
+    assert len(converted) == 1
+    assert wait_for(lambda: cache.hits == 1)
+    assert cache.misses == 1
+    
+    stats = client.get('/api/stats').get_json()['conversion_cache']
+    assert stats['hits'] == 1
@@ -0,0 +1,129 @@
+"""
+分割・再開可能なアップロード（uploads.py）の確認
+"""
+import hashlib
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import wait_for
+from taskqueue import TaskStatus
+from uploads import UploadManager, UploadSessionError
+
+DATA = bytes(range(256)) * 40
+
+
+def _sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return UploadManager(str(tmp_path / 'uploads'), max_size=len(DATA) * 2)
+
+
+def test_upload_resumes_after_restart(tmp_path, manager):
+    session = manager.create('sample.txt', len(DATA), sha256=_sha(DATA))
+    assert manager.write_chunk(session.id, 0, [DATA[:3000], DATA[3000:4000]]) == 4000
+    
+    # 再起動後は .part ファイルから受信済みのオフセットとハッシュを復元して続きを受け付ける
+    restarted = UploadManager(manager.upload_dir, max_size=manager.max_size)
+    restored = restarted.get(session.id)
+    assert restored.offset == 4000
+    assert restored.to_dict()['complete'] is False
+    
+    assert restarted.write_chunk(session.id, 4000, [DATA[4000:]], _sha(DATA[4000:])) == len(DATA)
+    
+    temp_path = str(tmp_path / 'received.txt')
+    finished = restarted.finalize(session.id, temp_path)
+    assert finished.digest.hexdigest() == _sha(DATA)
+    with open(temp_path, 'rb') as f:
+        assert f.read() == DATA
+    assert os.listdir(manager.upload_dir) == []
+
+
+def test_offset_mismatch_reports_received_offset(manager):
+    session = manager.create('sample.txt', len(DATA))
+    manager.write_chunk(session.id, 0, [DATA[:1000]])
+    
+    # 送信済みのチャンクの再送・飛ばしたチャンクはどちらも受信済みのオフセットを返して拒否する
+    for offset in (0, 2000):
+        with pytest.raises(UploadSessionError) as excinfo:
+            manager.write_chunk(session.id, offset, [DATA[offset:offset + 1000]])
+        assert excinfo.value.status == 409
+        assert excinfo.value.to_dict()['offset'] == 1000
+    
+    assert manager.get(session.id).offset == 1000
+    assert os.path.getsize(session.part_path) == 1000
+
+
+def test_failed_chunk_is_rolled_back(manager):
+    session = manager.create('sample.txt', len(DATA))
+    manager.write_chunk(session.id, 0, [DATA[:1000]])
+    
+    # チャンクのチェックサム不一致・サイズ超過ではチャンク開始位置まで切り詰める
+    with pytest.raises(UploadSessionError) as excinfo:
+        manager.write_chunk(session.id, 1000, [DATA[1000:2000]], _sha(b'other'))
+    assert excinfo.value.status == 422
+    with pytest.raises(UploadSessionError) as excinfo:
+        manager.write_chunk(session.id, 1000, [DATA[1000:], b'extra'])
+    assert excinfo.value.status == 413
+    
+    assert manager.get(session.id).offset == 1000
+    assert os.path.getsize(session.part_path) == 1000
+    assert manager.write_chunk(session.id, 1000, [DATA[1000:]]) == len(DATA)
+
+
+def test_finalize_checks_completeness_and_hash(tmp_path, manager):
+    temp_path = str(tmp_path / 'received.txt')
+    
+    incomplete = manager.create('sample.txt', len(DATA))
+    manager.write_chunk(incomplete.id, 0, [DATA[:1000]])
+    with pytest.raises(UploadSessionError) as excinfo:
+        manager.finalize(incomplete.id, temp_path)
+    assert excinfo.value.status == 409
+    assert excinfo.value.offset == 1000
+    
+    # 全体のハッシュが一致しない場合はセッションごと破棄して最初からやり直させる
+    corrupted = manager.create('sample.txt', len(DATA), sha256=_sha(b'other'))
+    manager.write_chunk(corrupted.id, 0, [DATA])
+    with pytest.raises(UploadSessionError) as excinfo:
+        manager.finalize(corrupted.id, temp_path)
+    assert excinfo.value.status == 422
+    assert not os.path.exists(corrupted.part_path)
+    with pytest.raises(UploadSessionError) as excinfo:
+        manager.get(corrupted.id)
+    assert excinfo.value.status == 404
+    assert not os.path.exists(temp_path)
+
+
+def test_chunked_upload_api(client, webapp):
+    response = client.post('/api/uploads', json={'filename': 'sample.txt', 'size': len(DATA), 'sha256': _sha(DATA)})
+    assert response.status_code == 201
+    upload_id = response.get_json()['upload_id']
+    
+    response = client.put(f"/api/uploads/{upload_id}", data=DATA[:5000], headers={'Upload-Offset': '0'})
+    assert response.get_json()['offset'] == 5000
+    response = client.put(f"/api/uploads/{upload_id}", data=DATA[:5000], headers={'Upload-Offset': '0'})
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == 5000
+    
+    # 中断後は受信済みのオフセットを問い合わせて続きから送る
+    offset = client.get(f"/api/uploads/{upload_id}").get_json()['offset']
+    response = client.put(
+        f"/api/uploads/{upload_id}",
+        data=DATA[offset:],
+        headers={'Upload-Offset': str(offset), 'X-Chunk-Sha256': _sha(DATA[offset:])}
+    )
+    assert response.get_json()['offset'] == len(DATA)
+    
+    response = client.post(f"/api/uploads/{upload_id}/finalize", json={})
+    assert response.status_code == 200
+    assert response.get_json()['sha256'] == _sha(DATA)
+    task_id = uuid.UUID(response.get_json()['task_id'])
+    assert wait_for(lambda: webapp.task_queue.is_done(task_id))
+    assert webapp.task_queue.get_task(task_id).status == TaskStatus.SUCCESS
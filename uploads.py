@@ -0,0 +1,527 @@
+"""
+分割・再開可能なアップロード
+
+初期化 → オフセット付きのチャンク送信（PUT）→ 完了 の3段階で大きなファイルを受け付ける。
+チャンクは一時ディレクトリの .part ファイルへ直接追記し、SHA-256は受信しながら計算する。
+中断された場合は、受信済みのオフセットを問い合わせて続きから送信できる
+（サーバー再起動後も .part ファイルから再開できる）
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
+
+# セッション情報とデータファイルの拡張子
+META_SUFFIX = '.json'
+PART_SUFFIX = '.part'
+
+# ファイルの再ハッシュ時の読み込み単位
+HASH_READ_BYTES = 1024 * 1024
+
+
+class UploadSessionError(Exception):
+    """分割アップロードのエラー（HTTPステータス付き）"""
+    
+    def __init__(self, message: str, status: int = 400, offset: Optional[int] = None):
+        self.message = message
+        self.status = status
+        self.offset = offset
+        super().__init__(message)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """APIレスポンス用の辞書"""
+        data: Dict[str, Any] = {'error': self.message}
+        if self.offset is not None:
+            data['offset'] = self.offset
+        return data
+
+
+class UploadSession:
+    """分割アップロードのセッション"""
+    
+    def __init__(
+        self,
+        upload_id: str,
+        filename: str,
+        folder: str,
+        size: int,
+        sha256: Optional[str],
+        part_path: str,
+        created_at: datetime
+    ):
+        self.id = upload_id
+        self.filename = filename
+        self.folder = folder
+        self.size = size
+        self.sha256 = sha256
+        self.part_path = part_path
+        self.created_at = created_at
+        self.updated_at = created_at
+        self.offset = 0
+        self.digest = hashlib.sha256()
+        # チャンクの同時書き込みを防ぐロック
+        self.lock = threading.Lock()
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """APIレスポンス用の辞書"""
+        return {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'folder': self.folder,
+            'size': self.size,
+            'offset': self.offset,
+            'complete': self.offset == self.size,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+
+class ReceivingFile:
+    """
+    フォームで送られたファイルを受信しながら一時ディレクトリに書き込み、同時にSHA-256を計算するファイル
+    （フォーム解析の stream_factory が返す。受信後は keep() で一時ファイルとして移すだけで、読み直さない）
+    """
+    
+    def __init__(self, directory: str):
+        """
+        初期化（一時ディレクトリに受信用のファイルを作成）
+        
+        Args:
+            directory: 受信中のファイルを置くディレクトリ
+        """
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix='receiving-', suffix=PART_SUFFIX)
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+    
+    def write(self, data: bytes) -> int:
+        """受信したデータを書き込み、ハッシュに加える"""
+        self._digest.update(data)
+        return self._file.write(data)
+    
+    def keep(self, path: str) -> str:
+        """
+        受信したファイルを path に移す（以後 close() しても削除しない）
+        
+        Args:
+            path: 移動先のパス（同じファイルシステム上）
+        
+        Returns:
+            str: ファイル内容のSHA-256（16進文字列）
+        """
+        self._file.close()
+        os.replace(self.path, path)
+        self.path = None
+        return self._digest.hexdigest()
+    
+    def close(self) -> None:
+        """ファイルを閉じる（keep() で移していなければ受信したファイルを削除する）"""
+        self._file.close()
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+    
+    def __getattr__(self, name: str) -> Any:
+        # 読み込み・シークなどはファイルにそのまま委ねる
+        return getattr(self._file, name)
+
+
+class ChunkWriter:
+    """
+    1チャンク分の書き込み
+    
+    commit するまでセッションのオフセットとハッシュは進めず、
+    失敗・中断時は .part ファイルをチャンク開始位置まで切り詰める
+    """
+    
+    def __init__(self, session: UploadSession):
+        self.session = session
+        self.start = session.offset
+        self.written = 0
+        self._digest = session.digest.copy()
+        self._chunk_digest = hashlib.sha256()
+        self._file = open(session.part_path, 'r+b' if os.path.exists(session.part_path) else 'wb')
+        self._file.seek(self.start)
+        self._file.truncate()
+    
+    def write(self, data: bytes) -> None:
+        """
+        チャンクのデータを追記
+        
+        Raises:
+            UploadSessionError: 宣言されたファイルサイズを超えた場合
+        """
+        if self.start + self.written + len(data) > self.session.size:
+            raise UploadSessionError('宣言されたファイルサイズを超えています', 413, offset=self.start)
+        self._file.write(data)
+        self._digest.update(data)
+        self._chunk_digest.update(data)
+        self.written += len(data)
+    
+    def commit(self, chunk_sha256: Optional[str] = None) -> int:
+        """
+        チャンクを確定してオフセットを進める
+        
+        Args:
+            chunk_sha256: クライアントが計算したチャンクのSHA-256（省略可）
+        
+        Returns:
+            int: 確定後のオフセット
+        
+        Raises:
+            UploadSessionError: チャンクのチェックサムが一致しない場合
+        """
+        try:
+            if chunk_sha256 and chunk_sha256.lower() != self._chunk_digest.hexdigest():
+                raise UploadSessionError('チャンクのチェックサムが一致しません', 422, offset=self.start)
+            self._file.flush()
+            self._file.close()
+        except Exception:
+            self.abort()
+            raise
+        
+        session = self.session
+        session.offset = self.start + self.written
+        session.digest = self._digest
+        session.updated_at = datetime.now()
+        session.lock.release()
+        return session.offset
+    
+    def abort(self) -> None:
+        """書き込んだデータを破棄してチャンク開始位置に戻す"""
+        try:
+            if self._file.closed:
+                self._file = open(self.session.part_path, 'r+b')
+            self._file.truncate(self.start)
+            self._file.close()
+        except OSError:
+            pass
+        finally:
+            if self.session.lock.locked():
+                self.session.lock.release()
+
+
+class UploadManager:
+    """分割アップロードのセッション管理"""
+    
+    def __init__(
+        self,
+        upload_dir: str,
+        max_size: int,
+        session_ttl: Optional[float] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        アップロードマネージャーの初期化
+        
+        Args:
+            upload_dir: .part ファイルとセッション情報の保存先
+            max_size: 1ファイルの最大サイズ（バイト）
+            session_ttl: 更新のないセッションを破棄するまでの秒数（None=無期限）
+            logger: カスタムロガー（省略可）
+        """
+        self.upload_dir = upload_dir
+        self.max_size = max_size
+        self.session_ttl = session_ttl
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, UploadSession] = {}
+    
+    def create(
+        self,
+        filename: str,
+        size: int,
+        folder: str = 'default',
+        sha256: Optional[str] = None
+    ) -> UploadSession:
+        """
+        アップロードセッションを作成する
+        
+        Args:
+            filename: 元のファイル名
+            size: ファイルサイズ（バイト）
+            folder: 保存先フォルダ
+            sha256: ファイル全体のSHA-256（指定時は完了時に検証する）
+        
+        Returns:
+            UploadSession: 作成したセッション
+        
+        Raises:
+            UploadSessionError: サイズが不正な場合
+        """
+        if size < 0:
+            raise UploadSessionError('ファイルサイズが不正です')
+        if size > self.max_size:
+            raise UploadSessionError('ファイルサイズが大きすぎます', 413)
+        
+        self.cleanup()
+        os.makedirs(self.upload_dir, exist_ok=True)
+        
+        upload_id = uuid.uuid4().hex
+        session = UploadSession(
+            upload_id,
+            filename,
+            folder,
+            size,
+            sha256.lower() if sha256 else None,
+            os.path.join(self.upload_dir, upload_id + PART_SUFFIX),
+            datetime.now()
+        )
+        open(session.part_path, 'wb').close()
+        with open(self._meta_path(upload_id), 'w', encoding='utf-8') as f:
+            json.dump({
+                'filename': filename,
+                'folder': folder,
+                'size': size,
+                'sha256': session.sha256,
+                'created_at': session.created_at.isoformat()
+            }, f, ensure_ascii=False)
+        
+        with self._lock:
+            self._sessions[upload_id] = session
+        self.logger.info(f"分割アップロード開始: {filename} ({size}バイト, {upload_id})")
+        return session
+    
+    def get(self, upload_id: str) -> UploadSession:
+        """
+        セッションを取得する（メモリにない場合は保存済みの情報から復元）
+        
+        Raises:
+            UploadSessionError: セッションが存在しない場合
+        """
+        with self._lock:
+            session = self._sessions.get(upload_id)
+        if session is not None:
+            return session
+        
+        session = self._restore(upload_id)
+        with self._lock:
+            # 同時に復元された場合は先に登録された方を使う
+            return self._sessions.setdefault(upload_id, session)
+    
+    def open_chunk(self, upload_id: str, offset: int) -> ChunkWriter:
+        """
+        チャンクの書き込みを開始する
+        
+        Args:
+            upload_id: セッションID
+            offset: チャンクの開始位置（受信済みのオフセットと一致する必要がある）
+        
+        Returns:
+            ChunkWriter: 書き込み用オブジェクト（commit または abort を必ず呼ぶ）
+        
+        Raises:
+            UploadSessionError: オフセットの不一致や同時書き込みの場合
+        """
+        session = self.get(upload_id)
+        if not session.lock.acquire(blocking=False):
+            raise UploadSessionError('このアップロードには別のチャンクを書き込み中です', 409, offset=session.offset)
+        
+        if offset != session.offset:
+            session.lock.release()
+            raise UploadSessionError('オフセットが一致しません', 409, offset=session.offset)
+        
+        try:
+            return ChunkWriter(session)
+        except Exception:
+            session.lock.release()
+            raise
+    
+    def write_chunk(
+        self,
+        upload_id: str,
+        offset: int,
+        chunks: Iterable[bytes],
+        chunk_sha256: Optional[str] = None
+    ) -> int:
+        """
+        チャンクを書き込んで確定する（同期版）
+        
+        Args:
+            upload_id: セッションID
+            offset: チャンクの開始位置
+            chunks: チャンクのデータ（少しずつ読み込むイテラブル）
+            chunk_sha256: チャンクのSHA-256（省略可）
+        
+        Returns:
+            int: 確定後のオフセット
+        """
+        writer = self.open_chunk(upload_id, offset)
+        try:
+            for data in chunks:
+                writer.write(data)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit(chunk_sha256)
+    
+    def finalize(self, upload_id: str, temp_path: str) -> UploadSession:
+        """
+        アップロードを完了して受信したファイルを指定パスへ移動する
+        
+        Args:
+            upload_id: セッションID
+            temp_path: 移動先（変換タスクの入力になる一時ファイル）
+        
+        Returns:
+            UploadSession: 完了したセッション（digest がファイル全体のSHA-256）
+        
+        Raises:
+            UploadSessionError: 未受信のデータがある・チェックサムが一致しない場合
+        """
+        session = self.get(upload_id)
+        if not session.lock.acquire(blocking=False):
+            raise UploadSessionError('このアップロードには別のチャンクを書き込み中です', 409, offset=session.offset)
+        
+        try:
+            if session.offset != session.size:
+                raise UploadSessionError('未受信のデータがあります', 409, offset=session.offset)
+            if session.sha256 and session.sha256 != session.digest.hexdigest():
+                # 受信データが壊れているため最初からやり直してもらう
+                self._discard(session)
+                raise UploadSessionError('ファイルのチェックサムが一致しません', 422)
+            
+            os.replace(session.part_path, temp_path)
+            self._remove_meta(upload_id)
+            with self._lock:
+                self._sessions.pop(upload_id, None)
+        finally:
+            session.lock.release()
+        
+        self.logger.info(f"分割アップロード完了: {session.filename} ({session.size}バイト, {upload_id})")
+        return session
+    
+    def abort(self, upload_id: str) -> None:
+        """
+        アップロードを中止して受信済みのデータを削除する
+        
+        Raises:
+            UploadSessionError: セッションが存在しない・書き込み中の場合
+        """
+        session = self.get(upload_id)
+        if not session.lock.acquire(blocking=False):
+            raise UploadSessionError('このアップロードには別のチャンクを書き込み中です', 409, offset=session.offset)
+        try:
+            self._discard(session)
+        finally:
+            session.lock.release()
+    
+    def cleanup(self, now: Optional[datetime] = None) -> int:
+        """
+        期限切れのセッションを削除する
+        
+        Args:
+            now: 基準日時（省略時は現在日時）
+        
+        Returns:
+            int: 削除したセッション数
+        """
+        if self.session_ttl is None or not os.path.isdir(self.upload_dir):
+            return 0
+        
+        deadline = (now or datetime.now()) - timedelta(seconds=self.session_ttl)
+        removed = 0
+        for entry in os.scandir(self.upload_dir):
+            if not entry.name.endswith(META_SUFFIX):
+                continue
+            upload_id = entry.name[:-len(META_SUFFIX)]
+            part_path = os.path.join(self.upload_dir, upload_id + PART_SUFFIX)
+            try:
+                # 最終更新日時はデータファイルの更新日時で判定する
+                mtime = os.path.getmtime(part_path if os.path.exists(part_path) else entry.path)
+            except OSError:
+                continue
+            if datetime.fromtimestamp(mtime) > deadline:
+                continue
+            
+            with self._lock:
+                session = self._sessions.get(upload_id)
+            if session is not None and session.lock.locked():
+                continue
+            
+            self._remove_files(upload_id)
+            with self._lock:
+                self._sessions.pop(upload_id, None)
+            removed += 1
+        
+        if removed:
+            self.logger.info(f"期限切れの分割アップロードを削除しました: {removed}件")
+        return removed
+    
+    def stats(self) -> Dict[str, Any]:
+        """アップロードの統計情報"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            'sessions': len(sessions),
+            'receiving': sum(1 for session in sessions if session.lock.locked()),
+            'bytes_received': sum(session.offset for session in sessions),
+            'max_size': self.max_size,
+            'session_ttl': self.session_ttl
+        }
+    
+    def _restore(self, upload_id: str) -> UploadSession:
+        """保存済みのセッション情報と .part ファイルからセッションを復元"""
+        if not upload_id.isalnum():
+            raise UploadSessionError('アップロードが見つかりません', 404)
+        
+        try:
+            with open(self._meta_path(upload_id), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise UploadSessionError('アップロードが見つかりません', 404)
+        
+        session = UploadSession(
+            upload_id,
+            meta['filename'],
+            meta.get('folder', 'default'),
+            int(meta['size']),
+            meta.get('sha256'),
+            os.path.join(self.upload_dir, upload_id + PART_SUFFIX),
+            datetime.fromisoformat(meta['created_at'])
+        )
+        
+        # 受信済みのデータからハッシュの途中状態を作り直す
+        if os.path.exists(session.part_path):
+            with open(session.part_path, 'rb') as f:
+                while True:
+                    data = f.read(HASH_READ_BYTES)
+                    if not data:
+                        break
+                    session.digest.update(data)
+                    session.offset += len(data)
+            session.updated_at = datetime.fromtimestamp(os.path.getmtime(session.part_path))
+        
+        self.logger.info(f"分割アップロードを復元しました: {session.filename} ({session.offset}/{session.size}バイト)")
+        return session
+    
+    def _discard(self, session: UploadSession) -> None:
+        """セッションとデータファイルを削除"""
+        self._remove_files(session.id)
+        with self._lock:
+            self._sessions.pop(session.id, None)
+        self.logger.info(f"分割アップロードを破棄しました: {session.filename} ({session.id})")
+    
+    def _remove_files(self, upload_id: str) -> None:
+        for path in (os.path.join(self.upload_dir, upload_id + PART_SUFFIX), self._meta_path(upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    
+    def _remove_meta(self, upload_id: str) -> None:
+        try:
+            os.remove(self._meta_path(upload_id))
+        except FileNotFoundError:
+            pass
+    
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.upload_dir, upload_id + META_SUFFIX)
@@ -0,0 +1,45 @@
+"""
+Markitdown WebUI のワーカー専用の起動スクリプト
+Webサーバーは起動せず、共有キューからタスクを取得して変換する
+（run.py --role web と同じ共有キュー・出力ディレクトリ・一時ディレクトリを参照させる）
+"""
+import argparse
+import signal
+import threading
+
+import app
+from config import SHARED_QUEUE_PATH, Config
+from taskqueue import ROLE_WORKER
+
+
+def parse_arguments():
+    """コマンドライン引数をパースする関数"""
+    parser = argparse.ArgumentParser(description='Markitdown WebUI ワーカー - 共有キューのタスクを変換するプロセス')
+    parser.add_argument('output_path', nargs='?', default=None,
+                        help='変換ファイルの保存先ディレクトリのパス (デフォルト: 設定ファイルで指定されたパス)')
+    parser.add_argument('--drain-timeout', type=float, default=Config.SHARED_QUEUE_DRAIN_TIMEOUT,
+                        help=f'停止時に実行中のタスクの完了を待つ秒数 (デフォルト: {Config.SHARED_QUEUE_DRAIN_TIMEOUT})')
+    
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    # コマンドライン引数を解析
+    args = parse_arguments()
+    
+    # アプリケーションのセットアップ（共有キューのワーカーとして参加）
+    app.setup_application(args.output_path, role=ROLE_WORKER)
+    
+    # SIGINT / SIGTERM で停止する
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    
+    print(f"Markitdown WebUI ワーカーを起動しました（{app.cluster.node_id}, キュー: {SHARED_QUEUE_PATH}）")
+    while not stopping.wait(1):
+        pass
+    
+    # 新しいタスクの取得をやめ、実行中のタスクの完了を待ってから終了する
+    # （終わらなかったタスクはリースの期限切れ後に別のワーカーが再実行する）
+    print("ワーカーを停止しています...")
+    app.cluster.stop(drain_timeout=args.drain_timeout)
+    app.task_queue.shutdown(wait=False)